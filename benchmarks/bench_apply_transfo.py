@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for the warping of 4D series (sct_apply_transfo), on a 100-volume DWI-like series
+#
+# The 'ants' method runs one isct_antsApplyTransforms per volume, as sct_apply_transfo used to; it is skipped if ANTs
+# binaries are not available.
+
+from __future__ import print_function, absolute_import
+
+import os
+import sys
+import shutil
+import tempfile
+import distutils.spawn
+
+import numpy as np
+import nibabel as nib
+from scipy.ndimage import map_coordinates
+
+from spinalcordtoolbox.utils import __sct_dir__
+sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.warping import WarpPlan, INTERPOLATION_ORDER
+
+import sct_utils as sct
+
+
+def dummy_dwi(path_tmp, nt=100):
+    """Series of nt volumes of 96x96x40 voxels, and a smooth warping field defined on the same grid"""
+    shape = (96, 96, 40)
+    affine = np.diag([1., 1., 2.5, 1.])
+    rs = np.random.RandomState(0)
+    data = rs.normal(500, 50, shape + (nt,)).astype(np.float32)
+    fname_dwi = os.path.join(path_tmp, 'dwi.nii')
+    nib.save(nib.Nifti1Image(data, affine), fname_dwi)
+    x, y, z = np.indices(shape)
+    data_warp = np.zeros(shape + (1, 3))
+    data_warp[..., 0, 0] = 2 * np.sin(z / 10.)
+    data_warp[..., 0, 1] = np.cos(x / 20.)
+    im_warp = nib.Nifti1Image(data_warp, affine)
+    im_warp.header.set_intent('vector', (), '')
+    fname_warp = os.path.join(path_tmp, 'warp.nii')
+    nib.save(im_warp, fname_warp)
+    return fname_dwi, fname_warp
+
+
+class TimeApplyTransfo4D:
+    params = [['nn', 'linear', 'spline'], ['ants', 'map_coordinates', 'warp_plan']]
+    param_names = ['interp', 'method']
+
+    def setup(self, interp, method):
+        if method == 'ants' and distutils.spawn.find_executable('isct_antsApplyTransforms') is None:
+            raise NotImplementedError("ANTs binaries are not available")
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fname_dwi, self.fname_warp = dummy_dwi(self.tmp_dir)
+        self.im_dwi = Image(self.fname_dwi)
+
+    def teardown(self, interp, method):
+        shutil.rmtree(self.tmp_dir)
+
+    def time_apply(self, interp, method):
+        if method == 'ants':
+            # one volume at a time, through files
+            for it in range(self.im_dwi.data.shape[3]):
+                fname_vol = os.path.join(self.tmp_dir, 'vol.nii')
+                Image(self.im_dwi.data[..., it], hdr=self.im_dwi.hdr.copy()).save(fname_vol, verbose=0)
+                sct.run(['isct_antsApplyTransforms', '-d', '3', '-i', fname_vol, '-o', fname_vol, '-t', self.fname_warp,
+                         '-r', fname_vol] + sct.get_interpolation('isct_antsApplyTransforms', interp), verbose=0,
+                        is_sct_binary=True)
+            return
+        plan = WarpPlan.from_files([self.fname_warp], self.im_dwi, self.im_dwi)
+        if method == 'map_coordinates':
+            for it in range(self.im_dwi.data.shape[3]):
+                map_coordinates(self.im_dwi.data[..., it], plan.coords, order=INTERPOLATION_ORDER[interp], mode='nearest')
+        else:
+            plan.apply(self.im_dwi.data, order=INTERPOLATION_ORDER[interp])
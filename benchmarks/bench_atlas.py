@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for the sparse representation of atlases (spinalcordtoolbox.atlas), against the dense 4D stack of labels,
+# on a PAM50-like atlas: 36 labels within a cord of ~80 voxels of diameter, on a 141x141 grid
+
+from __future__ import print_function, absolute_import
+
+import numpy as np
+
+from spinalcordtoolbox.atlas import SparseAtlas
+from spinalcordtoolbox.warping import WarpPlan, RAS2LPS
+
+
+def dummy_atlas(n_labels=36, shape=(141, 141, 100)):
+    """Stack of float32 labels (x, y, z, label): each label is a blob within the cord, with partial volume"""
+    np.random.seed(0)
+    centers = np.random.uniform(55, 85, (n_labels, 2))
+    x, y = np.mgrid[:shape[0], :shape[1]]
+    blobs = np.exp(-((x[..., np.newaxis] - centers[:, 0]) ** 2 + (y[..., np.newaxis] - centers[:, 1]) ** 2) / 30.)
+    blobs[blobs < 0.01] = 0
+    cord = np.clip(1.2 - np.sqrt((x - 70) ** 2 + (y - 70) ** 2) / 20., 0, 1)
+    labels = (blobs / np.maximum(blobs.sum(axis=-1, keepdims=True), 1e-6) * cord[..., np.newaxis]).astype(np.float32)
+    return np.repeat(labels[:, :, np.newaxis, :], shape[2], axis=2)
+
+
+class TimeAtlas:
+    params = [['dense', 'sparse']]
+    param_names = ['representation']
+
+    def setup(self, representation):
+        self.dense = dummy_atlas()
+        self.atlas = SparseAtlas.from_dense(self.dense, np.eye(4))
+        self.metric = np.random.rand(*self.dense.shape[:3])
+        shape = self.dense.shape[:3]
+        field = np.zeros(shape + (3,))
+        field[..., 0] = np.sin(np.arange(shape[2]) / 10.)
+        self.plan = WarpPlan([(field, RAS2LPS)], np.eye(4), shape, np.eye(4), shape)
+        if representation == 'sparse':
+            del self.dense
+
+    def time_weighted_sum_per_slice(self, representation):
+        if representation == 'dense':
+            np.einsum('xyzl,xyz->zl', self.dense, self.metric)
+        else:
+            self.atlas.weighted_sum(self.metric, per_slice=True)
+
+    def time_extract_slice(self, representation):
+        if representation == 'dense':
+            self.dense[:, :, 50].reshape(-1, self.dense.shape[3])
+        else:
+            self.atlas.get_support([50])
+
+    def time_warp(self, representation):
+        if representation == 'dense':
+            self.plan.apply(self.dense, order=1)
+        else:
+            self.atlas.warp(self.plan, order=1)
+
+    def mem_labels(self, representation):
+        return self.dense if representation == 'dense' else self.atlas.matrix
+
+    def track_nbytes(self, representation):
+        return self.dense.nbytes if representation == 'dense' else self.atlas.nbytes
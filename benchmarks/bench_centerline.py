@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for spinalcordtoolbox.types.Centerline, and for the fitting of the centerline
+# (spinalcordtoolbox.centerline.core.get_centerline) on dummy centerlines of 64x64 voxels per slice and 64 to 512
+# slices (spinalcordtoolbox.testing.create_test_data)
+
+from __future__ import print_function, absolute_import
+
+import os
+import sys
+
+import numpy as np
+
+from spinalcordtoolbox.utils import __sct_dir__
+sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+from spinalcordtoolbox.types import Centerline
+from spinalcordtoolbox.centerline.core import ParamCenterline, get_centerline
+from spinalcordtoolbox.testing.create_test_data import dummy_centerline
+
+
+def dummy_centerline_points(n_points):
+    """Smooth curved centerline along z, with its derivatives"""
+    z = np.linspace(0, 300, n_points)
+    x = 10 * np.sin(z / 50.)
+    y = 5 * np.cos(z / 80.)
+    return x, y, z, np.gradient(x, z), np.gradient(y, z), np.ones(n_points)
+
+
+class TimeCenterline:
+    params = [100, 1000, 5000, 20000]
+    param_names = ['n_points']
+
+    def setup(self, n_points):
+        self.points = dummy_centerline_points(n_points)
+
+    def time_init(self, n_points):
+        Centerline(*self.points)
+
+
+class TimeVertebralDistribution:
+    params = [1000, 5000]
+    param_names = ['n_points']
+
+    def setup(self, n_points):
+        x, y, z, dx, dy, dz = dummy_centerline_points(n_points)
+        self.centerline = Centerline(x, y, z, dx, dy, dz)
+        # one disk every 25 mm from the top, C1 to T5
+        z_disks = np.arange(290, 0, -25)[:12]
+        self.disks_levels = [[10 * np.sin(z_disk / 50.), 5 * np.cos(z_disk / 80.), z_disk, label]
+                             for label, z_disk in zip(range(1, 13), z_disks)]
+        self.centerline.compute_vertebral_distribution(list(self.disks_levels))
+
+    def time_compute_vertebral_distribution(self, n_points):
+        self.centerline.compute_vertebral_distribution(list(self.disks_levels))
+
+    def time_lookup_table(self, n_points):
+        # look-up table between two centerlines, as computed by the straightening with disk alignment
+        self.centerline.get_closest_to_absolute_positions(self.centerline.l_points, self.centerline.dist_points_rel,
+                                                          backup_indexes=range(n_points),
+                                                          backup_centerline=self.centerline)
+
+
+class TimeGetCenterline:
+    params = [[64, 256, 512], ['polyfit', 'bspline', 'linear', 'nurbs']]
+    param_names = ['nz', 'algo_fitting']
+
+    def setup(self, nz, algo_fitting):
+        # centerline defined every other slice
+        _, self.im_ctl, _ = dummy_centerline(size_arr=(64, 64, nz), subsampling=2, orientation='RPI')
+
+    def time_get_centerline(self, nz, algo_fitting):
+        get_centerline(self.im_ctl, ParamCenterline(algo_fitting=algo_fitting), verbose=0)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for the inference of the deepseg_sc 2D model on CPU: one slice per predict() call vs batched inference.
+# The model has random weights, so no model file is needed (keras is).
+
+from __future__ import print_function, absolute_import
+
+import os
+import sys
+
+import numpy as np
+
+from spinalcordtoolbox.utils import __sct_dir__
+sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+
+from spinalcordtoolbox.deepseg_sc.cnn_models import nn_architecture_seg
+from spinalcordtoolbox.deepseg_sc.inference import predict_slices
+
+
+class TimeSegment2D:
+    params = [[100, 400], ['per_slice', 'batched']]
+    param_names = ['size_z', 'method']
+
+    def setup(self, size_z, method):
+        self.model = nn_architecture_seg(height=64, width=64, depth=3, features=32, batchnorm=False, dropout=0.0)
+        self.data = np.random.RandomState(0).rand(64, 64, size_z).astype(np.float32) * 255
+
+    def time_segment_2d(self, size_z, method):
+        if method == 'batched':
+            predict_slices(self.model, self.data)
+        else:
+            for zz in range(size_z):
+                self.model.predict(self.data[np.newaxis, :, :, zz, np.newaxis], batch_size=4)
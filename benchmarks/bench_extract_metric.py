@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for the extraction of metrics within all the labels of a PAM50-like atlas (sct_extract_metric)
+#
+# The 'per_label' method calls extract_metric() for each label, as sct_extract_metric used to.
+
+from __future__ import print_function, absolute_import
+
+import numpy as np
+
+from spinalcordtoolbox.aggregate_slicewise import extract_metric, extract_metric_multilabel, Metric, LabelStruc
+
+
+def dummy_atlas(n_labels=36, shape=(60, 60, 100)):
+    """Metric and atlas of n_labels labels (30 WM tracts, then GM), with partial volume, and combined labels"""
+    np.random.seed(0)
+    centers = np.random.uniform(20, 40, (n_labels, 2))
+    x, y = np.mgrid[:shape[0], :shape[1]]
+    blobs = np.exp(-((x[..., np.newaxis] - centers[:, 0]) ** 2 + (y[..., np.newaxis] - centers[:, 1]) ** 2) / 4.)
+    cord = np.clip(1.2 - np.sqrt((x - 30) ** 2 + (y - 30) ** 2) / 12., 0, 1)
+    labels = blobs / blobs.sum(axis=-1, keepdims=True) * cord[..., np.newaxis]
+    labels = np.repeat(labels[:, :, np.newaxis, :], shape[2], axis=2)
+    data = np.sum(labels * np.random.uniform(20, 40, n_labels), axis=-1) + np.random.normal(0, 1, shape)
+    label_struc = {i: LabelStruc(id=i, name='label_{}'.format(i), map_cluster=int(i >= 30)) for i in range(n_labels)}
+    label_struc[50] = LabelStruc(id=list(range(n_labels)), name='spinal cord', map_cluster=0)
+    label_struc[51] = LabelStruc(id=list(range(30)), name='white matter', map_cluster=0)
+    return Metric(data=data), labels, label_struc
+
+
+class TimeExtractMetric:
+    params = [['wa', 'bin', 'ml', 'map'], [True, False], ['per_label', 'multilabel']]
+    param_names = ['method', 'perslice', 'engine']
+
+    def setup(self, method, perslice, engine):
+        self.data, self.labels, self.label_struc = dummy_atlas()
+        self.id_labels = sorted(self.label_struc)
+
+    def time_extract(self, method, perslice, engine):
+        indiv_labels_ids = list(range(self.labels.shape[-1]))
+        if engine == 'per_label':
+            for id_label in self.id_labels:
+                extract_metric(self.data, labels=self.labels, label_struc=self.label_struc, id_label=id_label,
+                               perslice=perslice, method=method, indiv_labels_ids=indiv_labels_ids)
+        else:
+            extract_metric_multilabel(self.data, self.labels, self.label_struc, self.id_labels, perslice=perslice,
+                                      method=method, indiv_labels_ids=indiv_labels_ids)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for spinalcordtoolbox.flattening, on large sagittal T2-like volumes
+
+from __future__ import print_function, absolute_import
+
+import numpy as np
+import nibabel as nib
+
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.flattening import shift_slices, flatten_sagittal
+
+
+def dummy_sagittal_t2(size_z, nt=None):
+    """RPI volume of 64 sagittal slices (R-L) x 320 x size_z, with a curved cord and its segmentation"""
+    nx, ny = 64, 320
+    xx = np.arange(nx)[:, np.newaxis, np.newaxis]
+    zz = np.arange(size_z)[np.newaxis, np.newaxis, :]
+    x_cord = nx // 2 + 8 * np.sin(zz * 3. / size_z)
+    seg = ((np.abs(xx - np.round(x_cord)) <= 3) * np.ones((1, ny, 1))).astype(np.uint8)
+    seg[:, :150] = seg[:, 170:] = 0
+    shape = (nx, ny, size_z) if nt is None else (nx, ny, size_z, nt)
+    data = np.random.RandomState(0).randint(0, 1000, shape).astype(np.int16)
+    affine = np.diag([-0.8, -0.8, 0.8, 1.])
+    return (Image(data, hdr=nib.Nifti1Image(data, affine).header),
+            Image(seg, hdr=nib.Nifti1Image(seg, affine).header))
+
+
+class TimeFlattening:
+    params = [[320, 640], [None, 4]]
+    param_names = ['size_z', 'nt']
+
+    def setup(self, size_z, nt):
+        self.image, self.image_seg = dummy_sagittal_t2(size_z, nt)
+        self.offsets = np.random.RandomState(0).uniform(-10, 10, size_z)
+
+    def time_shift_slices(self, size_z, nt):
+        shift_slices(self.image.data, self.offsets)
+
+    def time_flatten_sagittal(self, size_z, nt):
+        flatten_sagittal(self.image, self.image_seg, verbose=0)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for spinalcordtoolbox.image and spinalcordtoolbox.resampling, on dummy segmentations of 32^3 to 128^3
+# voxels (spinalcordtoolbox.testing.create_test_data)
+
+from __future__ import print_function, absolute_import
+
+import os
+import sys
+import shutil
+import tempfile
+
+from spinalcordtoolbox.utils import __sct_dir__
+sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.resampling import resample_nib
+from spinalcordtoolbox.testing.create_test_data import dummy_segmentation
+
+
+class TimeImage:
+    params = [[32, 64, 128], ['.nii', '.nii.gz']]
+    param_names = ['size', 'ext']
+
+    def setup(self, size, ext):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.image = dummy_segmentation(size_arr=(size, size, size), pixdim=(1, 1, 1))
+        self.fname = os.path.join(self.tmp_dir, 'seg' + ext)
+        self.image.save(self.fname)
+
+    def teardown(self, size, ext):
+        shutil.rmtree(self.tmp_dir)
+
+    def _load(self):
+        # the data of uncompressed files is memory-mapped: read it
+        return Image(self.fname).data.max()
+
+    def time_load(self, size, ext):
+        self._load()
+
+    def peakmem_load(self, size, ext):
+        self._load()
+
+    def time_save(self, size, ext):
+        self.image.save(os.path.join(self.tmp_dir, 'seg_out' + ext))
+
+    def time_change_orientation(self, size, ext):
+        self.image.copy().change_orientation('AIL')
+
+
+class TimeResampling:
+    params = [[32, 64, 128], ['nn', 'linear', 'spline']]
+    param_names = ['size', 'interpolation']
+
+    def setup(self, size, interpolation):
+        self.image = dummy_segmentation(size_arr=(size, size, size), pixdim=(1, 1, 1))
+
+    def time_resample_nib(self, size, interpolation):
+        resample_nib(self.image, new_size=[0.8, 0.8, 0.8], new_size_type='mm', interpolation=interpolation)
+
+    def peakmem_resample_nib(self, size, interpolation):
+        resample_nib(self.image, new_size=[0.8, 0.8, 0.8], new_size_type='mm', interpolation=interpolation)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for spinalcordtoolbox.labels and sct_label_utils, on dense label images (e.g. vertebral levels)
+
+from __future__ import print_function, absolute_import
+
+import os
+import sys
+
+import numpy as np
+import nibabel as nib
+
+from spinalcordtoolbox.utils import __sct_dir__
+sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.labels import LabelSet
+from sct_label_utils import ProcessLabels
+
+
+def dummy_vertebral_levels(size_z):
+    """Cylinder along z with 25 vertebral levels, from 1 (top) to 25"""
+    nx, ny = 64, 64
+    xx, yy = np.mgrid[:nx, :ny]
+    disk = (xx - nx // 2) ** 2 + (yy - ny // 2) ** 2 < 20 ** 2
+    levels = (np.arange(size_z)[::-1] * 25 // size_z + 1).astype(np.float32)
+    data = disk[..., np.newaxis] * levels
+    return Image(data, hdr=nib.Nifti1Header())
+
+
+class TimeLabels:
+    params = [50, 200]
+    param_names = ['size_z']
+
+    def setup(self, size_z):
+        self.image = dummy_vertebral_levels(size_z)
+        self.labels = LabelSet.from_image(self.image)
+
+    def time_from_image(self, size_z):
+        LabelSet.from_image(self.image)
+
+    def time_centroids(self, size_z):
+        self.labels.centroids()
+
+    def time_intersection(self, size_z):
+        self.labels.intersection(self.labels[::1000])
+
+    def time_cubic_to_point(self, size_z):
+        ProcessLabels(self.image, verbose=0).cubic_to_point()
+
+    def time_increment_z_inverse(self, size_z):
+        ProcessLabels(self.image, verbose=0).increment_z_inverse()
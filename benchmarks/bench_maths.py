@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for chained operations of sct_maths, on a 192x192x200 float64 volume
+#
+# The 'cli' method runs sct_maths once per operation, through files, as chains had to be run before; 'numpy' applies the
+# operations one after the other on whole volumes in memory; 'expression' and 'expression_chunked' evaluate the chain
+# with spinalcordtoolbox.math.Expression.
+
+from __future__ import print_function, absolute_import
+
+import os
+import sys
+import shutil
+import tempfile
+
+import numpy as np
+import nibabel as nib
+from scipy.ndimage import gaussian_filter, gaussian_laplace
+
+from spinalcordtoolbox.utils import __sct_dir__
+sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+import spinalcordtoolbox.math
+
+import sct_maths
+
+CHAINS = {
+    'arithmetic': ['-sub', '100', '-div', '50', '-mul', 'mask.nii', '-add', '1', '-thr', '0.5', '-bin', '1'],
+    'filtering': ['-thr', '100', '-smooth', '1', '-mul', 'mask.nii', '-laplacian', '1', '-bin', '0'],
+}
+
+
+def get_operations(chain):
+    """Split a chain of arguments into operations"""
+    starts = [i for i, arg in enumerate(chain) if arg.startswith('-')] + [len(chain)]
+    return [chain[start:stop] for start, stop in zip(starts[:-1], starts[1:])]
+
+
+class TimeMathsChain:
+    params = [sorted(CHAINS), ['cli', 'numpy', 'expression', 'expression_chunked']]
+    param_names = ['chain', 'method']
+
+    def setup(self, chain, method):
+        self.tmp_dir = tempfile.mkdtemp()
+        rs = np.random.RandomState(0)
+        self.data = rs.normal(100, 20, (192, 192, 200))
+        self.mask = rs.uniform(0, 1, self.data.shape)
+        nib.save(nib.Nifti1Image(self.data, np.eye(4)), os.path.join(self.tmp_dir, 'data.nii'))
+        nib.save(nib.Nifti1Image(self.mask, np.eye(4)), os.path.join(self.tmp_dir, 'mask.nii'))
+        self.chain = [os.path.join(self.tmp_dir, arg) if arg.endswith('.nii') else arg for arg in CHAINS[chain]]
+
+    def teardown(self, chain, method):
+        shutil.rmtree(self.tmp_dir)
+
+    def time_chain(self, chain, method):
+        if method == 'cli':
+            fname = os.path.join(self.tmp_dir, 'data.nii')
+            for i, operation in enumerate(get_operations(self.chain)):
+                fname_out = os.path.join(self.tmp_dir, 'step{}.nii'.format(i))
+                sct_maths.main(['-i', fname, '-o', fname_out, '-v', '0'] + operation)
+                fname = fname_out
+        elif method == 'numpy':
+            data = self.data
+            for operation in get_operations(CHAINS[chain]):
+                name, value = operation[0][1:], operation[1]
+                if name == 'mul':
+                    data = data * self.mask
+                elif name in ['add', 'sub', 'div']:
+                    data = getattr(np, {'add': 'add', 'sub': 'subtract', 'div': 'divide'}[name])(data, float(value))
+                elif name == 'thr':
+                    data = np.where(data < float(value), 0, data)
+                elif name == 'bin':
+                    data = data > float(value)
+                elif name == 'smooth':
+                    data = gaussian_filter(data.astype(float), float(value), truncate=4.0)
+                elif name == 'laplacian':
+                    data = gaussian_laplace(data.astype(float), float(value))
+        else:
+            expression = spinalcordtoolbox.math.Expression()
+            for operation in get_operations(CHAINS[chain]):
+                name, value = operation[0][1:], operation[1]
+                if name == 'mul':
+                    expression.mul(self.mask)
+                elif name in ['smooth', 'laplacian']:
+                    getattr(expression, name)([float(value)] * 3)
+                else:
+                    getattr(expression, name)(float(value))
+            expression.evaluate(self.data, chunk_size=32 if method == 'expression_chunked' else None)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for the partial-volume merge of images into a common space (sct_merge_images), on 24 overlapping slabs
+# (e.g. chunks of a spinal cord acquisition) merged into a 96x96x240 template space
+#
+# The 'stack' method warps every source and its mask into the destination space and averages the stack of warped
+# volumes, which is what sct_merge_images used to do (with files); the 'streaming' method is
+# sct_merge_images.merge_images.
+
+from __future__ import print_function, absolute_import
+
+import os
+import sys
+import shutil
+import tempfile
+
+import numpy as np
+import nibabel as nib
+
+from spinalcordtoolbox.utils import __sct_dir__
+sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.warping import WarpPlan
+
+import sct_merge_images
+
+
+def dummy_slabs(path_tmp, n_slabs=24, shape_dest=(96, 96, 240), nz_slab=20):
+    """Slabs of nz_slab slices evenly spread along the destination space (they overlap), each with its own warping
+    field defined on the destination grid"""
+    rs = np.random.RandomState(0)
+    fname_dest = os.path.join(path_tmp, 'dest.nii')
+    nib.save(nib.Nifti1Image(np.zeros(shape_dest, dtype=np.float32), np.eye(4)), fname_dest)
+    z = np.arange(shape_dest[2])
+    list_fname_src, list_fname_warp = [], []
+    for i, z_offset in enumerate(np.linspace(0, shape_dest[2] - nz_slab, n_slabs)):
+        fname_src = os.path.join(path_tmp, 'src{}.nii'.format(i))
+        data = rs.normal(500, 50, shape_dest[:2] + (nz_slab,)).astype(np.float32)
+        affine = np.eye(4)
+        affine[2, 3] = z_offset
+        nib.save(nib.Nifti1Image(data, affine), fname_src)
+        data_warp = np.zeros(shape_dest + (1, 3), dtype=np.float32)
+        data_warp[..., 0, 0] = 2 * np.sin(z / 20. + i)
+        im_warp = nib.Nifti1Image(data_warp, np.eye(4))
+        im_warp.header.set_intent('vector', (), '')
+        fname_warp = os.path.join(path_tmp, 'warp{}.nii'.format(i))
+        nib.save(im_warp, fname_warp)
+        list_fname_src.append(fname_src)
+        list_fname_warp.append(fname_warp)
+    return list_fname_src, fname_dest, list_fname_warp
+
+
+class TimeMergeImages:
+    params = [['stack', 'streaming'], [1, 2]]
+    param_names = ['method', 'n_jobs']
+
+    def setup(self, method, n_jobs):
+        if method == 'stack' and n_jobs != 1:
+            raise NotImplementedError("the stack method is sequential")
+        self.tmp_dir = tempfile.mkdtemp()
+        self.list_fname_src, self.fname_dest, self.list_fname_warp = dummy_slabs(self.tmp_dir)
+        self.param = sct_merge_images.Param()
+        self.param.fname_out = os.path.join(self.tmp_dir, 'merged.nii')
+        self.param.n_jobs = n_jobs
+        self.param.verbose = 0
+
+    def teardown(self, method, n_jobs):
+        shutil.rmtree(self.tmp_dir)
+
+    def time_merge(self, method, n_jobs):
+        if method == 'streaming':
+            sct_merge_images.merge_images(self.list_fname_src, self.fname_dest, self.list_fname_warp, self.param)
+            return
+        im_dest = Image(self.fname_dest)
+        data, partial_volume = [], []
+        for fname_src, fname_warp in zip(self.list_fname_src, self.list_fname_warp):
+            im_src = Image(fname_src)
+            plan = WarpPlan.from_files([fname_warp], im_src, im_dest)
+            data.append(plan.apply(im_src.data, order=1))
+            partial_volume.append(plan.apply((im_src.data > self.param.almost_zero).astype(np.float32), order=1))
+        data, partial_volume = np.stack(data, axis=-1), np.stack(partial_volume, axis=-1)
+        with np.errstate(invalid='ignore'):
+            im_dest.data = np.nan_to_num(np.sum(data * partial_volume, axis=3) / np.sum(partial_volume, axis=3))
+        im_dest.save(self.param.fname_out, verbose=0)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for the motion correction (spinalcordtoolbox.moco), on dummy fMRI-like 4D series of 10 to 40 volumes of
+# 32x32 voxels per slice and 8 to 32 slices (spinalcordtoolbox.testing.create_test_data)
+#
+# The registration runs isct_antsSliceRegularizedRegistration: the benchmarks are skipped if ANTs binaries are not
+# available.
+
+from __future__ import print_function, absolute_import
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import distutils.spawn
+
+from spinalcordtoolbox.utils import __sct_dir__
+sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+from spinalcordtoolbox.moco import ParamMoco, moco_wrapper
+from spinalcordtoolbox.testing.create_test_data import dummy_segmentation_4d
+
+
+class TimeMoco:
+    params = [[10, 40], [8, 32]]
+    param_names = ['nt', 'nz']
+
+    def setup(self, nt, nz):
+        if distutils.spawn.find_executable('isct_antsSliceRegularizedRegistration') is None:
+            raise NotImplementedError("ANTs binaries are not available")
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fname_data = os.path.join(self.tmp_dir, 'fmri.nii.gz')
+        # the shift of each volume is random
+        random.seed(0)
+        dummy_segmentation_4d(vol_num=nt, size_arr=(32, 32, nz), shape='ellipse', radius_RL=6.0, radius_AP=4.0,
+                              interleaved=True).save(self.fname_data)
+
+    def teardown(self, nt, nz):
+        shutil.rmtree(self.tmp_dir)
+
+    def time_moco(self, nt, nz):
+        # same parameters as sct_fmri_moco
+        param = ParamMoco(is_diffusion=False, group_size=1, metric='MeanSquares', smooth='0')
+        param.fname_data = self.fname_data
+        param.path_out = self.tmp_dir
+        param.verbose = 0
+        moco_wrapper(param)
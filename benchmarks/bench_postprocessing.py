@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for the segmentation post-processing (spinalcordtoolbox.postprocessing and deepseg_sc), on full-length
+# spinal cord segmentations (brainstem to conus)
+
+from __future__ import print_function, absolute_import
+
+import numpy as np
+import nibabel as nib
+
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox import postprocessing
+from spinalcordtoolbox.deepseg_sc.postprocessing import post_processing_volume_wise
+
+
+def dummy_cord_segmentation(size_z):
+    """Soft segmentation (RPI, 0.5x0.5x1 mm) of a curved cord along z, with holes and false positive blobs above"""
+    nx, ny = 192, 192
+    xx, yy = np.mgrid[:nx, :ny]
+    z_top = size_z - size_z // 10
+    x_cord = nx // 2 + 15 * np.sin(np.arange(size_z) / 80.)
+    data = np.zeros((nx, ny, size_z), dtype=np.float32)
+    for iz in range(5, z_top):
+        data[..., iz] = np.clip(1 - ((xx - x_cord[iz]) ** 2 + (yy - ny // 2) ** 2) / 100., 0, 1)
+    # holes
+    data[..., size_z // 3:size_z // 3 + 3] = 0
+    data[..., size_z // 2] = 0
+    # blobs above the cord (e.g. in the brain)
+    rs = np.random.RandomState(0)
+    for x, y, z in zip(rs.randint(10, nx - 10, 20), rs.randint(10, ny - 10, 20), rs.randint(z_top + 2, size_z - 5, 20)):
+        data[x - 2:x + 2, y - 2:y + 2, z - 2:z + 2] = 1
+    affine = np.diag([-0.5, -0.5, 1., 1.])
+    return Image(data, hdr=nib.Nifti1Image(data, affine).header)
+
+
+class TimePostProcessing:
+    params = [300, 1000]
+    param_names = ['size_z']
+
+    def setup(self, size_z):
+        self.image = dummy_cord_segmentation(size_z)
+
+    def time_post_processing_volume_wise(self, size_z):
+        post_processing_volume_wise(self.image.copy())
+
+    def time_keep_largest_object_per_slice(self, size_z):
+        postprocessing.keep_largest_object_per_slice(self.image.data)
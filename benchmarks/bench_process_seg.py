@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for spinalcordtoolbox.process_seg and spinalcordtoolbox.aggregate_slicewise, on dummy tilted elliptic
+# segmentations of 64x64 voxels per slice and 32 to 256 slices (spinalcordtoolbox.testing.create_test_data)
+
+from __future__ import print_function, absolute_import
+
+import os
+import sys
+
+import numpy as np
+
+from spinalcordtoolbox.utils import __sct_dir__
+sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+from spinalcordtoolbox.process_seg import compute_shape
+from spinalcordtoolbox.aggregate_slicewise import aggregate_per_slice_or_level
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.centerline.core import ParamCenterline
+from spinalcordtoolbox.testing.create_test_data import dummy_segmentation
+
+
+def dummy_seg(nz):
+    """Elliptic cord tilted by 15 degrees in the sagittal plane"""
+    return dummy_segmentation(size_arr=(64, 64, nz), pixdim=(1, 1, 1), shape='ellipse', radius_RL=8.0, radius_AP=5.0,
+                              angle_RL=15)
+
+
+class TimeComputeShape:
+    params = [[32, 128, 256], [False, True]]
+    param_names = ['nz', 'angle_correction']
+
+    def setup(self, nz, angle_correction):
+        self.im_seg = dummy_seg(nz)
+
+    def time_compute_shape(self, nz, angle_correction):
+        compute_shape(self.im_seg, angle_correction=angle_correction, param_centerline=ParamCenterline(),
+                      verbose=0)
+
+    def peakmem_compute_shape(self, nz, angle_correction):
+        compute_shape(self.im_seg, angle_correction=angle_correction, param_centerline=ParamCenterline(),
+                      verbose=0)
+
+
+class TimeAggregate:
+    params = [[32, 128, 256], ['perslice', 'levels', 'perlevel']]
+    param_names = ['nz', 'mode']
+
+    def setup(self, nz, mode):
+        self.metrics, _ = compute_shape(dummy_seg(nz), param_centerline=ParamCenterline(), verbose=0)
+        # one vertebral level every 16 slices, from the top
+        data = np.zeros((64, 64, nz))
+        data[32, 32, :] = 1 + (nz - 1 - np.arange(nz)) // 16
+        self.im_vertlevel = Image(data)
+        self.levels = list(range(1, int(data.max()) + 1))
+
+    def _aggregate(self, mode):
+        for metric in self.metrics.values():
+            if mode == 'perslice':
+                aggregate_per_slice_or_level(metric, perslice=True)
+            else:
+                aggregate_per_slice_or_level(metric, levels=self.levels, perlevel=(mode == 'perlevel'),
+                                             vert_level=self.im_vertlevel)
+
+    def time_aggregate(self, nz, mode):
+        self._aggregate(mode)
+
+    def peakmem_aggregate(self, nz, mode):
+        self._aggregate(mode)
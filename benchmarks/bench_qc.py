@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for the rendering of QC reports (spinalcordtoolbox.reports.qc), on a dummy image and its segmentation of
+# 64x64 voxels per slice and 32 to 256 slices (spinalcordtoolbox.testing.create_test_data)
+#
+# The processes cover the axial mosaics (sct_deepseg_sc, sct_warp_template) and the sagittal view
+# (sct_straighten_spinalcord).
+
+from __future__ import print_function, absolute_import
+
+import os
+import sys
+import shutil
+import tempfile
+
+import numpy as np
+
+from spinalcordtoolbox.utils import __sct_dir__
+sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+from spinalcordtoolbox.reports.qc import generate_qc
+from spinalcordtoolbox.testing.create_test_data import dummy_segmentation
+
+
+class TimeQc:
+    params = [[32, 256], ['sct_deepseg_sc', 'sct_warp_template', 'sct_straighten_spinalcord']]
+    param_names = ['nz', 'process']
+
+    def setup(self, nz, process):
+        self.tmp_dir = tempfile.mkdtemp()
+        im_seg = dummy_segmentation(size_arr=(64, 64, nz), shape='ellipse', radius_RL=8.0, radius_AP=5.0, angle_RL=15)
+        self.fname_seg = os.path.join(self.tmp_dir, 'seg.nii.gz')
+        im_seg.save(self.fname_seg)
+        # image: bright cord on a noisy background
+        im_seg.data = 100 + 400 * im_seg.data + np.random.RandomState(0).normal(0, 20, im_seg.data.shape)
+        self.fname_image = os.path.join(self.tmp_dir, 'image.nii.gz')
+        im_seg.save(self.fname_image)
+
+    def teardown(self, nz, process):
+        shutil.rmtree(self.tmp_dir)
+
+    def time_generate_qc(self, nz, process):
+        generate_qc(self.fname_image, fname_seg=self.fname_seg, args=[], path_qc=os.path.join(self.tmp_dir, 'qc'),
+                    process=process)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for the smoothing along the spinal cord (sct_smooth_spinalcord), on a synthetic curved cord of 96x96x160
+# voxels (0.8x0.8x1 mm), whose intensity oscillates along the cord
+#
+# The 'ants' method runs the pipeline that sct_smooth_spinalcord used to run (sct_straighten_spinalcord, sct_maths, then
+# sct_apply_transfo, through files); it is skipped if ANTs binaries are not available. The 'along_z' method smoothes
+# along z, ignoring the curvature, as a reference. track_error is the mean absolute difference, within the cord, with
+# the ideal result: the oscillations attenuated by the Gaussian kernel, the cord unchanged.
+
+from __future__ import print_function, absolute_import
+
+import os
+import sys
+import shutil
+import tempfile
+import distutils.spawn
+
+import numpy as np
+import nibabel as nib
+from scipy.ndimage import gaussian_filter
+from scipy.spatial import cKDTree
+
+from spinalcordtoolbox.utils import __sct_dir__
+sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.centerline.core import ParamCenterline, get_centerline
+from spinalcordtoolbox.smoothing import CurvedSpace
+
+import sct_utils as sct
+
+SIGMA = 4.  # mm, along the cord
+WAVELENGTH = 3.  # mm (divided by 2 pi) of the oscillations along the cord
+
+
+def dummy_curved_cord(path_tmp, shape=(96, 96, 160), pixdim=(0.8, 0.8, 1.)):
+    """
+    Curved cord, its centerline, and the ideal smoothed image
+    :return: fname_data, fname_seg, data_ref, mask of the cord
+    """
+    # centerline sampled every 0.05 slice, in mm
+    z_ctl = np.arange(0, shape[2] - 1 + 1e-6, 0.05)
+    points = np.column_stack([(shape[0] / 2. + 15 / pixdim[0] * np.sin(z_ctl * pixdim[2] / 50.)) * pixdim[0],
+                              (shape[1] / 2. + 6 / pixdim[1] * np.cos(z_ctl * pixdim[2] / 40.)) * pixdim[1],
+                              z_ctl * pixdim[2]])
+    distances = np.concatenate([[0], np.cumsum(np.linalg.norm(np.diff(points, axis=0), axis=1))])
+    # the closest point of the centerline gives the distance to the cord, and the position along it
+    coords = np.indices(shape).reshape(3, -1).T * np.array(pixdim)
+    dist, index = cKDTree(points).query(coords)
+    dist, s = dist.reshape(shape), distances[index].reshape(shape)
+    tube = np.exp(-dist ** 2 / 20.)
+    data = tube * (1 + 0.5 * np.sin(s / WAVELENGTH))
+    data_ref = tube * (1 + 0.5 * np.exp(-0.5 * (SIGMA / WAVELENGTH) ** 2) * np.sin(s / WAVELENGTH))
+    seg = (tube > 0.5).astype(np.uint8)
+    affine = np.diag(list(pixdim) + [1.])
+    fname_data, fname_seg = os.path.join(path_tmp, 'data.nii'), os.path.join(path_tmp, 'seg.nii')
+    nib.save(nib.Nifti1Image(data.astype(np.float32), affine), fname_data)
+    nib.save(nib.Nifti1Image(seg, affine), fname_seg)
+    # ignore the ends of the cord, where the kernel is truncated
+    mask = (tube > 0.1) & (s >= 3 * SIGMA) & (s < distances[-1] - 3 * SIGMA)
+    return fname_data, fname_seg, data_ref, mask
+
+
+class TimeSmoothSpinalcord:
+    params = [['ants', 'straighten', 'direct', 'along_z']]
+    param_names = ['method']
+
+    def setup(self, method):
+        if method == 'ants' and distutils.spawn.find_executable('isct_antsApplyTransforms') is None:
+            raise NotImplementedError("ANTs binaries are not available")
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fname_data, self.fname_seg, self.data_ref, self.mask = dummy_curved_cord(self.tmp_dir)
+
+    def teardown(self, method):
+        shutil.rmtree(self.tmp_dir)
+
+    def smooth(self, method):
+        sigmas = [0, 0, SIGMA]
+        if method == 'along_z':
+            # reference: smoothing along z (slices of 1 mm), ignoring the curvature of the cord
+            return gaussian_filter(Image(self.fname_data).data, sigmas)
+        if method == 'ants':
+            curdir = os.getcwd()
+            os.chdir(self.tmp_dir)
+            try:
+                sct.run(['sct_straighten_spinalcord', '-i', 'data.nii', '-s', 'seg.nii', '-o', 'data_straight.nii',
+                         '-x', 'spline', '-v', '0'], verbose=0)
+                sct.run(['sct_maths', '-i', 'data_straight.nii', '-smooth', ','.join(str(s) for s in sigmas),
+                         '-o', 'data_straight_smooth.nii', '-v', '0'], verbose=0)
+                sct.run(['sct_apply_transfo', '-i', 'data_straight_smooth.nii', '-d', 'data.nii', '-w',
+                         'warp_straight2curve.nii.gz', '-o', 'data_smooth.nii', '-x', 'spline', '-v', '0'], verbose=0)
+                data_smooth = Image('data_smooth.nii').data
+                data = Image('data.nii').data
+                data_smooth[data_smooth == 0] = data[data_smooth == 0]
+            finally:
+                os.chdir(curdir)
+            return data_smooth
+        im_data = Image(self.fname_data)
+        native_orientation = im_data.orientation
+        im_data.change_orientation('RPI')
+        _, arr_ctl, _, _ = get_centerline(Image(self.fname_seg).change_orientation('RPI'), ParamCenterline(),
+                                          verbose=0)
+        space = CurvedSpace(arr_ctl, im_data.dim[4:7], im_data.data.shape)
+        if method == 'direct':
+            im_data.data = space.smooth_direct(im_data.data, sigmas)
+        else:
+            im_data.data = space.smooth(im_data.data, sigmas)
+        return im_data.change_orientation(native_orientation).data
+
+    def time_smooth(self, method):
+        self.smooth(method)
+
+    def track_error(self, method):
+        return np.abs(self.smooth(method) - self.data_ref)[self.mask].mean()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for the startup of the SCT commands: a fresh interpreter runs each script with -h, as the launcher
+# (spinalcordtoolbox/compat/launcher.py) does for every command
+#
+# The module can also be run directly to profile the imports of each command with "python -X importtime":
+#   python benchmarks/bench_startup.py [-n 15] [sct_maths sct_register_to_template ...]
+# prints, for each command, the startup time and the imports with the largest cumulative time (top-level imports of
+# the script and of the SCT modules first, nested imports indented as in the -X importtime output).
+
+from __future__ import print_function, absolute_import
+
+import os
+import sys
+import re
+import glob
+import argparse
+import subprocess
+import timeit
+
+from spinalcordtoolbox.utils import __sct_dir__
+
+
+def get_commands():
+    """:return: list of str: name of the SCT commands (scripts/sct_*.py)"""
+    return sorted(os.path.basename(fname)[:-3] for fname in glob.glob(os.path.join(__sct_dir__, 'scripts', 'sct_*.py')))
+
+
+def get_env():
+    """:return: dict: environment of the commands, as set by the launcher"""
+    env = dict(os.environ)
+    env.setdefault('MPLBACKEND', 'Agg')
+    env['PYTHONPATH'] = os.pathsep.join([__sct_dir__, os.path.join(__sct_dir__, 'scripts')] +
+                                        ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+    return env
+
+
+def run_command(command, args=('-h',), importtime=False):
+    """
+    Run a command in a fresh interpreter.
+    :param command: str: name of the command, e.g. 'sct_maths'
+    :param args: list of str: arguments
+    :param importtime: bool: run python with -X importtime
+    :return: subprocess.CompletedProcess (stdout and stderr as str)
+    """
+    cmd = [sys.executable] + (['-X', 'importtime'] if importtime else []) + \
+        [os.path.join(__sct_dir__, 'scripts', command + '.py')] + list(args)
+    return subprocess.run(cmd, env=get_env(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+
+def parse_importtime(stderr):
+    """
+    :param stderr: str: standard error of "python -X importtime"
+    :return: list of (module, depth, self time in s, cumulative time in s), in import order
+    """
+    imports = []
+    for line in stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)', line)
+        if match:
+            imports.append((match.group(4), len(match.group(3)) // 2, int(match.group(1)) / 1e6,
+                            int(match.group(2)) / 1e6))
+    return imports
+
+
+class TimeStartup:
+    params = get_commands()
+    param_names = ['command']
+    timeout = 120
+
+    def time_help(self, command):
+        run_command(command)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Profile the imports of the SCT commands, run with -h.")
+    parser.add_argument('commands', nargs='*', help="Commands to profile. Default: all the commands")
+    parser.add_argument('-n', type=int, default=15, help="Number of imports displayed per command")
+    arguments = parser.parse_args(args)
+    results = []
+    for command in arguments.commands or get_commands():
+        t = min(timeit.repeat(lambda: run_command(command), number=1, repeat=3))
+        proc = run_command(command, importtime=True)
+        status = '' if proc.returncode == 0 else ' (exit status {})'.format(proc.returncode)
+        imports = parse_importtime(proc.stderr)
+        print("\n{}: {:.3f} s{}, {} modules imported".format(command, t, status, len(imports)))
+        for module, depth, _, cumulative in sorted(imports, key=lambda i: -i[3])[:arguments.n]:
+            print("  {:>8.3f} s  {}{}".format(cumulative, '  ' * depth, module))
+        results.append((t, command))
+    print("\nSlowest commands:")
+    for t, command in sorted(results, reverse=True)[:arguments.n]:
+        print("  {:>8.3f} s  {}".format(t, command))
+
+
+if __name__ == "__main__":
+    main()
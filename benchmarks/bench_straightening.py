@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for spinalcordtoolbox.straightening, on dummy tilted segmentations of 64x64 voxels per slice and 64 to
+# 256 slices (spinalcordtoolbox.testing.create_test_data)
+#
+# The straightening applies the warping fields with isct_antsApplyTransforms: the benchmarks are skipped if ANTs
+# binaries are not available.
+
+from __future__ import print_function, absolute_import
+
+import os
+import sys
+import shutil
+import tempfile
+import distutils.spawn
+
+from spinalcordtoolbox.utils import __sct_dir__
+sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+from spinalcordtoolbox.straightening import SpinalCordStraightener
+from spinalcordtoolbox.testing.create_test_data import dummy_segmentation
+
+
+class TimeStraightening:
+    params = [64, 128, 256]
+    param_names = ['nz']
+
+    def setup(self, nz):
+        if distutils.spawn.find_executable('isct_antsApplyTransforms') is None:
+            raise NotImplementedError("ANTs binaries are not available")
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fname_seg = os.path.join(self.tmp_dir, 'seg.nii.gz')
+        dummy_segmentation(size_arr=(64, 64, nz), shape='ellipse', radius_RL=8.0, radius_AP=5.0, angle_RL=15,
+                           angle_AP=10).save(self.fname_seg)
+
+    def teardown(self, nz):
+        shutil.rmtree(self.tmp_dir)
+
+    def time_straighten(self, nz):
+        straightener = SpinalCordStraightener(self.fname_seg, self.fname_seg, verbose=0)
+        straightener.path_output = self.tmp_dir
+        straightener.straighten()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for the loading of template files, as done by each subject of a batch: decompressing the .nii.gz every
+# time, against the memory map of the decompressed copy in the cache (spinalcordtoolbox.template_cache). The template
+# is data/PAM50/template/PAM50_t2.nii.gz if it is installed, otherwise a PAM50-like image (141x141x991, float32).
+
+from __future__ import print_function, absolute_import
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import nibabel
+
+from spinalcordtoolbox import template_cache
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.utils import __data_dir__
+
+
+FNAME_PAM50_T2 = os.path.join(__data_dir__, 'PAM50', 'template', 'PAM50_t2.nii.gz')
+
+
+def dummy_template(fname, shape=(141, 141, 991)):
+    """Smooth PAM50-like T2 image: bright CSF around a dark cord, varying along z, with noise"""
+    np.random.seed(0)
+    x, y = np.mgrid[:shape[0], :shape[1]]
+    radius = np.sqrt((x - 70.) ** 2 + (y - 70.) ** 2)
+    slice_ = np.where(radius < 6, 400., np.where(radius < 12, 1200., 200.))
+    data = slice_[..., np.newaxis] * (1 + 0.2 * np.sin(np.arange(shape[2]) / 50.))
+    data += np.random.normal(0, 5, shape)
+    nibabel.save(nibabel.Nifti1Image(data.astype(np.float32), np.eye(4)), fname)
+
+
+class TimeTemplateLoad:
+    params = [['gzip', 'cache']]
+    param_names = ['mode']
+    timeout = 300
+
+    def setup(self, mode):
+        self.path_tmp = tempfile.mkdtemp(prefix='sct_bench_template_')
+        self.env = os.environ.get(template_cache.ENV_CACHE)
+        self.cached_folders = template_cache.CACHED_FOLDERS
+        if os.path.isfile(FNAME_PAM50_T2):
+            self.fname = FNAME_PAM50_T2
+        else:
+            self.fname = os.path.join(self.path_tmp, 'PAM50_t2.nii.gz')
+            dummy_template(self.fname)
+            template_cache.CACHED_FOLDERS = [self.path_tmp]
+        os.environ[template_cache.ENV_CACHE] = os.path.join(self.path_tmp, 'cache') if mode == 'cache' else '0'
+        # first subject of the batch: fills the cache
+        Image(self.fname)
+
+    def teardown(self, mode):
+        template_cache.CACHED_FOLDERS = self.cached_folders
+        if self.env is None:
+            del os.environ[template_cache.ENV_CACHE]
+        else:
+            os.environ[template_cache.ENV_CACHE] = self.env
+        shutil.rmtree(self.path_tmp)
+
+    def time_load(self, mode):
+        Image(self.fname).data.sum()
+
+    def time_load_slices(self, mode):
+        # e.g. metrics or QC of a few vertebral levels
+        Image(self.fname).data[:, :, 500:530].sum()
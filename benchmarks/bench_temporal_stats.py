@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for spinalcordtoolbox.temporal_stats, on long fMRI-like series (up to 1000 volumes)
+#
+# The peak memory is the peak of numpy allocations (tracemalloc) on top of the memory-mapped input.
+
+from __future__ import print_function, absolute_import
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import nibabel as nib
+
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.temporal_stats import compute_temporal_stats
+
+
+def dummy_fmri(fname, nt):
+    """Uncompressed int16 series of nt volumes of 64x64x24 voxels, written one volume at a time"""
+    shape = (64, 64, 24, nt)
+    header = nib.Nifti1Image(np.zeros((1, 1, 1, 1), dtype=np.int16), np.eye(4)).header
+    header.set_data_shape(shape)
+    header.set_data_offset(352)
+    rs = np.random.RandomState(0)
+    with open(fname, 'wb') as f:
+        header.write_to(f)
+        f.write(b'\x00' * (352 - f.tell()))
+        for it in range(nt):
+            volume = rs.normal(1000, 20, shape[:3]).astype(np.int16)
+            f.write(volume.tobytes(order='F'))
+
+
+class TimeTemporalStats:
+    params = [[200, 1000], ['numpy', 'streaming']]
+    param_names = ['nt', 'method']
+
+    def setup(self, nt, method):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmp_dir, 'fmri.nii')
+        dummy_fmri(self.fname, nt)
+
+    def teardown(self, nt, method):
+        shutil.rmtree(self.tmp_dir)
+
+    def _tsnr(self, method):
+        data = Image(self.fname).data
+        if method == 'numpy':
+            return np.mean(data, 3) / np.std(data, 3, ddof=1)
+        return compute_temporal_stats(data).tsnr()
+
+    def time_tsnr(self, nt, method):
+        self._tsnr(method)
+
+    def peakmem_tsnr(self, nt, method):
+        self._tsnr(method)
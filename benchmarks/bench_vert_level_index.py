@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Benchmarks for the lookup of slices of vertebral levels (spinalcordtoolbox.template), on a PAM50-like labeling
+# (141x141x1100 voxels, 20 levels)
+#
+# The 'loop' method walks all slices for each level, as get_slices_from_vertebral_levels() used to.
+
+from __future__ import print_function, absolute_import
+
+import numpy as np
+
+from spinalcordtoolbox import template
+from spinalcordtoolbox.image import Image
+
+
+def dummy_vertlevel(shape=(141, 141, 1100), n_levels=20):
+    data = np.zeros(shape, dtype=np.float32)
+    data[60:80, 60:80, :] = (n_levels - np.arange(shape[2]) * n_levels // shape[2])[np.newaxis, np.newaxis, :]
+    return Image(data)
+
+
+def get_slices_loop(data_vertlevel, level):
+    slices = []
+    for iz in range(data_vertlevel.shape[-1]):
+        data_vertlevel_nonzero = data_vertlevel[..., iz].flatten()[np.nonzero(data_vertlevel[..., iz].flatten())]
+        data_vertlevel_nonzero_finite = [i for i in data_vertlevel_nonzero if np.isfinite(i)]
+        if not data_vertlevel_nonzero_finite == []:
+            if int(np.round(np.mean(data_vertlevel_nonzero_finite))) == level:
+                slices.append(iz)
+    return slices
+
+
+class TimeVertLevelIndex:
+    params = [['loop', 'index', 'index_cached']]
+    param_names = ['method']
+
+    def setup(self, method):
+        self.im_vertlevel = dummy_vertlevel()
+        template._vert_level_index_cache.clear()
+        if method == 'index_cached':
+            template.get_vert_level_index(self.im_vertlevel)
+
+    def time_slices_of_levels(self, method):
+        """Slices of 3 levels, as with sct_process_segmentation -vert 2:4"""
+        for level in [2, 3, 4]:
+            if method == 'loop':
+                get_slices_loop(self.im_vertlevel.data, level)
+            else:
+                if method == 'index':
+                    template._vert_level_index_cache.clear()
+                template.get_slices_from_vertebral_levels(self.im_vertlevel, level)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Run the benchmarks, on the working tree or on two commits to flag the regressions
+#
+# The benchmarks (benchmarks/bench_*.py) follow the airspeed velocity (asv) conventions: classes with params,
+# param_names, setup() and teardown(), and time_*, peakmem_*, mem_* and track_* methods. They are run against the code
+# of each commit, which is extracted with "git archive" into a temporary folder, in a separate process. Time benchmarks
+# (time_*) report the minimum over a few repeats, peak memory benchmarks (peakmem_*) report the peak of the Python and
+# numpy allocations (tracemalloc) during the call, memory benchmarks (mem_*) the size of the returned object, and
+# track_* benchmarks the returned value. A benchmark is flagged when the ratio between the two commits exceeds the
+# threshold. Benchmarks skipped in setup (NotImplementedError, e.g. missing ANTs binaries) or failing on one of the
+# commits are listed but not compared.
+#
+# Examples:
+#   python benchmarks/compare.py -run-only -b bench_image          # run the benchmarks on the working tree
+#   python benchmarks/compare.py master HEAD
+#   python benchmarks/compare.py -b "bench_image|TimeQc" -t 0.2 master .   # "." is the working tree
+
+from __future__ import print_function, absolute_import
+
+import os
+import sys
+import re
+import json
+import shutil
+import argparse
+import itertools
+import subprocess
+import tempfile
+import tarfile
+import timeit
+import tracemalloc
+import importlib.util
+import inspect
+
+
+PATH_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+PATH_REPO = os.path.dirname(PATH_BENCHMARKS)
+BENCHMARK_PREFIXES = ('time_', 'peakmem_', 'mem_', 'track_')
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Run the benchmarks on two commits of the repository, and flag the benchmarks whose time or peak "
+                    "memory increased by more than a threshold. Exit with status 1 if there are regressions. With "
+                    "-run-only, run the benchmarks on the working tree only.")
+    parser.add_argument('base', nargs='?', help="Reference commit (any git revision).")
+    parser.add_argument('new', nargs='?', default='HEAD',
+                        help="Commit to compare to the reference. Use '.' for the working tree. Default: HEAD")
+    parser.add_argument('-b', dest='bench', default='',
+                        help="Regular expression: only run the benchmarks whose name (e.g. "
+                             "bench_image.TimeImage.time_load) matches.")
+    parser.add_argument('-t', dest='threshold', type=float, default=0.1,
+                        help="Relative change above which a benchmark is flagged. Default: 0.1 (10%%)")
+    parser.add_argument('-repeat', type=int, default=3,
+                        help="Number of repeats of time benchmarks, the minimum is kept. Default: 3")
+    parser.add_argument('-o', dest='fname_out', default='',
+                        help="JSON file to write the results (of both commits) to.")
+    parser.add_argument('-run-only', action='store_true',
+                        help="Only run the benchmarks on the working tree, without comparing commits.")
+    # internal: run the benchmarks against the code of the current python path
+    parser.add_argument('-run', dest='fname_run', default='', help=argparse.SUPPRESS)
+    return parser
+
+
+def _get_param_combinations(bench_class):
+    """
+    Combinations of parameters of a benchmark class, following the asv conventions: params is either a list of values
+    of a single parameter, or a list of lists of values.
+    :return: list of tuples
+    """
+    params = getattr(bench_class, 'params', None)
+    if not params:
+        return [()]
+    if not isinstance(params[0], list):
+        params = [params]
+    return list(itertools.product(*params))
+
+
+def _get_name(module_name, bench_class, method_name, param_values):
+    param_names = getattr(bench_class, 'param_names', [])
+    args = ', '.join('{}={}'.format(name, value) for name, value in zip(param_names, param_values))
+    return '{}.{}.{}({})'.format(module_name, bench_class.__name__, method_name, args)
+
+
+def _get_size(obj):
+    """:return: int: size in bytes of the object returned by a mem_* benchmark (numpy array or scipy sparse matrix)"""
+    if hasattr(obj, 'indptr'):
+        return sum(getattr(obj, name).nbytes for name in ['data', 'indices', 'indptr'])
+    if hasattr(obj, 'nbytes'):
+        return obj.nbytes
+    return sys.getsizeof(obj)
+
+
+def run_method(bench, method, param_values, repeat):
+    """
+    Run a benchmark method.
+    :return: tuple: value, unit
+    """
+    func = getattr(bench, method)
+    if method.startswith('time_'):
+        return min(timeit.repeat(lambda: func(*param_values), number=1, repeat=repeat)), 's'
+    if method.startswith('peakmem_'):
+        tracemalloc.start()
+        try:
+            func(*param_values)
+            return float(tracemalloc.get_traced_memory()[1]), 'B'
+        finally:
+            tracemalloc.stop()
+    if method.startswith('mem_'):
+        return float(_get_size(func(*param_values))), 'B'
+    return float(func(*param_values)), getattr(func, 'unit', '')
+
+
+def run_benchmarks(path_benchmarks, pattern='', repeat=3):
+    """
+    Run the benchmarks of a folder, in the current process.
+    :param path_benchmarks: str: folder with the bench_*.py modules
+    :param pattern: str: regular expression, only run the benchmarks whose name matches
+    :param repeat: int: number of repeats of time benchmarks
+    :return: dict: {name: {'value': float or None, 'unit': 's', 'B' or the unit of track_* benchmarks,
+        'status': 'ok', 'skipped' or 'failed: ...'}}
+    """
+    results = {}
+    regex = re.compile(pattern)
+    for fname in sorted(os.listdir(path_benchmarks)):
+        if not (fname.startswith('bench_') and fname.endswith('.py')):
+            continue
+        module_name = fname[:-3]
+        try:
+            spec = importlib.util.spec_from_file_location(module_name, os.path.join(path_benchmarks, fname))
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        except Exception as e:
+            # e.g. the benchmark uses an API that does not exist in this commit
+            if not pattern or _module_may_match(os.path.join(path_benchmarks, fname), regex, module_name):
+                results[module_name] = {'value': None, 'unit': '', 'status': 'failed: {!r}'.format(e)}
+            continue
+        for _, bench_class in inspect.getmembers(module, inspect.isclass):
+            if bench_class.__module__ != module_name:
+                continue
+            methods = [name for name in sorted(dir(bench_class)) if name.startswith(BENCHMARK_PREFIXES)]
+            for param_values in _get_param_combinations(bench_class):
+                names = dict((method, _get_name(module_name, bench_class, method, param_values))
+                             for method in methods)
+                methods_run = [method for method in methods if regex.search(names[method])]
+                if methods_run:
+                    results.update(_run_benchmark(bench_class(), methods_run, names, param_values, repeat))
+    return results
+
+
+def _run_benchmark(bench, methods, names, param_values, repeat):
+    """Run the methods of a benchmark for a combination of parameters, between setup() and teardown()"""
+    results = {}
+    try:
+        try:
+            if hasattr(bench, 'setup'):
+                bench.setup(*param_values)
+        except NotImplementedError:
+            return dict((names[method], {'value': None, 'unit': '', 'status': 'skipped'}) for method in methods)
+        except Exception as e:
+            # e.g. the setup uses an API that does not exist in this commit
+            return dict((names[method], {'value': None, 'unit': '', 'status': 'failed: {!r}'.format(e)})
+                        for method in methods)
+        for method in methods:
+            try:
+                value, unit = run_method(bench, method, param_values, repeat)
+                results[names[method]] = {'value': value, 'unit': unit, 'status': 'ok'}
+            except Exception as e:
+                results[names[method]] = {'value': None, 'unit': '', 'status': 'failed: {!r}'.format(e)}
+            print("{}: {}".format(names[method], _format(results[names[method]])), file=sys.stderr)
+    finally:
+        if hasattr(bench, 'teardown'):
+            try:
+                bench.teardown(*param_values)
+            except Exception as e:
+                print("{}: teardown failed: {!r}".format(names[methods[0]], e), file=sys.stderr)
+    return results
+
+
+def _module_may_match(fname, regex, module_name):
+    """Whether a benchmark of a module that cannot be imported matches the pattern, based on its source"""
+    with open(fname) as f:
+        source = f.read()
+    classes = re.findall(r'^class (\w+)', source, re.MULTILINE)
+    methods = re.findall(r'def ((?:time|peakmem|mem|track)_\w+)', source)
+    return any(regex.search('{}.{}.{}'.format(module_name, c, m)) for c in classes for m in methods)
+
+
+def _format(result):
+    if result['status'] != 'ok':
+        return result['status']
+    if result['unit'] == 'B':
+        return '{:.1f} MB'.format(result['value'] / 1024. ** 2)
+    return '{:.4g} {}'.format(result['value'], result['unit']).strip()
+
+
+def export_tree(commit, path_out):
+    """
+    Extract the files of a commit into a folder.
+    :param commit: str: git revision
+    :param path_out: str: output folder
+    """
+    proc = subprocess.Popen(['git', 'archive', '--format=tar', commit], cwd=PATH_REPO, stdout=subprocess.PIPE)
+    with tarfile.open(fileobj=proc.stdout, mode='r|') as tar:
+        tar.extractall(path_out)
+    if proc.wait() != 0:
+        raise ValueError("Could not export commit: {}".format(commit))
+
+
+def run_commit(commit, pattern, repeat):
+    """
+    Run the benchmarks of the current tree against the code of a commit, in a separate process.
+    :param commit: str: git revision, or '.' for the working tree
+    :return: dict: see run_benchmarks()
+    """
+    path_tmp = tempfile.mkdtemp(prefix='sct_benchmarks_')
+    try:
+        if commit == '.':
+            path_code = PATH_REPO
+        else:
+            path_code = os.path.join(path_tmp, 'code')
+            export_tree(commit, path_code)
+        fname_results = os.path.join(path_tmp, 'results.json')
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([path_code, os.path.join(path_code, 'scripts')] +
+                                            ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+        print("Running benchmarks on {}...".format(commit))
+        cmd = [sys.executable, os.path.abspath(__file__), commit, '-run', fname_results, '-b', pattern,
+               '-repeat', str(repeat)]
+        subprocess.check_call(cmd, cwd=path_tmp, env=env)
+        with open(fname_results) as f:
+            return json.load(f)
+    finally:
+        shutil.rmtree(path_tmp)
+
+
+def compare(results_base, results_new, threshold):
+    """
+    :param results_base, results_new: dict: see run_benchmarks()
+    :param threshold: float: relative change above which a benchmark is flagged
+    :return: list of (flag, name, result_base, result_new, ratio), flag is 'regression', 'improvement', '' or
+        'not compared'
+    """
+    rows = []
+    for name in sorted(set(results_base) | set(results_new)):
+        result_base = results_base.get(name, {'value': None, 'unit': '', 'status': 'missing'})
+        result_new = results_new.get(name, {'value': None, 'unit': '', 'status': 'missing'})
+        if result_base['status'] != 'ok' or result_new['status'] != 'ok':
+            rows.append(('not compared', name, result_base, result_new, None))
+            continue
+        ratio = result_new['value'] / result_base['value'] if result_base['value'] > 0 else \
+            (1. if result_new['value'] == 0 else float('inf'))
+        if ratio > 1 + threshold:
+            flag = 'regression'
+        elif ratio < 1. / (1 + threshold):
+            flag = 'improvement'
+        else:
+            flag = ''
+        rows.append((flag, name, result_base, result_new, ratio))
+    return rows
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    arguments = get_parser().parse_args(args)
+
+    if arguments.fname_run:
+        results = run_benchmarks(PATH_BENCHMARKS, arguments.bench, arguments.repeat)
+        with open(arguments.fname_run, 'w') as f:
+            json.dump(results, f)
+        return 0
+
+    if arguments.run_only:
+        results = run_commit('.', arguments.bench, arguments.repeat)
+        if arguments.fname_out:
+            with open(arguments.fname_out, 'w') as f:
+                json.dump(results, f, indent=2)
+        print()
+        for name in sorted(results):
+            print("{:>14}  {}".format(_format(results[name]).split(':')[0], name))
+            if results[name]['status'].startswith('failed'):
+                print("  {}".format(results[name]['status']))
+        return 1 if any(result['status'].startswith('failed') for result in results.values()) else 0
+
+    if arguments.base is None:
+        get_parser().error("the reference commit is required, unless -run-only is used")
+    results_base = run_commit(arguments.base, arguments.bench, arguments.repeat)
+    results_new = run_commit(arguments.new, arguments.bench, arguments.repeat)
+    if arguments.fname_out:
+        with open(arguments.fname_out, 'w') as f:
+            json.dump({arguments.base: results_base, arguments.new: results_new}, f, indent=2)
+
+    rows = compare(results_base, results_new, arguments.threshold)
+    symbols = {'regression': '+', 'improvement': '-', '': ' ', 'not compared': 'x'}
+    print("\n{} {:>14} {:>14} {:>7}  benchmark".format(' ', arguments.base[:14], arguments.new[:14], 'ratio'))
+    for flag, name, result_base, result_new, ratio in sorted(rows, key=lambda row: (row[0] != 'regression', row[1])):
+        print("{} {:>14} {:>14} {:>7}  {}".format(symbols[flag], _format(result_base).split(':')[0],
+                                                   _format(result_new).split(':')[0],
+                                                   '' if ratio is None else '{:.2f}'.format(ratio), name))
+        for result in [result_base, result_new]:
+            if result['status'].startswith('failed'):
+                print("  {}".format(result['status']))
+    n_regressions = sum(row[0] == 'regression' for row in rows)
+    print("\n{} regression(s), {} improvement(s) above {:.0f}%, {} benchmark(s) not compared".format(
+        n_regressions, sum(row[0] == 'improvement' for row in rows), 100 * arguments.threshold,
+        sum(row[0] == 'not compared' for row in rows)))
+    return 1 if n_regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
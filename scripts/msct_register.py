@@ -21,12 +21,11 @@ from math import asin, cos, sin, acos
 import numpy as np
 from tqdm import tqdm
 
-from scipy import ndimage
-from scipy.signal import argrelmax, medfilt
-from scipy.io import loadmat
 from nibabel import load, Nifti1Image, save
 
 from spinalcordtoolbox.image import Image, find_zmin_zmax, spatial_crop
+from spinalcordtoolbox.tracing import traced
+from spinalcordtoolbox.utils import lazy_import
 
 import sct_utils as sct
 import sct_apply_transfo
@@ -35,6 +34,10 @@ from sct_convert import convert
 from sct_image import split_data, concat_warp2d
 from msct_register_landmarks import register_landmarks
 
+ndimage = lazy_import('scipy.ndimage')
+scipy_io = lazy_import('scipy.io')
+scipy_signal = lazy_import('scipy.signal')
+
 logger = logging.getLogger(__name__)
 
 
@@ -132,6 +135,7 @@ class ParamregMultiStep:
             sct.printv("ERROR: parameters must contain a type, either 'im' or 'seg'", 1, 'error')
 
 
+@traced
 def register_wrapper(fname_src, fname_dest, param, paramregmulti, fname_src_seg='', fname_dest_seg='', fname_src_label='',
                      fname_dest_label='', fname_mask='', fname_initwarp='', fname_initwarpinv='', identity=False,
                      interp='linear', fname_output='', fname_output_warp='', path_out='', same_space=False):
@@ -359,6 +363,7 @@ def register_wrapper(fname_src, fname_dest, param, paramregmulti, fname_src_seg=
 
 # register images
 # ==========================================================================================
+@traced
 def register(src, dest, paramregmulti, param, i_step_str):
     """
     Register src onto dest image. Output affine transformations that need to be inverted will have the prefix "-".
@@ -1333,7 +1338,7 @@ def register2d(fname_src, fname_dest, fname_mask='', fname_warp='warp_forward.ni
 
             if paramreg.algo in ['Translation']:
                 file_mat = prefix_warp2d + '0GenericAffine.mat'
-                matfile = loadmat(file_mat, struct_as_record=True)
+                matfile = scipy_io.loadmat(file_mat, struct_as_record=True)
                 array_transfo = matfile['AffineTransform_double_2_2']
                 x_displacement[i] = array_transfo[4][0]  # Tx in ITK'S coordinate system
                 y_displacement[i] = array_transfo[5][0]  # Ty  in ITK'S and fslview's coordinate systems
@@ -1632,7 +1637,7 @@ def find_angle_hog(image, centermass, px, py, angle_range=10):
     angle_found = repr_hist[index_angle_found] / 2
     angle_found_score = np.amax(grad_orient_histo_conv_restrained)
     # Finding other maxima to compute confidence score
-    arg_maxs = argrelmax(grad_orient_histo_conv_restrained, order=kmedian_size, mode='wrap')[0]
+    arg_maxs = scipy_signal.argrelmax(grad_orient_histo_conv_restrained, order=kmedian_size, mode='wrap')[0]
     # Confidence score is the ratio of the 2 first maxima :
     if len(arg_maxs) > 1:
         conf_score = angle_found_score / grad_orient_histo_conv_restrained[arg_maxs[1]]
@@ -1719,7 +1724,7 @@ def circular_filter_1d(signal, window_size, kernel='gaussian'):
     if kernel == 'gaussian':
         signal_extended_smooth = ndimage.gaussian_filter(signal_extended, window_size)  # gaussian
     elif kernel == 'median':
-        signal_extended_smooth = medfilt(signal_extended, window_size)  # median filtering
+        signal_extended_smooth = scipy_signal.medfilt(signal_extended, window_size)  # median filtering
     else:
         raise Exception("Unknow type of kernel")
 
@@ -14,16 +14,17 @@ import os, math, sys, pickle, shutil
 import argparse
 
 import numpy as np
-import pandas as pd
-from skimage.measure import label
 
 from spinalcordtoolbox.image import Image
 from spinalcordtoolbox.centerline.core import ParamCenterline, get_centerline
-from spinalcordtoolbox.utils import Metavar, SmartFormatter, ActionCreateFolder
+from spinalcordtoolbox.utils import Metavar, SmartFormatter, ActionCreateFolder, lazy_import
 
 import sct_utils as sct
 from sct_utils import extract_fname, printv, tmp_create
 
+pd = lazy_import('pandas')
+skimage_measure = lazy_import('skimage.measure')
+
 
 def get_parser():
     # Initialize the parser
@@ -450,7 +451,7 @@ class AnalyzeLeion:
         printv('\nLabel connected regions of the masked image...', self.verbose, 'normal')
         im = Image(self.fname_mask)
         im_2save = im.copy()
-        im_2save.data = label(im.data, connectivity=2)
+        im_2save.data = skimage_measure.label(im.data, connectivity=2)
         im_2save.save(self.fname_label)
 
         self.measure_pd['label'] = [l for l in np.unique(im_2save.data) if l]
@@ -16,16 +16,21 @@
 
 from __future__ import division, absolute_import
 
-import sys, io, os, time, functools
+import sys, io, os, time, functools, multiprocessing
 import argparse
 
+import numpy as np
+
 from spinalcordtoolbox.utils import Metavar, SmartFormatter
 from spinalcordtoolbox.image import Image
 from spinalcordtoolbox.cropping import ImageCropper
 from spinalcordtoolbox.math import dilate
 
+from spinalcordtoolbox.warping import WarpPlan, INTERPOLATION_ORDER
+from spinalcordtoolbox.tracing import traced
+
 import sct_utils as sct
-import sct_image
+from sct_label_utils import ProcessLabels
 
 
 # PARSER
@@ -34,7 +39,8 @@ def get_parser():
     # parser initialisation
 
     parser = argparse.ArgumentParser(
-        description='Apply transformations. This function is a wrapper for antsApplyTransforms (ANTs).',
+        description='Apply transformations. This function is a wrapper for antsApplyTransforms (ANTs). 4D images are '
+                    'warped in-process: the transformations are composed once, then applied to each volume.',
         add_help=None,
         formatter_class=SmartFormatter,
         prog=os.path.basename(__file__).strip(".py")
@@ -119,7 +125,7 @@ def get_parser():
 
 class Transform:
     def __init__(self, input_filename, fname_dest, list_warp, list_warpinv=[], output_filename='', verbose=0, crop=0,
-                 interp='spline', remove_temp_files=1, debug=0):
+                 interp='spline', remove_temp_files=1, debug=0, n_jobs=None):
         self.input_filename = input_filename
         self.list_warp = list_warp
         self.list_warpinv = list_warpinv
@@ -130,7 +136,9 @@ class Transform:
         self.verbose = verbose
         self.remove_temp_files = remove_temp_files
         self.debug = debug
+        self.n_jobs = n_jobs  # threads used to warp the volumes of 4d images (None: all available cores)
 
+    @traced
     def apply(self):
         # Initialization
         fname_src = self.input_filename  # source image (moving)
@@ -185,7 +193,6 @@ class Transform:
 
         # Extract path, file and extension
         path_src, file_src, ext_src = sct.extract_fname(fname_src)
-        path_dest, file_dest, ext_dest = sct.extract_fname(fname_dest)
 
         # Get output folder and file name
         if fname_out == '':
@@ -226,69 +233,26 @@ class Transform:
                      '-t'
                      ] + fname_warp_list_invert + ['-r', fname_dest] + interp, verbose=verbose, is_sct_binary=True)
 
-        # if 4d, loop across the T dimension
+        # if 4d, warp all volumes in-process: the transformations are composed once, then applied to each volume
         else:
-            if islabel:
-                raise NotImplementedError
-
             dim = '4'
-            path_tmp = sct.tmp_create(basename="apply_transfo", verbose=verbose)
-
-            # convert to nifti into temp folder
-            sct.printv('\nCopying input data to tmp folder and convert to nii...', verbose)
-            img_src.save(os.path.join(path_tmp, "data.nii"))
-            sct.copy(fname_dest, os.path.join(path_tmp, file_dest + ext_dest))
-            fname_warp_list_tmp = []
-            for fname_warp in list_warp:
-                path_warp, file_warp, ext_warp = sct.extract_fname(fname_warp)
-                sct.copy(fname_warp, os.path.join(path_tmp, file_warp + ext_warp))
-                fname_warp_list_tmp.append(file_warp + ext_warp)
-            fname_warp_list_invert_tmp = fname_warp_list_tmp[::-1]
-
-            curdir = os.getcwd()
-            os.chdir(path_tmp)
-
-            # split along T dimension
-            sct.printv('\nSplit along T dimension...', verbose)
-
-            im_dat = Image('data.nii')
-            im_header = im_dat.hdr
-            data_split_list = sct_image.split_data(im_dat, 3)
-            for im in data_split_list:
-                im.save()
-
-            # apply transfo
+            sct.printv('\nCompose transformations...', verbose)
+            im_dest = Image(fname_dest)
+            plan = WarpPlan.from_files(list_warp, img_src, im_dest, list_warpinv=self.list_warpinv)
+
+            # labels are warped with nearest neighbour interpolation, so that their values are preserved
             sct.printv('\nApply transformation to each 3D volume...', verbose)
-            for it in range(nt):
-                file_data_split = 'data_T' + str(it).zfill(4) + '.nii'
-                file_data_split_reg = 'data_reg_T' + str(it).zfill(4) + '.nii'
-
-                status, output = sct.run(['isct_antsApplyTransforms',
-                                          '-d', '3',
-                                          '-i', file_data_split,
-                                          '-o', file_data_split_reg,
-                                          '-t',
-                                          ] + fname_warp_list_invert_tmp + [
-                    '-r', file_dest + ext_dest,
-                ] + interp, verbose, is_sct_binary=True)
-
-            # Merge files back
-            sct.printv('\nMerge file back...', verbose)
-            import glob
-            path_out, name_out, ext_out = sct.extract_fname(fname_out)
-            # im_list = [Image(file_name) for file_name in glob.glob('data_reg_T*.nii')]
-            # concat_data use to take a list of image in input, now takes a list of file names to open the files one by one (see issue #715)
-            fname_list = glob.glob('data_reg_T*.nii')
-            fname_list.sort()
-            im_out = sct_image.concat_data(fname_list, 3, im_header['pixdim'])
-            im_out.save(name_out + ext_out)
-
-            os.chdir(curdir)
-            sct.generate_output_file(os.path.join(path_tmp, name_out + ext_out), fname_out)
-            # Delete temporary folder if specified
-            if remove_temp_files:
-                sct.printv('\nRemove temporary files...', verbose)
-                sct.rmtree(path_tmp, verbose=verbose)
+            order = INTERPOLATION_ORDER[self.interp]
+            n_jobs = multiprocessing.cpu_count() if self.n_jobs is None else self.n_jobs
+            data_reg = plan.apply(img_src.data, order=order, mode='constant', n_jobs=n_jobs)
+
+            # output is in the destination space, with the 4th dimension of the source, and saved as float32 (as
+            # isct_antsApplyTransforms does) whatever the data type of the destination
+            hdr_out = im_dest.hdr.copy()
+            hdr_out['pixdim'][4] = img_src.hdr['pixdim'][4]
+            hdr_out.set_data_dtype(np.float32)
+            hdr_out.set_slope_inter(1, 0)
+            Image(data_reg.astype(np.float32), hdr=hdr_out).save(fname_out, verbose=0)
 
         # Copy affine matrix from destination space to make sure qform/sform are the same
         sct.printv("Copy affine matrix from destination space to make sure qform/sform are the same.", verbose)
@@ -296,12 +260,10 @@ class Transform:
         im_src_reg.copy_qform_from_ref(Image(fname_dest))
         im_src_reg.save(verbose=0)  # set verbose=0 to avoid warning message about rewriting file
 
-        if islabel:
+        # labels were dilated before being warped in 3D (in 4D, they are warped with nearest neighbour interpolation)
+        if islabel and nt == 1:
             sct.printv("\nTake the center of mass of each registered dilated labels...")
-            sct.run(['sct_label_utils',
-                     '-i', fname_out,
-                     '-o', fname_out,
-                     '-cubic-to-point'])
+            ProcessLabels(fname_out, verbose=verbose).cubic_to_point().save(fname_out, verbose=0)
             if remove_temp_files:
                 sct.printv('\nRemove temporary files...', verbose)
                 sct.rmtree(path_tmp, verbose=verbose)
@@ -18,7 +18,8 @@ import sys
 import numpy as np
 import os
 import argparse
-from spinalcordtoolbox.image import Image, empty_like
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.temporal_stats import compute_temporal_stats, snr_in_roi
 from spinalcordtoolbox.utils import parse_num_list
 import sct_utils as sct
 from spinalcordtoolbox.utils import Metavar, SmartFormatter
@@ -128,11 +129,12 @@ def main():
         if not fname_mask:
             sct.printv('You need to provide a mask with -method diff. Exit.', 1, type='error')
 
-    # Load data and orient to RPI
-    im_data = Image(fname_data).change_orientation('RPI')
+    # Load data. The data are kept in their native orientation, so that uncompressed series stay memory-mapped and
+    # are only read chunk by chunk.
+    im_data = Image(fname_data)
     data = im_data.data
     if fname_mask:
-        mask = Image(fname_mask).change_orientation('RPI').data
+        mask = Image(fname_mask).change_orientation(im_data.orientation).data
 
     # Retrieve selected volumes
     if index_vol_user:
@@ -148,31 +150,27 @@ def main():
     # Compute SNR
     # NB: "time" is assumed to be the 4th dimension of the variable "data"
     if method == 'mult':
-        # Compute mean and STD across time
-        data_mean = np.mean(data[:, :, :, index_vol], axis=3)
-        data_std = np.std(data[:, :, :, index_vol], axis=3, ddof=1)
+        # Compute mean and STD across time, in a single pass over the selected volumes
+        stats = compute_temporal_stats(data, volumes=index_vol)
+        data_mean = stats.mean
+        data_std = stats.std()
         # Generate mask where std is different from 0
         mask_std_nonzero = np.where(data_std > param.almost_zero)
         snr_map = np.zeros_like(data_mean)
         snr_map[mask_std_nonzero] = data_mean[mask_std_nonzero] / data_std[mask_std_nonzero]
-        # Output SNR map
+        # Output SNR map (in RPI orientation)
         fname_snr = sct.add_suffix(fname_data, '_SNR-' + method)
-        im_snr = empty_like(im_data)
-        im_snr.data = snr_map
+        im_snr = Image(snr_map, hdr=im_data.hdr.copy()).change_orientation('RPI')
         im_snr.save(fname_snr, dtype=np.float32)
         # Output non-zero mask
         fname_stdnonzero = sct.add_suffix(fname_data, '_mask-STD-nonzero' + method)
-        im_stdnonzero = empty_like(im_data)
         data_stdnonzero = np.zeros_like(data_mean)
         data_stdnonzero[mask_std_nonzero] = 1
-        im_stdnonzero.data = data_stdnonzero
+        im_stdnonzero = Image(data_stdnonzero, hdr=im_data.hdr.copy()).change_orientation('RPI')
         im_stdnonzero.save(fname_stdnonzero, dtype=np.float32)
         # Compute SNR in ROI
         if fname_mask:
-            mean_in_roi = np.average(data_mean[mask_std_nonzero], weights=mask[mask_std_nonzero])
-            std_in_roi = np.average(data_std[mask_std_nonzero], weights=mask[mask_std_nonzero])
-            snr_roi = mean_in_roi / std_in_roi
-            # snr_roi = np.average(snr_map[mask_std_nonzero], weights=mask[mask_std_nonzero])
+            snr_roi = snr_in_roi(stats, mask, almost_zero=param.almost_zero)
 
     elif method == 'diff':
         data_2vol = np.take(data, index_vol, axis=3)
@@ -23,13 +23,14 @@ import argparse
 import numpy as np
 
 import nibabel
-from scipy import ndimage
 
 import sct_utils as sct
 import spinalcordtoolbox.image as msct_image
 from spinalcordtoolbox.image import Image
 from sct_image import concat_data
-from spinalcordtoolbox.utils import Metavar, SmartFormatter
+from spinalcordtoolbox.utils import Metavar, SmartFormatter, lazy_import
+
+ndimage = lazy_import('scipy.ndimage')
 
 
 # DEFAULT PARAMETERS
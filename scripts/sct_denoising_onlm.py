@@ -111,26 +111,19 @@ def main(file_to_denoise, param, output_file_name) :
     # mask = data[:, :, :] > noise_threshold
     # data = data[:, :, :]
 
-    from dipy.denoise.nlmeans import nlmeans
+    from spinalcordtoolbox.math import denoise_nlmeans
 
+    rician = param.parameter == 'Rician'
     if arguments.std is not None:
         sigma = std_noise
-        # Application of NLM filter to the image
-        sct.printv('Applying Non-local mean filter...')
-        if param.parameter == 'Rician':
-            den = nlmeans(data, sigma=sigma, mask=None, rician=True, block_radius=block_radius)
-        else :
-            den = nlmeans(data, sigma=sigma, mask=None, rician=False, block_radius=block_radius)
+        mask = None
     else:
         # # Process for manual detecting of background
         mask = data > noise_threshold
         sigma = np.std(data[~mask])
-        # Application of NLM filter to the image
-        sct.printv('Applying Non-local mean filter...')
-        if param.parameter == 'Rician':
-            den = nlmeans(data, sigma=sigma, mask=mask, rician=True, block_radius=block_radius)
-        else:
-            den = nlmeans(data, sigma=sigma, mask=mask, rician=False, block_radius=block_radius)
+    # Application of NLM filter to the image (chunks which do not overlap the mask are skipped)
+    sct.printv('Applying Non-local mean filter...')
+    den = denoise_nlmeans(data, sigma=sigma, mask=mask, rician=rician, block_radius=block_radius)
 
     t = time()
     sct.printv("total time: %s" % (time() - t))
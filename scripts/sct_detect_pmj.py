@@ -15,7 +15,6 @@ from __future__ import print_function, absolute_import, division
 import os
 import sys
 import numpy as np
-from scipy.ndimage.measurements import center_of_mass
 import nibabel as nib
 import argparse
 
@@ -23,7 +22,9 @@ import spinalcordtoolbox.image as msct_image
 from spinalcordtoolbox.image import Image
 
 import sct_utils as sct
-from spinalcordtoolbox.utils import Metavar, SmartFormatter, ActionCreateFolder
+from spinalcordtoolbox.utils import Metavar, SmartFormatter, ActionCreateFolder, lazy_import
+
+ndimage = lazy_import('scipy.ndimage')
 
 
 def get_parser():
@@ -224,7 +225,7 @@ class DetectPMJ:
 
             z_mid_slice = img_seg.data[:, int(img_seg.dim[1] / 2), :]
             if 1 in z_mid_slice:  # if SC segmentation available at this slice
-                self.rl_coord = int(center_of_mass(z_mid_slice)[1])  # Right_left coordinate
+                self.rl_coord = int(ndimage.center_of_mass(z_mid_slice)[1])  # Right_left coordinate
             else:
                 self.rl_coord = int(img_seg.dim[2] / 2)
             del img_seg
@@ -15,12 +15,13 @@ import sys
 import argparse
 import numpy as np
 
-from dipy.data.fetcher import read_bvals_bvecs
-from spinalcordtoolbox.utils import Metavar, SmartFormatter
+from spinalcordtoolbox.utils import Metavar, SmartFormatter, lazy_import
 from spinalcordtoolbox.image import Image, concat_data
 
 import sct_utils as sct
 
+fetcher = lazy_import('dipy.data.fetcher')
+
 
 def get_parser():
     parser = argparse.ArgumentParser(
@@ -132,7 +133,7 @@ def main(args=None):
             bvec = np.array([[0.0, 0.0, 0.0]] * n_b0)
         elif arguments.order[i_item] == 'dwi':
             # read bval/bvec files
-            bval, bvec = read_bvals_bvecs(arguments.bval[i_dwi], arguments.bvec[i_dwi])
+            bval, bvec = fetcher.read_bvals_bvecs(arguments.bval[i_dwi], arguments.bvec[i_dwi])
             i_dwi += 1
         # Concatenate bvals
         bvals_concat += ' '.join(str(v) for v in bval)
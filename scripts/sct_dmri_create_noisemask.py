@@ -14,11 +14,13 @@ from __future__ import absolute_import
 
 import sys
 
-from dipy.denoise.noise_estimate import piesno
 import nibabel as nib
 
 import sct_utils as sct
 from msct_parser import Parser
+from spinalcordtoolbox.utils import lazy_import
+
+noise_estimate = lazy_import('dipy.denoise.noise_estimate')
 
 # PARSER
 # ==========================================================================================
@@ -64,7 +66,7 @@ def main(fname_in, freedom_degree, file_output):
     img = nib.load(fname_in)
     data = img.get_data()
 
-    sigma, mask = piesno(data, N=freedom_degree, return_mask=True)
+    sigma, mask = noise_estimate.piesno(data, N=freedom_degree, return_mask=True)
 
     sct.printv('\nWrite NIFTI volumes...')
     output_name = file_output
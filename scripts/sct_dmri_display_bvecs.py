@@ -14,12 +14,12 @@ from __future__ import absolute_import
 
 import sys
 
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-from dipy.data.fetcher import read_bvals_bvecs
-
 import sct_utils as sct
 from msct_parser import Parser
+from spinalcordtoolbox.utils import lazy_import
+
+plt = lazy_import('matplotlib.pyplot')
+fetcher = lazy_import('dipy.data.fetcher')
 
 bzero = 0.0001  # b-zero threshold
 
@@ -61,7 +61,7 @@ def main():
     fname_bvecs = arguments['-bvec']
 
     # Read bvecs
-    bvecs = read_bvals_bvecs(fname_bvecs, None)
+    bvecs = fetcher.read_bvals_bvecs(fname_bvecs, None)
     bvecs = bvecs[0]
     # if first dimension is not equal to 3 (x,y,z), transpose bvecs file
     if not bvecs.shape[0] == 3:
@@ -101,6 +101,7 @@ def main():
     plot_2dscatter(fig_handle=fig, subplot=223, x=bvecs[1][:], y=bvecs[2][:], xlabel='Y', ylabel='Z')
 
     # 3D
+    from mpl_toolkits.mplot3d import Axes3D  # registers the '3d' projection
     ax = fig.add_subplot(224, projection='3d')
     # ax.auto_scale_xyz([-1, 1], [-1, 1], [-1, 1])
     for i in range(0, n_dir):
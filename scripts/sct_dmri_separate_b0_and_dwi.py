@@ -15,7 +15,6 @@
 from __future__ import division, absolute_import
 
 import sys
-import math
 import time
 import os
 
@@ -23,9 +22,7 @@ import numpy as np
 
 import sct_utils as sct
 from spinalcordtoolbox.image import Image
-from sct_image import split_data
 from msct_parser import Parser
-from sct_convert import convert
 
 
 class Param:
@@ -84,7 +81,7 @@ def get_parser():
                       default_value=str(param_default.verbose))
     parser.add_option(name='-r',
                       type_value='multiple_choice',
-                      description='remove temporary files.',
+                      description='remove temporary files. Deprecated: no temporary file is created anymore.',
                       mandatory=False,
                       example=['0', '1'],
                       default_value=str(param_default.remove_temp_files))
@@ -106,10 +103,9 @@ def main(args=None):
 
     fname_data = arguments['-i']
     fname_bvecs = arguments['-bvec']
-    average = arguments['-a']
+    average = int(arguments['-a'])
     verbose = int(arguments.get('-v'))
     sct.init_sct(log_level=verbose, update=True)  # Update log level
-    remove_temp_files = int(arguments['-r'])
     path_out = arguments['-ofolder']
 
     if '-bval' in arguments:
@@ -138,28 +134,19 @@ def main(args=None):
     # Extract path, file and extension
     path_data, file_data, ext_data = sct.extract_fname(fname_data)
 
-    # create temporary folder
-    path_tmp = sct.tmp_create(basename="dmri_separate", verbose=verbose)
-
-    # copy files into tmp folder and convert to nifti
-    sct.printv('\nCopy files into temporary folder...', verbose)
-    ext = '.nii'
-    dmri_name = 'dmri'
+    # Output file names
     b0_name = file_data + '_b0'
     b0_mean_name = b0_name + '_mean'
     dwi_name = file_data + '_dwi'
     dwi_mean_name = dwi_name + '_mean'
+    fname_b0 = os.path.abspath(os.path.join(path_out, b0_name + ext_data))
+    fname_dwi = os.path.abspath(os.path.join(path_out, dwi_name + ext_data))
+    fname_b0_mean = os.path.abspath(os.path.join(path_out, b0_mean_name + ext_data))
+    fname_dwi_mean = os.path.abspath(os.path.join(path_out, dwi_mean_name + ext_data))
 
-    if not convert(fname_data, os.path.join(path_tmp, dmri_name + ext)):
-        sct.printv('ERROR in convert.', 1, 'error')
-    sct.copy(fname_bvecs, os.path.join(path_tmp, "bvecs"), verbose=verbose)
-
-    # go to tmp folder
-    curdir = os.getcwd()
-    os.chdir(path_tmp)
-
-    # Get size of data
-    im_dmri = Image(dmri_name + ext)
+    # Open data. Volumes are accessed through im_dmri.data, which is a memory map for uncompressed NIfTI, so they are
+    # only read when selected below (no split/merge through temporary files).
+    im_dmri = Image(fname_data)
     sct.printv('\nGet dimensions data...', verbose)
     nx, ny, nz, nt, px, py, pz, pt = im_dmri.dim
     sct.printv('.. ' + str(nx) + ' x ' + str(ny) + ' x ' + str(nz) + ' x ' + str(nt), verbose)
@@ -168,55 +155,20 @@ def main(args=None):
     sct.printv(fname_bvals)
     index_b0, index_dwi, nb_b0, nb_dwi = identify_b0(fname_bvecs, fname_bvals, param.bval_min, verbose)
 
-    # Split into T dimension
-    sct.printv('\nSplit along T dimension...', verbose)
-    im_dmri_split_list = split_data(im_dmri, 3)
-    for im_d in im_dmri_split_list:
-        im_d.save()
-
-    # Merge b=0 images
-    sct.printv('\nMerge b=0...', verbose)
-    from sct_image import concat_data
-    l = []
-    for it in range(nb_b0):
-        l.append(dmri_name + '_T' + str(index_b0[it]).zfill(4) + ext)
-    im_out = concat_data(l, 3).save(b0_name + ext)
-
-    # Average b=0 images
-    if average:
-        sct.printv('\nAverage b=0...', verbose)
-        sct.run(['sct_maths', '-i', b0_name + ext, '-o', b0_mean_name + ext, '-mean', 't'], verbose)
-
-    # Merge DWI
-    l = []
-    for it in range(nb_dwi):
-        l.append(dmri_name + '_T' + str(index_dwi[it]).zfill(4) + ext)
-    im_out = concat_data(l, 3).save(dwi_name + ext)
-
-    # Average DWI images
-    if average:
-        sct.printv('\nAverage DWI...', verbose)
-        sct.run(['sct_maths', '-i', dwi_name + ext, '-o', dwi_mean_name + ext, '-mean', 't'], verbose)
-
-    # come back
-    os.chdir(curdir)
-
-    # Generate output files
-    fname_b0 = os.path.abspath(os.path.join(path_out, b0_name + ext_data))
-    fname_dwi = os.path.abspath(os.path.join(path_out, dwi_name + ext_data))
-    fname_b0_mean = os.path.abspath(os.path.join(path_out, b0_mean_name + ext_data))
-    fname_dwi_mean = os.path.abspath(os.path.join(path_out, dwi_mean_name + ext_data))
+    # Select b=0 and DWI volumes
     sct.printv('\nGenerate output files...', verbose)
-    sct.generate_output_file(os.path.join(path_tmp, b0_name + ext), fname_b0, verbose)
-    sct.generate_output_file(os.path.join(path_tmp, dwi_name + ext), fname_dwi, verbose)
-    if average:
-        sct.generate_output_file(os.path.join(path_tmp, b0_mean_name + ext), fname_b0_mean, verbose)
-        sct.generate_output_file(os.path.join(path_tmp, dwi_mean_name + ext), fname_dwi_mean, verbose)
-
-    # Remove temporary files
-    if remove_temp_files == 1:
-        sct.printv('\nRemove temporary files...', verbose)
-        sct.rmtree(path_tmp, verbose=verbose)
+    for name, index, fname_out, fname_out_mean in [('b=0', index_b0, fname_b0, fname_b0_mean),
+                                                   ('DWI', index_dwi, fname_dwi, fname_dwi_mean)]:
+        sct.printv('\nMerge ' + name + '...', verbose)
+        im_out = Image(select_volumes(im_dmri.data, index), hdr=im_dmri.hdr.copy())
+        im_out.save(fname_out, verbose=verbose)
+        sct.printv('  File created: ' + fname_out, verbose)
+        # Average volumes
+        if average:
+            sct.printv('\nAverage ' + name + '...', verbose)
+            im_out_mean = Image(mean_volumes(im_dmri.data, index), hdr=im_dmri.hdr.copy())
+            im_out_mean.save(fname_out_mean, verbose=verbose)
+            sct.printv('  File created: ' + fname_out_mean, verbose)
 
     # display elapsed time
     elapsed_time = time.time() - start_time
@@ -232,34 +184,21 @@ def identify_b0(fname_bvecs, fname_bvals, bval_min, verbose):
 
     # Identify b=0 and DWI images
     sct.printv('\nIdentify b=0 and DWI images...', verbose)
-    index_b0 = []
-    index_dwi = []
 
     # if bval is not provided
     if not fname_bvals:
         # Open bvecs file
-        bvecs = []
-        with open(fname_bvecs) as f:
-            for line in f:
-                bvecs_new = [x for x in map(float, line.split())]
-                bvecs.append(bvecs_new)
+        bvecs = np.loadtxt(fname_bvecs, ndmin=2)
 
         # Check if bvecs file is nx3
-        if not len(bvecs[0][:]) == 3:
+        if not bvecs.shape[1] == 3:
             sct.printv('  WARNING: bvecs file is 3xn instead of nx3. Consider using sct_dmri_transpose_bvecs.', verbose, 'warning')
             sct.printv('  Transpose bvecs...', verbose)
             # transpose bvecs
-            bvecs = list(zip(*bvecs))
-
-        # get number of lines
-        nt = len(bvecs)
+            bvecs = bvecs.T
 
         # identify b=0 and dwi
-        for it in range(0, nt):
-            if math.sqrt(math.fsum([i**2 for i in bvecs[it]])) < 0.01:
-                index_b0.append(it)
-            else:
-                index_dwi.append(it)
+        is_b0 = np.linalg.norm(bvecs, axis=1) < 0.01
 
     # if bval is provided
     else:
@@ -268,19 +207,14 @@ def identify_b0(fname_bvecs, fname_bvals, bval_min, verbose):
         from dipy.io import read_bvals_bvecs
         bvals, bvecs = read_bvals_bvecs(fname_bvals, fname_bvecs)
 
-        # get number of lines
-        nt = len(bvals)
-
         # Identify b=0 and DWI images
-        sct.printv('\nIdentify b=0 and DWI images...', verbose)
-        for it in range(0, nt):
-            if bvals[it] < bval_min:
-                index_b0.append(it)
-            else:
-                index_dwi.append(it)
+        is_b0 = np.asarray(bvals) < bval_min
+
+    index_b0 = np.flatnonzero(is_b0).tolist()
+    index_dwi = np.flatnonzero(~is_b0).tolist()
 
     # check if no b=0 images were detected
-    if index_b0 == []:
+    if not index_b0:
         sct.printv('ERROR: no b=0 images detected. Maybe you are using non-null low bvals? in that case use flag -bvalmin. Exit program.', 1, 'error')
         sys.exit(2)
 
@@ -294,6 +228,38 @@ def identify_b0(fname_bvecs, fname_bvals, bval_min, verbose):
     return index_b0, index_dwi, nb_b0, nb_dwi
 
 
+def select_volumes(data, index):
+    """
+    Select volumes along the 4th dimension with a single fancy indexing operation.
+    :param data: 4D array (can be a memory map, in which case only the selected volumes are read)
+    :param index: list of volume indices
+    :return: 4D array of shape (nx, ny, nz, len(index))
+    """
+    if data.ndim == 3:
+        data = data[..., np.newaxis]
+    return np.asarray(data[..., index])
+
+
+def mean_volumes(data, index):
+    """
+    Average volumes along the 4th dimension, reading one volume at a time so that the selected volumes are never
+    stacked in memory.
+    :param data: 4D array (can be a memory map)
+    :param index: list of volume indices. The program exits if it is empty.
+    :return: 3D array
+    """
+    if len(index) == 0:
+        sct.printv('ERROR: no volume to average (e.g. no DWI in the input data). Exit program.', 1, 'error')
+        sys.exit(2)
+    if data.ndim == 3:
+        data = data[..., np.newaxis]
+    data_mean = np.zeros(data.shape[:3], dtype=np.float64)
+    for it in index:
+        data_mean += data[..., it]
+    data_mean /= len(index)
+    return data_mean
+
+
 # START PROGRAM
 # ==========================================================================================
 if __name__ == "__main__":
@@ -22,11 +22,12 @@ from __future__ import division, absolute_import
 
 import sys, os
 
-import numpy as np
 
 from spinalcordtoolbox.metadata import read_label_file
 from spinalcordtoolbox.utils import parse_num_list
-from spinalcordtoolbox.aggregate_slicewise import check_labels, extract_metric, save_as_csv, Metric, LabelStruc
+from spinalcordtoolbox.atlas import SparseAtlas
+from spinalcordtoolbox.aggregate_slicewise import check_labels, extract_metric_multilabel, save_as_csv, Metric, \
+    LabelStruc
 import sct_utils as sct
 from spinalcordtoolbox.image import Image
 from msct_parser import Parser
@@ -300,31 +301,24 @@ def main(fname_data, path_label, method, slices, levels, fname_output, labels_us
 
     # check syntax of labels asked by user
     labels_id_user = check_labels(indiv_labels_ids + combined_labels_ids, parse_num_list(labels_user))
-    nb_labels = len(indiv_labels_files)
 
     # Load data and systematically reorient to RPI because we need the 3rd dimension to be z
     sct.printv('\nLoad metric image...', verbose)
     input_im = Image(fname_data).change_orientation("RPI")
 
     data = Metric(data=input_im.data, label='')
-    # Load labels
-    labels_tmp = np.empty([nb_labels], dtype=object)
-    for i_label in range(nb_labels):
-        im_label = Image(os.path.join(path_label, indiv_labels_files[i_label])).change_orientation("RPI")
-        labels_tmp[i_label] = np.expand_dims(im_label.data, 3)  # TODO: generalize to 2D input label
-    labels = np.concatenate(labels_tmp[:], 3)  # labels: (x,y,z,label)
+    # Load labels, as a sparse atlas: each label is only stored where it is non-zero
+    labels = SparseAtlas.from_files([os.path.join(path_label, fname) for fname in indiv_labels_files],
+                                    indiv_labels_ids, [label_struc[i].name for i in indiv_labels_ids],
+                                    orientation="RPI")
     # Load vertebral levels
     if vertebral_levels:
         im_vertebral_labeling = Image(fname_vertebral_labeling).change_orientation("RPI")
     else:
         im_vertebral_labeling = None
 
-    # Get dimensions of data and labels
-    nx, ny, nz = data.data.shape
-    nx_atlas, ny_atlas, nz_atlas, nt_atlas = labels.shape
-
     # Check dimensions consistency between atlas and data
-    if (nx, ny, nz) != (nx_atlas, ny_atlas, nz_atlas):
+    if data.data.shape != labels.shape:
         sct.printv('\nERROR: Metric data and labels DO NOT HAVE SAME DIMENSIONS.', 1, type='error')
 
     # Combine individual labels for estimation
@@ -334,14 +328,12 @@ def main(fname_data, path_label, method, slices, levels, fname_output, labels_us
                                      map_cluster=None)
         labels_id_user = [99]
 
-    for id_label in labels_id_user:
-        sct.printv('Estimation for label: '+label_struc[id_label].name, verbose)
-        agg_metric = extract_metric(data, labels=labels, slices=slices, levels=levels, perslice=perslice,
-                                    perlevel=perlevel, vert_level=im_vertebral_labeling, method=method,
-                                    label_struc=label_struc, id_label=id_label, indiv_labels_ids=indiv_labels_ids)
-
-        save_as_csv(agg_metric, fname_output, fname_in=fname_data, append=append_csv)
-        append_csv = True  # when looping across labels, need to append results in the same file
+    sct.printv('Estimation for label(s): ' + ', '.join([label_struc[id_label].name for id_label in labels_id_user]),
+               verbose)
+    agg_metrics = extract_metric_multilabel(data, labels, label_struc, labels_id_user, slices=slices, levels=levels,
+                                            perslice=perslice, perlevel=perlevel, vert_level=im_vertebral_labeling,
+                                            method=method, indiv_labels_ids=indiv_labels_ids)
+    save_as_csv(agg_metrics, fname_output, fname_in=fname_data, append=append_csv)
     sct.display_open(fname_output)
 
 
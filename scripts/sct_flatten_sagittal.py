@@ -15,13 +15,9 @@ from __future__ import absolute_import, division
 
 import sys
 
-import numpy as np
-from skimage import transform, img_as_float
-
 import sct_utils as sct
-import spinalcordtoolbox.image as msct_image
 from spinalcordtoolbox.image import Image
-from spinalcordtoolbox.centerline.core import ParamCenterline, get_centerline
+from spinalcordtoolbox.flattening import flatten_sagittal
 from msct_parser import Parser
 
 
@@ -35,59 +31,13 @@ class Param:
         self.verbose = 1
 
 
-def flatten_sagittal(im_anat, im_centerline, verbose):
-    """
-    Flatten a 3D volume using the segmentation, such that the spinal cord is centered in the R-L medial plane.
-    :param im_anat:
-    :param im_centerline:
-    :param verbose:
-    :return:
-    """
-    # re-oriente to RPI
-    orientation_native = im_anat.orientation
-    im_anat.change_orientation("RPI")
-    im_centerline.change_orientation("RPI")
-    nx, ny, nz, nt, px, py, pz, pt = im_anat.dim
-
-    # smooth centerline and return fitted coordinates in voxel space
-    _, arr_ctl, _, _ = get_centerline(im_centerline, param=ParamCenterline(), verbose=verbose)
-    x_centerline_fit, y_centerline_fit, z_centerline = arr_ctl
-
-    # Extend the centerline by copying values below zmin and above zmax to avoid discontinuities
-    zmin, zmax = z_centerline.min().astype(int), z_centerline.max().astype(int)
-    x_centerline_extended = np.concatenate([np.ones(zmin) * x_centerline_fit[0],
-                                            x_centerline_fit,
-                                            np.ones(nz-zmax) * x_centerline_fit[-1]])
-
-    # change type to float32 and scale between -1 and 1 as requested by img_as_float(). See #1790, #2069
-    im_anat_flattened = msct_image.change_type(im_anat, np.float32)
-    min_data, max_data = np.min(im_anat_flattened.data), np.max(im_anat_flattened.data)
-    im_anat_flattened.data = 2 * im_anat_flattened.data/(max_data - min_data) - 1
-
-    # loop and translate each axial slice, such that the flattened centerline is centered in the medial plane (R-L)
-    for iz in range(nz):
-        # compute translation along x (R-L)
-        translation_x = x_centerline_extended[iz] - np.round(nx/2.0)
-        # apply transformation to 2D image with linear interpolation
-        # tform = tf.SimilarityTransform(scale=1, rotation=0, translation=(translation_x, 0))
-        tform = transform.SimilarityTransform(translation=(0, translation_x))
-        # important to force input in float to skikit image, because it will output float values
-        img = img_as_float(im_anat_flattened.data[:, :, iz])
-        img_reg = transform.warp(img, tform)
-        im_anat_flattened.data[:, :, iz] = img_reg
-
-    # change back to native orientation
-    im_anat_flattened.change_orientation(orientation_native)
-
-    return im_anat_flattened
-
-
-def main(fname_anat, fname_centerline, verbose):
+def main(fname_anat, fname_centerline, verbose, unflatten=False):
     """
     Main function
     :param fname_anat:
     :param fname_centerline:
     :param verbose:
+    :param unflatten: bool: bring a flattened image back to the native space of the segmentation
     :return:
     """
     # load input images
@@ -95,10 +45,10 @@ def main(fname_anat, fname_centerline, verbose):
     im_centerline = Image(fname_centerline)
 
     # flatten sagittal
-    im_anat_flattened = flatten_sagittal(im_anat, im_centerline, verbose)
+    im_anat_flattened = flatten_sagittal(im_anat, im_centerline, verbose, unflatten=unflatten)
 
     # save output
-    fname_out = sct.add_suffix(fname_anat, '_flatten')
+    fname_out = sct.add_suffix(fname_anat, '_unflatten' if unflatten else '_flatten')
     im_anat_flattened.save(fname_out)
 
     sct.display_viewer_syntax([fname_anat, fname_out])
@@ -108,8 +58,8 @@ def get_parser():
     param_default = Param()
     parser = Parser(__file__)
     parser.usage.set_description("""Flatten the spinal cord such within the medial sagittal plane. Useful to make nice 
-    pictures. Output data has suffix _flatten. Output type is float32 (regardless of input type) to minimize loss of 
-    precision during conversion.""")
+    pictures. Output data has suffix _flatten. 3D and 4D volumes are supported. Output type is float32 for integer 
+    input (float input keeps its type) to minimize loss of precision during conversion. Intensities are not rescaled.""")
     parser.add_option(name='-i',
                       type_value='image_nifti',
                       description='Input volume.',
@@ -120,6 +70,11 @@ def get_parser():
                       description='Spinal cord segmentation or centerline.',
                       mandatory=True,
                       example='t2_seg.nii.gz')
+    parser.add_option(name='-unflatten',
+                      type_value=None,
+                      description='Apply the inverse transformation, to bring back an image flattened with the same '
+                                  'segmentation (-s) to its native space. Output data has suffix _unflatten.',
+                      mandatory=False)
     parser.add_option(name='-v',
                       type_value='multiple_choice',
                       description='0: no verbose (default), 1: min verbose, 2: verbose + figures',
@@ -144,8 +99,9 @@ if __name__ == "__main__":
     arguments = parser.parse(sys.argv[1:])
     fname_anat = arguments['-i']
     fname_centerline = arguments['-s']
+    unflatten = '-unflatten' in arguments
     verbose = int(arguments.get('-v'))
     sct.init_sct(log_level=verbose, update=True)  # Update log level
 
     # call main function
-    main(fname_anat, fname_centerline, verbose)
+    main(fname_anat, fname_centerline, verbose, unflatten=unflatten)
@@ -19,15 +19,17 @@ import sys
 import numpy as np
 
 import sct_utils as sct
-import spinalcordtoolbox.image as msct_image
 from msct_parser import Parser
 from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.temporal_stats import compute_temporal_stats
 
 
 class Param:
     def __init__(self):
         self.debug = 1
         self.verbose = 1
+        self.detrend = 0  # remove a linear drift before computing the STD
+        self.chunk_size = 32  # number of volumes read at a time
 
 
 class Tsnr:
@@ -44,21 +46,19 @@ class Tsnr:
 
         fname_data = self.fmri
 
-        # open data
+        # open data (uncompressed data are memory-mapped, and read chunk by chunk)
         nii_data = Image(fname_data)
-        data = nii_data.data
 
-        # compute mean
-        data_mean = np.mean(data, 3)
-        # compute STD
-        data_std = np.std(data, 3, ddof=1)
-        # compute TSNR
-        data_tsnr = data_mean / data_std
+        # compute mean and STD in a single pass, then TSNR
+        stats = compute_temporal_stats(nii_data.data, chunk_size=self.param.chunk_size)
+        if self.param.detrend:
+            data_tsnr = stats.tsnr_detrended()
+        else:
+            data_tsnr = stats.tsnr()
 
         # save TSNR
         fname_tsnr = self.out
-        nii_tsnr = msct_image.empty_like(nii_data)
-        nii_tsnr.data = data_tsnr
+        nii_tsnr = Image(data_tsnr, hdr=nii_data.hdr.copy())
         nii_tsnr.save(fname_tsnr, dtype=np.float32)
 
         sct.display_viewer_syntax([fname_tsnr])
@@ -74,6 +74,10 @@ def get_parser():
                       description='fMRI data',
                       mandatory=True,
                       example='fmri.nii.gz')
+    parser.add_option(name='-detrend',
+                      type_value=None,
+                      description='Remove a linear drift along time before computing the temporal STD.',
+                      mandatory=False)
     parser.add_option(name='-v',
                       type_value='multiple_choice',
                       description='verbose',
@@ -98,6 +102,7 @@ def main(args=None):
     arguments = parser.parse(sys.argv[1:])
     fname_src = arguments['-i']
     fname_dst = arguments.get("-o", sct.add_suffix(fname_src, "_tsnr"))
+    param.detrend = int('-detrend' in arguments)
     verbose = int(arguments.get('-v'))
     sct.init_sct(log_level=verbose, update=True)  # Update log level
 
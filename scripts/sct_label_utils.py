@@ -22,15 +22,19 @@ import os
 import sys
 
 import numpy as np
-from scipy import ndimage
 
 import spinalcordtoolbox.image as msct_image
 from spinalcordtoolbox.image import Image, zeros_like
 from spinalcordtoolbox.types import Coordinate, CoordinateValue
+from spinalcordtoolbox.labels import LabelSet
+from spinalcordtoolbox.template import get_continuous_vertebral_levels
+from spinalcordtoolbox.utils import lazy_import
 
 from msct_parser import Parser
 import sct_utils as sct
 
+ndimage = lazy_import('scipy.ndimage')
+
 
 class Param:
     def __init__(self):
@@ -133,30 +137,18 @@ class ProcessLabels(object):
                 # the input image is reoriented to 'SAL' when open by the GUI
                 previous_lab.change_orientation('SAL')
                 mid = int(np.round(previous_lab.data.shape[2]/2))
-                previous_points = previous_lab.getNonZeroCoordinates()
-                # boolean used to mark first element to initiate the list.
-                first = True
-                for i in range(len(previous_points)):
-                    if int(previous_points[i].value) in self.value:
-                        pass
-                    else:
-                        self.value.append(int(previous_points[i].value))
-                    if first:
-                        points = np.array([previous_points[i]. x, previous_points[i].y, previous_points[i].z, previous_points[i].value])
-                        points = np.reshape(points, (1, 4))
-                        previous_label = points
-                        first = False
-                    else:
-                        points = np.array([previous_points[i].x, previous_points[i].y, previous_points[i].z, previous_points[i].value])
-                        points = np.reshape(points, (1, 4))
-                        previous_label = np.append(previous_label, points, axis=0)
-                    self.value.sort()
+                previous_points = LabelSet.from_image(previous_lab)
 
-                # check if variable was created which means the file was not empty and contains some points asked in self.value
-                if 'previous_label' in locals():
+                # check if the file was not empty and contains some points asked in self.value
+                if len(previous_points):
+                    for value in previous_points.values():
+                        if int(value) not in self.value:
+                            self.value.append(int(value))
+                    self.value.sort()
+                    previous_label = np.column_stack([previous_points.x, previous_points.y, previous_points.z,
+                                                      previous_points.value])
                     # project onto mid sagittal plane
-                    for i in range(len(previous_label)):
-                        previous_label[i][2] = mid
+                    previous_label[:, 2] = mid
                     self.output_image = self.launch_sagittal_viewer(self.value, previous_points=previous_label)
                 else:
                     self.output_image = self.launch_sagittal_viewer(self.value)
@@ -184,13 +176,8 @@ class ProcessLabels(object):
         This function add a specified value to all non-zero voxels.
         """
         image_output = self.image_input.copy()
-        # image_output.data *= 0
-
-        coordinates_input = self.image_input.getNonZeroCoordinates()
-
-        # for all points with non-zeros neighbors, force the neighbors to 0
-        for i, coord in enumerate(coordinates_input):
-            image_output.data[int(coord.x), int(coord.y), int(coord.z)] = image_output.data[int(coord.x), int(coord.y), int(coord.z)] + float(value)
+        labels = LabelSet.from_image(self.image_input)
+        labels.write(image_output.data, value=labels.value + float(value))
         return image_output
 
     def create_label(self, add=False):
@@ -209,18 +196,15 @@ class ProcessLabels(object):
         """
         image_output = self.image_input.copy() if add else msct_image.zeros_like(self.image_input)
 
-        # loop across labels
+        if len(image_output.data.shape) not in [2, 3]:
+            sct.printv('ERROR: Data should be 2D or 3D. Current shape is: ' + str(image_output.data.shape), 1, 'error')
+        # display info
         for i, coord in enumerate(self.coordinates):
-            if len(image_output.data.shape) == 3:
-                image_output.data[int(coord.x), int(coord.y), int(coord.z)] = coord.value
-            elif len(image_output.data.shape) == 2:
+            if len(image_output.data.shape) == 2:
                 assert str(coord.z) == '0', "ERROR: 2D coordinates should have a Z value of 0. Z coordinate is :" + str(coord.z)
-                image_output.data[int(coord.x), int(coord.y)] = coord.value
-            else:
-                sct.printv('ERROR: Data should be 2D or 3D. Current shape is: ' + str(image_output.data.shape), 1, 'error')
-            # display info
             sct.printv('Label #' + str(i) + ': ' + str(coord.x) + ',' + str(coord.y) + ',' + str(coord.z) + ' --> ' +
                        str(coord.value), 1)
+        LabelSet.from_coordinates(self.coordinates).write(image_output.data)
         return image_output
 
     def create_label_along_segmentation(self):
@@ -267,11 +251,9 @@ class ProcessLabels(object):
         """
         image_output = msct_image.zeros_like(self.image_input)
 
-        coordinates_input = self.image_input.getNonZeroCoordinates()
-
-        # for all points with non-zeros neighbors, force the neighbors to 0
-        for coord in coordinates_input:
-            image_output.data[:, :, int(coord.z) - width:int(coord.z) + width] = offset + gap * coord.value
+        # the plane of each label overwrites the planes of the previous ones
+        for x, y, z, value in LabelSet.from_image(self.image_input):
+            image_output.data[:, :, int(z) - width:int(z) + width] = offset + gap * value
 
         return image_output
 
@@ -281,25 +263,14 @@ class ProcessLabels(object):
         """
 
         image_output = msct_image.zeros_like(Image(self.image_ref))
-
-        image_input_neg = msct_image.zeros_like(Image(self.image_input))
-        image_input_pos = msct_image.zeros_like(Image(self.image_input))
-
-        X, Y, Z = (self.image_input.data < 0).nonzero()
-        for i in range(len(X)):
-            image_input_neg.data[X[i], Y[i], Z[i]] = -self.image_input.data[X[i], Y[i], Z[i]]  # in order to apply getNonZeroCoordinates
-        X_pos, Y_pos, Z_pos = (self.image_input.data > 0).nonzero()
-        for i in range(len(X_pos)):
-            image_input_pos.data[X_pos[i], Y_pos[i], Z_pos[i]] = self.image_input.data[X_pos[i], Y_pos[i], Z_pos[i]]
-
-        coordinates_input_neg = image_input_neg.getNonZeroCoordinates()
-        coordinates_input_pos = image_input_pos.getNonZeroCoordinates()
-
         image_output.change_type('float32')
-        for coord in coordinates_input_neg:
-            image_output.data[:, :, int(coord.z)] = -coord.value  # PB: takes the int value of coord.value
-        for coord in coordinates_input_pos:
-            image_output.data[:, :, int(coord.z)] = coord.value
+
+        # negative labels first, then positive labels; for each slice, the last label is kept
+        labels_neg = LabelSet.from_array(-np.minimum(self.image_input.data, 0))
+        labels_pos = LabelSet.from_array(self.image_input.data)
+        for labels, sign in [(labels_neg, -1), (labels_pos, 1)]:
+            z, index_last = np.unique(labels.z[::-1], return_index=True)
+            image_output.data[:, :, z] = sign * labels.value[::-1][index_last]
 
         return image_output
 
@@ -317,22 +288,14 @@ class ProcessLabels(object):
         # 0. Initialization of output image
         output_image = msct_image.zeros_like(self.image_input)
 
-        # 1. Extraction of coordinates from all non-null voxels in the image. Coordinates are sorted by value.
-        coordinates = self.image_input.getNonZeroCoordinates(sorting='value')
+        # 1. Compute the center of mass of each group of voxels with the same value
+        values, centroids = LabelSet.from_image(self.image_input).centroids()
 
-        # 2. Separate all coordinates into groups by value
-        groups = dict()
-        for coord in coordinates:
-            if coord.value in groups:
-                groups[coord.value].append(coord)
-            else:
-                groups[coord.value] = [coord]
-
-        # 3. Compute the center of mass of each group of voxels and write them into the output image
-        for value, list_coord in groups.items():
-            center_of_mass = sum(list_coord) / float(len(list_coord))
-            sct.printv("Value = " + str(center_of_mass.value) + " : (" + str(center_of_mass.x) + ", " + str(center_of_mass.y) + ", " + str(center_of_mass.z) + ") --> ( " + str(np.round(center_of_mass.x)) + ", " + str(np.round(center_of_mass.y)) + ", " + str(np.round(center_of_mass.z)) + ")", verbose=self.verbose)
-            output_image.data[int(np.round(center_of_mass.x)), int(np.round(center_of_mass.y)), int(np.round(center_of_mass.z))] = center_of_mass.value
+        # 2. Write them into the output image
+        for value, center_of_mass in zip(values, centroids):
+            sct.printv("Value = " + str(value) + " : (" + str(center_of_mass[0]) + ", " + str(center_of_mass[1]) + ", " + str(center_of_mass[2]) + ") --> ( " + str(np.round(center_of_mass[0])) + ", " + str(np.round(center_of_mass[1])) + ", " + str(np.round(center_of_mass[2])) + ")", verbose=self.verbose)
+        x, y, z = np.round(centroids).astype(int).T
+        LabelSet(x, y, z, values, dtype=values.dtype).write(output_image.data)
 
         return output_image
 
@@ -343,11 +306,8 @@ class ProcessLabels(object):
         """
         image_output = msct_image.zeros_like(self.image_input)
 
-        coordinates_input = self.image_input.getNonZeroCoordinates(sorting='z', reverse_coord=True)
-
-        # for all points with non-zeros neighbors, force the neighbors to 0
-        for i, coord in enumerate(coordinates_input):
-            image_output.data[int(coord.x), int(coord.y), int(coord.z)] = i + 1
+        labels = LabelSet.from_image(self.image_input).sort(by='z', reverse=True)
+        labels.write(image_output.data, value=np.arange(1, len(labels) + 1))
 
         return image_output
 
@@ -360,14 +320,13 @@ class ProcessLabels(object):
         """
         image_output = msct_image.zeros_like(self.image_input)
 
-        coordinates_input = self.image_input.getNonZeroCoordinates()
-        coordinates_ref = self.image_ref.getNonZeroCoordinates(sorting='value')
+        labels_input = LabelSet.from_image(self.image_input)
+        labels_ref = LabelSet.from_image(self.image_ref).sort(by='value')
 
         # for all points in input, find the value that has to be set up, depending on the vertebral level
-        for i, coord in enumerate(coordinates_input):
-            for j in range(0, len(coordinates_ref) - 1):
-                if coordinates_ref[j + 1].z < coord.z <= coordinates_ref[j].z:
-                    image_output.data[int(coord.x), int(coord.y), int(coord.z)] = coordinates_ref[j].value
+        for j in range(0, len(labels_ref) - 1):
+            is_in_level = (labels_ref.z[j + 1] < labels_input.z) & (labels_input.z <= labels_ref.z[j])
+            labels_input[is_in_level].write(image_output.data, value=labels_ref.value[j])
 
         return image_output
 
@@ -378,17 +337,10 @@ class ProcessLabels(object):
         """
         # get center of mass of each vertebral level
         image_cubic2point = self.cubic_to_point()
-        # get list of coordinates for each label
-        list_coordinates = image_cubic2point.getNonZeroCoordinates(sorting='value')
-        # if user did not specify levels, include all:
-        if levels_user[0] == 0:
-            levels_user = [int(i.value) for i in list_coordinates]
-        # loop across labels and remove those that are not listed by the user
-        for i_label in range(len(list_coordinates)):
-            # check if this level is NOT in levels_user
-            if not levels_user.count(int(list_coordinates[i_label].value)):
-                # if not, set value to zero
-                image_cubic2point.data[int(list_coordinates[i_label].x), int(list_coordinates[i_label].y), int(list_coordinates[i_label].z)] = 0
+        # if user did not specify levels, include all; otherwise, remove the labels that are not listed by the user
+        if levels_user[0] != 0:
+            labels = LabelSet.from_image(image_cubic2point)
+            labels[~np.isin(labels.value.astype(int), levels_user)].write(image_cubic2point.data, value=0)
         # list all labels
         return image_cubic2point
 
@@ -398,26 +350,25 @@ class ProcessLabels(object):
         Moreover, a warning is generated for each label mismatch.
         If the MSE is above the threshold provided (by default = 0mm), a log is reported with the filenames considered here.
         """
-        coordinates_input = self.image_input.getNonZeroCoordinates()
-        coordinates_ref = self.image_ref.getNonZeroCoordinates()
+        labels_input = LabelSet.from_image(self.image_input)
+        labels_ref = LabelSet.from_image(self.image_ref)
+        values_input, values_ref = np.round(labels_input.value), np.round(labels_ref.value)
 
         # check if all the labels in both the images match
-        if len(coordinates_input) != len(coordinates_ref):
+        if len(labels_input) != len(labels_ref):
+            sct.printv('ERROR: labels mismatch', 1, 'warning')
+        for _ in range(np.count_nonzero(~np.isin(values_input, values_ref))):
+            sct.printv('ERROR: labels mismatch', 1, 'warning')
+        for _ in range(np.count_nonzero(~np.isin(values_ref, values_input))):
             sct.printv('ERROR: labels mismatch', 1, 'warning')
-        for coord in coordinates_input:
-            if np.round(coord.value) not in [np.round(coord_ref.value) for coord_ref in coordinates_ref]:
-                sct.printv('ERROR: labels mismatch', 1, 'warning')
-        for coord_ref in coordinates_ref:
-            if np.round(coord_ref.value) not in [np.round(coord.value) for coord in coordinates_input]:
-                sct.printv('ERROR: labels mismatch', 1, 'warning')
 
-        result = 0.0
-        for coord in coordinates_input:
-            for coord_ref in coordinates_ref:
-                if np.round(coord_ref.value) == np.round(coord.value):
-                    result += (coord_ref.z - coord.z) ** 2
-                    break
-        result = np.sqrt(result / len(coordinates_input))
+        # each input label is compared to the first reference label with the same value
+        values_ref_unique, index_first = np.unique(values_ref, return_index=True)
+        index_match = np.clip(np.searchsorted(values_ref_unique, values_input), 0, max(len(values_ref_unique) - 1, 0))
+        is_matched = np.isin(values_input, values_ref_unique)
+        z_ref = labels_ref.z[index_first[index_match[is_matched]]]
+        result = np.sum((z_ref - labels_input.z[is_matched]) ** 2, dtype=np.float64)
+        result = np.sqrt(result / len(labels_input))
         sct.printv('MSE error in Z direction = ' + str(result) + ' mm')
 
         if result > threshold_mse:
@@ -431,49 +382,24 @@ class ProcessLabels(object):
 
         return result
 
-    @staticmethod
-    def remove_label_coord(coord_input, coord_ref, symmetry=False):
-        """
-        coord_input and coord_ref should be sets of CoordinateValue in order to improve speed of intersection
-        :param coord_input: set of CoordinateValue
-        :param coord_ref: set of CoordinateValue
-        :param symmetry: boolean,
-        :return: intersection of CoordinateValue: list
-        """
-        from spinalcordtoolbox.types import CoordinateValue
-        if isinstance(coord_input[0], CoordinateValue) and isinstance(coord_ref[0], CoordinateValue) and symmetry:
-            coord_intersection = list(set(coord_input).intersection(set(coord_ref)))
-            result_coord_input = [coord for coord in coord_input if coord in coord_intersection]
-            result_coord_ref = [coord for coord in coord_ref if coord in coord_intersection]
-        else:
-            result_coord_ref = coord_ref
-            result_coord_input = [coord for coord in coord_input if list(filter(lambda x: x.value == coord.value, coord_ref))]
-            if symmetry:
-                result_coord_ref = [coord for coord in coord_ref if list(filter(lambda x: x.value == coord.value, result_coord_input))]
-
-        return result_coord_input, result_coord_ref
-
     def remove_label(self, symmetry=False):
         """
         Compare two label images and remove any labels in input image that are not in reference image.
         The symmetry option enables to remove labels from reference image that are not in input image
         """
-        # image_output = Image(self.image_input.dim, orientation=self.image_input.orientation, hdr=self.image_input.hdr, verbose=self.verbose)
         image_output = msct_image.zeros_like(self.image_input)
 
-        result_coord_input, result_coord_ref = self.remove_label_coord(self.image_input.getNonZeroCoordinates(coordValue=True),
-                                                                       self.image_ref.getNonZeroCoordinates(coordValue=True), symmetry)
-
-        for coord in result_coord_input:
-            image_output.data[int(coord.x), int(coord.y), int(coord.z)] = int(np.round(coord.value))
+        labels_input = LabelSet.from_image(self.image_input)
+        labels_ref = LabelSet.from_image(self.image_ref)
+        result_labels_input = labels_input.intersection(labels_ref)
+        result_labels_input.write(image_output.data, value=np.round(result_labels_input.value).astype(int))
 
         if symmetry:
-            # image_output_ref = Image(self.image_ref.dim, orientation=self.image_ref.orientation, hdr=self.image_ref.hdr, verbose=self.verbose)
-            image_output_ref = Image(self.image_ref, verbose=self.verbose)
-            for coord in result_coord_ref:
-                image_output_ref.data[int(coord.x), int(coord.y), int(coord.z)] = int(np.round(coord.value))
+            image_output_ref = msct_image.zeros_like(self.image_ref)
+            result_labels_ref = labels_ref.intersection(labels_input)
+            result_labels_ref.write(image_output_ref.data, value=np.round(result_labels_ref.value).astype(int))
             image_output_ref.absolutepath = self.fname_output[1]
-            image_output_ref.save('minimize_int')
+            image_output_ref.save(dtype='minimize_int')
 
             self.fname_output = self.fname_output[0]
 
@@ -484,13 +410,10 @@ class ProcessLabels(object):
         Display all the labels that are contained in the input image.
         The image is suppose to be RPI to display voxels. But works also for other orientations
         """
-        coordinates_input = self.image_input.getNonZeroCoordinates(sorting='value')
-        self.useful_notation = ''
+        coordinates_input = LabelSet.from_image(self.image_input).sort(by='value').to_coordinates()
         for coord in coordinates_input:
             sct.printv('Position=(' + str(coord.x) + ',' + str(coord.y) + ',' + str(coord.z) + ') -- Value= ' + str(coord.value), verbose=self.verbose)
-            if self.useful_notation:
-                self.useful_notation = self.useful_notation + ':'
-            self.useful_notation += str(coord)
+        self.useful_notation = ':'.join(str(coord) for coord in coordinates_input)
         sct.printv('All labels (useful syntax):', verbose=self.verbose)
         sct.printv(self.useful_notation, verbose=self.verbose)
         return coordinates_input
@@ -500,13 +423,9 @@ class ProcessLabels(object):
         This function returns the coordinates of the labels in the physical referential system.
         :return: a list of CoordinateValue, in the physical (scanner) space
         """
-        coord = self.image_input.getNonZeroCoordinates(sorting='value')
-        phys_coord = []
-        for c in coord:
-            # convert pixelar coordinates to physical coordinates
-            c_p = self.image_input.transfo_pix2phys([[c.x, c.y, c.z]])[0]
-            phys_coord.append(CoordinateValue([c_p[0], c_p[1], c_p[2], c.value]))
-        return phys_coord
+        labels = LabelSet.from_image(self.image_input).sort(by='value')
+        coord_phys = labels.physical_coordinates(self.image_input)
+        return [CoordinateValue([c_p[0], c_p[1], c_p[2], value]) for c_p, value in zip(coord_phys, labels.value)]
 
     def get_coordinates_in_destination(self, im_dest, type='discrete'):
         """
@@ -531,44 +450,32 @@ class ProcessLabels(object):
         """
         Detect any label mismatch between input image and reference image
         """
-        coordinates_input = self.image_input.getNonZeroCoordinates()
-        coordinates_ref = self.image_ref.getNonZeroCoordinates()
+        labels_input = LabelSet.from_image(self.image_input)
+        labels_ref = LabelSet.from_image(self.image_ref)
 
         sct.printv("Label in input image that are not in reference image:")
-        for coord in coordinates_input:
-            isIn = False
-            for coord_ref in coordinates_ref:
-                if coord.value == coord_ref.value:
-                    isIn = True
-                    break
-            if not isIn:
-                sct.printv(coord.value)
+        for value in labels_input.difference(labels_ref).value:
+            sct.printv(value)
 
         sct.printv("Label in ref image that are not in input image:")
-        for coord_ref in coordinates_ref:
-            isIn = False
-            for coord in coordinates_input:
-                if coord.value == coord_ref.value:
-                    isIn = True
-                    break
-            if not isIn:
-                sct.printv(coord_ref.value)
+        for value in labels_ref.difference(labels_input).value:
+            sct.printv(value)
 
     def distance_interlabels(self, max_dist):
         """
         Calculate the distances between each label in the input image.
         If a distance is larger than max_dist, a warning message is displayed.
         """
-        coordinates_input = self.image_input.getNonZeroCoordinates()
+        labels = LabelSet.from_image(self.image_input)
 
-        # for all points with non-zeros neighbors, force the neighbors to 0
-        for i in range(0, len(coordinates_input) - 1):
-            dist = np.sqrt((coordinates_input[i].x - coordinates_input[i + 1].x)**2 + (coordinates_input[i].y - coordinates_input[i + 1].y)**2 + (coordinates_input[i].z - coordinates_input[i + 1].z)**2)
-            if dist < max_dist:
-                sct.printv('Warning: the distance between label ' + str(i) + '[' + str(coordinates_input[i].x) + ',' + str(coordinates_input[i].y) + ',' + str(
-                    coordinates_input[i].z) + ']=' + str(coordinates_input[i].value) + ' and label ' + str(i + 1) + '[' + str(
-                    coordinates_input[i + 1].x) + ',' + str(coordinates_input[i + 1].y) + ',' + str(coordinates_input[i + 1].z) + ']=' + str(
-                    coordinates_input[i + 1].value) + ' is larger than ' + str(max_dist) + '. Distance=' + str(dist))
+        # distance between consecutive labels
+        dist = np.linalg.norm(np.diff(labels.coordinates, axis=0), axis=1)
+        for i in np.flatnonzero(dist < max_dist):
+            (x, y, z, value), (x_next, y_next, z_next, value_next) = labels[i:i + 2]
+            sct.printv('Warning: the distance between label ' + str(i) + '[' + str(x) + ',' + str(y) + ',' + str(z) +
+                       ']=' + str(value) + ' and label ' + str(i + 1) + '[' + str(x_next) + ',' + str(y_next) + ',' +
+                       str(z_next) + ']=' + str(value_next) + ' is larger than ' + str(max_dist) + '. Distance=' +
+                       str(dist[i]))
 
     def continuous_vertebral_levels(self):
         """
@@ -578,58 +485,7 @@ class ProcessLabels(object):
         The image must be RPI
         :return:
         """
-        im_input = Image(self.image_input, self.verbose)
-        im_output = msct_image.zeros_like(self.image_input)
-
-        # 1. extract vertebral levels from input image
-        #   a. extract centerline
-        #   b. for each slice, extract corresponding level
-        nx, ny, nz, nt, px, py, pz, pt = im_input.dim
-        from spinalcordtoolbox.centerline.core import ParamCenterline, get_centerline
-        _, arr_ctl, _, _ = get_centerline(self.image_input, param=ParamCenterline())
-        x_centerline_fit, y_centerline_fit, z_centerline = arr_ctl
-        value_centerline = np.array(
-            [im_input.data[int(x_centerline_fit[it]), int(y_centerline_fit[it]), int(z_centerline[it])]
-             for it in range(len(z_centerline))])
-
-        # 2. compute distance for each vertebral level --> Di for i being the vertebral levels
-        vertebral_levels = {}
-        for slice_image, level in enumerate(value_centerline):
-            if level not in vertebral_levels:
-                vertebral_levels[level] = slice_image
-
-        length_levels = {}
-        for level in vertebral_levels:
-            indexes_slice = np.where(value_centerline == level)
-            length_levels[level] = np.sum([np.sqrt(((x_centerline_fit[indexes_slice[0][index_slice + 1]] - x_centerline_fit[indexes_slice[0][index_slice]]) * px)**2 +
-                                                     ((y_centerline_fit[indexes_slice[0][index_slice + 1]] - y_centerline_fit[indexes_slice[0][index_slice]]) * py)**2 +
-                                                     ((z_centerline[indexes_slice[0][index_slice + 1]] - z_centerline[indexes_slice[0][index_slice]]) * pz)**2)
-                                           for index_slice in range(len(indexes_slice[0]) - 1)])
-
-        # 2. for each slice:
-        #   a. identify corresponding vertebral level --> i
-        #   b. calculate distance of slice from upper vertebral level --> d
-        #   c. compute relative distance in the vertebral level coordinate system --> d/Di
-        continuous_values = {}
-        for it, iz in enumerate(z_centerline):
-            level = value_centerline[it]
-            indexes_slice = np.where(value_centerline == level)
-            indexes_slice = indexes_slice[0][indexes_slice[0] >= it]
-            distance_from_level = np.sum([np.sqrt(((x_centerline_fit[indexes_slice[index_slice + 1]] - x_centerline_fit[indexes_slice[index_slice]]) * px * px) ** 2 +
-                                                    ((y_centerline_fit[indexes_slice[index_slice + 1]] - y_centerline_fit[indexes_slice[index_slice]]) * py * py) ** 2 +
-                                                    ((z_centerline[indexes_slice[index_slice + 1]] - z_centerline[indexes_slice[index_slice]]) * pz * pz) ** 2)
-                                          for index_slice in range(len(indexes_slice) - 1)])
-            continuous_values[iz] = level + 2.0 * distance_from_level / float(length_levels[level])
-
-        # 3. saving data
-        # for each slice, get all non-zero pixels and replace with continuous values
-        coordinates_input = self.image_input.getNonZeroCoordinates()
-        im_output.change_type(np.float32)
-        # for all points in input, find the value that has to be set up, depending on the vertebral level
-        for i, coord in enumerate(coordinates_input):
-            im_output.data[int(coord.x), int(coord.y), int(coord.z)] = continuous_values[coord.z]
-
-        return im_output
+        return get_continuous_vertebral_levels(self.image_input)
 
     def launch_sagittal_viewer(self, labels, previous_points=None):
         from spinalcordtoolbox.gui import base
@@ -658,19 +514,17 @@ class ProcessLabels(object):
             image_output = msct_image.zeros_like(self.image_input)
         elif action == 'remove':
             image_output = self.image_input.copy()
-        coordinates_input = self.image_input.getNonZeroCoordinates()
+        labels_input = LabelSet.from_image(self.image_input)
 
         for labelNumber in labels:
-            isInLabels = False
-            for coord in coordinates_input:
-                if labelNumber == coord.value:
-                    new_coord = coord
-                    isInLabels = True
-            if isInLabels:
+            index_label = np.flatnonzero(labels_input.value == labelNumber)
+            if len(index_label):
+                # only the last voxel with this value is processed
+                new_label = labels_input[index_label[-1]]
                 if action == 'keep':
-                    image_output.data[int(new_coord.x), int(new_coord.y), int(new_coord.z)] = new_coord.value
+                    new_label.write(image_output.data)
                 elif action == 'remove':
-                    image_output.data[int(new_coord.x), int(new_coord.y), int(new_coord.z)] = 0.0
+                    new_label.write(image_output.data, value=0.0)
             else:
                 sct.printv("WARNING: Label " + str(float(labelNumber)) + " not found in input image.", type='warning')
 
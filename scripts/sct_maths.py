@@ -27,12 +27,26 @@ from sct_utils import printv, extract_fname, display_viewer_syntax, init_sct
 
 ALMOST_ZERO = 0.000000001
 
+DIM_LIST = ['x', 'y', 'z', 't']
+
+
+class AppendOperation(argparse.Action):
+    """
+    Store the value of an operation, and record the order in which operations are given, so that they can be chained
+    (see spinalcordtoolbox.math.Expression)
+    """
+    def __call__(self, parser, namespace, values, option_string=None):
+        setattr(namespace, self.dest, values)
+        namespace.operations = namespace.operations + [(self.dest, values)]
+
 
 def get_parser():
 
     parser = argparse.ArgumentParser(
         description='Perform mathematical operations on images. Some inputs can be either a number or a 4d image or '
-                    'several 3d images separated with ","',
+                    'several 3d images separated with ",". Arithmetic, thresholding (-thr, -bin), morphology, filtering '
+                    'and -mean/-rms/-std can be chained: they are applied in memory, in the order given. Example: '
+                    '-thr 0.5 -dilate 2 -mul mask.nii.gz -smooth 1',
         add_help=None,
         formatter_class=SmartFormatter,
         prog=os.path.basename(__file__).strip(".py"))
@@ -59,45 +73,53 @@ def get_parser():
     basic = parser.add_argument_group('BASIC OPERATIONS')
     basic.add_argument(
         "-add",
+        action=AppendOperation,
         metavar='',
         nargs="+",
         help='Add following input. Can be a number or multiple images (separated with space).',
         required=False)
     basic.add_argument(
         "-sub",
+        action=AppendOperation,
         metavar='',
         nargs="+",
         help='Subtract following input. Can be a number or an image.',
         required=False)
     basic.add_argument(
         "-mul",
+        action=AppendOperation,
         metavar='',
         nargs="+",
         help='Multiply by following input. Can be a number or multiple images (separated with space).',
         required=False)
     basic.add_argument(
         "-div",
+        action=AppendOperation,
         metavar='',
         nargs="+",
         help='Divide by following input. Can be a number or an image.',
         required=False)
     basic.add_argument(
         '-mean',
+        action=AppendOperation,
         help='Average data across dimension.',
         required=False,
         choices=('x', 'y', 'z', 't'))
     basic.add_argument(
         '-rms',
+        action=AppendOperation,
         help='Compute root-mean-squared across dimension.',
         required=False,
         choices=('x', 'y', 'z', 't'))
     basic.add_argument(
         '-std',
+        action=AppendOperation,
         help='Compute STD across dimension.',
         required=False,
         choices=('x', 'y', 'z', 't'))
     basic.add_argument(
         "-bin",
+        action=AppendOperation,
         type=float,
         metavar=Metavar.float,
         help='Binarize image using specified threshold. Example: 0.5',
@@ -132,6 +154,7 @@ def get_parser():
         required=False)
     thresholding.add_argument(
         "-thr",
+        action=AppendOperation,
         type=float,
         help='Use following number to threshold image (zero below number).',
         metavar=Metavar.float,
@@ -140,6 +163,7 @@ def get_parser():
     mathematical = parser.add_argument_group("MATHEMATICAL MORPHOLOGY")
     mathematical.add_argument(
         '-dilate',
+        action=AppendOperation,
         type=int,
         metavar=Metavar.int,
         help="Dilate binary or greyscale image with specified size. If shape={'square', 'cube'}: size corresponds to the length of "
@@ -148,6 +172,7 @@ def get_parser():
         required=False)
     mathematical.add_argument(
         '-erode',
+        action=AppendOperation,
         type=int,
         metavar=Metavar.int,
         help="Erode binary or greyscale image with specified size. If shape={'square', 'cube'}: size corresponds to the length of "
@@ -172,12 +197,14 @@ def get_parser():
     filtering = parser.add_argument_group("FILTERING METHODS")
     filtering.add_argument(
         "-smooth",
+        action=AppendOperation,
         metavar='',
         help='Gaussian smoothing filter with specified standard deviations in mm for each axis (Example: 2,2,1) or '
              'single value for all axis (Example: 2).',
         required = False)
     filtering.add_argument(
         '-laplacian',
+        action=AppendOperation,
         nargs="+",
         metavar='',
         help='Laplacian filtering with specified standard deviations in mm for all axes (Example: 2).',
@@ -223,6 +250,14 @@ def get_parser():
         help='Output type.',
         choices=('uint8', 'int16', 'int32', 'float32', 'complex64', 'float64', 'int8', 'uint16', 'uint32', 'int64',
                  'uint64'))
+    misc.add_argument(
+        '-chunk',
+        type=int,
+        metavar=Metavar.int,
+        help='When operations are chained, number of slices along z processed at a time, to limit memory use. 0: '
+             'whole volume.',
+        required=False,
+        default=0)
     misc.add_argument(
         "-v",
         type=int,
@@ -230,6 +265,7 @@ def get_parser():
         required=False,
         default=1,
         choices=(0, 1, 2))
+    parser.set_defaults(operations=[])
 
     return parser
 
@@ -242,8 +278,6 @@ def main(args=None):
     :param args:
     :return:
     """
-    dim_list = ['x', 'y', 'z', 't']
-
     # Get parser args
     if args is None:
         args = None if sys.argv[1:] else ['--help']
@@ -264,7 +298,20 @@ def main(args=None):
     dim = im.dim
 
     # run command
-    if arguments.otsu is not None:
+    if len(arguments.operations) > 1:
+        others = [name for name in ['otsu', 'adap', 'otsu_median', 'percent', 'denoise', 'symmetrize', 'mi', 'minorm',
+                                    'corr'] if getattr(arguments, name) is not None]
+        if others:
+            printv(parser.error('ERROR: -{} cannot be chained with other operations'.format(others[0])))
+        if data.ndim != 3:
+            printv(parser.error('ERROR: operations can only be chained on 3D images'))
+        try:
+            expression = get_expression(arguments.operations, dim, arguments)
+        except ValueError as e:
+            printv(parser.error('ERROR: ' + str(e)))
+        data_out = expression.evaluate(data, chunk_size=arguments.chunk or None)
+
+    elif arguments.otsu is not None:
         param = arguments.otsu
         data_out = otsu(data, param)
 
@@ -299,14 +346,10 @@ def main(args=None):
         data_out = data - data2
 
     elif arguments.laplacian is not None:
-        sigmas = convert_list_str(arguments.laplacian, "float")
-        if len(sigmas) == 1:
-            sigmas = [sigmas for i in range(len(data.shape))]
-        elif len(sigmas) != len(data.shape):
+        try:
+            sigmas = get_sigmas(','.join(arguments.laplacian), dim)
+        except ValueError:
             printv(parser.error('ERROR: -laplacian need the same number of inputs as the number of image dimension OR only one input'))
-        # adjust sigma based on voxel size
-        sigmas = [sigmas[i] / dim[i + 4] for i in range(3)]
-        # smooth data
         data_out = laplacian(data, sigmas)
 
     elif arguments.mul is not None:
@@ -322,34 +365,30 @@ def main(args=None):
 
     elif arguments.mean is not None:
         from numpy import mean
-        dim = dim_list.index(arguments.mean)
+        dim = DIM_LIST.index(arguments.mean)
         if dim + 1 > len(np.shape(data)):  # in case input volume is 3d and dim=t
             data = data[..., np.newaxis]
         data_out = mean(data, dim)
 
     elif arguments.rms is not None:
         from numpy import mean, sqrt, square
-        dim = dim_list.index(arguments.rms)
+        dim = DIM_LIST.index(arguments.rms)
         if dim + 1 > len(np.shape(data)):  # in case input volume is 3d and dim=t
             data = data[..., np.newaxis]
         data_out = sqrt(mean(square(data.astype(float)), dim))
 
     elif arguments.std is not None:
         from numpy import std
-        dim = dim_list.index(arguments.std)
+        dim = DIM_LIST.index(arguments.std)
         if dim + 1 > len(np.shape(data)):  # in case input volume is 3d and dim=t
             data = data[..., np.newaxis]
         data_out = std(data, dim, ddof=1)
 
     elif arguments.smooth is not None:
-        sigmas = convert_list_str(arguments.smooth, "float")
-        if len(sigmas) == 1:
-            sigmas = [sigmas[0] for i in range(len(data.shape))]
-        elif len(sigmas) != len(data.shape):
+        try:
+            sigmas = get_sigmas(arguments.smooth, dim)
+        except ValueError:
             printv(parser.error('ERROR: -smooth need the same number of inputs as the number of image dimension OR only one input'))
-        # adjust sigma based on voxel size
-        sigmas = [sigmas[i] / dim[i + 4] for i in range(3)]
-        # smooth data
         data_out = smooth(data, sigmas)
 
     elif arguments.dilate is not None:
@@ -452,6 +491,66 @@ def convert_list_str(string_list, type='int'):
     return new_type_list
 
 
+def get_sigmas(string_sigmas, dim):
+    """
+    Convert the standard deviations of a Gaussian kernel from mm to voxels.
+    Example: "2" or "2,2,1"
+    :param string_sigmas: comma-separated standard deviations in mm: one for all axes, or one per axis
+    :param dim: Image.dim of the image
+    :return: list of 3 floats
+    """
+    sigmas = convert_list_str(string_sigmas, "float")
+    if len(sigmas) == 1:
+        sigmas = [sigmas[0] for i in range(3)]
+    elif len(sigmas) != 3:
+        raise ValueError("Expected 1 or 3 standard deviations, got: {}".format(string_sigmas))
+    # adjust sigma based on voxel size
+    return [sigmas[i] / dim[i + 4] for i in range(3)]
+
+
+def get_operands(argument):
+    """
+    Get the operands of -add, -sub, -mul or -div: a number, or the data of images
+    :param argument: list of str: number or file names
+    :return: list: [float] or list of numpy arrays
+    """
+    try:
+        return [float(argument[0])]
+    except ValueError:
+        return [Image(fname).data for fname in argument]
+
+
+def get_expression(operations, dim, arguments):
+    """
+    Chain operations in the order they were given.
+    :param operations: list of tuples (name, value), see AppendOperation
+    :param dim: Image.dim of the input image
+    :param arguments: parsed arguments, for the options of morphological operations (-shape, -dim)
+    :return: spinalcordtoolbox.math.Expression
+    """
+    expression = sct.math.Expression()
+    for name, value in operations:
+        if name in ['add', 'mul']:
+            getattr(expression, name)(*get_operands(value))
+        elif name in ['sub', 'div']:
+            operands = get_operands(value)
+            if len(operands) > 1:
+                raise ValueError("-{} takes a single number or image".format(name))
+            getattr(expression, name)(operands[0])
+        elif name in ['thr', 'bin']:
+            getattr(expression, name)(value)
+        elif name in ['dilate', 'erode']:
+            getattr(expression, name)(value, shape=arguments.shape, dim=arguments.dim)
+        elif name == 'smooth':
+            expression.smooth(get_sigmas(value, dim))
+        elif name == 'laplacian':
+            expression.laplacian(get_sigmas(','.join(value), dim))
+        else:
+            # mean, rms, std
+            getattr(expression, name)(DIM_LIST.index(value))
+    return expression
+
+
 def otsu(data, nbins):
     from skimage.filters import threshold_otsu
     thresh = threshold_otsu(data, nbins)
@@ -545,19 +644,10 @@ def denoise_nlmeans(data_in, patch_radius=1, block_radius=5):
     """
     data_in: nd_array to denoise
     for more info about patch_radius and block radius, please refer to the dipy website: http://nipy.org/dipy/reference/dipy.denoise.html#dipy.denoise.nlmeans.nlmeans
+    The volume is processed in overlapping chunks across all available cores, see
+    spinalcordtoolbox.math.denoise_nlmeans.
     """
-    from dipy.denoise.nlmeans import nlmeans
-    from dipy.denoise.noise_estimate import estimate_sigma
-    from numpy import asarray
-    data_in = asarray(data_in)
-
-    block_radius_max = min(data_in.shape) - 1
-    block_radius = block_radius_max if block_radius > block_radius_max else block_radius
-
-    sigma = estimate_sigma(data_in)
-    denoised = nlmeans(data_in, sigma, patch_radius=patch_radius, block_radius=block_radius)
-
-    return denoised
+    return sct.math.denoise_nlmeans(data_in, patch_radius=patch_radius, block_radius=block_radius)
 
 
 def smooth(data, sigmas):
@@ -18,15 +18,16 @@ from __future__ import absolute_import
 # Python imports
 import sys
 import os
-import shutil
+import threading
+import concurrent.futures
 import numpy as np
+import nibabel as nib
 import argparse
 
 # SCT imports
 import sct_utils as sct
-import sct_apply_transfo
 import spinalcordtoolbox.image as msct_image
-import sct_maths
+from spinalcordtoolbox.warping import WarpPlan, INTERPOLATION_ORDER
 from spinalcordtoolbox.utils import Metavar, SmartFormatter
 
 
@@ -34,9 +35,9 @@ class Param:
     def __init__(self):
         self.fname_out = 'merged_images.nii.gz'
         self.interp = 'linear'
-        self.rm_tmp = True
         self.verbose = 1
         self.almost_zero = 0.00000001
+        self.n_jobs = 1
 
 
 # PARSER
@@ -94,13 +95,19 @@ def get_parser():
                       required=False)
     '''
     misc = parser.add_argument_group('MISC')
+    misc.add_argument(
+        "-j",
+        type=int,
+        help="Number of source images warped in parallel. 0: all available cores.",
+        required=False,
+        default=Param().n_jobs)
+    # deprecated: images are merged in memory, without temporary files
     misc.add_argument(
         "-r",
-        type=bool,
-        help='Remove temporary files.',
-        required = False,
-        default = Param().rm_tmp,
-        choices = (0, 1))
+        type=int,
+        help=argparse.SUPPRESS,
+        required=False,
+        choices=(0, 1))
     misc.add_argument(
         "-v",
         type=int,
@@ -123,6 +130,10 @@ def merge_images(list_fname_src, fname_dest, list_fname_warp, param):
     resulting value will be: dest(i,j,k) = (0.5*0.5 + 0.5*0.5) / (0.5+0.5) = 0.5. So this function acts like a weighted
     average operator, only in destination voxels that share multiple source voxels.
 
+    Each source image and its support (mask of its non-null voxels) are warped in memory, with a sampling grid shared
+    by the sources that have the same warping field and grid. The numerator and denominator of the weighted average
+    are accumulated in float32 volumes, so memory does not depend on the number of sources.
+
     Parameters
     ----------
     list_fname_src
@@ -134,60 +145,55 @@ def merge_images(list_fname_src, fname_dest, list_fname_warp, param):
     -------
 
     """
-    # create temporary folder
-    path_tmp = sct.tmp_create()
-
     # get dimensions of destination file
     nii_dest = msct_image.Image(fname_dest)
-
-    # initialize variables
-    data = np.zeros([nii_dest.dim[0], nii_dest.dim[1], nii_dest.dim[2], len(list_fname_src)])
-    partial_volume = np.zeros([nii_dest.dim[0], nii_dest.dim[1], nii_dest.dim[2], len(list_fname_src)])
-    data_merge = np.zeros([nii_dest.dim[0], nii_dest.dim[1], nii_dest.dim[2]])
-
-    # loop across files
-    i_file = 0
-    for fname_src in list_fname_src:
-
-        # apply transformation src --> dest
-        sct_apply_transfo.main(args=[
-            '-i', fname_src,
-            '-d', fname_dest,
-            '-w', list_fname_warp[i_file],
-            '-x', param.interp,
-            '-o', 'src_' + str(i_file) + '_template.nii.gz',
-            '-v', str(param.verbose)])
-        # create binary mask from input file by assigning one to all non-null voxels
-        sct_maths.main(args=[
-            '-i', fname_src,
-            '-bin', str(param.almost_zero),
-            '-o', 'src_' + str(i_file) + 'native_bin.nii.gz'])
-
-        # apply transformation to binary mask to compute partial volume
-        sct_apply_transfo.main(args=[
-            '-i', 'src_' + str(i_file) + 'native_bin.nii.gz',
-            '-d', fname_dest,
-            '-w', list_fname_warp[i_file],
-            '-x', param.interp,
-            '-o', 'src_' + str(i_file) + '_template_partialVolume.nii.gz'])
-
-        # open data
-        data[:, :, :, i_file] = msct_image.Image('src_' + str(i_file) + '_template.nii.gz').data
-        partial_volume[:, :, :, i_file] = msct_image.Image('src_' + str(i_file) + '_template_partialVolume.nii.gz').data
-        i_file += 1
-
-    # merge files using partial volume information (and convert nan resulting from division by zero to zeros)
-    data_merge = np.divide(np.sum(data * partial_volume, axis=3), np.sum(partial_volume, axis=3))
-    data_merge = np.nan_to_num(data_merge)
+    shape_dest = tuple(nii_dest.data.shape[:3])
+    order = INTERPOLATION_ORDER[param.interp]
+
+    # running sums of the partial volume weighted data, and of the partial volume
+    numerator = np.zeros(shape_dest, dtype=np.float32)
+    denominator = np.zeros(shape_dest, dtype=np.float32)
+    lock = threading.Lock()
+
+    # group the sources that share a sampling grid: same warping field, same source grid
+    groups = {}
+    for fname_src, fname_warp in zip(list_fname_src, list_fname_warp):
+        # only the header is read here
+        hdr_src = nib.load(fname_src).header
+        key = (os.path.abspath(fname_warp), hdr_src.get_data_shape()[:3], hdr_src.get_best_affine().tobytes())
+        groups.setdefault(key, []).append(fname_src)
+
+    def merge_group(fname_warp, list_fname_src_group):
+        plan = None
+        for fname_src in list_fname_src_group:
+            im_src = msct_image.Image(fname_src)
+            if plan is None:
+                sct.printv('Compose transformations for ' + fname_warp + '...', param.verbose)
+                plan = WarpPlan.from_files([fname_warp], im_src, nii_dest)
+            sct.printv('Warp ' + fname_src + '...', param.verbose)
+            # warp the data, and the binary mask of the non-null voxels to get the partial volume
+            data = plan.apply(im_src.data.astype(np.float32), order=order, mode='constant')
+            partial_volume = plan.apply((im_src.data > param.almost_zero).astype(np.float32), order=order,
+                                        mode='constant')
+            data *= partial_volume
+            with lock:
+                np.add(numerator, data, out=numerator)
+                np.add(denominator, partial_volume, out=denominator)
+
+    n_jobs = param.n_jobs if param.n_jobs > 0 else os.cpu_count()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(n_jobs, len(groups)))) as executor:
+        futures = [executor.submit(merge_group, key[0], list_fname_src_group)
+                   for key, list_fname_src_group in groups.items()]
+        for future in futures:
+            future.result()
+
+    # merge files using partial volume information (destination voxels outside all sources are set to zero)
+    data_merge = np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
 
     # write result in file
     nii_dest.data = data_merge
     nii_dest.save(param.fname_out)
 
-    # remove temporary folder
-    if param.rm_tmp:
-        sct.rmtree(path_tmp)
-
 
 # MAIN
 # ==========================================================================================
@@ -210,7 +216,9 @@ def main():
     if arguments.x is not None:
         param.interp = arguments.x
     if arguments.r is not None:
-        param.rm_tmp = arguments.r
+        sct.printv("WARNING: -r is deprecated and has no effect: images are merged in memory, without temporary "
+                   "files.", 1, 'warning')
+    param.n_jobs = arguments.j
     param.verbose = arguments.v
     sct.init_sct(log_level=param.verbose, update=True)  # Update log level
 
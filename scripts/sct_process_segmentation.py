@@ -20,17 +20,18 @@ from __future__ import absolute_import, division
 
 import sys, os
 import numpy as np
-from matplotlib.ticker import MaxNLocator
 
 import sct_utils as sct
 from msct_parser import Parser
 from spinalcordtoolbox import process_seg
 from spinalcordtoolbox.aggregate_slicewise import aggregate_per_slice_or_level, save_as_csv, func_wa, func_std, \
     func_sum, _merge_dict
-from spinalcordtoolbox.utils import parse_num_list
+from spinalcordtoolbox.utils import parse_num_list, lazy_import
 from spinalcordtoolbox.centerline.core import ParamCenterline
 from spinalcordtoolbox.reports.qc import generate_qc
 
+ticker = lazy_import('matplotlib.ticker')
+
 
 def get_parser():
     """
@@ -179,7 +180,7 @@ def _make_figure(metric, fit_results):
         ax.grid(True)
         ax.set_ylabel('CSA [$mm^2$]')
         ax.set_xticklabels([])
-        ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+        ax.xaxis.set_major_locator(ticker.MaxNLocator(integer=True))
 
         ax = fig.add_subplot(312)
         ax.grid(True)
@@ -190,7 +191,7 @@ def _make_figure(metric, fit_results):
         ax.legend(['Rotation about AP axis', 'Rotation about RL axis'])
         ax.set_ylabel('Angle [$deg$]')
         ax.set_xticklabels([])
-        ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+        ax.xaxis.set_major_locator(ticker.MaxNLocator(integer=True))
 
         ax = fig.add_subplot(313)
         ax.grid(True)
@@ -210,7 +211,7 @@ def _make_figure(metric, fit_results):
         ax.plot(zref_list, yfit_list, 'r')
         ax.legend(['Fitted (RL)', 'Fitted (AP)'])
         ax.set_ylabel('Centerline [$vox$]')
-        ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+        ax.xaxis.set_major_locator(ticker.MaxNLocator(integer=True))
     else:
         ax = fig.add_subplot(111)
         ax.plot(z, csa, 'k')
@@ -18,7 +18,6 @@ from __future__ import division, absolute_import
 import os, sys
 
 import numpy as np
-from scipy import ndimage as ndi
 
 import spinalcordtoolbox.image as msct_image
 from spinalcordtoolbox.image import Image
@@ -27,6 +26,9 @@ import sct_utils as sct
 from msct_parser import Parser
 from spinalcordtoolbox.centerline import optic
 from spinalcordtoolbox.reports.qc import generate_qc
+from spinalcordtoolbox.utils import lazy_import
+
+ndi = lazy_import('scipy.ndimage')
 
 
 def check_and_correct_segmentation(fname_segmentation, fname_centerline, folder_output='', threshold_distance=5.0,
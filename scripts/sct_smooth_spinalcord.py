@@ -16,14 +16,14 @@
 
 from __future__ import absolute_import
 
-import sys, os, time
+import sys, time
 
 import numpy as np
 
 import sct_utils as sct
-import sct_maths
-import spinalcordtoolbox.image as msct_image
-from sct_convert import convert
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.centerline.core import ParamCenterline, get_centerline
+from spinalcordtoolbox.smoothing import CurvedSpace
 from msct_parser import Parser
 
 # PARAMETERS
@@ -31,6 +31,7 @@ class Param:
     # The constructor
     def __init__(self):
         self.algo_fitting = 'bspline'  # Fitting algorithm for centerline. See sct_straighten_spinalcord.
+        self.mode = 'straighten'  # Smoothing in the straightened space, or directly along the centerline
 
     # update constructor with user's parameters
     def update(self, param_user):
@@ -82,12 +83,13 @@ def get_parser():
     parser.add_option(name='-param',
                       type_value=[[','], 'str'],
                       description="Advanced parameters. Assign value with \"=\"; Separate params with \",\"\n"
-                                  "algo_fitting {bspline, polyfit}: Algorithm for curve fitting. For more information, see sct_straighten_spinalcord. Default="+ param_default.algo_fitting + ".\n",
+                                  "algo_fitting {bspline, polyfit}: Algorithm for curve fitting. For more information, see sct_straighten_spinalcord. Default="+ param_default.algo_fitting + ".\n"
+                                  "mode {straighten, direct}: straighten: the image is resampled into the straightened space, smoothed, and resampled back. direct: the kernel is oriented along the centerline at each slice, without resampling (faster for small kernels, less accurate where the cord bends). Default=" + param_default.mode + ".\n",
                       mandatory=False)
     parser.usage.addSection('MISC')
     parser.add_option(name="-r",
                       type_value="multiple_choice",
-                      description='Remove temporary files.',
+                      description='Remove temporary files (not used: the image is smoothed in memory).',
                       mandatory=False,
                       default_value='1',
                       example=['0', '1'])
@@ -108,8 +110,10 @@ def main(args=None):
     param = Param()
     start_time = time.time()
 
+    if args is None:
+        args = sys.argv[1:]
     parser = get_parser()
-    arguments = parser.parse(sys.argv[1:])
+    arguments = parser.parse(args)
 
     fname_anat = arguments['-i']
     fname_centerline = arguments['-s']
@@ -117,8 +121,6 @@ def main(args=None):
         sigma = arguments['-smooth']
     if '-param' in arguments:
         param.update(arguments['-param'])
-    if '-r' in arguments:
-        remove_temp_files = int(arguments['-r'])
     verbose = int(arguments.get('-v'))
     sct.init_sct(log_level=verbose, update=True)  # Update log level
 
@@ -130,7 +132,6 @@ def main(args=None):
     sct.printv('  Verbose ........................... ' + str(verbose))
 
     # Check that input is 3D:
-    from spinalcordtoolbox.image import Image
     nx, ny, nz, nt, px, py, pz, pt = Image(fname_anat).dim
     dim = 4  # by default, will be adjusted later
     if nt == 1:
@@ -144,91 +145,36 @@ def main(args=None):
 
     # Extract path/file/extension
     path_anat, file_anat, ext_anat = sct.extract_fname(fname_anat)
-    path_centerline, file_centerline, ext_centerline = sct.extract_fname(fname_centerline)
-
-    path_tmp = sct.tmp_create(basename="smooth_spinalcord", verbose=verbose)
-
-    # Copying input data to tmp folder
-    sct.printv('\nCopying input data to tmp folder and convert to nii...', verbose)
-    sct.copy(fname_anat, os.path.join(path_tmp, "anat" + ext_anat))
-    sct.copy(fname_centerline, os.path.join(path_tmp, "centerline" + ext_centerline))
-
-    # go to tmp folder
-    curdir = os.getcwd()
-    os.chdir(path_tmp)
-
-    # convert to nii format
-    convert('anat' + ext_anat, 'anat.nii')
-    convert('centerline' + ext_centerline, 'centerline.nii')
-
-    # Change orientation of the input image into RPI
-    sct.printv('\nOrient input volume to RPI orientation...')
-    fname_anat_rpi = msct_image.Image("anat.nii") \
-     .change_orientation("RPI", generate_path=True) \
-     .save() \
-     .absolutepath
-
-    # Change orientation of the input image into RPI
-    sct.printv('\nOrient centerline to RPI orientation...')
-    fname_centerline_rpi = msct_image.Image("centerline.nii") \
-     .change_orientation("RPI", generate_path=True) \
-     .save() \
-     .absolutepath
-
-    # Straighten the spinal cord
-    # straighten segmentation
-    sct.printv('\nStraighten the spinal cord using centerline/segmentation...', verbose)
-    cache_sig = sct.cache_signature(input_files=[fname_anat_rpi, fname_centerline_rpi],
-                                    input_params={"x": "spline"})
-    cachefile = os.path.join(curdir, "straightening.cache")
-    if sct.cache_valid(cachefile, cache_sig) and os.path.isfile(os.path.join(curdir, 'warp_curve2straight.nii.gz')) and os.path.isfile(os.path.join(curdir, 'warp_straight2curve.nii.gz')) and os.path.isfile(os.path.join(curdir, 'straight_ref.nii.gz')):
-        # if they exist, copy them into current folder
-        sct.printv('Reusing existing warping field which seems to be valid', verbose, 'warning')
-        sct.copy(os.path.join(curdir, 'warp_curve2straight.nii.gz'), 'warp_curve2straight.nii.gz')
-        sct.copy(os.path.join(curdir, 'warp_straight2curve.nii.gz'), 'warp_straight2curve.nii.gz')
-        sct.copy(os.path.join(curdir, 'straight_ref.nii.gz'), 'straight_ref.nii.gz')
-        # apply straightening
-        sct.run(['sct_apply_transfo', '-i', fname_anat_rpi, '-w', 'warp_curve2straight.nii.gz', '-d', 'straight_ref.nii.gz', '-o', 'anat_rpi_straight.nii', '-x', 'spline'], verbose)
+
+    # Load input data in RPI orientation
+    im_anat = Image(fname_anat)
+    native_orientation = im_anat.orientation
+    im_anat.change_orientation('RPI')
+    im_centerline = Image(fname_centerline).change_orientation('RPI')
+
+    # Fit the centerline
+    sct.printv('\nFit the spinal cord centerline...', verbose)
+    _, arr_ctl, _, _ = get_centerline(im_centerline, ParamCenterline(algo_fitting=param.algo_fitting),
+                                      verbose=verbose)
+
+    # Compute the mapping between the image and the straightened space, then smooth along the centerline
+    sct.printv('\nCompute the mapping to the straightened spinal cord...', verbose)
+    space = CurvedSpace(arr_ctl, im_anat.dim[4:7], im_anat.data.shape)
+    if len(sigma) == 1:
+        sigma = [sigma[0]] * 3
+    if param.mode == 'direct':
+        sct.printv('\nSmooth along the centerline...', verbose)
+        data_smooth = space.smooth_direct(im_anat.data, sigma)
     else:
-        sct.run(['sct_straighten_spinalcord', '-i', fname_anat_rpi, '-o', 'anat_rpi_straight.nii', '-s', fname_centerline_rpi, '-x', 'spline', '-param', 'algo_fitting='+param.algo_fitting], verbose)
-        sct.cache_save(cachefile, cache_sig)
-        # move warping fields locally (to use caching next time)
-        sct.copy('warp_curve2straight.nii.gz', os.path.join(curdir, 'warp_curve2straight.nii.gz'))
-        sct.copy('warp_straight2curve.nii.gz', os.path.join(curdir, 'warp_straight2curve.nii.gz'))
-
-    # Smooth the straightened image along z
-    sct.printv('\nSmooth the straightened image...')
-    sigma_smooth = ",".join([str(i) for i in sigma])
-    sct_maths.main(args=['-i', 'anat_rpi_straight.nii',
-                         '-smooth', sigma_smooth,
-                         '-o', 'anat_rpi_straight_smooth.nii',
-                         '-v', '0'])
-    # Apply the reversed warping field to get back the curved spinal cord
-    sct.printv('\nApply the reversed warping field to get back the curved spinal cord...')
-    sct.run(['sct_apply_transfo', '-i', 'anat_rpi_straight_smooth.nii', '-o', 'anat_rpi_straight_smooth_curved.nii', '-d', 'anat.nii', '-w', 'warp_straight2curve.nii.gz', '-x', 'spline'], verbose)
-
-    # replace zeroed voxels by original image (issue #937)
-    sct.printv('\nReplace zeroed voxels by original image...', verbose)
-    nii_smooth = Image('anat_rpi_straight_smooth_curved.nii')
-    data_smooth = nii_smooth.data
-    data_input = Image('anat.nii').data
-    indzero = np.where(data_smooth == 0)
-    data_smooth[indzero] = data_input[indzero]
-    nii_smooth.data = data_smooth
-    nii_smooth.save('anat_rpi_straight_smooth_curved_nonzero.nii')
-
-    # come back
-    os.chdir(curdir)
+        sct.printv('\nSmooth the straightened image and get back the curved spinal cord...', verbose)
+        # voxels outside of the straightened space keep their original value (issue #937)
+        data_smooth = space.smooth(im_anat.data, sigma)
 
     # Generate output file
     sct.printv('\nGenerate output file...')
-    sct.generate_output_file(os.path.join(path_tmp, "anat_rpi_straight_smooth_curved_nonzero.nii"),
-                             file_anat + '_smooth' + ext_anat)
-
-    # Remove temporary files
-    if remove_temp_files == 1:
-        sct.printv('\nRemove temporary files...')
-        sct.rmtree(path_tmp)
+    im_anat.data = data_smooth
+    im_anat.change_orientation(native_orientation)
+    im_anat.save(file_anat + '_smooth' + ext_anat, dtype='float32')
 
     # Display elapsed time
     elapsed_time = time.time() - start_time
@@ -46,6 +46,7 @@ else:
 
 from spinalcordtoolbox import __version__, __sct_dir__, __data_dir__
 from spinalcordtoolbox.utils import check_exe
+from spinalcordtoolbox import tracing
 
 
 def init_sct(log_level=1, update=False):
@@ -287,17 +288,20 @@ def run(cmd, verbose=1, raise_exception=True, cwd=None, env=None, is_sct_binary=
 
     shell = isinstance(cmd, str)
 
-    process = subprocess.Popen(cmd, shell=shell, cwd=cwd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
-    output_final = ''
-    while True:
-        # Watch out for deadlock!!!
-        output = process.stdout.readline().decode("utf-8")
-        if output == '' and process.poll() is not None:
-            break
-        if output:
-            if verbose == 2:
-                printv(output.strip())
-            output_final += output.strip() + '\n'
+    name = os.path.basename(cmd.split(" ", 1)[0] if shell else cmd[0])
+    with tracing.span(name, cat='run', args={'cmd': cmdline}):
+        process = subprocess.Popen(cmd, shell=shell, cwd=cwd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, env=tracing.get_child_env(env))
+        output_final = ''
+        while True:
+            # Watch out for deadlock!!!
+            output = process.stdout.readline().decode("utf-8")
+            if output == '' and process.poll() is not None:
+                break
+            if output:
+                if verbose == 2:
+                    printv(output.strip())
+                output_final += output.strip() + '\n'
 
     status = process.returncode
     output = output_final.rstrip()
@@ -15,7 +15,12 @@ from __future__ import absolute_import
 
 import sys, os
 
+import numpy as np
+
 import spinalcordtoolbox.metadata
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.atlas import SparseAtlas
+from spinalcordtoolbox.warping import WarpPlan
 from spinalcordtoolbox.reports.qc import generate_qc
 from msct_parser import Parser
 import sct_utils as sct
@@ -74,7 +79,7 @@ class WarpTemplate:
         # Warp atlas
         if self.warp_atlas == 1:
             sct.printv('\nWARP ATLAS OF WHITE MATTER TRACTS:', self.verbose)
-            warp_label(self.path_template, self.folder_atlas, param.file_info_label, self.fname_src, self.fname_transfo, self.folder_out)
+            warp_atlas(self.path_template, self.folder_atlas, param.file_info_label, self.fname_src, self.fname_transfo, self.folder_out)
 
         # Warp spinal levels
         if self.warp_spinal_levels == 1:
@@ -121,6 +126,39 @@ def warp_label(path_label, folder_label, file_label, fname_src, fname_transfo, p
         sct.copy(os.path.join(path_label, folder_label, param.file_info_label), os.path.join(path_out, folder_label))
 
 
+def warp_atlas(path_label, folder_label, file_label, fname_src, fname_transfo, path_out):
+    """
+    Warp the label files of an atlas according to info_label.txt file, in-process: the atlas is loaded as a
+    SparseAtlas, and only the voxels of the destination image that sample the labels are interpolated.
+    :param path_label:
+    :param folder_label:
+    :param file_label:
+    :param fname_src:
+    :param fname_transfo:
+    :param path_out:
+    :return:
+    """
+    try:
+        atlas = SparseAtlas.from_folder(os.path.join(path_label, folder_label), file_label)
+    except Exception as error:
+        sct.printv('\nWARNING: Cannot warp label ' + folder_label + ': ' + str(error), 1, 'warning')
+        raise
+    if not os.path.exists(os.path.join(path_out, folder_label)):
+        os.makedirs(os.path.join(path_out, folder_label))
+    im_dest = Image(fname_src)
+    plan = WarpPlan.from_files([fname_transfo], Image(os.path.join(path_label, folder_label, atlas.filenames[0])),
+                               im_dest)
+    atlas_warped = {}
+    for i_label, filename in enumerate(atlas.filenames):
+        order = 0 if get_interp(filename) == 'NearestNeighbor' else 1
+        if order not in atlas_warped:
+            atlas_warped[order] = atlas.warp(plan, order=order)
+        im_label = Image(atlas_warped[order].get_label(i_label).astype(np.float32), hdr=im_dest.hdr.copy())
+        im_label.save(os.path.join(path_out, folder_label, filename), dtype='float32', verbose=0)
+    # Copy list.txt
+    sct.copy(os.path.join(path_label, folder_label, param.file_info_label), os.path.join(path_out, folder_label))
+
+
 # Get interpolation method
 # ==========================================================================================
 def get_interp(file_label):
@@ -15,8 +15,9 @@ import csv
 import datetime
 import logging
 
-from spinalcordtoolbox.template import get_slices_from_vertebral_levels, get_vertebral_level_from_slice
+from spinalcordtoolbox.template import get_vert_level_index
 from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.atlas import SparseAtlas
 from spinalcordtoolbox.utils import __version__, parse_num_list_inv
 
 
@@ -69,6 +70,29 @@ def func_max(data, mask=None, map_clusters=None):
     return np.max(data), None
 
 
+def _get_cluster_ids(map_clusters):
+    """
+    Iterate across all labels (excluding the first one) and generate cluster labels. Examples of input/output:
+      [[0], [0], [0], [1], [2], [0]] --> [0, 0, 0, 1, 2, 0]
+      [[0, 1], [0], [0], [1], [2]] --> [0, 0, 0, 0, 1]
+      [[0, 1], [0], [1], [2], [3]] --> [0, 0, 0, 1, 2]
+    :param map_clusters: list of list of int: see func_map()
+    :return: list of int: cluster of each label
+    """
+    possible_clusters = [map_clusters[0]]
+    id_clusters = [0]  # this one corresponds to the first cluster
+    for i_cluster in map_clusters[1:]:  # skip the first
+        found_index = False
+        for possible_cluster in possible_clusters:
+            if i_cluster[0] in possible_cluster:
+                id_clusters.append(possible_clusters.index(possible_cluster))
+                found_index = True
+        if not found_index:
+            possible_clusters.append(i_cluster)
+            id_clusters.append(possible_clusters.index([i_cluster[0]]))
+    return id_clusters
+
+
 def func_map(data, mask, map_clusters):
     """
     Compute maximum a posteriori (MAP) by aggregating the last dimension of mask according to a clustering method
@@ -85,21 +109,7 @@ def func_map(data, mask, map_clusters):
     # Check number of labels and map_clusters
     assert mask.shape[-1] == len(map_clusters)
 
-    # Iterate across all labels (excluding the first one) and generate cluster labels. Examples of input/output:
-    #   [[0], [0], [0], [1], [2], [0]] --> [0, 0, 0, 1, 2, 0]
-    #   [[0, 1], [0], [0], [1], [2]] --> [0, 0, 0, 0, 1]
-    #   [[0, 1], [0], [1], [2], [3]] --> [0, 0, 0, 1, 2]
-    possible_clusters = [map_clusters[0]]
-    id_clusters = [0]  # this one corresponds to the first cluster
-    for i_cluster in map_clusters[1:]:  # skip the first
-        found_index = False
-        for possible_cluster in possible_clusters:
-            if i_cluster[0] in possible_cluster:
-                id_clusters.append(possible_clusters.index(possible_cluster))
-                found_index = True
-        if not found_index:
-            possible_clusters.append(i_cluster)
-            id_clusters.append(possible_clusters.index([i_cluster[0]]))
+    id_clusters = _get_cluster_ids(map_clusters)
 
     # Sum across each clustered labels, then concatenate to generate mask_clusters
     # mask_clusters has dimension: x, y, z, n_clustered_labels, with n_clustered_labels being equal to the number of
@@ -209,21 +219,12 @@ def func_wa(data, mask=None, map_clusters=None):
     return np.average(data, weights=mask), None
 
 
-def aggregate_per_slice_or_level(metric, mask=None, slices=[], levels=[], perslice=None, perlevel=False,
-                                 vert_level=None, group_funcs=(('MEAN', func_wa),), map_clusters=None):
+def _get_slicegroups(n_slices, slices, levels, perslice, perlevel, vert_level):
     """
-    The aggregation will be performed along the last dimension of 'metric' ndarray.
-    :param metric: Class Metric(): data to aggregate.
-    :param mask: Class Metric(): mask to use for aggregating the data. Optional.
-    :param slices: List[int]: Slices to aggregate metric from. If empty, select all slices.
-    :param levels: List[int]: Vertebral levels to aggregate metric from. It has priority over "slices".
-    :param Bool perslice: Aggregate per slice (True) or across slices (False)
-    :param Bool perlevel: Aggregate per level (True) or across levels (False). Has priority over "perslice".
-    :param vert_level: Vertebral level. Could be either an Image or a file name.
-    :param tuple group_funcs: Name and function to apply on metric. Example: (('MEAN', func_wa),)). Note, the function
-      has special requirements in terms of i/o. See the definition to func_wa and use it as a template.
-    :param map_clusters: list of list of int: See func_map()
-    :return: Aggregated metric
+    Groups of slices (and their vertebral levels) across which metrics are aggregated.
+    :param n_slices: int: number of slices of the metric
+    :param slices, levels, perslice, perlevel, vert_level: see aggregate_per_slice_or_level()
+    :return: list of tuple: slicegroups, list of tuple: vertgroups (None if levels are not used)
     """
     # If user neither specified slices nor levels, set perslice=True, otherwise, the output will likely contain nan
     # because in many cases the segmentation does not span the whole I-S dimension.
@@ -234,15 +235,14 @@ def aggregate_per_slice_or_level(metric, mask=None, slices=[], levels=[], persli
             perslice = False
 
     # if slices is empty, select all available slices from the metric
-    ndim = metric.data.ndim
     if not slices:
-        slices = range(metric.data.shape[ndim-1])
+        slices = range(n_slices)
 
     # aggregation based on levels
     if levels:
-        im_vert_level = Image(vert_level).change_orientation('RPI')
+        vert_level_index = get_vert_level_index(Image(vert_level).change_orientation('RPI'))
         # slicegroups = [(0, 1, 2), (3, 4, 5), (6, 7, 8)]
-        slicegroups = [tuple(get_slices_from_vertebral_levels(im_vert_level, level)) for level in levels]
+        slicegroups = [tuple(vert_level_index.get_slices(level)) for level in levels]
         if perlevel:
             # vertgroups = [(2,), (3,), (4,)]
             vertgroups = [tuple([level]) for level in levels]
@@ -250,7 +250,7 @@ def aggregate_per_slice_or_level(metric, mask=None, slices=[], levels=[], persli
             # slicegroups = [(0,), (1,), (2,), (3,), (4,), (5,), (6,), (7,), (8,)]
             slicegroups = [tuple([i]) for i in functools.reduce(operator.concat, slicegroups)]  # reduce to individual tuple
             # vertgroups = [(2,), (2,), (2,), (3,), (3,), (3,), (4,), (4,), (4,)]
-            vertgroups = [tuple([get_vertebral_level_from_slice(im_vert_level, i[0])]) for i in slicegroups]
+            vertgroups = [tuple([vert_level_index.get_level(i[0])]) for i in slicegroups]
         # output aggregate metric across levels
         else:
             # slicegroups = [(0, 1, 2, 3, 4, 5, 6, 7, 8)]
@@ -266,6 +266,26 @@ def aggregate_per_slice_or_level(metric, mask=None, slices=[], levels=[], persli
         else:
             # slicegroups = [(0, 1, 2, 3, 4, 5, 6, 7, 8)]
             slicegroups = [tuple(slices)]
+    return slicegroups, vertgroups
+
+
+def aggregate_per_slice_or_level(metric, mask=None, slices=[], levels=[], perslice=None, perlevel=False,
+                                 vert_level=None, group_funcs=(('MEAN', func_wa),), map_clusters=None):
+    """
+    The aggregation will be performed along the last dimension of 'metric' ndarray.
+    :param metric: Class Metric(): data to aggregate.
+    :param mask: Class Metric(): mask to use for aggregating the data. Optional.
+    :param slices: List[int]: Slices to aggregate metric from. If empty, select all slices.
+    :param levels: List[int]: Vertebral levels to aggregate metric from. It has priority over "slices".
+    :param Bool perslice: Aggregate per slice (True) or across slices (False)
+    :param Bool perlevel: Aggregate per level (True) or across levels (False). Has priority over "perslice".
+    :param vert_level: Vertebral level. Could be either an Image or a file name.
+    :param tuple group_funcs: Name and function to apply on metric. Example: (('MEAN', func_wa),)). Note, the function
+      has special requirements in terms of i/o. See the definition to func_wa and use it as a template.
+    :param map_clusters: list of list of int: See func_map()
+    :return: Aggregated metric
+    """
+    slicegroups, vertgroups = _get_slicegroups(metric.data.shape[-1], slices, levels, perslice, perlevel, vert_level)
     agg_metric = dict((slicegroup, dict()) for slicegroup in slicegroups)
 
     # loop across slice group
@@ -419,6 +439,140 @@ def extract_metric(data, labels=None, slices=None, levels=None, perslice=True, p
                                         map_clusters=map_clusters)
 
 
+def _solve_batched(matrices, vectors):
+    """
+    Compute pinv(A).b for a list of square matrices A of possibly different sizes. Matrices are grouped by size, so that
+    each group is solved with a single (stacked) call to pinv.
+    :param matrices: list of 2d-array
+    :param vectors: list of 1d-array
+    :return: list of 1d-array
+    """
+    results = [None] * len(matrices)
+    groups = {}
+    for i, matrix in enumerate(matrices):
+        groups.setdefault(matrix.shape[0], []).append(i)
+    for ids in groups.values():
+        solutions = np.einsum('nij,nj->ni', np.linalg.pinv(np.stack([matrices[i] for i in ids])),
+                              np.stack([vectors[i] for i in ids]))
+        for i, solution in zip(ids, solutions):
+            results[i] = solution
+    return results
+
+
+def extract_metric_multilabel(data, labels, label_struc, id_labels, slices=None, levels=None, perslice=True,
+                              perlevel=False, vert_level=None, method=None, indiv_labels_ids=None):
+    """
+    Extract metric within several labels in a single pass. This gives the same results as calling extract_metric() for
+    each label, but the data and labels of each slice group are only read once, and all labels are estimated together:
+    - WA, BIN and STD are computed from the product of the labels with a (label x requested label) weight matrix;
+    - ML and MAP are computed from the Gram matrix of all labels (Xt.X and Xt.y), from which the system of each
+      requested label (that label + the complementary ones) is derived, instead of being computed from the voxels.
+    :param data: Class Metric(): Data (a.k.a. metric) of n-dimension to extract aggregated value from
+    :param labels: ndarray: Labels of (n+1)dim. The last dim encloses the labels. Or SparseAtlas (3d data only), whose
+      labels are only read where they are non-zero.
+    :param label_struc: dict of LabelStruc
+    :param id_labels: list of int: IDs of labels to select (keys of label_struc)
+    :param slices, levels, perslice, perlevel, vert_level, method, indiv_labels_ids: see extract_metric()
+    :return: list of aggregate_per_slice_or_level() outputs: one per label in id_labels
+    """
+    func_names = {'wa': ('WA', 'STD'), 'bin': ('BIN', 'STD'), 'ml': ('ML', 'STD'), 'map': ('MAP', 'STD'),
+                  'max': ('MAX',)}[method]
+    n_labels = labels.n_labels if isinstance(labels, SparseAtlas) else labels.shape[-1]
+    # Weight matrix: column j sums the (individual) labels that make the j-th requested label
+    weights = np.zeros((n_labels, len(id_labels)))
+    for j, id_label in enumerate(id_labels):
+        np.add.at(weights[:, j], label_struc[id_label].id, 1)
+    # For ML and MAP: selection matrix of the labels of each system (first the requested label, then the
+    # complementary ones), and clusters of these labels for the MAP prior. See extract_metric().
+    selections, clusters = [], []
+    if method in ['ml', 'map']:
+        for j, id_label in enumerate(id_labels):
+            id_label_compl = diff_between_list_or_int(indiv_labels_ids, label_struc[id_label].id)
+            selection = np.zeros((n_labels, 1 + len(id_label_compl)))
+            selection[:, 0] = weights[:, j]
+            selection[id_label_compl, np.arange(1, selection.shape[1])] = 1
+            selections.append(selection)
+            if method == 'map':
+                if isinstance(label_struc[id_label].id, list):
+                    map_clusters = [list(set([label_struc[i].map_cluster for i in label_struc[id_label].id]))]
+                else:
+                    map_clusters = [[label_struc[id_label].map_cluster]]
+                map_clusters += [[label_struc[i].map_cluster] for i in id_label_compl]
+                id_clusters = _get_cluster_ids(map_clusters)
+                cluster = np.zeros((len(id_clusters), max(id_clusters) + 1))
+                cluster[np.arange(len(id_clusters)), id_clusters] = 1
+                clusters.append(cluster)
+        # the mask of each label is [label, complementary labels]
+        mask_weights = np.stack([selection.sum(axis=1) for selection in selections], axis=1)
+    else:
+        mask_weights = weights
+
+    slicegroups, vertgroups = _get_slicegroups(data.data.shape[-1], slices, levels, perslice, perlevel, vert_level)
+    agg_metrics = [dict((slicegroup, dict()) for slicegroup in slicegroups) for _ in id_labels]
+    for i_group, slicegroup in enumerate(slicegroups):
+        # selection is done in the last dimension of data, and in the one before last for labels. Voxels are ordered
+        # slice by slice, as in SparseAtlas.
+        y = np.moveaxis(data.data[..., slicegroup], -1, 0).reshape(-1)
+        # labels of the voxels within at least one label (the others do not contribute to the estimations)
+        if isinstance(labels, SparseAtlas):
+            index, x = labels.get_support(slicegroup)
+        else:
+            x = np.moveaxis(labels[..., slicegroup, :], -2, 0).reshape(-1, n_labels)
+            index = np.flatnonzero(np.any(x != 0, axis=1))
+            x = x[index]
+        size = x.sum(axis=0).dot(mask_weights)
+        # Ignore nonfinite values
+        is_finite = np.isfinite(y)
+        y[~is_finite] = 0.
+        results = {'MAX': np.full(len(id_labels), np.max(y))}
+        y, x = y[index][is_finite[index]], x[is_finite[index]]
+        mask_sum = x.sum(axis=0).dot(mask_weights)
+        # weighted average and standard deviation within each label
+        x_label = x.dot(weights)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weights_sum = x_label.sum(axis=0)
+            results['WA'] = x_label.T.dot(y) / weights_sum
+            results['STD'] = np.sqrt(np.sum(x_label * (y[:, np.newaxis] - results['WA']) ** 2, axis=0) / weights_sum)
+            x_bin = (x_label >= 0.5).astype(float)
+            bin_sum = x_bin.sum(axis=0)
+            results['BIN'] = x_bin.T.dot(y) / bin_sum
+        errors = {'WA': weights_sum == 0, 'STD': weights_sum == 0, 'BIN': bin_sum == 0}
+        if method in ['ml', 'map']:
+            gram, xty = x.T.dot(x), x.T.dot(y)
+            matrices = [selection.T.dot(gram).dot(selection) for selection in selections]
+            vectors = [selection.T.dot(xty) for selection in selections]
+            if method == 'ml':
+                betas = _solve_batched(matrices, vectors)
+            else:
+                # prior: ML estimation for each cluster of labels, then MAP estimation (see func_map())
+                betas_cluster = _solve_batched([c.T.dot(a).dot(c) for a, c in zip(matrices, clusters)],
+                                               [c.T.dot(b) for b, c in zip(vectors, clusters)])
+                betas_0 = [c.dot(beta_cluster) for c, beta_cluster in zip(clusters, betas_cluster)]
+                betas = _solve_batched([a + np.eye(a.shape[0]) for a in matrices],
+                                       [b - a.dot(beta_0) for a, b, beta_0 in zip(matrices, vectors, betas_0)])
+                betas = [beta_0 + beta for beta_0, beta in zip(betas_0, betas)]
+            results[method.upper()] = np.array([beta[0] for beta in betas])
+
+        for j, id_label in enumerate(id_labels):
+            agg_metric = agg_metrics[j][slicegroup]
+            agg_metric['VertLevel'] = None if vertgroups is None else vertgroups[i_group]
+            agg_metric['Label'] = label_struc[id_label].name
+            agg_metric['Size [vox]'] = size[j]
+            for name in func_names:
+                if mask_sum[j] == 0:
+                    result = None
+                elif name in errors and errors[name][j]:
+                    # same as np.average()
+                    result = "Weights sum to zero, can't be normalized"
+                    logging.warning(result)
+                else:
+                    result = results[name][j]
+                    if np.isnan(result):
+                        result = None
+                agg_metric['{}({})'.format(name, data.label)] = result
+    return agg_metrics
+
+
 def make_a_string(item):
     """Convert tuple or list or None to a string. Important: elements in tuple or list are separated with ; (not ,)
     for compatibility with csv."""
@@ -462,7 +616,8 @@ def _merge_dict(dict_in):
 def save_as_csv(agg_metric, fname_out, fname_in=None, append=False):
     """
     Write metric structure as csv. If field 'error' exists, it will add a specific column.
-    :param agg_metric: output of aggregate_per_slice_or_level()
+    :param agg_metric: output of aggregate_per_slice_or_level(), or list of them (e.g., one per label) to write in the
+      same file
     :param fname_out: output filename. Extention (.csv) will be added if it does not exist.
     :param fname_in: input file to be listed in the csv file (e.g., segmentation file which produced the results).
     :param append: Bool: Append results at the end of file (if exists) instead of overwrite.
@@ -476,13 +631,15 @@ def save_as_csv(agg_metric, fname_out, fname_in=None, append=False):
                  'STD(angle_RL)', 'MEAN(diameter_AP)', 'STD(diameter_AP)', 'MEAN(diameter_RL)', 'STD(diameter_RL)',
                  'MEAN(eccentricity)', 'STD(eccentricity)', 'MEAN(orientation)', 'STD(orientation)',
                  'MEAN(solidity)', 'STD(solidity)', 'SUM(length)', 'WA()', 'BIN()', 'ML()', 'MAP()', 'STD()', 'MAX()']
+    if isinstance(agg_metric, dict):
+        agg_metric = [agg_metric]
     # TODO: if append=True but file does not exist yet, raise warning and set append=False
     # write header (only if append=False)
     if not append or not os.path.isfile(fname_out):
         with open(fname_out, 'w') as csvfile:
             # spamwriter = csv.writer(csvfile, delimiter=',')
             header = ['Timestamp', 'SCT Version', 'Filename', 'Slice (I->S)', 'VertLevel']
-            agg_metric_key = [v for i, (k, v) in enumerate(agg_metric.items())][0]
+            agg_metric_key = [v for i, (k, v) in enumerate(agg_metric[0].items())][0]
             for item in list_item:
                 for key in agg_metric_key:
                     if item in key:
@@ -494,17 +651,18 @@ def save_as_csv(agg_metric, fname_out, fname_in=None, append=False):
     # populate data
     with open(fname_out, 'a') as csvfile:
         spamwriter = csv.writer(csvfile, delimiter=',')
-        for slicegroup in sorted(agg_metric.keys()):
-            line = list()
-            line.append(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))  # Timestamp
-            line.append(__version__)  # SCT Version
-            line.append(fname_in)  # file name associated with the results
-            line.append(parse_num_list_inv(slicegroup))  # list all slices in slicegroup
-            line.append(parse_num_list_inv(agg_metric[slicegroup]['VertLevel']))  # list vertebral levels
-            agg_metric_key = [v for i, (k, v) in enumerate(agg_metric.items())][0]
-            for item in list_item:
-                for key in agg_metric_key:
-                    if item in key:
-                        line.append(str(agg_metric[slicegroup][key]))
-                        break
-            spamwriter.writerow(line)
+        for agg_metric_label in agg_metric:
+            agg_metric_key = [v for i, (k, v) in enumerate(agg_metric_label.items())][0]
+            for slicegroup in sorted(agg_metric_label.keys()):
+                line = list()
+                line.append(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))  # Timestamp
+                line.append(__version__)  # SCT Version
+                line.append(fname_in)  # file name associated with the results
+                line.append(parse_num_list_inv(slicegroup))  # list all slices in slicegroup
+                line.append(parse_num_list_inv(agg_metric_label[slicegroup]['VertLevel']))  # list vertebral levels
+                for item in list_item:
+                    for key in agg_metric_key:
+                        if item in key:
+                            line.append(str(agg_metric_label[slicegroup][key]))
+                            break
+                spamwriter.writerow(line)
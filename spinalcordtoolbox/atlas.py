@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Sparse representation of atlases (e.g. the PAM50 white matter tracts): each label is non-zero in a small fraction of
+# the voxels, so the labels are stored as a sparse (voxel x label) matrix instead of a dense 4D stack.
+
+
+from __future__ import division, absolute_import
+
+import os
+import logging
+
+import numpy as np
+
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.metadata import read_label_file
+from spinalcordtoolbox.utils import lazy_import
+
+
+logger = logging.getLogger(__name__)
+
+sparse = lazy_import('scipy.sparse')
+
+
+def _to_rows(data):
+    """
+    Flatten the first three axes of an array in the voxel order of SparseAtlas: slice by slice (along the third axis),
+    then in C order within each slice.
+    :param data: numpy array (x, y, z, ...)
+    :return: numpy array (x*y*z, ...)
+    """
+    return np.moveaxis(data, 2, 0).reshape((-1,) + data.shape[3:])
+
+
+def _row_index(ijk, shape):
+    """
+    :param ijk: tuple of 3 numpy arrays: voxel indices along each axis
+    :param shape: tuple: 3d shape of the grid
+    :return: numpy array: row of each voxel in the order of _to_rows()
+    """
+    return (ijk[2] * shape[0] + ijk[0]) * shape[1] + ijk[1]
+
+
+def _from_rows(rows, shape):
+    """Inverse of _to_rows(): reshape rows to an array (x, y, z, ...) with shape[:3] = (x, y, z)"""
+    return np.moveaxis(rows.reshape((shape[2], shape[0], shape[1]) + rows.shape[1:]), 0, 2)
+
+
+class SparseAtlas(object):
+    """
+    Labels of an atlas, stored as a sparse CSR matrix of weights with one row per voxel and one column per label.
+    Voxels are ordered slice by slice (along the third axis), so the rows of a slice are contiguous and slices are
+    extracted without reading the rest of the atlas.
+
+    Example:
+      atlas = SparseAtlas.load('PAM50/atlas')  # folder with info_label.txt, or .npz written by SparseAtlas.save()
+      sums = atlas.weighted_sum(Image('fa.nii.gz').data, per_slice=True)  # (nz, n_labels)
+      volume_fractions = atlas.weighted_sum(np.ones(atlas.shape), per_slice=True)
+    """
+    def __init__(self, matrix, shape, affine, ids, names, filenames=None):
+        """
+        :param matrix: scipy sparse matrix (n_voxels, n_labels), voxels ordered as in _to_rows()
+        :param shape: tuple: 3d shape of the grid of the atlas
+        :param affine: 4x4 affine of the grid of the atlas
+        :param ids: list of int: ID of each label
+        :param names: list of str: name of each label
+        :param filenames: list of str: file of each label (used to write the labels of a warped atlas)
+        """
+        self.shape = tuple(int(n) for n in shape)
+        if matrix.shape != (int(np.prod(self.shape)), len(ids)):
+            raise ValueError("Sparse matrix of shape {} does not match {} labels on a grid of shape {}".format(
+                matrix.shape, len(ids), self.shape))
+        self.matrix = sparse.csr_matrix(matrix)
+        self.affine = np.asarray(affine, dtype=np.float64)
+        self.ids = list(ids)
+        self.names = list(names)
+        self.filenames = list(filenames) if filenames is not None else None
+        self._entry_rows = None
+
+    @property
+    def n_labels(self):
+        return self.matrix.shape[1]
+
+    @property
+    def nbytes(self):
+        """Memory used by the sparse matrix, in bytes"""
+        return self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+
+    @classmethod
+    def from_dense(cls, data, affine, ids=None, names=None, filenames=None):
+        """
+        :param data: numpy array (x, y, z, n_labels)
+        :param affine: 4x4 affine of the grid
+        :param ids, names, filenames: see __init__(). Default ids: 0..n_labels-1, default names: str(id).
+        :return: SparseAtlas
+        """
+        ids = list(range(data.shape[3])) if ids is None else ids
+        names = [str(i) for i in ids] if names is None else names
+        return cls(sparse.csr_matrix(_to_rows(data)), data.shape[:3], affine, ids, names, filenames)
+
+    @classmethod
+    def from_files(cls, fnames, ids, names, orientation=None):
+        """
+        Read labels from NIfTI files, one at a time, so that the dense 4D stack is never in memory.
+        :param fnames: list of str: file of each label. All files should be defined on the same grid.
+        :param ids: list of int: ID of each label
+        :param names: list of str: name of each label
+        :param orientation: str: orientation to change the labels to (e.g. 'RPI'). Default: keep the orientation of the
+            files.
+        :return: SparseAtlas
+        """
+        rows, cols, weights = [], [], []
+        shape, affine, dtype = None, None, None
+        for i_label, fname in enumerate(fnames):
+            im_label = Image(fname)
+            if orientation is not None:
+                im_label.change_orientation(orientation)
+            data = im_label.data[..., np.newaxis] if im_label.data.ndim == 2 else im_label.data
+            if shape is None:
+                shape, affine = data.shape[:3], im_label.hdr.get_best_affine()
+                dtype = np.float64 if np.issubdtype(data.dtype, np.integer) else data.dtype
+            elif data.shape[:3] != shape:
+                raise ValueError("Label {} has shape {}, other labels have shape {}".format(fname, data.shape, shape))
+            data = _to_rows(data)
+            index = np.flatnonzero(data)
+            rows.append(index)
+            cols.append(np.full(len(index), i_label, dtype=index.dtype))
+            weights.append(data[index].astype(dtype))
+            logger.debug("Loaded label %s: %d voxels", fname, len(index))
+        matrix = sparse.coo_matrix((np.concatenate(weights), (np.concatenate(rows), np.concatenate(cols))),
+                                   shape=(int(np.prod(shape)), len(fnames)))
+        return cls(matrix, shape, affine, ids, names, [os.path.basename(fname) for fname in fnames])
+
+    @classmethod
+    def from_folder(cls, path_label, file_info_label='info_label.txt', orientation=None):
+        """
+        Read the individual labels listed in the info_label.txt file of a folder.
+        :param path_label: str: folder of the labels
+        :param file_info_label: str: name of the file listing the labels, in path_label
+        :param orientation: str: see from_files()
+        :return: SparseAtlas
+        """
+        ids, names, filenames = read_label_file(path_label, file_info_label)[:3]
+        return cls.from_files([os.path.join(path_label, filename) for filename in filenames], ids, names,
+                              orientation)
+
+    @classmethod
+    def load(cls, fname, file_info_label='info_label.txt', orientation=None):
+        """
+        :param fname: str: folder of the labels (see from_folder()) or .npz file written by save()
+        :param file_info_label: str: see from_folder()
+        :param orientation: str: see from_folder(). Not used for .npz files, which keep the orientation they were
+            saved with.
+        :return: SparseAtlas
+        """
+        if os.path.isdir(fname):
+            return cls.from_folder(fname, file_info_label, orientation)
+        with np.load(fname) as npz:
+            matrix = sparse.csr_matrix((npz['data'], npz['indices'], npz['indptr']),
+                                       shape=tuple(npz['matrix_shape']))
+            filenames = [str(f) for f in npz['filenames']] if 'filenames' in npz else None
+            return cls(matrix, npz['shape'], npz['affine'], [int(i) for i in npz['ids']],
+                       [str(name) for name in npz['names']], filenames)
+
+    def save(self, fname):
+        """
+        Save the atlas as a compressed .npz file, which loads much faster than the NIfTI labels.
+        :param fname: str: output file (.npz)
+        """
+        fields = dict(data=self.matrix.data, indices=self.matrix.indices, indptr=self.matrix.indptr,
+                      matrix_shape=self.matrix.shape, shape=self.shape, affine=self.affine, ids=self.ids,
+                      names=self.names)
+        if self.filenames is not None:
+            fields['filenames'] = self.filenames
+        np.savez_compressed(fname, **fields)
+
+    def to_dense(self):
+        """:return: numpy array (x, y, z, n_labels), as the labels stacked along a fourth axis"""
+        return _from_rows(self.matrix.toarray(), self.shape)
+
+    def get_label(self, i_label):
+        """
+        :param i_label: int: index of the label (column of the matrix, not its ID)
+        :return: 3d numpy array of the weights of the label
+        """
+        return _from_rows(self.matrix[:, i_label].toarray()[:, 0], self.shape)
+
+    def get_slices(self, slices):
+        """
+        Labels within a group of slices.
+        :param slices: list of int: indices along the third axis
+        :return: scipy CSR matrix (len(slices) * nx * ny, n_labels), whose rows are ordered slice by slice, then in C
+            order within each slice
+        """
+        n_slice = self.shape[0] * self.shape[1]
+        rows = np.concatenate([np.arange(iz * n_slice, (iz + 1) * n_slice) for iz in slices])
+        return self.matrix[rows]
+
+    def get_support(self, slices):
+        """
+        Labels of the voxels, within a group of slices, where at least one label is non-zero.
+        :param slices: list of int: indices along the third axis
+        :return: index of these voxels in the rows of get_slices(), dense numpy array (n_voxels, n_labels) of weights
+        """
+        matrix = self.get_slices(slices)
+        index = np.flatnonzero(np.diff(matrix.indptr))
+        return index, matrix[index].toarray()
+
+    def weighted_sum(self, data, per_slice=False):
+        """
+        Sum of data weighted by each label.
+        :param data: 3d numpy array defined on the grid of the atlas
+        :param per_slice: bool: sum within each slice (along the third axis) instead of across the whole volume
+        :return: numpy array (n_labels,), or (nz, n_labels) if per_slice
+        """
+        if data.shape[:3] != self.shape:
+            raise ValueError("Data shape {} does not match the atlas grid {}".format(data.shape, self.shape))
+        values = _to_rows(data).astype(np.float64, copy=False)
+        if not per_slice:
+            return self.matrix.T.dot(values)
+        if self._entry_rows is None:
+            self._entry_rows = np.repeat(np.arange(self.matrix.shape[0]), np.diff(self.matrix.indptr))
+        rows = self._entry_rows
+        bins = rows // (self.shape[0] * self.shape[1]) * self.n_labels + self.matrix.indices
+        sums = np.bincount(bins, weights=self.matrix.data * values[rows], minlength=self.shape[2] * self.n_labels)
+        return sums.reshape(self.shape[2], self.n_labels)
+
+    def warp(self, plan, order=1):
+        """
+        Warp the labels onto the destination grid of a WarpPlan, with the same interpolation as WarpPlan.apply() (mode
+        'constant'). Only the destination voxels that sample the support of the labels are interpolated: warping is a
+        sparse product between the interpolation weights of these voxels and the labels.
+        :param plan: spinalcordtoolbox.warping.WarpPlan, from the grid of the atlas
+        :param order: int: 0 (nearest neighbour) or 1 (linear)
+        :return: SparseAtlas on the destination grid
+        """
+        if plan.shape != self.shape:
+            raise ValueError("Plan from grid {} does not match the atlas grid {}".format(plan.shape, self.shape))
+        if order not in (0, 1):
+            raise ValueError("Sparse warping supports nearest neighbour (0) and linear (1) interpolation only")
+        index, weights = plan._get_kernel(order)
+        is_support = np.diff(self.matrix.indptr) > 0
+        corners = list(np.ndindex(*(2,) * len(weights))) if order == 1 else [(0, 0, 0)]
+
+        def get_corner(corner, used):
+            """Source row and weight of a corner of the interpolation kernel, for the destination voxels used"""
+            # kernels index the source voxels in Fortran order
+            index_axes = np.unravel_index(index[used], self.shape, order='F')
+            rows = _row_index([np.minimum(i + offset, n - 1) for i, offset, n in zip(index_axes, corner, self.shape)],
+                              self.shape)
+            weight_corner = np.ones(len(rows), dtype=np.float64)
+            for weight, offset in zip(weights, corner):
+                weight_corner *= weight[used] if offset else 1 - weight[used]
+            return rows, weight_corner
+
+        # destination voxels (in Fortran order, as the kernels) that sample the support of the labels
+        is_used = np.zeros(len(index), dtype=bool)
+        for corner in corners:
+            rows_src, weight = get_corner(corner, slice(None))
+            is_used |= is_support[rows_src] & (weight != 0)
+        used = np.flatnonzero(is_used & ~np.ravel(plan.is_outside, order='F'))
+        rows_dest = _row_index(np.unravel_index(used, plan.shape_r, order='F'), plan.shape_r)
+        rows_src, weights_src = zip(*[get_corner(corner, used) for corner in corners])
+        interpolation = sparse.coo_matrix(
+            (np.concatenate(weights_src), (np.tile(rows_dest, len(corners)), np.concatenate(rows_src))),
+            shape=(len(index), self.matrix.shape[0])).tocsr()
+        interpolation.eliminate_zeros()
+        matrix = interpolation.dot(self.matrix).astype(self.matrix.dtype)
+        matrix.eliminate_zeros()
+        return SparseAtlas(matrix, plan.shape_r, plan.affine_r, self.ids, self.names, self.filenames)
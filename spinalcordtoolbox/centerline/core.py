@@ -8,6 +8,7 @@ import numpy as np
 
 from spinalcordtoolbox.image import Image, zeros_like
 from spinalcordtoolbox.centerline import curve_fitting
+from spinalcordtoolbox.tracing import traced
 
 logger = logging.getLogger(__name__)
 
@@ -82,6 +83,7 @@ def find_and_sort_coord(img):
     return np.array(arr_sorted_avg)
 
 
+@traced
 def get_centerline(im_seg, param=ParamCenterline(), verbose=1):
     """
     Extract centerline from an image (using optic) or from a binary or weighted segmentation (using the center of mass).
@@ -15,6 +15,7 @@ import ivadomed.postprocessing
 
 import spinalcordtoolbox as sct
 import spinalcordtoolbox.deepseg.models
+from spinalcordtoolbox.postprocessing import keep_largest_object_per_slice
 
 
 logger = logging.getLogger(__name__)
@@ -60,7 +61,8 @@ def postprocess(nii_seg, options):
             else:
                 raise ValueError(
                     "Neither I nor S is present in code: {}, for affine matrix: {}".format(code, affine))
-            nii_seg = imed.postprocessing.keep_largest_object_per_slice(nii_seg, axis=axis_infsup)
+            data_seg = keep_largest_object_per_slice(np.asanyarray(nii_seg.dataobj), axis=axis_infsup)
+            nii_seg = nib.Nifti1Image(data_seg, nii_seg.affine, nii_seg.header)
         else:
             logger.warning("Algorithm 'keep largest object' can only be run on binary segmentation. Skipping.")
         return nii_seg
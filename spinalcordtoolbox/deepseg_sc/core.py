@@ -3,6 +3,7 @@
 # Functions dealing with deepseg_sc
 
 import os, sys, logging
+import functools
 
 import numpy as np
 from scipy.ndimage.measurements import center_of_mass, label
@@ -13,6 +14,7 @@ import nibabel as nib
 from spinalcordtoolbox import resampling
 from .cnn_models import nn_architecture_seg, nn_architecture_ctr
 from .postprocessing import post_processing_volume_wise, keep_largest_object, fill_holes_2d
+from .inference import predict_slices, predict_patches_3d, place_slices
 from spinalcordtoolbox.image import Image, empty_like, change_type, zeros_like
 from spinalcordtoolbox.centerline.core import ParamCenterline, get_centerline, _call_viewer_centerline
 
@@ -331,74 +333,51 @@ def _normalize_data(data, mean, std):
     return data
 
 
-def segment_2d(model_fname, contrast_type, input_size, im_in):
-    """
-    Segment data using 2D convolutions.
-    :return: seg_crop.data: ndarray float32: Output prediction
-    """
-    seg_model = nn_architecture_seg(height=input_size[0],
-                                    width=input_size[1],
-                                    depth=2 if contrast_type != 't2' else 3,
+@functools.lru_cache(maxsize=4)
+def _load_model_2d(model_fname, height, width, depth):
+    """Build the 2D segmentation model and load its weights. Models are cached, to be reused across calls."""
+    seg_model = nn_architecture_seg(height=height,
+                                    width=width,
+                                    depth=depth,
                                     features=32,
                                     batchnorm=False,
                                     dropout=0.0)
     seg_model.load_weights(model_fname)
+    return seg_model
 
-    seg_crop = zeros_like(im_in, dtype=np.float32)
 
-    data_norm = im_in.data
-    # TODO: use tqdm
-    for zz in range(im_in.dim[2]):
-        # 2D CNN prediction
-        pred_seg = seg_model.predict(np.expand_dims(np.expand_dims(data_norm[:, :, zz], -1), 0),
-                                     batch_size=BATCH_SIZE)[0, :, :, 0]
-        seg_crop.data[:, :, zz] = pred_seg
+@functools.lru_cache(maxsize=4)
+def _load_model_3d(model_fname):
+    """Load the 3D segmentation model. Models are cached, to be reused across calls."""
+    from spinalcordtoolbox.deepseg_sc.cnn_models_3d import load_trained_model
+    return load_trained_model(model_fname)
 
-    return seg_crop.data
+
+def segment_2d(model_fname, contrast_type, input_size, im_in):
+    """
+    Segment data using 2D convolutions. All the non-empty axial slices are predicted by batches.
+    :return: seg_crop.data: ndarray float32: Output prediction
+    """
+    seg_model = _load_model_2d(model_fname, input_size[0], input_size[1], 2 if contrast_type != 't2' else 3)
+    return predict_slices(seg_model, im_in.data)
 
 
-def segment_3d(model_fname, contrast_type, im_in):
+def segment_3d(model_fname, contrast_type, im_in, overlap=None):
     """
-    Perform segmentation with 3D convolutions.
+    Perform segmentation with 3D convolutions, on patches that overlap along z and are blended together.
+    :param overlap: int: number of slices shared by two consecutive patches. Default: 1/4 of the patch size.
     :return: seg_crop.data: ndarray float32: Output prediction
     """
-    from spinalcordtoolbox.deepseg_sc.cnn_models_3d import load_trained_model
     dct_patch_sc_3d = {'t2': {'size': (64, 64, 48), 'mean': 65.8562, 'std': 59.7999},
                        't2s': {'size': (96, 96, 48), 'mean': 87.0212, 'std': 64.425},
                        't1': {'size': (64, 64, 48), 'mean': 88.5001, 'std': 66.275}}
     # load 3d model
-    seg_model = load_trained_model(model_fname)
-
-    out = zeros_like(im_in, dtype=np.float32)
+    seg_model = _load_model_3d(model_fname)
 
     # segment the spinal cord
-    z_patch_size = dct_patch_sc_3d[contrast_type]['size'][2]
-    z_step_keep = list(range(0, im_in.data.shape[2], z_patch_size))
-    # TODO: use tqdm
-    for zz in z_step_keep:
-        if zz == z_step_keep[-1]:  # deal with instances where the im.data.shape[2] % patch_size_z != 0
-            patch_im = np.zeros(dct_patch_sc_3d[contrast_type]['size'])
-            z_patch_extracted = im_in.data.shape[2] - zz
-            patch_im[:, :, :z_patch_extracted] = im_in.data[:, :, zz:]
-        else:
-            z_patch_extracted = z_patch_size
-            patch_im = im_in.data[:, :, zz:z_patch_size + zz]
-
-        if np.any(patch_im):  # Check if the patch is (not) empty, which could occur after a brain detection.
-            patch_norm = \
-                _normalize_data(patch_im, dct_patch_sc_3d[contrast_type]['mean'], dct_patch_sc_3d[contrast_type]['std'])
-            patch_pred_proba = \
-                seg_model.predict(np.expand_dims(np.expand_dims(patch_norm, 0), 0), batch_size=BATCH_SIZE)
-            # pred_seg_th = (patch_pred_proba > 0.5).astype(int)[0, 0, :, :, :]
-            pred_seg_th = patch_pred_proba[0, 0, :, :, :]  # TODO: clarified variable (this is not thresholded!)
-
-            # TODO: add comment about what the code is doing below
-            if zz == z_step_keep[-1]:
-                out.data[:, :, zz:] = pred_seg_th[:, :, :z_patch_extracted]
-            else:
-                out.data[:, :, zz:z_patch_size + zz] = pred_seg_th
-
-    return out.data
+    return predict_patches_3d(seg_model, im_in.data, patch_shape=dct_patch_sc_3d[contrast_type]['size'],
+                              mean=dct_patch_sc_3d[contrast_type]['mean'], std=dct_patch_sc_3d[contrast_type]['std'],
+                              overlap=overlap)
 
 
 def uncrop_image(ref_in, data_crop, x_crop_lst, y_crop_lst, z_crop_lst):
@@ -406,13 +385,7 @@ def uncrop_image(ref_in, data_crop, x_crop_lst, y_crop_lst, z_crop_lst):
     Reconstruct the data from the cropped segmentation.
     """
     seg_unCrop = zeros_like(ref_in, dtype=np.float32)
-    crop_size_x, crop_size_y = data_crop.shape[:2]
-    for i_z, zz in enumerate(z_crop_lst):
-        pred_seg = data_crop[:, :, zz]
-        x_start, y_start = int(x_crop_lst[i_z]), int(y_crop_lst[i_z])
-        x_end = x_start + crop_size_x if x_start + crop_size_x < seg_unCrop.dim[0] else seg_unCrop.dim[0]
-        y_end = y_start + crop_size_y if y_start + crop_size_y < seg_unCrop.dim[1] else seg_unCrop.dim[1]
-        seg_unCrop.data[x_start:x_end, y_start:y_end, zz] = pred_seg[0:x_end - x_start, 0:y_end - y_start]
+    seg_unCrop.data = place_slices(seg_unCrop.data.shape, data_crop, x_crop_lst, y_crop_lst, z_crop_lst)
     return seg_unCrop
 
 
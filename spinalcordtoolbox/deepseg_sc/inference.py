@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Batched inference of segmentation models on 2D axial slices or overlapping 3D patches along z.
+# Models only need a keras-like predict(batch, batch_size=...) method.
+
+
+from __future__ import division, absolute_import
+
+import logging
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# Memory (in bytes) that a batch may use during inference. The activations of the first layers dominate, so the cost of
+# one input voxel is counted ACTIVATION_FACTOR times.
+MEMORY_BUDGET = 512 * 1024 ** 2
+ACTIVATION_FACTOR = 64
+
+
+def get_batch_size(item_shape, memory_budget=MEMORY_BUDGET, itemsize=4):
+    """
+    Number of items (slices or patches) that fit in the memory budget.
+    :param item_shape: tuple: shape of one item
+    :param memory_budget: int: memory budget, in bytes
+    :param itemsize: int: bytes per voxel
+    :return: int >= 1
+    """
+    bytes_per_item = int(np.prod(item_shape)) * itemsize * ACTIVATION_FACTOR
+    return max(1, int(memory_budget // bytes_per_item))
+
+
+def _predict_batches(model, items, batch_size):
+    """Predict items (n, ...) by batches. Yields (start index, prediction) for each batch."""
+    for i in range(0, len(items), batch_size):
+        yield i, model.predict(items[i:i + batch_size], batch_size=batch_size)
+
+
+def predict_slices(model, data, memory_budget=MEMORY_BUDGET):
+    """
+    Predict all axial slices of a 3D volume, by batches. Empty slices are not predicted, and are set to 0.
+    :param model: 2D model, with input and output of shape (n, x, y, 1)
+    :param data: 3D numpy array (x, y, z)
+    :param memory_budget: int: see get_batch_size()
+    :return: 3D numpy array of float32, same shape as data
+    """
+    data_pred = np.zeros(data.shape, dtype=np.float32)
+    z_nonempty = np.flatnonzero(np.any(data, axis=(0, 1)))
+    if not len(z_nonempty):
+        return data_pred
+    # slices are stacked along the first axis, with a channel axis
+    slices = np.moveaxis(data[:, :, z_nonempty], 2, 0)[..., np.newaxis].astype(np.float32)
+    batch_size = get_batch_size(data.shape[:2], memory_budget)
+    logger.debug("Predicting %d slices by batches of %d", len(z_nonempty), batch_size)
+    for i, pred in _predict_batches(model, slices, batch_size):
+        data_pred[:, :, z_nonempty[i:i + len(pred)]] = np.moveaxis(pred[..., 0], 0, 2)
+    return data_pred
+
+
+def get_z_tiles(nz, z_patch_size, overlap):
+    """
+    Start indexes of overlapping tiles along z. The last tile ends at the last slice, unless the volume is smaller than
+    a tile.
+    :param nz: int: number of slices
+    :param z_patch_size: int: size of the tiles
+    :param overlap: int: minimum number of slices shared by two consecutive tiles
+    :return: list of int
+    """
+    if nz <= z_patch_size:
+        return [0]
+    step = max(z_patch_size - overlap, 1)
+    starts = list(range(0, nz - z_patch_size, step))
+    return starts + [nz - z_patch_size]
+
+
+def get_blending_weights(z_patch_size, overlap):
+    """
+    Weight of each slice of a tile: ramps linearly over the overlap at both ends, and is 1 in the center. Weights are
+    strictly positive, so slices covered by a single tile keep their prediction.
+    :return: 1D array of float32
+    """
+    z = np.arange(z_patch_size)
+    ramp = np.minimum(z + 1, z_patch_size - z) / (overlap + 1.)
+    return np.minimum(ramp, 1).astype(np.float32)
+
+
+def predict_patches_3d(model, data, patch_shape, mean, std, overlap=None, memory_budget=MEMORY_BUDGET):
+    """
+    Predict a 3D volume with overlapping patches along z, blended with weights that decrease towards the edges of each
+    patch. Patches without signal are not predicted.
+    :param model: 3D model, channels first: input and output of shape (n, 1, x, y, z)
+    :param data: 3D numpy array, of shape patch_shape in x and y
+    :param patch_shape: tuple: (x, y, z) shape of the patches
+    :param mean: float: mean used to normalize the data
+    :param std: float: std used to normalize the data
+    :param overlap: int: number of slices shared by two consecutive patches. Default: 1/4 of the patch size.
+    :param memory_budget: int: see get_batch_size()
+    :return: 3D numpy array of float32, same shape as data
+    """
+    nz, z_patch_size = data.shape[2], patch_shape[2]
+    if overlap is None:
+        overlap = z_patch_size // 4
+    data_pred = np.zeros(data.shape, dtype=np.float32)
+    sum_weights = np.zeros(nz, dtype=np.float32)
+    # Check if the patch is (not) empty, which could occur after a brain detection.
+    z_nonempty = np.any(data, axis=(0, 1))
+    starts = [z for z in get_z_tiles(nz, z_patch_size, overlap) if z_nonempty[z:z + z_patch_size].any()]
+    if not starts:
+        return data_pred
+    weights = get_blending_weights(z_patch_size, overlap)
+    batch_size = get_batch_size(patch_shape, memory_budget)
+    logger.debug("Predicting %d patches by batches of %d", len(starts), batch_size)
+
+    for i in range(0, len(starts), batch_size):
+        starts_batch = starts[i:i + batch_size]
+        # patches are zero-padded when the volume is smaller than a patch
+        patches = np.zeros((len(starts_batch), 1) + tuple(patch_shape), dtype=np.float32)
+        for patch, z in zip(patches, starts_batch):
+            patch[0, :, :, :min(z_patch_size, nz - z)] = data[:, :, z:z + z_patch_size]
+        patches -= mean
+        patches /= std
+        pred = model.predict(patches, batch_size=batch_size)
+        for pred_patch, z in zip(pred[:, 0], starts_batch):
+            n = min(z_patch_size, nz - z)
+            data_pred[:, :, z:z + n] += pred_patch[:, :, :n] * weights[:n]
+            sum_weights[z:z + n] += weights[:n]
+
+    is_predicted = sum_weights > 0
+    data_pred[:, :, is_predicted] /= sum_weights[is_predicted]
+    return data_pred
+
+
+def place_slices(shape, data_crop, x_starts, y_starts, z_indexes, dtype=np.float32):
+    """
+    Place cropped axial slices back into a volume, all at once. Crops that extend beyond the volume are truncated.
+    :param shape: tuple: shape of the output volume
+    :param data_crop: 3D numpy array (crop_x, crop_y, z): cropped slices, indexed by z
+    :param x_starts: list: x index of the corner of each crop
+    :param y_starts: list: y index of the corner of each crop
+    :param z_indexes: list: slice of each crop
+    :param dtype: output data type
+    :return: 3D numpy array
+    """
+    crop_x, crop_y = data_crop.shape[:2]
+    z_indexes = np.asarray(z_indexes, dtype=int)
+    x_starts, y_starts = np.asarray(x_starts, dtype=int), np.asarray(y_starts, dtype=int)
+    # the output is padded by the crop size, so that crops beyond the edges do not need to be clipped
+    data_out = np.zeros((shape[0] + crop_x, shape[1] + crop_y, shape[2]), dtype=dtype)
+    x = x_starts[:, np.newaxis, np.newaxis] + np.arange(crop_x)[np.newaxis, :, np.newaxis]
+    y = y_starts[:, np.newaxis, np.newaxis] + np.arange(crop_y)[np.newaxis, np.newaxis, :]
+    data_out[x, y, z_indexes[:, np.newaxis, np.newaxis]] = np.moveaxis(data_crop[:, :, z_indexes], 2, 0)
+    return data_out[:shape[0], :shape[1]]
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Functions to flatten the spinal cord in the sagittal plane
+
+
+import logging
+
+import numpy as np
+
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.centerline.core import ParamCenterline, get_centerline
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_flattening_offsets(im_centerline, verbose=1):
+    """
+    Compute the R-L translation of each axial slice that centers the spinal cord in the medial sagittal plane.
+    :param im_centerline: Image: spinal cord segmentation or centerline, in RPI orientation
+    :param verbose:
+    :return: 1D array of float: translation along x (voxels) for each slice
+    """
+    nx, nz = im_centerline.dim[0], im_centerline.dim[2]
+    # smooth centerline and return fitted coordinates in voxel space
+    _, arr_ctl, _, _ = get_centerline(im_centerline, param=ParamCenterline(), verbose=verbose)
+    x_centerline_fit, y_centerline_fit, z_centerline = arr_ctl
+
+    # Extend the centerline by copying values below zmin and above zmax to avoid discontinuities
+    zmin, zmax = z_centerline.min().astype(int), z_centerline.max().astype(int)
+    x_centerline_extended = np.concatenate([np.ones(zmin) * x_centerline_fit[0],
+                                            x_centerline_fit,
+                                            np.ones(nz - zmax) * x_centerline_fit[-1]])
+    return x_centerline_extended[:nz] - np.round(nx / 2.0)
+
+
+def shift_slices(data, offsets, dtype=None):
+    """
+    Translate each axial slice along x, with linear interpolation: out[x, y, z] = data[x + offsets[z], y, z]. Voxels
+    sampled outside of the volume are set to 0. All slices (and volumes, for 4D data) are shifted at once, with an
+    integer shift followed by a linear interpolation between the two neighbouring voxels.
+    :param data: 3D or 4D array, with z as third dimension
+    :param offsets: 1D array: translation (in voxels) of each slice
+    :param dtype: output data type. Default: float32, or the input type for floating point data.
+    :return: numpy array, same shape as data
+    """
+    if dtype is None:
+        dtype = data.dtype if np.issubdtype(data.dtype, np.floating) else np.float32
+    nx = data.shape[0]
+    offsets = np.asarray(offsets, dtype=np.float64)
+    offset_int = np.floor(offsets).astype(int)
+    weight = (offsets - offset_int).astype(dtype)
+
+    # pad with zeros along x, so that neighbours outside of the volume can be clipped to a null voxel
+    data_padded = np.zeros((nx + 2,) + data.shape[1:], dtype=dtype)
+    data_padded[1:-1] = data
+    # index (in the padded array) of the two neighbours of each output voxel, along x: shape (nx, 1, nz, 1, ...)
+    shape_index = (nx, 1, len(offsets)) + (1,) * (data.ndim - 3)
+    index_0 = (np.arange(nx)[:, np.newaxis] + offset_int + 1).reshape(shape_index)
+    weight = weight.reshape((1, 1, len(offsets)) + (1,) * (data.ndim - 3))
+    data_out = np.take_along_axis(data_padded, np.clip(index_0, 0, nx + 1), axis=0)
+    data_out *= 1 - weight
+    data_out += weight * np.take_along_axis(data_padded, np.clip(index_0 + 1, 0, nx + 1), axis=0)
+    return data_out
+
+
+def flatten_sagittal(im_anat, im_centerline, verbose=1, unflatten=False):
+    """
+    Flatten a 3D or 4D volume using the segmentation, such that the spinal cord is centered in the R-L medial plane.
+    :param im_anat: Image to flatten
+    :param im_centerline: Image: spinal cord segmentation or centerline
+    :param verbose:
+    :param unflatten: bool: apply the inverse translations, to bring back a flattened image in the native space of
+    im_centerline.
+    :return: Image: flattened image (float32, or native type for floating point images)
+    """
+    # re-oriente to RPI
+    orientation_native = im_anat.orientation
+    im_anat.change_orientation("RPI")
+    im_centerline.change_orientation("RPI")
+
+    offsets = get_flattening_offsets(im_centerline, verbose=verbose)
+    if unflatten:
+        offsets = -offsets
+
+    # translate each axial slice, such that the flattened centerline is centered in the medial plane (R-L)
+    data_flattened = shift_slices(im_anat.data, offsets)
+    im_anat_flattened = Image(data_flattened, hdr=im_anat.hdr.copy(), orientation="RPI",
+                              dim=im_anat.dim)
+    im_anat_flattened.hdr.set_data_dtype(data_flattened.dtype)
+
+    # change back to native orientation
+    im_anat.change_orientation(orientation_native)
+    im_anat_flattened.change_orientation(orientation_native)
+
+    return im_anat_flattened
@@ -19,17 +19,19 @@ import nibabel
 import nibabel.orientations
 
 import numpy as np
-from scipy.ndimage import map_coordinates
 
 import transforms3d.affines as affines
 from spinalcordtoolbox.types import Coordinate
-from spinalcordtoolbox.utils import __sct_dir__
+from spinalcordtoolbox.utils import __sct_dir__, lazy_import
+from spinalcordtoolbox import template_cache
 
 sys.path.append(os.path.join(__sct_dir__, 'scripts'))
 import sct_utils as sct
 
 logger = logging.getLogger(__name__)
 
+ndimage = lazy_import('scipy.ndimage')
+
 
 def _get_permutations(im_src_orientation, im_dst_orientation):
     """
@@ -336,12 +338,18 @@ class Image(object):
     def loadFromPath(self, path, verbose):
         """
         This function load an image from an absolute path using nibabel library
+        Template files (see spinalcordtoolbox.template_cache) are loaded from their decompressed copy in the cache, as a
+        copy-on-write memory map: the pages are shared between processes until the data is modified.
         :param path: path of the file from which the image will be loaded
         :return:
         """
 
         try:
-            self.im_file = nibabel.load(path)
+            path_cached = template_cache.get_cached_path(path)
+            if path_cached != path:
+                self.im_file = nibabel.load(path_cached, mmap='c')
+            else:
+                self.im_file = nibabel.load(path)
         except nibabel.spatialimages.ImageFileError:
             sct.printv('Error: make sure ' + path + ' is an image.', 1, 'error')
         self.data = self.im_file.get_data()
@@ -625,7 +633,7 @@ class Image(object):
         :param interpolation_mode: 0=nearest neighbor, 1= linear, 2= 2nd-order spline, 3= 2nd-order spline, 4= 2nd-order spline, 5= 5th-order spline
         :return: intensity values at continuouspix with interpolation_mode
         """
-        return map_coordinates(self.data, coordi, output=np.float32, order=interpolation_mode, mode=border, cval=cval)
+        return ndimage.map_coordinates(self.data, coordi, output=np.float32, order=interpolation_mode, mode=border, cval=cval)
 
     def get_transform(self, im_ref, mode='affine'):
         aff_im_self = self.im_file.affine
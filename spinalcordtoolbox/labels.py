@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Sets of labels (non-zero voxels of an image), stored as arrays
+
+
+import logging
+
+import numpy as np
+
+from .types import Coordinate
+from .utils import lazy_import
+
+
+logger = logging.getLogger(__name__)
+
+spatial = lazy_import('scipy.spatial')
+
+
+class LabelSet(object):
+    """
+    Set of labels, i.e. voxels with a value, stored as a structured numpy array with fields (x, y, z, value).
+    Labels are kept in the order they were given; when built from an image, it is the order of np.nonzero(), which is
+    also the order of Image.getNonZeroCoordinates().
+
+    Example:
+      labels = LabelSet.from_image(Image('labels.nii.gz'))
+      labels_common = labels.intersection(LabelSet.from_image(Image('labels_ref.nii.gz')))
+      labels_common.write(im_out.data)
+    """
+    def __init__(self, x=(), y=(), z=(), value=(), dtype=np.float64):
+        """
+        :param x, y, z: sequences of voxel indexes
+        :param value: sequence of label values
+        :param dtype: type of the values
+        """
+        self.labels = np.empty(len(value), dtype=[('x', np.intp), ('y', np.intp), ('z', np.intp),
+                                                  ('value', np.dtype(dtype))])
+        self.labels['x'], self.labels['y'], self.labels['z'], self.labels['value'] = x, y, z, value
+
+    @classmethod
+    def from_array(cls, data):
+        """
+        Create a label set from the positive voxels of a 2D or 3D array. For 2D arrays, z is 0.
+        :param data: numpy array
+        :return: LabelSet
+        """
+        if data.ndim == 2:
+            x, y = np.nonzero(data > 0)
+            z = np.zeros_like(x)
+        elif data.ndim == 3:
+            x, y, z = np.nonzero(data > 0)
+        else:
+            raise ValueError("Labels can only be extracted from 2D or 3D data. Shape is: {}".format(data.shape))
+        return cls(x, y, z, data[(x, y, z)[:data.ndim]], dtype=data.dtype)
+
+    @classmethod
+    def from_image(cls, image):
+        """
+        Create a label set from the positive voxels of an image.
+        :param image: Image
+        :return: LabelSet
+        """
+        data = np.asarray(image.data)
+        if data.ndim > 3:
+            data = data.reshape(data.shape[:3])
+        return cls.from_array(data)
+
+    @classmethod
+    def from_coordinates(cls, coordinates):
+        """
+        Create a label set from a list of Coordinate.
+        :param coordinates: list of Coordinate
+        :return: LabelSet
+        """
+        return cls([int(c.x) for c in coordinates], [int(c.y) for c in coordinates], [int(c.z) for c in coordinates],
+                   [float(c.value) for c in coordinates])
+
+    def _new(self, labels):
+        new = LabelSet.__new__(LabelSet)
+        new.labels = labels
+        return new
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, index):
+        """Labels at index (int, slice, boolean mask or array of indexes). Always returns a LabelSet."""
+        return self._new(np.atleast_1d(self.labels[index]))
+
+    def __iter__(self):
+        """Iterate over (x, y, z, value) tuples"""
+        return iter(self.labels.tolist())
+
+    def __repr__(self):
+        return "LabelSet({})".format(self.labels.tolist())
+
+    @property
+    def x(self):
+        return self.labels['x']
+
+    @property
+    def y(self):
+        return self.labels['y']
+
+    @property
+    def z(self):
+        return self.labels['z']
+
+    @property
+    def value(self):
+        return self.labels['value']
+
+    @property
+    def coordinates(self):
+        """:return: numpy array (n, 3) of voxel indexes"""
+        return np.column_stack([self.x, self.y, self.z])
+
+    def index(self, ndim=3):
+        """
+        :param ndim: number of dimensions of the array to index (2 or 3)
+        :return: tuple of arrays, to index the voxels of the labels in a numpy array
+        """
+        return (self.x, self.y, self.z)[:ndim]
+
+    def values(self):
+        """:return: sorted unique values of the labels"""
+        return np.unique(self.value)
+
+    def sort(self, by='value', reverse=False):
+        """
+        Stable sort of the labels, as sorted() would do on a list of Coordinate.
+        :param by: 'x', 'y', 'z' or 'value'
+        :param reverse: sort from larger to smaller, keeping the original order of equal labels
+        :return: LabelSet
+        """
+        if by not in ['x', 'y', 'z', 'value']:
+            raise ValueError("sorting parameter must be either 'x', 'y', 'z' or 'value'")
+        key = self.labels[by]
+        if reverse:
+            order = len(key) - 1 - np.argsort(key[::-1], kind='stable')[::-1]
+        else:
+            order = np.argsort(key, kind='stable')
+        return self._new(self.labels[order])
+
+    def isin(self, values):
+        """:return: boolean array, True for labels whose value is in values"""
+        return np.isin(self.value, np.asarray(values))
+
+    def intersection(self, other):
+        """
+        :param other: LabelSet
+        :return: LabelSet with the labels whose value is also a value of other
+        """
+        return self[self.isin(other.value)]
+
+    def difference(self, other):
+        """
+        :param other: LabelSet
+        :return: LabelSet with the labels whose value is not a value of other
+        """
+        return self[~self.isin(other.value)]
+
+    def keep_values(self, values):
+        return self[self.isin(values)]
+
+    def remove_values(self, values):
+        return self[~self.isin(values)]
+
+    def nearest(self, other):
+        """
+        Find the nearest label of other for each label, in voxel space.
+        :param other: LabelSet
+        :return: distances, indexes in other
+        """
+        return spatial.cKDTree(other.coordinates).query(self.coordinates)
+
+    def centroids(self):
+        """
+        Center of mass of the voxels of each value. Voxels with the same value are grouped, even if they are not
+        connected.
+        :return: values, numpy array (n_values, 3) of centroids
+        """
+        values, groups = np.unique(self.value, return_inverse=True)
+        counts = np.bincount(groups, minlength=len(values)).astype(np.float64)
+        centroids = np.column_stack([np.bincount(groups, weights=self.labels[axis], minlength=len(values))
+                                     for axis in ['x', 'y', 'z']])
+        return values, centroids / counts[:, np.newaxis]
+
+    def physical_coordinates(self, image):
+        """
+        :param image: Image in which the labels were defined
+        :return: numpy array (n, 3) of coordinates in the physical (scanner) space
+        """
+        affine = image.hdr.get_best_affine()
+        return self.coordinates.dot(affine[:3, :3].T) + affine[:3, 3]
+
+    def write(self, data, value=None):
+        """
+        Write the labels in an array, in place. When several labels are on the same voxel, the last one is written (as
+        numpy does for repeated indexes).
+        :param data: 2D or 3D numpy array
+        :param value: value(s) to write instead of the label values
+        """
+        data[self.index(data.ndim)] = self.value if value is None else value
+
+    def to_coordinates(self, cls=Coordinate):
+        """
+        :param cls: Coordinate or CoordinateValue
+        :return: list of Coordinate
+        """
+        return [cls([label['x'], label['y'], label['z'], label['value']]) for label in self.labels]
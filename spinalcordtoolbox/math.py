@@ -4,11 +4,17 @@
 
 
 import logging
+import itertools
+import multiprocessing
+import concurrent.futures
+
 import numpy as np
 
-from skimage.morphology import erosion, dilation, disk, ball, square, cube
 
 from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.utils import lazy_import
+
+morphology = lazy_import('skimage.morphology')
 
 
 logger = logging.getLogger(__name__)
@@ -25,13 +31,13 @@ def _get_selem(shape, size, dim):
     """
     # TODO: enable custom selem
     if shape == 'square':
-        selem = square(size)
+        selem = morphology.square(size)
     elif shape == 'cube':
-        selem = cube(size)
+        selem = morphology.cube(size)
     elif shape == 'disk':
-        selem = disk(size)
+        selem = morphology.disk(size)
     elif shape == 'ball':
-        selem = ball(size)
+        selem = morphology.ball(size)
     else:
         ValueError("This shape is not a valid entry: {}".format(shape))
 
@@ -70,7 +76,7 @@ def dilate(data, size, shape, dim=None):
         im_out.data = dilate(data.data, size, shape, dim)
         return im_out
     else:
-        return dilation(data, selem=_get_selem(shape, size, dim), out=None)
+        return morphology.dilation(data, selem=_get_selem(shape, size, dim), out=None)
 
 
 def erode(data, size, shape, dim=None):
@@ -89,4 +95,405 @@ def erode(data, size, shape, dim=None):
         im_out.data = erode(data.data, size, shape, dim)
         return im_out
     else:
-        return erosion(data, selem=_get_selem(shape, size, dim), out=None)
+        return morphology.erosion(data, selem=_get_selem(shape, size, dim), out=None)
+
+
+def _get_chunks(shape, chunk_size, halo):
+    """
+    Split a 3D grid into chunks padded with a halo
+    :param shape: tuple: shape of the 3D array
+    :param chunk_size: int: size of the chunk core along each axis
+    :param halo: int: number of voxels added on each side of the core (clipped to the array boundaries)
+    :return: list of tuples (slices_core, slices_padded, slices_core_in_padded)
+    """
+    ranges = []
+    for n in shape:
+        ranges.append([(start, min(start + chunk_size, n)) for start in range(0, n, chunk_size)])
+    chunks = []
+    for core in itertools.product(*ranges):
+        padded = [(max(0, start - halo), min(n, stop + halo)) for (start, stop), n in zip(core, shape)]
+        chunks.append((tuple(slice(start, stop) for start, stop in core),
+                       tuple(slice(start, stop) for start, stop in padded),
+                       tuple(slice(start - start_pad, stop - start_pad)
+                             for (start, stop), (start_pad, _) in zip(core, padded))))
+    return chunks
+
+
+def _denoise_nlmeans_chunk(data, sigma, mask, patch_radius, block_radius, rician, num_threads):
+    from dipy.denoise.nlmeans import nlmeans
+    return nlmeans(data, sigma, mask=mask, patch_radius=patch_radius, block_radius=block_radius, rician=rician,
+                   num_threads=num_threads)
+
+
+def denoise_nlmeans(data, patch_radius=1, block_radius=5, sigma=None, mask=None, rician=True, chunk_size=64,
+                    n_jobs=None):
+    """
+    Non-local means denoising from P. Coupe et al. as implemented in dipy, run on overlapping chunks in parallel.
+    Each chunk is padded with patch_radius + block_radius voxels, which is the neighbourhood seen by the filter, so
+    the stitched output is identical to denoising the whole volume at once.
+    :param data: 3D or 4D numpy array
+    :param patch_radius: int: patch size is 2*patch_radius+1
+    :param block_radius: int: block size is 2*block_radius+1. Lowered if larger than the smallest image dimension.
+    :param sigma: float or list: standard deviation of the noise (one value per volume for 4D data). If None, it is
+    estimated once on the whole data with dipy's estimate_sigma.
+    :param mask: 3D numpy array: only voxels within the mask are denoised (others are set to 0). Chunks that do not
+    contain any voxel of the mask are skipped.
+    :param rician: bool: Rician noise (True) or Gaussian noise (False)
+    :param chunk_size: int: size of the chunks along each axis (halo not included)
+    :param n_jobs: int: number of worker processes. If None, use all available cores.
+    :return: numpy array: denoised data, with the same shape and type as the input
+    """
+    from dipy.denoise.noise_estimate import estimate_sigma
+
+    data = np.asarray(data)
+    if data.ndim not in [3, 4]:
+        raise ValueError("Only 3D or 4D arrays are supported: {}".format(data.shape))
+
+    block_radius_max = min(data.shape[:3]) - 1
+    block_radius = block_radius_max if block_radius > block_radius_max else block_radius
+
+    data4d = data if data.ndim == 4 else data[..., np.newaxis]
+    nt = data4d.shape[3]
+    if sigma is None:
+        sigma = estimate_sigma(data)
+    sigma = np.broadcast_to(np.asarray(sigma, dtype=np.float64).ravel(), (nt,))
+    if mask is not None:
+        mask = np.asarray(mask).astype(bool)
+
+    # chunks must be larger than the halo, otherwise dipy can't pad them
+    halo = patch_radius + block_radius
+    chunks = _get_chunks(data4d.shape[:3], max(chunk_size, halo + 1), halo)
+    if mask is not None:
+        chunks = [chunk for chunk in chunks if mask[chunk[0]].any()]
+
+    if n_jobs is None:
+        n_jobs = multiprocessing.cpu_count()
+    # each worker runs dipy's kernel with a single thread to avoid oversubscription
+    num_threads = 1 if n_jobs > 1 else None
+    tasks = [(it, chunk) for it in range(nt) for chunk in chunks]
+    args = [(data4d[chunk[1] + (it,)], sigma[it], None if mask is None else mask[chunk[1]], patch_radius,
+             block_radius, rician, num_threads) for it, chunk in tasks]
+    logger.debug("Denoising %d chunks (halo: %d voxels) with %d job(s)", len(tasks), halo, n_jobs)
+
+    data_out = np.zeros_like(data4d)
+    if n_jobs > 1 and len(tasks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = executor.map(_denoise_nlmeans_chunk, *zip(*args))
+            for (it, chunk), denoised in zip(tasks, results):
+                data_out[chunk[0] + (it,)] = denoised[chunk[2]]
+    else:
+        for (it, chunk), arg in zip(tasks, args):
+            data_out[chunk[0] + (it,)] = _denoise_nlmeans_chunk(*arg)[chunk[2]]
+
+    return data_out if data.ndim == 4 else data_out[..., 0]
+
+
+# Number of voxels processed at once by fused elementwise operations, so that intermediate results stay in cache
+ELEMENTWISE_BLOCK_SIZE = 2 ** 16
+
+
+def _concatenate_along_4th_dimension(data1, data2):
+    if data1.ndim == 3:
+        data1 = data1[..., np.newaxis]
+    if data2.ndim == 3:
+        data2 = data2[..., np.newaxis]
+    return np.concatenate((data1, data2), axis=3)
+
+
+def _get_data_or_scalar(data, operands):
+    """
+    Second term of add/sub/mul/div, built as sct_maths does: a scalar is broadcast to the data, and images are
+    concatenated along the 4th dimension.
+    """
+    if np.isscalar(operands[0]):
+        return data * 0 + operands[0]
+    data2 = operands[0]
+    for operand in operands[1:]:
+        data2 = _concatenate_along_4th_dimension(data2, operand)
+    return data2
+
+
+def _reduce_along_4th_dimension(ufunc, data, data2):
+    """
+    Sum (ufunc=np.add) or product (np.multiply) of data with data2 along the 4th dimension, as np.sum/np.prod of their
+    concatenation. The concatenation is skipped when data2 is a single volume.
+    """
+    if data2.ndim == 3:
+        # np.sum/np.prod promote booleans and small integers
+        dtype = ufunc.reduce(np.zeros(1, dtype=np.result_type(data, data2))).dtype
+        return ufunc(data, data2, dtype=dtype)
+    # the order of the reduction depends on the memory layout: use the layout of images loaded by sct_maths
+    return ufunc.reduce(_concatenate_along_4th_dimension(np.asfortranarray(data), data2), axis=3)
+
+
+def _threshold(data, operands, thr):
+    data = data.copy()
+    data[data < thr] = 0
+    return data
+
+
+class _Step(object):
+    """
+    One operation of an Expression.
+    :param name: str: name of the operation (i.e. flag of sct_maths)
+    :param func: function(data, operands): returns the result of the operation on data. Operands are cut to the same
+        slices as data.
+    :param kind: 'elementwise', 'neighbourhood' (needs the neighbouring slices along z) or 'reduction' (needs the whole
+        volume)
+    :param operands: list of scalars or numpy arrays defined on the grid of the input data
+    :param halo: int: number of neighbouring slices needed on each side along z, for neighbourhood operations
+    """
+    def __init__(self, name, func, kind='elementwise', operands=(), halo=0):
+        self.name = name
+        self.func = func
+        self.kind = kind
+        self.operands = list(operands)
+        self.halo = halo
+
+    def __call__(self, data, zslice):
+        return self.func(data, [operand if np.isscalar(operand) else operand[:, :, zslice]
+                                for operand in self.operands])
+
+
+class Expression(object):
+    """
+    Chain of operations on a 3D image, as given to sct_maths, evaluated lazily on the in-memory data. The chain forms
+    a small graph: the input data goes through each operation in turn, and images used as operands (e.g. with mul) are
+    additional inputs. When evaluated:
+
+    - consecutive elementwise operations (add, sub, mul, div, thr, bin) are fused: they are applied one block of
+      slices at a time, so intermediate volumes are never allocated;
+    - neighbourhood operations (dilate, erode, smooth, laplacian) run on the whole volume or, to bound memory, on
+      chunks of slices along z padded with the neighbouring slices they need;
+    - a reduction (mean, rms, std) can only be the last operation.
+
+    Each operation uses the same numpy/scipy/skimage calls as the sct_maths flag of the same name, so the result is
+    identical to running sct_maths once per operation on a float64 image (with other types, the intermediate files
+    are cast to the input type, which the expression does not do).
+
+    Example:
+      expression = Expression().thr(0.5).dilate(2, 'ball').mul(im_mask.data).smooth([1, 1, 0.5])
+      data_out = expression.evaluate(im.data, chunk_size=32)
+    """
+    def __init__(self):
+        self.steps = []
+
+    def _append(self, step):
+        if self.steps and self.steps[-1].kind == 'reduction':
+            raise ValueError("-{} can only be the last operation".format(self.steps[-1].name))
+        self.steps.append(step)
+        return self
+
+    def _append_arithmetic(self, name, func, operands):
+        if not operands:
+            raise ValueError("-{} needs an operand".format(name))
+        if np.isscalar(operands[0]) and len(operands) > 1:
+            raise ValueError("-{} takes either a single number or images".format(name))
+        return self._append(_Step(name, func, operands=operands))
+
+    def add(self, *operands):
+        """
+        Add a number or images.
+        :param operands: float, or 3D/4D numpy arrays (each volume is added)
+        """
+        return self._append_arithmetic(
+            'add', lambda data, ops: _reduce_along_4th_dimension(np.add, data, _get_data_or_scalar(data, ops)),
+            operands)
+
+    def sub(self, operand):
+        """
+        Subtract a number or an image.
+        :param operand: float or 3D numpy array
+        """
+        return self._append_arithmetic('sub', lambda data, ops: data - _get_data_or_scalar(data, ops), [operand])
+
+    def mul(self, *operands):
+        """
+        Multiply by a number or images.
+        :param operands: float, or 3D/4D numpy arrays (the data is multiplied by each volume)
+        """
+        return self._append_arithmetic(
+            'mul', lambda data, ops: _reduce_along_4th_dimension(np.multiply, data, _get_data_or_scalar(data, ops)),
+            operands)
+
+    def div(self, operand):
+        """
+        Divide by a number or an image.
+        :param operand: float or 3D numpy array
+        """
+        return self._append_arithmetic('div', lambda data, ops: np.divide(data, _get_data_or_scalar(data, ops)),
+                                       [operand])
+
+    def thr(self, thr):
+        """
+        Set to zero the values below a threshold.
+        :param thr: float
+        """
+        return self._append(_Step('thr', lambda data, ops: _threshold(data, ops, thr)))
+
+    def bin(self, thr):
+        """
+        Binarize with a threshold.
+        :param thr: float
+        """
+        return self._append(_Step('bin', lambda data, ops: data > thr))
+
+    def dilate(self, size, shape, dim=None):
+        """
+        Dilate, see dilate().
+        """
+        halo = _get_selem(shape, size, dim).shape[2]
+        return self._append(_Step('dilate', lambda data, ops: dilate(data, size, shape, dim), kind='neighbourhood',
+                                  halo=halo))
+
+    def erode(self, size, shape, dim=None):
+        """
+        Erode, see erode().
+        """
+        halo = _get_selem(shape, size, dim).shape[2]
+        return self._append(_Step('erode', lambda data, ops: erode(data, size, shape, dim), kind='neighbourhood',
+                                  halo=halo))
+
+    def smooth(self, sigmas):
+        """
+        Gaussian smoothing.
+        :param sigmas: list of 3 floats: standard deviation of the kernel along each axis, in voxels
+        """
+        from scipy.ndimage import gaussian_filter
+        sigmas = [float(sigma) for sigma in sigmas]
+
+        def func(data, ops):
+            return gaussian_filter(data.astype(float), sigmas, order=0, truncate=4.0)
+
+        return self._append(_Step('smooth', func, kind='neighbourhood', halo=int(4.0 * sigmas[2] + 0.5)))
+
+    def laplacian(self, sigmas):
+        """
+        Laplacian of Gaussian.
+        :param sigmas: list of 3 floats: standard deviation of the kernel along each axis, in voxels
+        """
+        from scipy.ndimage import gaussian_laplace
+        sigmas = [float(sigma) for sigma in sigmas]
+
+        def func(data, ops):
+            return gaussian_laplace(data.astype(float), sigmas)
+
+        return self._append(_Step('laplacian', func, kind='neighbourhood', halo=int(4.0 * sigmas[2] + 0.5)))
+
+    def _append_reduction(self, name, func, axis):
+        def func_axis(data, ops):
+            # the order of the summation depends on the memory layout: use the layout of images loaded by sct_maths
+            data = np.asfortranarray(data)
+            # mean across t of a 3D volume
+            if axis + 1 > data.ndim:
+                data = data[..., np.newaxis]
+            return func(data, axis)
+
+        return self._append(_Step(name, func_axis, kind='reduction'))
+
+    def mean(self, axis):
+        """
+        Average across an axis.
+        :param axis: int: 0, 1, 2 or 3 (t)
+        """
+        return self._append_reduction('mean', np.mean, axis)
+
+    def rms(self, axis):
+        """
+        Root mean square across an axis.
+        :param axis: int: 0, 1, 2 or 3 (t)
+        """
+        return self._append_reduction('rms', lambda data, axis: np.sqrt(np.mean(np.square(data.astype(float)), axis)),
+                                      axis)
+
+    def std(self, axis):
+        """
+        Standard deviation across an axis.
+        :param axis: int: 0, 1, 2 or 3 (t)
+        """
+        return self._append_reduction('std', lambda data, axis: np.std(data, axis, ddof=1), axis)
+
+    @property
+    def halo(self):
+        """Number of slices along z needed on each side of a chunk to compute it exactly"""
+        return sum(step.halo for step in self.steps if step.kind == 'neighbourhood')
+
+    def _get_nodes(self, steps):
+        """Group consecutive elementwise steps, which are fused"""
+        nodes = []
+        for step in steps:
+            if step.kind == 'elementwise' and nodes and nodes[-1][0].kind == 'elementwise':
+                nodes[-1].append(step)
+            else:
+                nodes.append([step])
+        return nodes
+
+    def _evaluate_fused(self, steps, data, start):
+        """
+        Apply elementwise steps one block of slices at a time.
+        :param data: 3D numpy array: slices start: of the input grid
+        """
+        nz = data.shape[2]
+        nz_block = max(1, ELEMENTWISE_BLOCK_SIZE // (data.shape[0] * data.shape[1]))
+        data_out = None
+        for z in range(0, nz, nz_block):
+            block = data[:, :, z:z + nz_block]
+            zslice = slice(start + z, start + z + block.shape[2])
+            for step in steps:
+                block = step(block, zslice)
+            if data_out is None:
+                data_out = np.empty(data.shape, dtype=block.dtype, order='F')
+            data_out[:, :, z:z + block.shape[2]] = block
+        return data_out
+
+    def _evaluate_slab(self, nodes, data, start, stop):
+        """Apply the steps on slices start:stop"""
+        data = data[:, :, start:stop]
+        for node in nodes:
+            if node[0].kind == 'elementwise':
+                data = self._evaluate_fused(node, data, start)
+            else:
+                data = node[0](data, slice(start, stop))
+        return data
+
+    def evaluate(self, data, chunk_size=None):
+        """
+        Evaluate the expression.
+        :param data: 3D numpy array
+        :param chunk_size: int: number of slices along z computed at a time. If None, neighbourhood operations run on
+            the whole volume.
+        :return: numpy array
+        """
+        data = np.asanyarray(data)
+        if data.ndim != 3:
+            raise ValueError("Only 3D arrays are supported: {}".format(data.shape))
+        for step in self.steps:
+            for operand in step.operands:
+                if not np.isscalar(operand) and operand.shape[:3] != data.shape:
+                    raise ValueError("Operand of -{} has shape {}, data has shape {}".format(
+                        step.name, operand.shape, data.shape))
+        steps = self.steps
+        reduction = None
+        if steps and steps[-1].kind == 'reduction':
+            steps, reduction = steps[:-1], steps[-1]
+        nodes = self._get_nodes(steps)
+
+        nz = data.shape[2]
+        if chunk_size is None or chunk_size >= nz:
+            data_out = self._evaluate_slab(nodes, data, 0, nz)
+        else:
+            halo = self.halo
+            logger.debug("Evaluating %d operation(s) by chunks of %d slices (halo: %d slices)", len(steps), chunk_size,
+                         halo)
+            data_out = None
+            for z in range(0, nz, chunk_size):
+                stop = min(z + chunk_size, nz)
+                start_pad, stop_pad = max(0, z - halo), min(nz, stop + halo)
+                chunk = self._evaluate_slab(nodes, data, start_pad, stop_pad)[:, :, z - start_pad:stop - start_pad]
+                if data_out is None:
+                    data_out = np.empty(data.shape, dtype=chunk.dtype, order='F')
+                data_out[:, :, z:stop] = chunk
+
+        if reduction is not None:
+            data_out = reduction(data_out, slice(None))
+        return data_out
@@ -26,6 +26,7 @@ import operator
 import csv
 
 from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.tracing import traced
 
 import sct_utils as sct
 import sct_dmri_separate_b0_and_dwi
@@ -116,6 +117,7 @@ def copy_mat_files(nt, list_file_mat, index, folder_out, param):
                 copyfile(fsrc, fdest)
 
 
+@traced
 def moco_wrapper(param):
     """
     Wrapper that performs motion correction.
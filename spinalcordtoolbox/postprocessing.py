@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Post-processing engine for segmentations: per-slice statistics, connected objects, interpolation of missing slices.
+# All functions work on numpy arrays, so that they can be shared by the deep learning segmentation modules.
+
+
+import logging
+
+import numpy as np
+from scipy.ndimage import label, generate_binary_structure
+
+
+logger = logging.getLogger(__name__)
+
+
+def _other_axes(ndim, axis):
+    return tuple(i for i in range(ndim) if i != axis)
+
+
+def get_slice_counts(data, axis=2):
+    """
+    Number of non-zero voxels of each slice, computed with a single reduction.
+    :param data: 3D numpy array
+    :param axis: int: axis along which slices are taken
+    :return: 1D array of int
+    """
+    return np.count_nonzero(data, axis=_other_axes(data.ndim, axis))
+
+
+def get_slice_areas(data, pixel_area=1., axis=2):
+    """
+    Area of each slice, accounting for partial volume (soft segmentation).
+    :param data: 3D numpy array, binary or weighted between 0 and 1
+    :param pixel_area: float: area of a pixel within the slice (e.g. in mm2)
+    :param axis: int: axis along which slices are taken
+    :return: 1D array of float
+    """
+    return np.sum(data, axis=_other_axes(data.ndim, axis), dtype=np.float64) * pixel_area
+
+
+def label_objects(data, structure=None):
+    """
+    Label the connected objects of a binary array, and compute their size.
+    :param data: numpy array
+    :param structure: connectivity, see scipy.ndimage.label. Default: faces only.
+    :return: labeled array (0 is the background), 1D array of sizes indexed by label (size of the background is 0)
+    """
+    labeled_obj, num_obj = label(data, structure=structure)
+    sizes = np.bincount(labeled_obj.ravel(), minlength=num_obj + 1)
+    sizes[0] = 0
+    return labeled_obj, sizes
+
+
+def keep_largest_object(data, structure=None):
+    """
+    Keep the largest connected object. For ties, the first object (in raster order) is kept.
+    :param data: numpy array, binary or weighted
+    :param structure: connectivity, see scipy.ndimage.label
+    :return: numpy array, same type as data
+    """
+    labeled_obj, sizes = label_objects(data > 0, structure=structure)
+    if len(sizes) <= 2:
+        return data.copy()
+    return np.where(labeled_obj == sizes.argmax(), data, 0).astype(data.dtype, copy=False)
+
+
+def keep_largest_object_per_slice(data, axis=2):
+    """
+    Keep the largest connected object (4-connectivity) within each slice. All slices are labeled at once, with a
+    structuring element that does not connect adjacent slices.
+    :param data: 3D numpy array, binary or weighted
+    :param axis: int: axis along which slices are taken
+    :return: numpy array, same type as data
+    """
+    structure = generate_binary_structure(3, 1)
+    # no connection between slices
+    slc = [1, 1, 1]
+    slc[axis] = [0, 2]
+    structure[tuple(slc)] = False
+    labeled_obj, sizes = label_objects(data > 0, structure=structure)
+    num_obj = len(sizes) - 1
+    if num_obj == 0:
+        return data.copy()
+    # slice of each object
+    index_slice = np.arange(data.shape[axis]).reshape([-1 if i == axis else 1 for i in range(3)])
+    slice_obj = np.zeros(num_obj + 1, dtype=int)
+    slice_obj[labeled_obj.ravel()] = np.broadcast_to(index_slice, data.shape).ravel()
+    # for each slice, largest object (lowest label for ties)
+    id_obj = np.arange(1, num_obj + 1)
+    order = np.lexsort((id_obj, -sizes[1:], slice_obj[1:]))
+    _, first = np.unique(slice_obj[1:][order], return_index=True)
+    is_kept = np.zeros(num_obj + 1, dtype=bool)
+    is_kept[id_obj[order][first]] = True
+    return np.where(is_kept[labeled_obj], data, 0).astype(data.dtype, copy=False)
+
+
+def get_hole_ranges(counts):
+    """
+    Find the runs of empty slices located between non-empty slices. Empty slices at the extremities are not holes.
+    :param counts: 1D array: number of voxels (or area) of each slice
+    :return: numpy array (n_holes, 2): [start, stop) of each hole
+    """
+    index_nonempty = np.flatnonzero(counts)
+    if len(index_nonempty) == 0:
+        return np.zeros((0, 2), dtype=int)
+    is_empty = np.concatenate([[False], counts[index_nonempty[0]:index_nonempty[-1] + 1] == 0, [False]])
+    edges = np.flatnonzero(np.diff(is_empty.astype(np.int8)))
+    return edges.reshape(-1, 2) + index_nonempty[0]
+
+
+def interpolate_holes(data, hole_ranges):
+    """
+    Fill holes along z (last axis of a 3D array) with a linear blend of the two slices that surround each hole. All
+    hole slices are computed at once.
+    :param data: 3D numpy array
+    :param hole_ranges: numpy array (n_holes, 2): [start, stop) of each hole, see get_hole_ranges()
+    :return: numpy array of float, with interpolated slices
+    """
+    data_interp = data.astype(np.float64)
+    hole_ranges = np.asarray(hole_ranges, dtype=int).reshape(-1, 2)
+    if not len(hole_ranges):
+        return data_interp
+    lengths = hole_ranges[:, 1] - hole_ranges[:, 0]
+    start = np.repeat(hole_ranges[:, 0], lengths)
+    z_hole = start + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    # weight of the slice above the hole
+    weight = (z_hole - start + 1) / (np.repeat(lengths, lengths) + 1.)
+    data_interp[:, :, z_hole] = (data_interp[:, :, start - 1] * (1 - weight) +
+                                 data_interp[:, :, np.repeat(hole_ranges[:, 1], lengths)] * weight)
+    return data_interp
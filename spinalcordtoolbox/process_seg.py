@@ -7,7 +7,6 @@ from __future__ import absolute_import
 import math
 import platform
 import numpy as np
-from skimage import measure, transform
 from tqdm import tqdm
 import logging
 import nibabel
@@ -16,8 +15,14 @@ from spinalcordtoolbox.image import Image
 from spinalcordtoolbox.aggregate_slicewise import Metric
 from spinalcordtoolbox.centerline.core import ParamCenterline, get_centerline
 from spinalcordtoolbox.resampling import resample_nib
+from spinalcordtoolbox.tracing import traced
+from spinalcordtoolbox.utils import lazy_import
 
+measure = lazy_import('skimage.measure')
+transform = lazy_import('skimage.transform')
 
+
+@traced
 def compute_shape(segmentation, angle_correction=True, param_centerline=None, verbose=1):
     """
     Compute morphometric measures of the spinal cord in the transverse (axial) plane from the segmentation.
@@ -12,6 +12,10 @@ import logging
 import warnings
 import datetime
 import io
+import zlib
+import struct
+import contextlib
+import concurrent.futures
 from string import Template
 from shutil import copyfile
 
@@ -19,18 +23,18 @@ warnings.filterwarnings("ignore")
 
 import numpy as np
 
-import skimage
-import skimage.io
-import skimage.exposure
-
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
-from matplotlib.figure import Figure
-import matplotlib.colors as color
-
 import sct_utils as sct
 from spinalcordtoolbox.image import Image
 import spinalcordtoolbox.reports.slice as qcslice
 from spinalcordtoolbox import __sct_dir__
+from spinalcordtoolbox.utils import lazy_import
+
+# only needed to render the images
+skimage_io = lazy_import('skimage.io')
+exposure = lazy_import('skimage.exposure')
+backend_agg = lazy_import('matplotlib.backends.backend_agg')
+figure = lazy_import('matplotlib.figure')
+color = lazy_import('matplotlib.colors')
 
 logger = logging.getLogger(__name__)
 
@@ -223,6 +227,46 @@ class QcImage(object):
         ax.get_xaxis().set_visible(False)
         ax.get_yaxis().set_visible(False)
 
+    def listed_seg_rgba(self, mask):
+        """Array counterpart of listed_seg()"""
+        rgba = np.zeros(mask.shape + (4,), dtype=np.uint8)
+        # as in listed_seg(), voxels below 1 (e.g. partial volume of a soft segmentation) are transparent
+        rgba[mask >= 1] = _hex_to_rgba(self._color_bin_red[1])
+        return rgba
+
+    def template_rgba(self, mask):
+        """Array counterpart of template()"""
+        values = mask
+        values[values < 0.5] = 0
+        # same colormap as template(): white (transparent) -> blue -> cyan, sampled on 256 levels
+        colors = np.array([[1, 1, 1, 0], [0, 0, 1, 0.7], [0, 1, 1, 0.8]])
+        levels = np.linspace(0, 1, 256)
+        lut = np.stack([np.interp(levels, [0, 0.5, 1], colors[:, i]) for i in range(4)], axis=1)
+        lut = np.uint8(np.round(lut * 255))
+        return lut[_normalize(values, 256)]
+
+    def no_seg_seg_rgba(self, mask):
+        """Array counterpart of no_seg_seg()"""
+        rgba = _gray_to_rgba(mask)
+        self._add_orientation_label_rgba(rgba, mask.shape)
+        return rgba
+
+    def vertical_line_rgba(self, mask):
+        """Array counterpart of vertical_line()"""
+        return np.zeros(mask.shape + (4,), dtype=np.uint8)
+
+    def _vertical_line_canvas(self, canvas, geometry):
+        # vertical_line() draws a 2pt-wide line at the center of the image, which is drawn on the upsampled canvas
+        x0, y0, width, height = geometry
+        half_width = max(1, int(round(self.qc_report.qc_params.dpi / 72.)))
+        canvas[y0:y0 + height, x0 + width // 2 - half_width:x0 + width // 2 + half_width] = (255, 0, 0, 255)
+
+    # Actions that can be rendered as arrays, and post-processing of the canvas they are rendered on
+    _array_actions = {'listed_seg': (listed_seg_rgba, None),
+                      'template': (template_rgba, None),
+                      'no_seg_seg': (no_seg_seg_rgba, None),
+                      'vertical_line': (vertical_line_rgba, _vertical_line_canvas)}
+
     # def colorbar(self):
     #     fig = plt.figure(figsize=(9, 1.5))
     #     ax = fig.add_axes([0.05, 0.80, 0.9, 0.15])
@@ -288,47 +332,58 @@ class QcImage(object):
                         b1 = np.zeros((h1, w1), dtype=b.dtype)
                         b1[:h, :w] = b
                         b = b1
-                    c = skimage.exposure.equalize_adapthist(b, kernel_size=(winsize, winsize))
+                    c = exposure.equalize_adapthist(b, kernel_size=(winsize, winsize))
                     if h != h1 or w != w1:
                         c = c[:h, :w]
                     return np.array(c * (max_ - min_) + min_, dtype=a.dtype)
 
                 def contrast_stretching(a):
                     p2, p98 = np.percentile(a, (2, 98))
-                    return skimage.exposure.rescale_intensity(a, in_range=(p2, p98))
+                    return exposure.rescale_intensity(a, in_range=(p2, p98))
 
                 func_stretch_contrast = {'equalized': equalized,
                                          'contrast_stretching': contrast_stretching}
 
                 img = func_stretch_contrast[self._stretch_contrast_method](img)
 
-            fig = Figure()
             # if axial mosaic restrict width
             if sct_slice.get_name() == 'Axial':
                 size_fig = [5, 5 * img.shape[0] / img.shape[1]]  # with dpi=300, will give 1500pix width
             # if sagittal orientation restrict height
             elif sct_slice.get_name() == 'Sagittal':
                 size_fig = [5 * img.shape[1] / img.shape[0], 5]
-            fig.set_size_inches(size_fig[0], size_fig[1], forward=True)
-            FigureCanvas(fig)
-            ax = fig.add_axes((0, 0, 1, 1))
-            ax.imshow(img, cmap='gray', interpolation=self.interpolation, aspect=float(aspect_img))
-            self._add_orientation_label(ax)
-            ax.get_xaxis().set_visible(False)
-            ax.get_yaxis().set_visible(False)
-            self._save(fig, self.qc_report.qc_params.abs_bkg_img_path(), dpi=self.qc_report.qc_params.dpi)
 
+            # Render the background and the overlays. Array-based renderings are encoded to PNG directly in a pool of
+            # threads, other actions (which draw text or lines) go through a matplotlib figure on the calling thread.
+            dpi = self.qc_report.qc_params.dpi
+            img_rgba = _gray_to_rgba(img)
+            self._add_orientation_label_rgba(img_rgba, img.shape)
+            tasks = [(self._save_rgba, img_rgba, aspect_img, size_fig, self.qc_report.qc_params.abs_bkg_img_path(),
+                      None)]
+            figure_actions = []
             for action in self.action_list:
                 logger.debug('Action List %s', action.__name__)
                 if self._stretch_contrast and action.__name__ in ("no_seg_seg",):
-                    print("Mask type %s" % mask.dtype)
+                    logger.debug("Mask type %s" % mask.dtype)
                     mask = func_stretch_contrast[self._stretch_contrast_method](mask)
-                fig = Figure()
-                fig.set_size_inches(size_fig[0], size_fig[1], forward=True)
-                FigureCanvas(fig)
-                ax = fig.add_axes((0, 0, 1, 1))
-                action(self, mask, ax)
-                self._save(fig, self.qc_report.qc_params.abs_overlay_img_path(), dpi=self.qc_report.qc_params.dpi)
+                if action.__name__ in self._array_actions:
+                    action_rgba, action_canvas = self._array_actions[action.__name__]
+                    tasks.append((self._save_rgba, action_rgba(self, mask), float(self.aspect_mask), size_fig,
+                                  self.qc_report.qc_params.abs_overlay_img_path(), action_canvas))
+                else:
+                    figure_actions.append(action)
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+                futures = [executor.submit(*task) for task in tasks]
+                for action in figure_actions:
+                    fig = figure.Figure()
+                    fig.set_size_inches(size_fig[0], size_fig[1], forward=True)
+                    backend_agg.FigureCanvasAgg(fig)
+                    ax = fig.add_axes((0, 0, 1, 1))
+                    action(self, mask, ax)
+                    self._save(fig, self.qc_report.qc_params.abs_overlay_img_path(), dpi=dpi)
+                for future in futures:
+                    future.result()
 
             self.qc_report.update_description_file(img.shape)
 
@@ -347,6 +402,44 @@ class QcImage(object):
             ax.text(0, 18, 'L', color='yellow', size=4)
             ax.text(24, 18, 'R', color='yellow', size=4)
 
+    def _add_orientation_label_rgba(self, rgba, shape):
+        """
+        Array counterpart of _add_orientation_label(): draw the labels (in yellow) on an RGBA image, in place
+        :param rgba: numpy array (h, w, 4)
+        :param shape: shape of the image the labels are positioned on
+        :return:
+        """
+        if self.qc_report.qc_params.orientation == 'Axial':
+            for letter, (x, y) in [('A', (12, 6)), ('P', (12, 28)), ('L', (0, 18)), ('R', (24, 18))]:
+                _draw_glyph(rgba, letter, x, y, _hex_to_rgba('#ffff00'))
+
+    def _save_rgba(self, rgba, aspect, size_fig, img_path, action_canvas=None):
+        """
+        Save an RGBA image as it would be displayed by imshow() in a figure of size size_fig (without
+        interpolation), without going through matplotlib.
+        :param rgba: numpy array (h, w, 4) of uint8
+        :param aspect: float: aspect ratio (height/width) of the pixels
+        :param size_fig: [float, float]: size of the figure in inches
+        :param img_path: str: path of the output PNG file
+        :param action_canvas: function(self, canvas, geometry): drawing applied on the upsampled canvas
+        :return:
+        """
+        dpi = self.qc_report.qc_params.dpi
+        canvas_shape = (int(round(size_fig[1] * dpi)), int(round(size_fig[0] * dpi)))
+        canvas = np.zeros(canvas_shape + (4,), dtype=np.uint8)
+        # fit the image in the canvas while preserving the aspect ratio, centered (as imshow does)
+        h, w = rgba.shape[:2]
+        scale = min(canvas_shape[0] / (h * aspect), canvas_shape[1] / float(w))
+        height, width = max(1, int(round(h * aspect * scale))), max(1, int(round(w * scale)))
+        y0, x0 = (canvas_shape[0] - height) // 2, (canvas_shape[1] - width) // 2
+        rows = np.minimum((np.arange(height) * h) // height, h - 1)
+        cols = np.minimum((np.arange(width) * w) // width, w - 1)
+        canvas[y0:y0 + height, x0:x0 + width] = rgba[rows[:, np.newaxis], cols]
+        if action_canvas is not None:
+            action_canvas(self, canvas, (x0, y0, width, height))
+        logger.debug('Save image %s', img_path)
+        _write_png(img_path, canvas)
+
     def _save(self, fig, img_path, format='png', bbox_inches='tight', pad_inches=0.00, dpi=300):
         """
         Save the current figure into an image.
@@ -366,6 +459,69 @@ class QcImage(object):
                     dpi=dpi)
 
 
+# 5x7 bitmaps of the letters drawn on the QC images
+_GLYPHS = {
+    'A': [".###.", "#...#", "#...#", "#####", "#...#", "#...#", "#...#"],
+    'P': ["####.", "#...#", "#...#", "####.", "#....", "#....", "#...."],
+    'L': ["#....", "#....", "#....", "#....", "#....", "#....", "#####"],
+    'R': ["####.", "#...#", "#...#", "####.", "#.#..", "#..#.", "#...#"],
+}
+
+
+def _hex_to_rgba(hex_color, alpha=255):
+    return tuple(int(hex_color[i:i + 2], 16) for i in (1, 3, 5)) + (alpha,)
+
+
+def _normalize(a, n):
+    """
+    Map values linearly from [min, max] to the indices of a colormap with n levels, as matplotlib does
+    :return: numpy array of int
+    """
+    min_, max_ = np.nanmin(a), np.nanmax(a)
+    if max_ == min_:
+        return np.zeros(a.shape, dtype=int)
+    x = (np.nan_to_num(np.asarray(a, dtype=np.float64)) - min_) / (max_ - min_)
+    return np.clip((x * n).astype(int), 0, n - 1)
+
+
+def _gray_to_rgba(a):
+    """Render a 2D array with a gray colormap scaled on its range"""
+    gray = np.uint8(_normalize(a, 256))
+    rgba = np.empty(a.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = gray[..., np.newaxis]
+    rgba[..., 3] = 255
+    return rgba
+
+
+def _draw_glyph(rgba, letter, x, y, rgba_color):
+    """Draw a letter on an RGBA image, in place. (x, y) is the bottom-left corner of the letter, as for ax.text()"""
+    glyph = np.array([[c == '#' for c in row] for row in _GLYPHS[letter]])
+    top = y - glyph.shape[0] + 1
+    for (iy, ix) in zip(*np.nonzero(glyph)):
+        if 0 <= top + iy < rgba.shape[0] and 0 <= x + ix < rgba.shape[1]:
+            rgba[top + iy, x + ix] = rgba_color
+
+
+def _write_png(img_path, rgba):
+    """
+    Encode an RGBA image of uint8 as PNG, without going through matplotlib
+    :param img_path: str: output file
+    :param rgba: numpy array (h, w, 4)
+    """
+    def chunk(tag, payload):
+        return struct.pack('>I', len(payload)) + tag + payload + struct.pack('>I', zlib.crc32(tag + payload) & 0xffffffff)
+
+    height, width = rgba.shape[:2]
+    # each scanline starts with the filter type (0: none)
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = np.ascontiguousarray(rgba, dtype=np.uint8).reshape(height, width * 4)
+    with open(img_path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b'IEND', b''))
+
+
 class Params(object):
     """Parses and stores the variables that will be included into the QC details
     """
@@ -488,30 +644,79 @@ class QcReport(object):
             # Create json file
             with open(self.qc_params.qc_results, 'w+') as qc_file:
                 json.dump(output, qc_file, indent=1)
-            self._update_html_assets(get_json_data_from_path(path_json))
+            if _is_index_update_deferred():
+                logger.debug('Index update deferred: %s', self.qc_params.root_folder)
+                _deferred_index_folders.add(self.qc_params.root_folder)
+            else:
+                _update_html_assets(self.qc_params.root_folder, get_json_data_from_path(path_json))
         finally:
             #fcntl.flock(path_json_fd, fcntl.LOCK_UN) # technically, redundant, since close() triggers this too.
             os.close(path_json_fd)
 
-    def _update_html_assets(self, json_data):
-        """Update the html file and assets"""
-        assets_path = os.path.join(os.path.dirname(__file__), 'assets')
-        dest_path = self.qc_params.root_folder
 
-        with io.open(os.path.join(assets_path, 'index.html')) as template_index:
-            template = Template(template_index.read())
-            output = template.substitute(sct_json_data=json.dumps(json_data))
-            io.open(os.path.join(dest_path, 'index.html'), 'w').write(output)
+def _update_html_assets(dest_path, json_data):
+    """Update the html file and assets"""
+    assets_path = os.path.join(os.path.dirname(__file__), 'assets')
+
+    with io.open(os.path.join(assets_path, 'index.html')) as template_index:
+        template = Template(template_index.read())
+        output = template.substitute(sct_json_data=json.dumps(json_data))
+        io.open(os.path.join(dest_path, 'index.html'), 'w').write(output)
+
+    for path in ['css', 'js', 'imgs', 'fonts']:
+        src_path = os.path.join(assets_path, '_assets', path)
+        dest_full_path = os.path.join(dest_path, '_assets', path)
+        if not os.path.exists(dest_full_path):
+            os.makedirs(dest_full_path, exist_ok = True)
+        for file_ in os.listdir(src_path):
+            if not os.path.isfile(os.path.join(dest_full_path, file_)):
+                sct.copy(os.path.join(src_path, file_),
+                         dest_full_path)
+
 
-        for path in ['css', 'js', 'imgs', 'fonts']:
-            src_path = os.path.join(assets_path, '_assets', path)
-            dest_full_path = os.path.join(dest_path, '_assets', path)
-            if not os.path.exists(dest_full_path):
-                os.makedirs(dest_full_path, exist_ok = True)
-            for file_ in os.listdir(src_path):
-                if not os.path.isfile(os.path.join(dest_full_path, file_)):
-                    sct.copy(os.path.join(src_path, file_),
-                             dest_full_path)
+# Index updates of the QC report can be deferred, so that adding many entries does not rewrite the report each time:
+# either within batch_index_update(), or across processes by setting the environment variable SCT_QC_DEFER_INDEX=1
+# (then call update_index() once all entries have been added).
+_deferred_index_depth = 0
+_deferred_index_folders = set()
+
+
+def _is_index_update_deferred():
+    return _deferred_index_depth > 0 or os.environ.get('SCT_QC_DEFER_INDEX', '0') not in ('', '0')
+
+
+@contextlib.contextmanager
+def batch_index_update():
+    """
+    Context manager within which QC entries are added without updating the index of their report. Reports that
+    received entries are updated once, when leaving the outermost context.
+    """
+    global _deferred_index_depth
+    _deferred_index_depth += 1
+    try:
+        yield
+    finally:
+        _deferred_index_depth -= 1
+        if _deferred_index_depth == 0:
+            while _deferred_index_folders:
+                update_index(_deferred_index_folders.pop())
+
+
+def update_index(path_qc):
+    """
+    Regenerate the index (html file and assets) of a QC report from all its entries
+    :param path_qc: str: Path of the QC report
+    """
+    path_json = os.path.join(path_qc, '_json')
+    if not os.path.isdir(path_json):
+        logger.warning('No QC entry found in %s', path_qc)
+        return
+    path_json_fd = os.open(path_json, os.O_RDONLY)
+    fcntl.flock(path_json_fd, fcntl.LOCK_EX)
+    try:
+        _update_html_assets(path_qc, get_json_data_from_path(path_json))
+    finally:
+        os.close(path_json_fd)
 
 
 def add_entry(src, process, args, path_qc, plane, path_img=None, path_img_overlay=None,
@@ -556,7 +761,7 @@ def add_entry(src, process, args, path_qc, plane, path_img=None, path_img_overla
         layout(qcslice)
     elif path_img is not None:
         report.make_content_path()
-        report.update_description_file(skimage.io.imread(path_img).shape[:2])
+        report.update_description_file(skimage_io.imread(path_img).shape[:2])
         copyfile(path_img, qc_param.abs_bkg_img_path())
         if path_img_overlay is not None:
             # User specified a second image to overlay
@@ -619,25 +824,25 @@ def generate_qc(fname_in1, fname_in2=None, fname_seg=None, angle_line=None, args
     # Axial orientation, switch between two input images
     if process in ['sct_register_multimodal', 'sct_register_to_template']:
         plane = 'Axial'
-        qcslice_type = qcslice.Axial([Image(fname_in1), Image(fname_in2), Image(fname_seg)])
+        qcslice_type = qcslice.Axial([Image(fname_in1), Image(fname_in2), Image(fname_seg)], cache=True)
         qcslice_operations = [QcImage.no_seg_seg]
         qcslice_layout = lambda x: x.mosaic()[:2]
     # Rotation visualisation
     elif process in ['rotation']:
         plane = 'Axial'
-        qcslice_type = qcslice.Axial([Image(fname_in1), Image(fname_seg)])
+        qcslice_type = qcslice.Axial([Image(fname_in1), Image(fname_seg)], cache=True)
         qcslice_operations = [QcImage.line_angle]
         qcslice_layout = lambda x: x.mosaic(return_center=True)
     # Axial orientation, switch between the image and the segmentation
     elif process in ['sct_propseg', 'sct_deepseg_sc', 'sct_deepseg_gm']:
         plane = 'Axial'
-        qcslice_type = qcslice.Axial([Image(fname_in1), Image(fname_seg)])
+        qcslice_type = qcslice.Axial([Image(fname_in1), Image(fname_seg)], cache=True)
         qcslice_operations = [QcImage.listed_seg]
         qcslice_layout = lambda x: x.mosaic()
     # Axial orientation, switch between the image and the white matter segmentation (linear interp, in blue)
     elif process in ['sct_warp_template']:
         plane = 'Axial'
-        qcslice_type = qcslice.Axial([Image(fname_in1), Image(fname_seg)])
+        qcslice_type = qcslice.Axial([Image(fname_in1), Image(fname_seg)], cache=True)
         qcslice_operations = [QcImage.template]
         qcslice_layout = lambda x: x.mosaic()
     # Sagittal orientation, display vertebral labels
@@ -6,18 +6,26 @@
 from __future__ import print_function, absolute_import, division
 
 import abc
+import os
 import logging
 import math
+import collections
 
 import numpy as np
-from scipy import ndimage
 
 from spinalcordtoolbox.image import Image
 from spinalcordtoolbox.resampling import resample_nib
+from spinalcordtoolbox.utils import lazy_import
 from nibabel.nifti1 import Nifti1Image
 
 logger = logging.getLogger(__name__)
 
+ndimage = lazy_import('scipy.ndimage')
+
+# Number of resampled background images kept in memory (see Slice.__init__)
+RESAMPLED_CACHE_SIZE = 4
+_resampled_cache = collections.OrderedDict()
+
 
 class Slice(object):
     """Abstract class representing slicing applied to >=1 volumes for the purpose
@@ -38,16 +46,18 @@ class Slice(object):
 
     __metaclass__ = abc.ABCMeta
 
-    def __init__(self, images, p_resample=0.6):
+    def __init__(self, images, p_resample=0.6, cache=False):
         """
         :param images: list of 3D volumes to be separated into slices.
+        :param p_resample: float: Resampling resolution in mm. If None, images are not resampled.
+        :param cache: bool: Cache the resampled first image (background), keyed on its file. Only use it if the image
+        is unchanged since it was loaded, e.g. when several QC entries with different overlays share the same
+        background.
         """
         logger.info('Resample images to {}x{} mm'.format(p_resample, p_resample))
         self._images = list()
         image_ref = None  # first pass: we don't have a reference image to resample to
         for i, image in enumerate(images):
-            img = image.copy()
-            img.change_orientation('SAL')
             if p_resample:
                 if i == len(images) - 1:
                     # Last volume corresponds to a segmentation, therefore use linear interpolation here
@@ -55,12 +65,35 @@ class Slice(object):
                 else:
                     # Otherwise it's an image: use spline interpolation
                     type_img = 'im'
-                img_r = self._resample_slicewise(img, p_resample, type_img=type_img, image_ref=image_ref)
+                key = self._get_cache_key(image, p_resample, type_img) if (cache and i == 0) else None
+                if key in _resampled_cache:
+                    logger.debug('Use cached resampled image: %s', image.absolutepath)
+                    _resampled_cache.move_to_end(key)
+                    img_r = _resampled_cache[key].copy()
+                else:
+                    img = image.copy()
+                    img.change_orientation('SAL')
+                    img_r = self._resample_slicewise(img, p_resample, type_img=type_img, image_ref=image_ref)
+                    if key is not None:
+                        _resampled_cache[key] = img_r.copy()
+                        while len(_resampled_cache) > RESAMPLED_CACHE_SIZE:
+                            _resampled_cache.popitem(last=False)
             else:
-                img_r = img.copy()
+                img_r = image.copy()
+                img_r.change_orientation('SAL')
             self._images.append(img_r)
             image_ref = self._images[0]  # 2nd and next passes: we resample any image to the space of the first one
 
+    @staticmethod
+    def _get_cache_key(image, p_resample, type_img):
+        """
+        :return: key identifying the resampling of an image file, or None if the image is not stored on disk
+        """
+        if image.absolutepath is None or not os.path.isfile(image.absolutepath):
+            return None
+        stat = os.stat(image.absolutepath)
+        return image.absolutepath, stat.st_mtime, stat.st_size, p_resample, type_img
+
     @staticmethod
     def axial_slice(data, i):
         return data[i, :, :]
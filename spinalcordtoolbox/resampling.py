@@ -14,18 +14,23 @@
 from __future__ import division, absolute_import
 
 import logging
+import concurrent.futures
+
 import numpy as np
 import nibabel as nib
-from nibabel.processing import resample_from_to
 
 from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.utils import lazy_import
 
 import sct_utils as sct
 
 logger = logging.getLogger(__name__)
 
+ndimage = lazy_import('scipy.ndimage')
+
 
-def resample_nib(image, new_size=None, new_size_type=None, image_dest=None, interpolation='linear', mode='nearest'):
+def resample_nib(image, new_size=None, new_size_type=None, image_dest=None, interpolation='linear', mode='nearest',
+                 n_jobs=1):
     """
     Resample a nibabel or Image object based on a specified resampling factor.
     Can deal with 2d, 3d or 4d image objects.
@@ -40,6 +45,7 @@ def resample_nib(image, new_size=None, new_size_type=None, image_dest=None, inte
         are ignored
     :param interpolation: {'nn', 'linear', 'spline'}. The interpolation type
     :param mode: Outside values are filled with 0 ('constant') or nearest value ('nearest').
+    :param n_jobs: int: Number of threads used to resample the volumes of 4d images.
     :return: The resampled nibabel or Image image (depending on the input object type).
     """
 
@@ -54,13 +60,18 @@ def resample_nib(image, new_size=None, new_size_type=None, image_dest=None, inte
     else:
         raise Exception(TypeError)
 
+    # Generate 3d affine transformation of the input image
+    affine = img.affine[:4, :4]
+    affine[3, :] = np.array([0, 0, 0, 1])  # satisfy to nifti convention. Otherwise it grabs the temporal
+    logger.debug('Affine matrix: \n' + str(affine))
+
     if image_dest is None:
         # Get dimensions of data
         p = img.header.get_zooms()
         shape = img.header.get_data_shape()
 
         if img.ndim == 4:
-            new_size += ['1']  # needed because the code below is general, i.e., does not assume 3d input and uses img.shape
+            new_size = list(new_size) + ['1']  # needed because the code below is general, i.e., does not assume 3d input and uses img.shape
 
         # compute new shape based on specific resampling method
         if new_size_type == 'vox':
@@ -81,9 +92,6 @@ def resample_nib(image, new_size=None, new_size_type=None, image_dest=None, inte
             raise ValueError("'new_size_type' is not recognized.")
 
         # Generate 3d affine transformation: R
-        affine = img.affine[:4, :4]
-        affine[3, :] = np.array([0, 0, 0, 1])  # satisfy to nifti convention. Otherwise it grabs the temporal
-        logger.debug('Affine matrix: \n' + str(affine))
         R = np.eye(4)
         for i in range(3):
             try:
@@ -94,7 +102,6 @@ def resample_nib(image, new_size=None, new_size_type=None, image_dest=None, inte
                                         "not corrupted.".format(i))
 
         affine_r = np.dot(affine, R)
-        reference = (shape_r, affine_r)
 
     # If reference is provided
     else:
@@ -105,23 +112,18 @@ def resample_nib(image, new_size=None, new_size_type=None, image_dest=None, inte
         else:
             raise Exception(TypeError)
 
+    if image_dest is not None:
+        shape_r, affine_r = reference.shape[:3] + img.shape[3:], reference.affine
+
+    plan = ResamplingPlan(affine, img.shape[:3], affine_r, shape_r[:3])
+
     if img.ndim == 3:
         # we use mode 'nearest' to overcome issue #2453
-        img_r = resample_from_to(
-            img, to_vox_map=reference, order=dict_interp[interpolation], mode=mode, cval=0.0, out_class=None)
+        data3d = plan.apply(np.asanyarray(img.dataobj), order=dict_interp[interpolation], mode=mode)
+        img_r = img.__class__(data3d, affine_r, img.header)
 
     elif img.ndim == 4:
-        # TODO: Cover img_dest with 4D volumes
-        # Import here instead of top of the file because this is an isolated case and nibabel takes time to import
-        data4d = np.zeros(shape_r)
-        # Loop across 4th dimension and resample each 3d volume
-        for it in range(img.shape[3]):
-            # Create dummy 3d nibabel image
-            nii_tmp = nib.nifti1.Nifti1Image(img.get_data()[..., it], affine)
-            img3d_r = resample_from_to(
-                nii_tmp, to_vox_map=(shape_r[:-1], affine_r), order=dict_interp[interpolation], mode=mode,
-                cval=0.0, out_class=None)
-            data4d[..., it] = img3d_r.get_data()
+        data4d = plan.apply(np.asanyarray(img.dataobj), order=dict_interp[interpolation], mode=mode, n_jobs=n_jobs)
         # Create 4d nibabel Image
         img_r = nib.nifti1.Nifti1Image(data4d, affine_r)
 
@@ -132,6 +134,65 @@ def resample_nib(image, new_size=None, new_size_type=None, image_dest=None, inte
         return Image(img_r.get_data(), hdr=img_r.header, orientation=image.orientation, dim=img_r.header.get_data_shape())
 
 
+class ResamplingPlan(object):
+    """
+    Mapping from a destination grid to a source grid, which can be applied to any number of arrays defined on the
+    source grid (e.g. all volumes of a 4d image, possibly across threads). The mapping is the voxel-to-voxel affine:
+    scipy.ndimage.affine_transform computes the coordinates of the destination voxels on the fly.
+
+    Subclasses with a non-affine mapping (see warping.WarpPlan) override _resample_volume().
+    """
+    def __init__(self, affine, shape, affine_r, shape_r):
+        """
+        :param affine: 4x4 affine of the source grid
+        :param shape: tuple: 3d shape of the source grid
+        :param affine_r: 4x4 affine of the destination grid
+        :param shape_r: tuple: 3d shape of the destination grid
+        """
+        self.shape = tuple(shape)
+        self.shape_r = tuple(shape_r)
+        self.vox2vox = np.linalg.inv(affine).dot(affine_r)
+
+    def apply(self, data, order=1, mode='nearest', n_jobs=1):
+        """
+        Resample data onto the destination grid.
+
+        :param data: 3d or 4d numpy array defined on the source grid
+        :param order: int: order of the spline interpolation (0: nn, 1: linear, 2: spline)
+        :param mode: Outside values are filled with 0 ('constant') or nearest value ('nearest').
+        :param n_jobs: int: Number of threads across which the volumes of a 4d array are distributed.
+        :return: numpy array. 3d arrays keep their dtype. 4d arrays keep their dtype if it is a float or if order=0,
+            otherwise they are converted to float32.
+        """
+        if data.shape[:3] != self.shape:
+            raise ValueError("Data shape {} does not match the source grid {}".format(data.shape, self.shape))
+        if data.ndim == 3:
+            return self._resample_volume(data, data.dtype, order, mode)
+
+        dtype = data.dtype if (order == 0 or np.issubdtype(data.dtype, np.floating)) else np.float32
+        data_r = np.empty(self.shape_r + data.shape[3:], dtype=dtype)
+
+        def resample_volume(it):
+            self._resample_volume(data[..., it], data_r[..., it], order, mode)
+
+        if n_jobs > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                list(executor.map(resample_volume, range(data.shape[3])))
+        else:
+            for it in range(data.shape[3]):
+                resample_volume(it)
+        return data_r
+
+    def _resample_volume(self, volume, output, order, mode):
+        """
+        :param volume: 3d numpy array defined on the source grid
+        :param output: dtype of the output, or 3d numpy array defined on the destination grid to write the result to
+        :return: 3d numpy array defined on the destination grid
+        """
+        return ndimage.affine_transform(volume, self.vox2vox[:3, :3], self.vox2vox[:3, 3], output_shape=self.shape_r,
+                                        output=output, order=order, mode=mode, cval=0.0)
+
+
 def resample_file(fname_data, fname_out, new_size, new_size_type, interpolation, verbose, fname_ref=None):
     """This function will resample the specified input
     image file to the target size.
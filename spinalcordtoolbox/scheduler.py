@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Scheduling of independent jobs (e.g. one per subject in sct_run_batch). The state of each job is recorded in a
+# journal, so that an interrupted batch resumes where it stopped; jobs start longest-first, and their concurrency is
+# capped by the number of cores and by a memory budget.
+
+
+from __future__ import division, absolute_import
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import subprocess
+import multiprocessing
+
+
+logger = logging.getLogger(__name__)
+
+# States of a job, as recorded in the journal
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+
+def get_total_memory():
+    """:return: int: physical memory of the machine, in bytes (0 if unknown)"""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+class Journal(object):
+    """
+    Append-only record of the state of jobs, as JSON lines. The last record of a job is its current state. Records are
+    written as soon as the state changes, so the journal survives an interrupted batch (a truncated last line is
+    ignored).
+    """
+    def __init__(self, fname):
+        """
+        :param fname: str: path of the journal (created if it does not exist)
+        """
+        self.fname = fname
+
+    def record(self, name, state, **fields):
+        """
+        Append the new state of a job.
+        :param name: str: name of the job
+        :param state: str: one of PENDING, RUNNING, DONE, FAILED
+        :param fields: other fields to record (e.g. duration, peak_rss)
+        :return: dict: the record
+        """
+        entry = dict(name=name, state=state, time=time.time(), **fields)
+        with open(self.fname, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        return entry
+
+    def read(self):
+        """:return: list of dict: all records, in the order they were written"""
+        if not os.path.isfile(self.fname):
+            return []
+        records = []
+        with open(self.fname) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    logger.warning("Skipping invalid line in journal %s: %s", self.fname, line.strip())
+        return records
+
+    def last_states(self):
+        """:return: dict: last record of each job"""
+        return {record['name']: record for record in self.read()}
+
+    def history(self):
+        """
+        Statistics of the previous runs of each job.
+        :return: dict: for each job, dict with the duration of its last completed run (if any), and the largest peak
+            memory it used (if known)
+        """
+        history = {}
+        for record in self.read():
+            stats = history.setdefault(record['name'], {})
+            if record['state'] == DONE and record.get('duration') is not None:
+                stats['duration'] = record['duration']
+            if record.get('peak_rss'):
+                stats['peak_rss'] = max(stats.get('peak_rss', 0), record['peak_rss'])
+        return history
+
+
+class Job(object):
+    """
+    Command run in a subprocess, whose output is written to a log file.
+    """
+    def __init__(self, name, cmd, log_file, env=None):
+        """
+        :param name: str: unique name of the job (e.g. the subject)
+        :param cmd: list of str: command
+        :param log_file: str: file where stdout and stderr are written
+        :param env: dict: environment of the command. Default: environment of the current process.
+        """
+        self.name = name
+        self.cmd = cmd
+        self.log_file = log_file
+        self.env = env
+        # identifies the command in the journal: a job only resumes from a run of the same command
+        self.signature = hashlib.md5(json.dumps(cmd).encode('utf-8')).hexdigest()
+        # estimates from previous runs, in seconds and bytes (None if unknown)
+        self.duration = None
+        self.memory = None
+        self.attempt = 0
+        self.itk_threads = None
+        self.proc = None
+        self.start_time = None
+
+    def start(self, itk_threads):
+        """
+        Start the command.
+        :param itk_threads: int: value of ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS for the command
+        """
+        env = dict(os.environ if self.env is None else self.env)
+        env['ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS'] = str(itk_threads)
+        self.attempt += 1
+        self.itk_threads = itk_threads
+        self.start_time = time.time()
+        with open(self.log_file, 'w') as log:
+            self.proc = subprocess.Popen(self.cmd, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    def poll(self):
+        """
+        Check if the command has finished, without blocking.
+        :return: None if it is still running, otherwise (return code, peak resident memory in bytes)
+        """
+        pid, status, rusage = os.wait4(self.proc.pid, os.WNOHANG)
+        if pid == 0:
+            return None
+        returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+        self.proc.returncode = returncode
+        # ru_maxrss includes the descendants waited for by the command; it is in bytes on macOS, kilobytes elsewhere
+        peak_rss = rusage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        return returncode, peak_rss
+
+
+class Scheduler(object):
+    """
+    Run jobs in parallel subprocesses:
+    - jobs whose last recorded state is DONE, with the same command, are skipped (resume);
+    - the others start longest-first, using durations from previous runs, so that a slow job does not start last and
+      leave cores idle at the end of the batch;
+    - a job starts if a slot is free (n_jobs) and if the peak memory it used in previous runs fits in the memory budget
+      left by the running jobs; smaller jobs can start before a larger one that does not fit;
+    - each job gets an ITK thread count such that the running jobs share all the cores;
+    - failed jobs are retried up to max_retries times.
+
+    Example:
+      scheduler = Scheduler(Journal('log/batch.jsonl'), n_jobs=4)
+      results = scheduler.run([Job(subject, ['process_data.sh', subject], subject + '.log') for subject in subjects])
+    """
+    def __init__(self, journal, n_jobs=None, n_cores=None, memory_budget=None, default_memory=None, itk_threads=0,
+                 max_retries=0, poll_interval=0.2):
+        """
+        :param journal: Journal
+        :param n_jobs: int: maximum number of jobs running at the same time. Default: number of cores.
+        :param n_cores: int: number of cores shared by the jobs. Default: all available cores.
+        :param memory_budget: int: memory (in bytes) that the running jobs may use. Default: physical memory. 0: no limit.
+        :param default_memory: int: memory (in bytes) of jobs without history. Default: largest peak memory of the
+            previous runs of all jobs.
+        :param itk_threads: int: ITK threads per job. 0: share the cores between the running jobs.
+        :param max_retries: int: number of times a failed job is restarted
+        :param poll_interval: float: time (in seconds) between two checks of the running jobs
+        """
+        self.journal = journal
+        self.n_cores = multiprocessing.cpu_count() if n_cores is None else n_cores
+        self.n_jobs = self.n_cores if n_jobs is None else max(n_jobs, 1)
+        self.memory_budget = get_total_memory() if memory_budget is None else memory_budget
+        self.default_memory = default_memory
+        self.itk_threads = itk_threads
+        self.max_retries = max_retries
+        self.poll_interval = poll_interval
+
+    def order(self, jobs):
+        """
+        Set the estimates of each job from the journal, and sort jobs longest-first. Jobs without history are assumed
+        to last as long as the average job, and to use as much memory as the largest job.
+        :param jobs: list of Job
+        :return: list of Job
+        """
+        history = self.journal.history()
+        for job in jobs:
+            job.duration = history.get(job.name, {}).get('duration')
+            job.memory = history.get(job.name, {}).get('peak_rss')
+        durations = [job.duration for job in jobs if job.duration is not None]
+        default_duration = sum(durations) / len(durations) if durations else 0
+        peaks = [stats['peak_rss'] for stats in history.values() if stats.get('peak_rss')]
+        default_memory = self.default_memory if self.default_memory is not None else max(peaks, default=0)
+        for job in jobs:
+            if job.duration is None:
+                job.duration = default_duration
+            if job.memory is None:
+                job.memory = default_memory
+        # stable sort: jobs with the same duration keep their order
+        return sorted(jobs, key=lambda job: -job.duration)
+
+    def get_itk_threads(self, running, n_startable):
+        """
+        Number of ITK threads of a job about to start: the cores not used by the running jobs are shared between the
+        jobs that can start now.
+        :param running: list of Job: running jobs
+        :param n_startable: int: number of jobs that can start now, including this one
+        :return: int >= 1
+        """
+        if self.itk_threads:
+            return self.itk_threads
+        free_cores = self.n_cores - sum(job.itk_threads for job in running)
+        return max(1, free_cores // max(n_startable, 1))
+
+    def fits(self, job, running):
+        """:return: True if the job can start while the running jobs use their memory"""
+        if not running or not self.memory_budget:
+            return True
+        return sum(job.memory for job in running) + job.memory <= self.memory_budget
+
+    def run(self, jobs, resume=True):
+        """
+        Run the jobs, until all of them are done or failed.
+        :param jobs: list of Job
+        :param resume: bool: skip the jobs that are done according to the journal, if they ran the same command (same
+            signature)
+        :return: dict: last record of each job
+        """
+        results = {}
+        if resume:
+            last_states = self.journal.last_states()
+            for job in jobs:
+                last_state = last_states.get(job.name, {})
+                if last_state.get('state') == DONE and last_state.get('signature') == job.signature:
+                    results[job.name] = last_states[job.name]
+            if results:
+                logger.info("Skipping %d job(s) already done (see %s)", len(results), self.journal.fname)
+        pending = self.order([job for job in jobs if job.name not in results])
+        for job in pending:
+            self.journal.record(job.name, PENDING)
+        running = []
+        try:
+            while pending or running:
+                self._start_jobs(pending, running)
+                time.sleep(self.poll_interval if running else 0)
+                for job in list(running):
+                    status = job.poll()
+                    if status is None:
+                        continue
+                    running.remove(job)
+                    returncode, peak_rss = status
+                    duration = time.time() - job.start_time
+                    state = DONE if returncode == 0 else FAILED
+                    results[job.name] = self.journal.record(
+                        job.name, state, duration=duration, peak_rss=peak_rss, returncode=returncode,
+                        attempt=job.attempt, itk_threads=job.itk_threads, signature=job.signature)
+                    # memory of the next attempts
+                    job.memory = max(job.memory, peak_rss)
+                    if state == FAILED and job.attempt <= self.max_retries:
+                        logger.warning("%s failed (return code %d), retrying", job.name, returncode)
+                        pending.append(job)
+                        self.journal.record(job.name, PENDING)
+                    else:
+                        logger.info("%s %s in %.1f s", job.name, state, duration)
+        except BaseException:
+            # interrupted jobs stay in the RUNNING state in the journal, so they are restarted when resuming
+            for job in running:
+                job.proc.kill()
+                job.proc.wait()
+            raise
+        return results
+
+    def _start_jobs(self, pending, running):
+        """Start the pending jobs (in order) that fit in the free slots and in the memory budget"""
+        while pending and len(running) < self.n_jobs:
+            job = next((job for job in pending if self.fits(job, running)), None)
+            if job is None:
+                break
+            n_startable = min(self.n_jobs - len(running), len(pending))
+            job.start(self.get_itk_threads(running, n_startable))
+            pending.remove(job)
+            running.append(job)
+            self.journal.record(job.name, RUNNING, attempt=job.attempt, itk_threads=job.itk_threads)
+            logger.info("Running %s (%d ITK thread(s)). See log file %s", job.name, job.itk_threads, job.log_file)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Smoothing of an image along the spinal cord centerline, in memory
+
+
+import logging
+
+import numpy as np
+from scipy.ndimage import map_coordinates, gaussian_filter
+
+
+logger = logging.getLogger(__name__)
+
+# Number of Newton iterations to project voxels onto the planes orthogonal to the centerline
+PROJECTION_ITERATIONS = 4
+# Number of slices processed at a time when computing the mapping and smoothing in direct mode, to bound memory
+SLICE_CHUNK_SIZE = 16
+
+
+def _get_frames(tangents):
+    """
+    Orthonormal frames of the planes orthogonal to the centerline. The first in-plane axis is the x axis of the image
+    projected onto the plane, so that straightening does not twist the cord.
+    :param tangents: numpy array (3, n): unit tangent vectors
+    :return: u, v: numpy arrays (3, n): in-plane axes
+    """
+    u = np.zeros_like(tangents)
+    u[0] = 1
+    u -= tangents[0] * tangents
+    u /= np.linalg.norm(u, axis=0)
+    v = np.cross(tangents, u, axis=0)
+    return u, v
+
+
+class CurvedSpace(object):
+    """
+    Mapping between an image in RPI orientation and a straightened space, where the spinal cord centerline is a
+    straight line along z, at the center of the field of view. Each slice of the straightened space is the plane
+    orthogonal to the centerline at a given distance along it (slices are spaced by pz), and covers the same field of
+    view as the slices of the image.
+
+    The coordinates of the straightened voxels in the image, and of the image voxels in the straightened space, are
+    computed once: straighten(), curve() and the smoothing functions only interpolate, so several images can be
+    smoothed with the same mapping.
+
+    Example:
+      _, arr_ctl, _, _ = get_centerline(im_seg_rpi, ParamCenterline(algo_fitting='bspline'))
+      space = CurvedSpace(arr_ctl, im_rpi.dim[4:7], im_rpi.data.shape)
+      data_smooth = space.smooth(im_rpi.data, [0, 0, 3])
+    """
+    def __init__(self, centerline, pixdim, shape):
+        """
+        :param centerline: numpy array (3, n): centerline in voxel coordinates, one point per slice over consecutive
+            slices, see spinalcordtoolbox.centerline.core.get_centerline()
+        :param pixdim: (px, py, pz): voxel size in mm
+        :param shape: tuple: 3d shape of the image
+        """
+        self.pixdim = np.array(pixdim[:3], dtype=np.float64)
+        self.shape = tuple(shape[:3])
+        # centerline and its unit tangent in mm, as a function of the distance along it
+        self.z_centerline = np.asarray(centerline[2], dtype=np.float64)
+        self.points = np.asarray(centerline, dtype=np.float64) * self.pixdim[:, np.newaxis]
+        tangents = np.gradient(self.points, axis=1) if self.points.shape[1] > 1 else np.array([[0.], [0.], [1.]])
+        self.tangents = tangents / np.linalg.norm(tangents, axis=0)
+        self.distances = np.concatenate([[0], np.cumsum(np.linalg.norm(np.diff(self.points, axis=1), axis=0))])
+        self.length = self.distances[-1]
+        # straightened grid: the centerline goes through the center of the slices
+        self.center = (np.array(self.shape[:2], dtype=np.float64) - 1) / 2
+        self.shape_straight = self.shape[:2] + (int(np.floor(self.length / self.pixdim[2])) + 1,)
+        self.coords_straight = self._get_coords_straight()
+        self.coords_curved, self.is_outside = self._get_coords_curved()
+
+    def _get_points(self, distances):
+        """
+        Interpolate the centerline and its tangent.
+        :param distances: numpy array (n,): distances along the centerline in mm
+        :return: points, tangents: numpy arrays (3, n), in mm
+        """
+        points = np.array([np.interp(distances, self.distances, coord) for coord in self.points])
+        tangents = np.array([np.interp(distances, self.distances, coord) for coord in self.tangents])
+        return points, tangents / np.linalg.norm(tangents, axis=0)
+
+    def _get_coords_straight(self):
+        """
+        :return: numpy array (3, nx, ny, nz_straight): voxel coordinates in the image of each straightened voxel
+        """
+        points, tangents = self._get_points(np.arange(self.shape_straight[2]) * self.pixdim[2])
+        u, v = _get_frames(tangents)
+        # in-plane offsets from the centerline, in mm
+        offset_u = (np.arange(self.shape[0]) - self.center[0]) * self.pixdim[0]
+        offset_v = (np.arange(self.shape[1]) - self.center[1]) * self.pixdim[1]
+        coords = np.empty((3,) + self.shape_straight, dtype=np.float32)
+        for axis in range(3):
+            coords[axis] = (points[axis] + u[axis] * offset_u[:, np.newaxis, np.newaxis] +
+                            v[axis] * offset_v[np.newaxis, :, np.newaxis]) / self.pixdim[axis]
+        return coords
+
+    def _get_coords_curved(self):
+        """
+        Project each voxel of the image onto the closest orthogonal plane of the centerline, by Newton iterations
+        starting from the plane of its slice.
+        :return: coords: numpy array (3, nx, ny, nz): voxel coordinates in the straightened space of each voxel
+        :return: is_outside: numpy array (nx, ny, nz) of bool: voxels beyond the ends of the centerline or outside of the
+            straightened field of view
+        """
+        coords = np.zeros((3,) + self.shape, dtype=np.float32)
+        is_outside = np.ones(self.shape, dtype=bool)
+        shape_straight = np.array(self.shape_straight, dtype=np.float64)[:, np.newaxis]
+        z_min, z_max = int(np.ceil(self.z_centerline.min())), int(np.floor(self.z_centerline.max()))
+        for start in range(max(z_min, 0), min(z_max + 1, self.shape[2]), SLICE_CHUNK_SIZE):
+            stop = min(start + SLICE_CHUNK_SIZE, z_max + 1, self.shape[2])
+            chunk_shape = self.shape[:2] + (stop - start,)
+            grid = np.indices(chunk_shape, dtype=np.float64).reshape(3, -1)
+            grid[2] += start
+            p = grid * self.pixdim[:, np.newaxis]
+            distances = np.interp(grid[2], self.z_centerline, self.distances)
+            for _ in range(PROJECTION_ITERATIONS):
+                points, tangents = self._get_points(distances)
+                distances = distances + np.sum((p - points) * tangents, axis=0)
+            points, tangents = self._get_points(distances)
+            u, v = _get_frames(tangents)
+            diff = p - points
+            coords_chunk = np.array([np.sum(diff * u, axis=0) / self.pixdim[0] + self.center[0],
+                                     np.sum(diff * v, axis=0) / self.pixdim[1] + self.center[1],
+                                     distances / self.pixdim[2]])
+            is_outside_chunk = np.any((coords_chunk < -0.5) | (coords_chunk > shape_straight - 0.5), axis=0)
+            coords[:, :, :, start:stop] = coords_chunk.reshape((3,) + chunk_shape)
+            is_outside[:, :, start:stop] = is_outside_chunk.reshape(chunk_shape)
+        return coords, is_outside
+
+    def straighten(self, data, order=3):
+        """
+        Resample an image into the straightened space.
+        :param data: 3d numpy array
+        :param order: int: order of the spline interpolation
+        :return: numpy array of shape shape_straight
+        """
+        return map_coordinates(np.asarray(data, dtype=np.float64), self.coords_straight, order=order, mode='nearest')
+
+    def curve(self, data_straight, order=3):
+        """
+        Resample an image of the straightened space back into the image space. Voxels outside of the straightened space
+        are set to 0.
+        :param data_straight: 3d numpy array of shape shape_straight
+        :param order: int: order of the spline interpolation
+        :return: numpy array
+        """
+        data = map_coordinates(np.asarray(data_straight, dtype=np.float64), self.coords_curved, order=order,
+                               mode='nearest')
+        data[self.is_outside] = 0
+        return data
+
+    def smooth(self, data, sigmas, order=3):
+        """
+        Smooth an image with a Gaussian kernel in the straightened space: the kernel follows the centerline, and is
+        applied in the planes orthogonal to it. Voxels outside of the straightened space keep their value.
+        :param data: 3d numpy array
+        :param sigmas: list of 3 floats: standard deviations in mm, along x, y and along the centerline
+        :param order: int: order of the spline interpolation
+        :return: numpy array of float
+        """
+        data_straight = gaussian_filter(self.straighten(data, order=order), np.asarray(sigmas) / self.pixdim,
+                                        truncate=4.0)
+        data_smooth = self.curve(data_straight, order=order)
+        data_smooth[self.is_outside] = data[self.is_outside]
+        return data_smooth
+
+    def smooth_direct(self, data, sigmas):
+        """
+        Smooth an image with a Gaussian kernel oriented along the centerline, without resampling it into the
+        straightened space: for each slice, the kernel is aligned with the centerline frame at that slice, and each
+        axis of the kernel is applied as a weighted sum of samples taken every voxel size along that axis. Slices beyond
+        the ends of the centerline keep their value.
+        :param data: 3d numpy array
+        :param sigmas: list of 3 floats: standard deviations in mm, along x, y and along the centerline
+        :return: numpy array of float
+        """
+        data = np.asarray(data, dtype=np.float64)
+        z_min, z_max = int(np.ceil(self.z_centerline.min())), int(np.floor(self.z_centerline.max()))
+        z_min, z_max = max(z_min, 0), min(z_max, self.shape[2] - 1)
+        # frame of each slice
+        _, tangents = self._get_points(np.interp(np.arange(z_min, z_max + 1), self.z_centerline, self.distances))
+        axes = _get_frames(tangents) + (tangents,)
+        data_smooth = data.copy()
+        for axis, sigma in enumerate(sigmas):
+            if sigma == 0:
+                continue
+            step = self.pixdim[axis]
+            radius = int(4.0 * sigma / step + 0.5)
+            offsets = np.arange(-radius, radius + 1)
+            weights = np.exp(-0.5 * (offsets * step / float(sigma)) ** 2)
+            weights /= weights.sum()
+            # displacement of one step along the axis, in voxels, for each slice
+            displacement = axes[axis] * step / self.pixdim[:, np.newaxis]
+            data_in = data_smooth.copy()
+            for start in range(z_min, z_max + 1, SLICE_CHUNK_SIZE):
+                stop = min(start + SLICE_CHUNK_SIZE, z_max + 1)
+                grid = np.indices(self.shape[:2] + (stop - start,), dtype=np.float64)
+                grid[2] += start
+                chunk = np.zeros(grid.shape[1:])
+                for offset, weight in zip(offsets, weights):
+                    coords = grid + offset * displacement[:, np.newaxis, np.newaxis, start - z_min:stop - z_min]
+                    chunk += weight * map_coordinates(data_in, coords, order=1, mode='nearest')
+                data_smooth[:, :, start:stop] = chunk
+        return data_smooth
@@ -18,6 +18,7 @@ from spinalcordtoolbox.types import Centerline
 import spinalcordtoolbox.image as msct_image
 from spinalcordtoolbox.image import Image
 from spinalcordtoolbox.centerline.core import ParamCenterline, get_centerline
+from spinalcordtoolbox.tracing import traced
 
 import sct_utils as sct
 from sct_image import pad_image
@@ -62,6 +63,7 @@ class SpinalCordStraightener(object):
 
         self.template_orientation = 0
 
+    @traced
     def straighten(self):
         """
         Straighten spinal cord. Steps: (everything is done in physical space)
@@ -374,20 +376,14 @@ class SpinalCordStraightener(object):
         lookup_curved2straight = list(range(centerline.number_of_points))
         if self.discs_input_filename != "":
             # create look-up table curved to straight
-            for index in range(centerline.number_of_points):
-                disc_label = centerline.l_points[index]
-                if alignment_mode == 'length':
-                    relative_position = centerline.dist_points[index]
-                else:
-                    relative_position = centerline.dist_points_rel[index]
-                idx_closest = centerline_straight.get_closest_to_absolute_position(disc_label, relative_position,
-                                                                                   backup_index=index,
-                                                                                   backup_centerline=centerline_straight,
-                                                                                   mode=alignment_mode)
-                if idx_closest is not None:
-                    lookup_curved2straight[index] = idx_closest
-                else:
-                    lookup_curved2straight[index] = 0
+            if alignment_mode == 'length':
+                relative_positions = centerline.dist_points
+            else:
+                relative_positions = centerline.dist_points_rel
+            indexes_closest = centerline_straight.get_closest_to_absolute_positions(
+                centerline.l_points, relative_positions, backup_indexes=range(centerline.number_of_points),
+                backup_centerline=centerline_straight, mode=alignment_mode)
+            lookup_curved2straight = [idx_closest if idx_closest is not None else 0 for idx_closest in indexes_closest]
         for p in range(0, len(lookup_curved2straight) // 2):
             if lookup_curved2straight[p] == lookup_curved2straight[p + 1]:
                 lookup_curved2straight[p] = 0
@@ -402,18 +398,15 @@ class SpinalCordStraightener(object):
 
         lookup_straight2curved = list(range(centerline_straight.number_of_points))
         if self.discs_input_filename != "":
-            for index in range(centerline_straight.number_of_points):
-                disc_label = centerline_straight.l_points[index]
-                if alignment_mode == 'length':
-                    relative_position = centerline_straight.dist_points[index]
-                else:
-                    relative_position = centerline_straight.dist_points_rel[index]
-                idx_closest = centerline.get_closest_to_absolute_position(disc_label, relative_position,
-                                                                          backup_index=index,
-                                                                          backup_centerline=centerline_straight,
-                                                                          mode=alignment_mode)
-                if idx_closest is not None:
-                    lookup_straight2curved[index] = idx_closest
+            if alignment_mode == 'length':
+                relative_positions = centerline_straight.dist_points
+            else:
+                relative_positions = centerline_straight.dist_points_rel
+            indexes_closest = centerline.get_closest_to_absolute_positions(
+                centerline_straight.l_points, relative_positions, backup_indexes=range(centerline_straight.number_of_points),
+                backup_centerline=centerline_straight, mode=alignment_mode)
+            lookup_straight2curved = [idx_closest if idx_closest is not None else index
+                                      for index, idx_closest in enumerate(indexes_closest)]
         for p in range(0, len(lookup_straight2curved) // 2):
             if lookup_straight2curved[p] == lookup_straight2curved[p + 1]:
                 lookup_straight2curved[p] = 0
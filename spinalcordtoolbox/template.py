@@ -4,12 +4,87 @@
 
 from __future__ import absolute_import
 
+import zlib
 import logging
+import collections
+
 import numpy as np
 
 logger = logging.getLogger(__name__)
 
 
+class VertLevelIndex(object):
+    """
+    Vertebral level of each slice of a vertebral labeling, and slices of each level. The level of a slice is the
+    average of its non-null and finite values, rounded to the closest integer; it is computed once for all slices, so
+    that lookups are O(1).
+    Important: This class assumes that the last dimension is Z.
+    Use get_vert_level_index() to benefit from the cache of indexes.
+    """
+    def __init__(self, data_vertlevel):
+        """
+        :param data_vertlevel: numpy array of vertebral labeling (e.g., label/template/PAM50_levels.nii.gz)
+        """
+        values = np.reshape(data_vertlevel, (-1, np.shape(data_vertlevel)[-1]))
+        is_valid = (values != 0) & np.isfinite(values)
+        count = is_valid.sum(axis=0)
+        total = np.where(is_valid, values, 0).sum(axis=0, dtype=np.float64)
+        # average of the non-null values of each slice (nan for empty slices)
+        self.fractional_levels = np.full(len(count), np.nan)
+        np.divide(total, count, out=self.fractional_levels, where=count > 0)
+        self.fractional_levels.flags.writeable = False
+        self._levels = [None if n == 0 else int(level) for n, level in zip(count, np.round(self.fractional_levels))]
+        self._slices = {}
+        for iz, level in enumerate(self._levels):
+            if level is not None:
+                self._slices.setdefault(level, []).append(iz)
+
+    @property
+    def levels(self):
+        """:return: list of int: levels found in the labeling, in increasing order"""
+        return sorted(self._slices)
+
+    def get_level(self, idx_slice):
+        """
+        :param idx_slice: int: slice (z)
+        :return: int: vertebral level. If no level is found (only zeros on this slice), return None.
+        """
+        return self._levels[idx_slice]
+
+    def get_slices(self, level):
+        """
+        :param level: int: vertebral level
+        :return: list of int: slices
+        """
+        return list(self._slices.get(level, []))
+
+
+# Maximum number of VertLevelIndex objects kept in memory
+VERT_LEVEL_INDEX_CACHE_SIZE = 8
+_vert_level_index_cache = collections.OrderedDict()
+
+
+def get_vert_level_index(im_vertlevel):
+    """
+    Get the VertLevelIndex of a vertebral labeling. The last VERT_LEVEL_INDEX_CACHE_SIZE indexes are cached, keyed on a
+    checksum of the data, so repeated calls on the same labeling (even after reloading it from the file) only compute
+    the index once.
+    :param im_vertlevel: image object of vertebral labeling (e.g., label/template/PAM50_levels.nii.gz)
+    :return: VertLevelIndex
+    """
+    data = np.ascontiguousarray(im_vertlevel.data)
+    # crc32 is ~3x faster than building the index, and collisions between images of the same shape and dtype used in
+    # a single run are unlikely
+    key = (data.shape, data.dtype.str, zlib.crc32(data))
+    if key in _vert_level_index_cache:
+        _vert_level_index_cache.move_to_end(key)
+    else:
+        _vert_level_index_cache[key] = VertLevelIndex(data)
+        if len(_vert_level_index_cache) > VERT_LEVEL_INDEX_CACHE_SIZE:
+            _vert_level_index_cache.popitem(last=False)
+    return _vert_level_index_cache[key]
+
+
 def get_slices_from_vertebral_levels(im_vertlevel, level):
     """
     Find the slices of the corresponding vertebral level.
@@ -18,21 +93,7 @@ def get_slices_from_vertebral_levels(im_vertlevel, level):
     :param level: int: vertebral level
     :return: list of int: slices
     """
-    data_vertlevel = im_vertlevel.data
-    slices = []
-    # loop across z
-    for iz in range(data_vertlevel.shape[-1]):
-        # fetch non-null and finite values
-        data_vertlevel_nonzero = data_vertlevel[..., iz].flatten()[np.nonzero(data_vertlevel[..., iz].flatten())]
-        data_vertlevel_nonzero_finite = [i for i in data_vertlevel_nonzero if np.isfinite(i)]
-        # avoid empty slice
-        if not data_vertlevel_nonzero_finite == []:
-            # average non-null values and round to closest
-            average_value = int(np.round(np.mean(data_vertlevel_nonzero_finite)))
-            # if that matches the desired level, append it to slice list
-            if average_value == level:
-                slices.append(iz)
-    return slices
+    return get_vert_level_index(im_vertlevel).get_slices(level)
 
 
 def get_vertebral_level_from_slice(im_vertlevel, idx_slice):
@@ -43,15 +104,67 @@ def get_vertebral_level_from_slice(im_vertlevel, idx_slice):
     :param idx_slice: int: slice (z)
     :return: int: vertebral level. If no level is found (only zeros on this slice), return None.
     """
-    data_vertlevel = im_vertlevel.data
-    # average non-null values and round to closest
-    try:
-        # find indices of non-null values
-        indx, indy = np.where(data_vertlevel[:, :, idx_slice])
-        vert_level = int(np.round(np.mean(data_vertlevel[indx, indy, idx_slice])))
-    except ValueError as e:
-        # slice is empty (no indx found). Do nothing.
-        logger.debug('Empty slice: z=%s (%s)', idx_slice, e)
-        vert_level = None
-    return vert_level
+    return get_vert_level_index(im_vertlevel).get_level(idx_slice)
+
+
+def get_continuous_levels_along_centerline(levels, coords):
+    """
+    Compute the position of each centerline point in the vertebral level coordinate system: level + relative distance
+    from the top of the level, from 0 (top) to 1 (bottom), measured along the centerline.
+    The points must be ordered from inferior to superior.
+    :param levels: 1D array: vertebral level of each centerline point
+    :param coords: numpy array (n, 3): physical coordinates (mm) of the centerline points
+    :return: 1D array of float: continuous level of each centerline point
+    """
+    levels = np.asarray(levels)
+    # group points by level, keeping their order along the centerline
+    order = np.argsort(levels, kind='stable')
+    levels_sorted = levels[order]
+    is_first = np.r_[True, levels_sorted[1:] != levels_sorted[:-1]]
+    # arc length from the first point of the level, restarting at 0 for each level
+    segment_length = np.r_[0, np.linalg.norm(np.diff(coords[order], axis=0), axis=1)]
+    segment_length[is_first] = 0
+    arc_length = np.cumsum(segment_length)
+    group = np.cumsum(is_first) - 1
+    index_first = np.flatnonzero(is_first)
+    index_last = np.r_[index_first[1:], len(levels_sorted)] - 1
+    arc_length -= arc_length[index_first][group]
+    length_level = arc_length[index_last][group]
+    # relative distance from the top of the level (last point along the centerline); levels with a single point
+    # are at 0
+    distance_rel = np.divide(length_level - arc_length, length_level, out=np.zeros_like(arc_length),
+                             where=length_level > 0)
+    continuous_levels = np.empty(len(levels), dtype=np.float64)
+    continuous_levels[order] = levels_sorted + distance_rel
+    return continuous_levels
+
+
+def get_continuous_vertebral_levels(im_vertlevel, param_centerline=None):
+    """
+    Transform a vertebral level image (e.g., label/template/PAM50_levels.nii.gz) into a continuous one: instead of the
+    integer level, each voxel gets the position of its slice in the vertebral level coordinate system (see
+    get_continuous_levels_along_centerline).
+    Important: The image must be RPI.
+    :param im_vertlevel: image object of vertebral labeling
+    :param param_centerline: ParamCenterline used to extract the centerline of the levels
+    :return: Image of float32, with the same non-zero voxels as im_vertlevel
+    """
+    from spinalcordtoolbox.image import zeros_like
+    from spinalcordtoolbox.centerline.core import ParamCenterline, get_centerline
+
+    if param_centerline is None:
+        param_centerline = ParamCenterline()
+    _, arr_ctl, _, _ = get_centerline(im_vertlevel, param=param_centerline)
+    x_centerline, y_centerline, z_centerline = arr_ctl
+    levels = im_vertlevel.data[x_centerline.astype(int), y_centerline.astype(int), z_centerline.astype(int)]
+    px, py, pz = im_vertlevel.dim[4:7]
+    coords = np.column_stack([x_centerline * px, y_centerline * py, z_centerline * pz])
+    continuous_levels = get_continuous_levels_along_centerline(levels, coords)
 
+    # broadcast the value of each slice to its non-zero voxels
+    values_slice = np.zeros(im_vertlevel.data.shape[2], dtype=np.float32)
+    values_slice[z_centerline.astype(int)] = continuous_levels
+    im_output = zeros_like(im_vertlevel, dtype=np.float32)
+    mask = im_vertlevel.data > 0
+    im_output.data[mask] = np.broadcast_to(values_slice, mask.shape)[mask]
+    return im_output
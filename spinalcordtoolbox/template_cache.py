@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Cache of decompressed template files (e.g., PAM50), shared between processes
+#
+# The template and atlas files are stored as .nii.gz, which every process used to decompress when loading them. The
+# cache decompresses each file once into a .nii named after the MD5 of the .nii.gz, so a file that changes (e.g. after
+# an update of the template) gets a new entry. Image() loads the cached .nii as a memory map: all the processes of a
+# batch read the same pages through the OS page cache instead of holding their own decompressed copy.
+#
+# The cache folder is set by SCT_TEMPLATE_CACHE (default: ~/.cache/spinalcordtoolbox/templates); SCT_TEMPLATE_CACHE=0
+# disables the cache.
+
+from __future__ import absolute_import
+
+import os
+import io
+import gzip
+import zlib
+import shutil
+import hashlib
+import logging
+import tempfile
+
+from spinalcordtoolbox.utils import __data_dir__
+
+
+logger = logging.getLogger(__name__)
+
+ENV_CACHE = 'SCT_TEMPLATE_CACHE'
+# Version of the layout of the cache, to change whenever the format of the entries changes
+CACHE_VERSION = 1
+# Folders whose .nii.gz files go through the cache
+CACHED_FOLDERS = [__data_dir__]
+
+
+def get_cache_dir():
+    """:return: str: folder of the cache entries, or None if the cache is disabled"""
+    path = os.environ.get(ENV_CACHE)
+    if path == '0':
+        return None
+    if not path:
+        path = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(os.path.join('~', '.cache')),
+                            'spinalcordtoolbox', 'templates')
+    return os.path.join(path, 'v{}'.format(CACHE_VERSION))
+
+
+def is_cached(fname):
+    """:return: bool: whether the file goes through the cache: a .nii.gz in one of the CACHED_FOLDERS"""
+    if not fname.endswith('.nii.gz'):
+        return False
+    path = os.path.realpath(fname)
+    return any(path.startswith(os.path.join(os.path.realpath(folder), '')) for folder in CACHED_FOLDERS)
+
+
+def _md5(path, path_cache):
+    """
+    MD5 of a file. It is stored in the cache with the size and modification time of the file, and only computed again
+    when they change, so that each process does not hash the templates it loads.
+    :param path: str: real path of the file
+    :param path_cache: str: folder of the cache
+    :return: str: hex digest
+    """
+    stat = os.stat(path)
+    signature = '{} {}'.format(stat.st_size, stat.st_mtime_ns)
+    fname_md5 = os.path.join(path_cache, hashlib.md5(path.encode('utf-8')).hexdigest() + '.md5')
+    if os.path.isfile(fname_md5):
+        with io.open(fname_md5, 'r') as f:
+            line = f.read().split()
+        if len(line) == 3 and ' '.join(line[:2]) == signature:
+            return line[2]
+    h = hashlib.md5()
+    with io.open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    content = '{} {}'.format(signature, h.hexdigest()).encode('utf-8')
+    _write_atomic(fname_md5, lambda f: f.write(content), path_cache)
+    return h.hexdigest()
+
+
+def _write_atomic(fname, write, path_cache):
+    """
+    Write a file of the cache through a temporary file, so that concurrent processes never read a partial file.
+    :param fname: str: output file
+    :param write: function writing the content to a binary file object
+    :param path_cache: str: folder of the cache
+    """
+    fd, fname_tmp = tempfile.mkstemp(suffix='.tmp', dir=path_cache)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(fname_tmp, fname)
+    except BaseException:
+        os.remove(fname_tmp)
+        raise
+
+
+def _gunzip(fname, f_out):
+    with gzip.open(fname, 'rb') as f_in:
+        shutil.copyfileobj(f_in, f_out, 1 << 20)
+
+
+def get_cached_path(fname):
+    """
+    Get the decompressed copy of a template file, decompressing it into the cache if needed.
+    :param fname: str: path of the .nii.gz file
+    :return: str: path of the cached .nii, or fname if the file does not go through the cache, the cache is disabled,
+        or the entry could not be written
+    """
+    path_cache = get_cache_dir()
+    if path_cache is None or not is_cached(fname):
+        return fname
+    try:
+        os.makedirs(path_cache, exist_ok=True)
+        fname_cached = os.path.join(path_cache, _md5(os.path.realpath(fname), path_cache) + '.nii')
+        if not os.path.isfile(fname_cached):
+            _write_atomic(fname_cached, lambda f: _gunzip(fname, f), path_cache)
+            logger.debug("Cached %s as %s", fname, fname_cached)
+    except (OSError, EOFError, zlib.error) as e:
+        logger.warning("Could not cache the template file {}: {}".format(fname, e))
+        return fname
+    return fname_cached
+
+
+def clear_cache():
+    """Remove all the entries of the cache (e.g. after an update of the templates, to remove the old entries)"""
+    path_cache = get_cache_dir()
+    if path_cache is not None and os.path.isdir(path_cache):
+        shutil.rmtree(path_cache)
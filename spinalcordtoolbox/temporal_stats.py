@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Voxel-wise statistics along time (mean, variance, tSNR), computed in a single streaming pass over 4D data
+
+
+from __future__ import division, absolute_import
+
+import logging
+import concurrent.futures
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+class TemporalStats(object):
+    """
+    Running voxel-wise statistics along time, updated chunk by chunk with Welford/Chan's algorithm, so that the series
+    never needs to be converted to float64 as a whole. Also keeps the co-moment between the signal and the time index,
+    which gives the variance of the residuals of a linear fit along time (detrended tSNR).
+
+    Example:
+      stats = TemporalStats(data.shape[:3])
+      for t in range(0, data.shape[3], 32):
+          stats.update(data[..., t:t + 32])
+      tsnr = stats.tsnr()
+    """
+    def __init__(self, shape):
+        """
+        :param shape: tuple: spatial shape of the volumes
+        """
+        self.n = 0
+        self.mean = np.zeros(shape, dtype=np.float64)
+        self.m2 = np.zeros(shape, dtype=np.float64)
+        # statistics of the time index, and co-moment between the signal and the time index
+        self.mean_t = 0.
+        self.m2_t = 0.
+        self.c_xt = np.zeros(shape, dtype=np.float64)
+
+    def update(self, chunk, time=None):
+        """
+        Add a chunk of volumes.
+        :param chunk: numpy array, with time as last dimension (shape + (nt_chunk,))
+        :param time: 1D array: time index of each volume of the chunk. Default: the volumes follow the ones already \
+        added (n, n+1, ...).
+        """
+        chunk = np.asarray(chunk)
+        n_b = chunk.shape[-1]
+        if n_b == 0:
+            return
+        if time is None:
+            time = np.arange(self.n, self.n + n_b, dtype=np.float64)
+        mean_b = np.mean(chunk, axis=-1, dtype=np.float64)
+        dx = chunk - mean_b[..., np.newaxis]
+        time = np.asarray(time, dtype=np.float64)
+        dt = time - time.mean()
+        other = TemporalStats.__new__(TemporalStats)
+        other.n, other.mean, other.m2 = n_b, mean_b, np.einsum('...t,...t->...', dx, dx)
+        other.mean_t, other.m2_t, other.c_xt = time.mean(), dt.dot(dt), np.einsum('...t,t->...', dx, dt)
+        self.merge(other)
+
+    def merge(self, other):
+        """
+        Merge the statistics of another set of volumes (same voxels), in place.
+        :param other: TemporalStats
+        :return: self
+        """
+        n = self.n + other.n
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.n, self.mean, self.m2 = other.n, other.mean.copy(), other.m2.copy()
+            self.mean_t, self.m2_t, self.c_xt = other.mean_t, other.m2_t, other.c_xt.copy()
+            return self
+        weight = self.n * other.n / n
+        delta = other.mean - self.mean
+        delta_t = other.mean_t - self.mean_t
+        self.m2 += other.m2 + delta ** 2 * weight
+        self.c_xt += other.c_xt + delta * delta_t * weight
+        self.m2_t += other.m2_t + delta_t ** 2 * weight
+        self.mean += delta * (other.n / n)
+        self.mean_t += delta_t * other.n / n
+        self.n = n
+        return self
+
+    def variance(self, ddof=1):
+        """:return: variance along time"""
+        return self.m2 / (self.n - ddof)
+
+    def std(self, ddof=1):
+        """:return: standard deviation along time"""
+        return np.sqrt(self.variance(ddof=ddof))
+
+    def variance_detrended(self):
+        """:return: variance of the residuals of a linear fit along time (2 degrees of freedom)"""
+        if self.m2_t == 0:
+            return self.variance(ddof=2)
+        residuals = self.m2 - self.c_xt ** 2 / self.m2_t
+        return np.maximum(residuals, 0) / (self.n - 2)
+
+    def tsnr(self):
+        """:return: temporal SNR: mean / std. Voxels with a null std are inf (or nan if the mean is also null)."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.mean / self.std()
+
+    def tsnr_detrended(self):
+        """:return: temporal SNR, after removing a linear drift: mean / std of the residuals"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.mean / np.sqrt(self.variance_detrended())
+
+
+def compute_temporal_stats(data, volumes=None, chunk_size=32, slab_size=None, n_jobs=1):
+    """
+    Compute the statistics along time of 4D data, reading chunk_size volumes (of slab_size axial slices) at a time.
+    With memory-mapped data (e.g. uncompressed NIfTI loaded by Image), the series is never fully loaded in memory.
+    :param data: 4D numpy array (or memmap), with time as last dimension
+    :param volumes: list of int: index of the volumes to use. Default: all volumes.
+    :param chunk_size: int: number of volumes read at a time
+    :param slab_size: int: number of slices (along the 3rd dimension) processed at a time. Default: all slices.
+    :param n_jobs: int: number of threads across which the slabs are distributed
+    :return: TemporalStats
+    """
+    if data.ndim != 4:
+        raise ValueError("Expecting 4D data. Shape is: {}".format(data.shape))
+    volumes = np.arange(data.shape[3]) if volumes is None else np.asarray(volumes, dtype=int)
+    nz = data.shape[2]
+    slab_size = nz if slab_size is None else max(int(slab_size), 1)
+    slabs = [slice(z, min(z + slab_size, nz)) for z in range(0, nz, slab_size)]
+    logger.debug("Computing temporal statistics on %d volumes, %d slab(s), with %d job(s)", len(volumes), len(slabs),
+                 n_jobs)
+
+    def compute_slab(slab):
+        stats_slab = TemporalStats(data.shape[:2] + (slab.stop - slab.start,))
+        for i in range(0, len(volumes), chunk_size):
+            index_chunk = volumes[i:i + chunk_size]
+            # contiguous volumes are read with a slice, to keep reading from memory-mapped files sequential
+            if np.all(np.diff(index_chunk) == 1):
+                chunk = data[:, :, slab, index_chunk[0]:index_chunk[-1] + 1]
+            else:
+                chunk = data[:, :, slab][..., index_chunk]
+            stats_slab.update(chunk, time=index_chunk)
+        return stats_slab
+
+    if n_jobs > 1 and len(slabs) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            stats_slabs = list(executor.map(compute_slab, slabs))
+    else:
+        stats_slabs = [compute_slab(slab) for slab in slabs]
+
+    stats = TemporalStats(data.shape[:3])
+    stats.n, stats.mean_t, stats.m2_t = stats_slabs[0].n, stats_slabs[0].mean_t, stats_slabs[0].m2_t
+    for slab, stats_slab in zip(slabs, stats_slabs):
+        stats.mean[:, :, slab] = stats_slab.mean
+        stats.m2[:, :, slab] = stats_slab.m2
+        stats.c_xt[:, :, slab] = stats_slab.c_xt
+    return stats
+
+
+def snr_in_roi(stats, mask, almost_zero=np.finfo(float).eps):
+    """
+    SNR within a (weighted) ROI, from the mean and STD across time: weighted average of the mean divided by weighted
+    average of the STD, over the voxels with a non-null STD.
+    :param stats: TemporalStats
+    :param mask: 3D numpy array: binary or weighted mask
+    :param almost_zero: float: voxels with a STD below this value are ignored
+    :return: float
+    """
+    data_std = stats.std()
+    mask_std_nonzero = np.where(data_std > almost_zero)
+    mean_in_roi = np.average(stats.mean[mask_std_nonzero], weights=mask[mask_std_nonzero])
+    std_in_roi = np.average(data_std[mask_std_nonzero], weights=mask[mask_std_nonzero])
+    return mean_in_roi / std_in_roi
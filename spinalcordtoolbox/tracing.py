@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Execution tracing: spans with wall time, CPU time, peak memory and I/O, for each sct.run() call and decorated Python
+# stage, across nested SCT processes. Output: Chrome trace-event JSON (chrome://tracing, https://ui.perfetto.dev) and
+# a summary table per stage.
+#
+# Tracing is enabled by setting SCT_TRACE to the path of the output JSON file, e.g.:
+#   SCT_TRACE=trace.json sct_register_to_template -i t2.nii.gz -s t2_seg.nii.gz -l labels.nii.gz
+# When SCT_TRACE is not set, span() returns a shared no-op context manager and traced() returns the function itself.
+#
+# The first traced process creates the trace ID, and passes it to the SCT processes it runs through SCT_TRACE_ID (and
+# the ID of the calling span through SCT_TRACE_PARENT). Each child process writes its spans to a part file next to the
+# output when it exits; the first process merges them when it exits, writes the trace and logs the summary.
+
+
+from __future__ import division, absolute_import
+
+import os
+import sys
+import json
+import time
+import uuid
+import atexit
+import logging
+import resource
+import functools
+import threading
+import itertools
+
+
+logger = logging.getLogger(__name__)
+
+ENV_TRACE = 'SCT_TRACE'
+ENV_TRACE_ID = 'SCT_TRACE_ID'
+ENV_TRACE_PARENT = 'SCT_TRACE_PARENT'
+
+# ru_maxrss is in kilobytes on Linux, in bytes on macOS; ru_inblock/ru_oublock are in blocks of 512 bytes
+_MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+_BLOCK_SIZE = 512
+
+
+def _get_usage(who):
+    """
+    :param who: resource.RUSAGE_SELF or resource.RUSAGE_CHILDREN
+    :return: tuple: cpu time (s), peak RSS (bytes), bytes read, bytes written
+    """
+    usage = resource.getrusage(who)
+    return (usage.ru_utime + usage.ru_stime, usage.ru_maxrss * _MAXRSS_UNIT, usage.ru_inblock * _BLOCK_SIZE,
+            usage.ru_oublock * _BLOCK_SIZE)
+
+
+class Span(object):
+    """
+    Timed section of the execution. Resources are measured with getrusage: for 'run' spans (sct.run), on the child
+    processes (RUSAGE_CHILDREN), otherwise on the current process (RUSAGE_SELF). CPU time and I/O are the differences
+    between the end and the start of the span; the I/O only counts the blocks actually read from or written to the
+    storage (not the reads served from the page cache). The peak RSS is a high-water mark: for 'run' spans, the
+    largest peak of the child processes waited for so far.
+    """
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = dict(args or {})
+        self.id = tracer.new_span_id()
+        self.who = resource.RUSAGE_CHILDREN if cat == 'run' else resource.RUSAGE_SELF
+
+    def __enter__(self):
+        self.parent_id = self.tracer.push(self)
+        self.ts = time.time()
+        self.t0 = time.perf_counter()
+        self.usage = _get_usage(self.who)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        duration = time.perf_counter() - self.t0
+        cpu, max_rss, read, written = _get_usage(self.who)
+        cpu, read, written = cpu - self.usage[0], read - self.usage[2], written - self.usage[3]
+        self.tracer.pop(self)
+        self.args.update(id=self.id, parent=self.parent_id, cpu_s=cpu, max_rss_bytes=max_rss, read_bytes=read,
+                         written_bytes=written)
+        if exc_type is not None:
+            self.args['error'] = repr(exc_value)
+        self.tracer.add_event(self.name, self.cat, self.ts, duration, self.args)
+        return False
+
+
+class _NullSpan(object):
+    """No-op span, returned by span() when tracing is disabled"""
+    args = {}
+    id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+class Tracer(object):
+    """
+    Record of the spans of the current process, as Chrome trace events ("complete" events, timestamps in µs since the
+    epoch so that the events of all processes share the same time axis).
+    """
+    def __init__(self, fname_trace, trace_id=None, parent_id=None, process_name=None):
+        """
+        :param fname_trace: str: output JSON file
+        :param trace_id: str: ID of the trace to attach to. If None, this process is the root of a new trace.
+        :param parent_id: str: ID of the span (in the parent process) that runs this process
+        :param process_name: str: name of the process in the trace. Default: name of the script
+        """
+        self.fname_trace = os.path.abspath(fname_trace)
+        self.is_root = trace_id is None
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.parent_id = parent_id
+        self.process_name = process_name or os.path.basename(sys.argv[0]) or 'python'
+        self.pid = os.getpid()
+        self.events = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counter = itertools.count()
+        self._process_span = None
+
+    @property
+    def path_parts(self):
+        """Folder of the part files written by the child processes"""
+        return '{}.{}.parts'.format(self.fname_trace, self.trace_id)
+
+    def new_span_id(self):
+        return '{}.{}'.format(self.pid, next(self._counter))
+
+    def _get_stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def current_span_id(self):
+        """
+        :return: str: ID of the current span of the thread, or of the span of the whole process, or of the span (in the
+            parent process) that runs this process
+        """
+        stack = self._get_stack()
+        if stack:
+            return stack[-1].id
+        return self._process_span.id if self._process_span is not None else self.parent_id
+
+    def push(self, span):
+        """:return: str: ID of the parent span"""
+        parent_id = self.current_span_id()
+        self._get_stack().append(span)
+        return parent_id
+
+    def pop(self, span):
+        stack = self._get_stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+
+    def add_event(self, name, cat, ts, duration, args):
+        with self._lock:
+            self.events.append({'name': name, 'cat': cat, 'ph': 'X', 'ts': ts * 1e6, 'dur': duration * 1e6,
+                                'pid': self.pid, 'tid': threading.get_ident(), 'args': args})
+
+    def span(self, name, cat='python', args=None):
+        return Span(self, name, cat, args)
+
+    def get_child_env(self, env=None):
+        """
+        :param env: dict: environment of the child process. Default: os.environ
+        :return: dict: copy of the environment, with the variables that attach the child to this trace
+        """
+        env = dict(os.environ if env is None else env)
+        env[ENV_TRACE] = self.fname_trace
+        env[ENV_TRACE_ID] = self.trace_id
+        parent_id = self.current_span_id()
+        if parent_id is not None:
+            env[ENV_TRACE_PARENT] = parent_id
+        return env
+
+    def start(self):
+        """Open the span of the whole process, and close it (and write the trace) at exit"""
+        if self.is_root:
+            os.makedirs(self.path_parts, exist_ok=True)
+        process_span = self.span(self.process_name, cat='process', args={'argv': sys.argv[1:]})
+        process_span.__enter__()
+        self._process_span = process_span
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Close the span of the process, then write the part file, or the trace and the summary for the root"""
+        if os.getpid() != self.pid:
+            # forked process (e.g. multiprocessing): its spans belong to the parent
+            return
+        if self._process_span is not None:
+            self._process_span.__exit__(None, None, None)
+            self._process_span = None
+        metadata = {'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': self.process_name}}
+        if not self.is_root:
+            if os.path.isdir(self.path_parts):
+                with open(os.path.join(self.path_parts, '{}.json'.format(self.pid)), 'w') as f:
+                    json.dump([metadata] + self.events, f)
+            return
+        events = [metadata] + self.events
+        if os.path.isdir(self.path_parts):
+            for fname in sorted(os.listdir(self.path_parts)):
+                fname = os.path.join(self.path_parts, fname)
+                try:
+                    with open(fname) as f:
+                        events += json.load(f)
+                except ValueError:
+                    logger.warning("Ignoring incomplete trace part: {}".format(fname))
+                os.remove(fname)
+            os.rmdir(self.path_parts)
+        with open(self.fname_trace, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'trace_id': self.trace_id}}, f)
+        sys.stderr.write("\nTrace written to {}\n{}\n".format(self.fname_trace, format_summary(summarize(events))))
+
+
+def summarize(events):
+    """
+    Aggregate the spans of a trace per stage.
+    :param events: list of Chrome trace events
+    :return: list of dict (name, cat, calls, wall_s, cpu_s, max_rss_bytes, read_bytes, written_bytes), sorted by
+        decreasing wall time
+    """
+    stages = {}
+    for event in events:
+        if event.get('ph') != 'X':
+            continue
+        key = (event['cat'], event['name'])
+        if key not in stages:
+            stages[key] = dict(name=event['name'], cat=event['cat'], calls=0, wall_s=0., cpu_s=0., max_rss_bytes=0,
+                               read_bytes=0, written_bytes=0)
+        stage, args = stages[key], event['args']
+        stage['calls'] += 1
+        stage['wall_s'] += event['dur'] / 1e6
+        stage['cpu_s'] += args.get('cpu_s', 0)
+        stage['max_rss_bytes'] = max(stage['max_rss_bytes'], args.get('max_rss_bytes', 0))
+        stage['read_bytes'] += args.get('read_bytes', 0)
+        stage['written_bytes'] += args.get('written_bytes', 0)
+    return sorted(stages.values(), key=lambda stage: -stage['wall_s'])
+
+
+def format_summary(stages):
+    """
+    :param stages: see summarize()
+    :return: str: table, one line per stage
+    """
+    lines = ['{:<40} {:<8} {:>6} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+        'stage', 'type', 'calls', 'wall (s)', 'cpu (s)', 'rss (MB)', 'read (MB)', 'write (MB)')]
+    for stage in stages:
+        lines.append('{:<40} {:<8} {:>6} {:>10.3f} {:>10.3f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+            stage['name'][:40], stage['cat'], stage['calls'], stage['wall_s'], stage['cpu_s'],
+            stage['max_rss_bytes'] / 1024. ** 2, stage['read_bytes'] / 1024. ** 2,
+            stage['written_bytes'] / 1024. ** 2))
+    return '\n'.join(lines)
+
+
+def _init_tracer():
+    if not os.environ.get(ENV_TRACE):
+        return None
+    tracer = Tracer(os.environ[ENV_TRACE], trace_id=os.environ.get(ENV_TRACE_ID) or None,
+                    parent_id=os.environ.get(ENV_TRACE_PARENT) or None)
+    tracer.start()
+    # the child processes of this process attach to the trace, including those not started through sct.run()
+    os.environ.update(tracer.get_child_env({}))
+    return tracer
+
+
+_tracer = _init_tracer()
+
+
+def is_enabled():
+    return _tracer is not None
+
+
+def span(name, cat='python', args=None):
+    """
+    Context manager recording a span, if tracing is enabled. Example:
+      with tracing.span('straighten', args={'fname': fname}):
+          ...
+    :param name: str: name of the stage
+    :param cat: str: 'python' for Python stages, 'run' for child processes (see sct_utils.run())
+    :param args: dict: extra information saved with the span (must be JSON serializable)
+    :return: context manager
+    """
+    if _tracer is None:
+        return _null_span
+    return _tracer.span(name, cat, args)
+
+
+def traced(func=None, name=None):
+    """
+    Decorator recording a span for each call of a function, if tracing is enabled when the function is defined. Can be
+    used as @traced or @traced(name='stage').
+    :param func: function
+    :param name: str: name of the stage. Default: qualified name of the function
+    """
+    if func is None:
+        return functools.partial(traced, name=name)
+    if _tracer is None:
+        return func
+    name = name or '{}.{}'.format(func.__module__.rsplit('.', 1)[-1], func.__qualname__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _tracer.span(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def get_child_env(env=None):
+    """
+    :param env: dict: environment of a child process. Default: os.environ
+    :return: dict: environment attaching the child process to the current span, if tracing is enabled, otherwise env
+    """
+    if _tracer is None:
+        return os.environ if env is None else env
+    return _tracer.get_child_env(env)
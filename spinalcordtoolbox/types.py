@@ -18,7 +18,10 @@ from __future__ import division, absolute_import
 from numpy import dot, cross, array, dstack, einsum, tile, multiply, stack, rollaxis, zeros
 from numpy.linalg import norm, inv
 import numpy as np
-from scipy.spatial import cKDTree
+
+from spinalcordtoolbox.utils import lazy_import
+
+spatial = lazy_import('scipy.spatial')
 
 
 class Point(object):
@@ -160,6 +163,44 @@ class CoordinateValue(Coordinate):
         return hash(self.value)
 
 
+def _group_by_level(vertebral_levels):
+    """
+    Group queries by vertebral level
+    :return: dict {vertebral level: list of query indexes}
+    """
+    groups = {}
+    for i, vertebral_level in enumerate(vertebral_levels):
+        groups.setdefault(vertebral_level, []).append(i)
+    return groups
+
+
+def _argmin_abs_monotonic(values, targets):
+    """
+    Same as [np.argmin(np.abs(values - target)) for target in targets], with binary searches: values must be sorted in
+    increasing or decreasing order. Falls back to a linear scan for unsorted values or NaNs.
+    :param values: 1D numpy array
+    :param targets: 1D numpy array
+    :return: numpy array of int, same length as targets
+    """
+    targets = np.asarray(targets, dtype=np.float64)
+    diff = np.diff(values)
+    if np.all(diff >= 0):
+        values_sorted = values
+    elif np.all(diff <= 0):
+        # negating is exact, so distances are unchanged
+        values_sorted, targets = -values, -targets
+    else:
+        return np.array([np.argmin(np.abs(values - target)) for target in targets], dtype=int)
+    if np.isnan(targets).any():
+        return np.array([np.argmin(np.abs(values - target)) for target in targets], dtype=int)
+
+    # first value >= target, and first occurrence of the value just below it
+    right = np.searchsorted(values_sorted, targets, side='left')
+    left = np.searchsorted(values_sorted, values_sorted[np.maximum(right - 1, 0)], side='left')
+    right = np.minimum(right, len(values_sorted) - 1)
+    return np.where(np.abs(values_sorted[left] - targets) <= np.abs(values_sorted[right] - targets), left, right)
+
+
 class Centerline:
     """
     This class represents a centerline in an image. Its coordinates can be in voxel space as well as in physical space.
@@ -252,33 +293,23 @@ class Centerline:
 
         # computation of centerline features, based on points and derivatives
         self.compute_length()
-        self.coordinate_system = [self.compute_coordinate_system(index) for index in range(0, self.number_of_points)]
-        self.plans_parameters = [self.get_plan_parameters(index) for index in range(0, self.number_of_points)]
-
-        self.matrices = stack([item[4] for item in self.coordinate_system])
-        self.inverse_matrices = stack([item[5] for item in self.coordinate_system])
-        self.offset_plans = array([item[3] for item in self.plans_parameters])
+        self.compute_coordinate_systems()
 
         # initialization of KDTree for enabling computation of nearest points in centerline
-        self.tree_points = cKDTree(self.points)
+        self.tree_points = spatial.cKDTree(self.points)
 
         if self.compute_init_distribution:
             self.compute_vertebral_distribution(disks_levels=self.disks_levels, label_reference=self.label_reference)
 
     def compute_length(self):
-        for i in range(0, self.number_of_points - 1):
-            distance = np.sqrt((self.points[i][0] - self.points[i + 1][0]) ** 2 +
-                            (self.points[i][1] - self.points[i + 1][1]) ** 2 +
-                            (self.points[i][2] - self.points[i + 1][2]) ** 2)
-            self.length += distance
-            self.progressive_length.append(distance)
-            self.incremental_length.append(self.incremental_length[-1] + distance)
-        for i in range(self.number_of_points - 1, 0, -1):
-            distance = np.sqrt((self.points[i][0] - self.points[i - 1][0]) ** 2 +
-                            (self.points[i][1] - self.points[i - 1][1]) ** 2 +
-                            (self.points[i][2] - self.points[i - 1][2]) ** 2)
-            self.progressive_length_inverse.append(distance)
-            self.incremental_length_inverse.append(self.incremental_length_inverse[-1] + distance)
+        # distance between consecutive points, accumulated from both ends of the centerline
+        diff = self.points[:-1] - self.points[1:]
+        distances = np.sqrt(diff[:, 0] ** 2 + diff[:, 1] ** 2 + diff[:, 2] ** 2)
+        self.progressive_length = [0.0] + distances.tolist()
+        self.incremental_length = [0.0] + np.cumsum(distances).tolist()
+        self.progressive_length_inverse = [0.0] + distances[::-1].tolist()
+        self.incremental_length_inverse = [0.0] + np.cumsum(distances[::-1]).tolist()
+        self.length = self.incremental_length[-1]
 
     def find_nearest_index(self, coord):
         """
@@ -390,6 +421,30 @@ class Centerline:
 
         return origin, x_prime_axis, y_prime_axis, z_prime_axis, matrix_base, inverse_matrix
 
+    def compute_coordinate_systems(self):
+        """
+        This function computes the coordinate reference system and the plane of every point of the centerline at once.
+        It gives the same results as compute_coordinate_system() and get_plan_parameters() called on each index, and
+        normalizes the derivatives in the same way.
+        """
+        z_prime_axis = self.derivatives / norm(self.derivatives, axis=1)[:, np.newaxis]
+        # projection of the y axis [0, 1, 0] on the plane orthogonal to z_prime_axis
+        y_prime_axis = - z_prime_axis[:, 1:2] * z_prime_axis
+        y_prime_axis[:, 1] += 1
+        y_prime_axis /= norm(y_prime_axis, axis=1)[:, np.newaxis]
+        x_prime_axis = cross(y_prime_axis, z_prime_axis)
+        x_prime_axis /= norm(x_prime_axis, axis=1)[:, np.newaxis]
+
+        self.derivatives = z_prime_axis
+        self.matrices = stack([x_prime_axis, y_prime_axis, z_prime_axis], axis=2)
+        self.inverse_matrices = inv(self.matrices)
+        self.offset_plans = - (z_prime_axis[:, 0] * self.points[:, 0] + z_prime_axis[:, 1] * self.points[:, 1] +
+                               z_prime_axis[:, 2] * self.points[:, 2])
+
+        self.coordinate_system = list(zip(self.points, x_prime_axis, y_prime_axis, z_prime_axis, self.matrices,
+                                          self.inverse_matrices))
+        self.plans_parameters = np.column_stack([z_prime_axis, self.offset_plans]).tolist()
+
     def get_projected_coordinates_on_plane(self, coord, index, plane_params=None):
         """
         This function returns the coordinates of
@@ -461,33 +516,24 @@ class Centerline:
         if not is_C2_here and C1 is not None and C3 is not None:
             disks_levels.append([(C1[0] + C3[0]) / 2.0, (C1[1] + C3[1]) / 2.0, (C1[2] + C3[2]) / 2.0, 2])
 
-        labels_points = [0] * self.number_of_points
         self.l_points = [0] * self.number_of_points
-        self.dist_points = [0] * self.number_of_points
-        self.dist_points_rel = [0] * self.number_of_points
         self.index_disk, index_disk_inv = {}, []
 
         # extracting each level based on position and computing its nearest point along the centerline
+        levels = [level for level in disks_levels if level[3] in self.list_labels]
+        nearest_indexes = self.find_nearest_indexes(np.array([level[:3] for level in levels]).reshape(-1, 3))
         first_label, last_label = None, None
-        for level in disks_levels:
-            if level[3] in self.list_labels:
-                coord_level = [level[0], level[1], level[2]]
-                disk = self.regions_labels[str(int(level[3]))]
-                nearest_index = self.find_nearest_index(coord_level)
-                labels_points[nearest_index] = disk + '-0.0'
-                self.index_disk[disk] = nearest_index
-                index_disk_inv.append([nearest_index, disk])
-
-                # Finding minimum and maximum label, based on list_labels, which is ordered from top to bottom.
-                index_label = self.list_labels.index(int(level[3]))
-                if first_label is None:
-                    first_label = index_label
-                if index_label < first_label:
-                    first_label = index_label
-                if last_label is None:
-                    last_label = index_label
-                if index_label > last_label:
-                    last_label = index_label
+        for level, nearest_index in zip(levels, nearest_indexes):
+            disk = self.regions_labels[str(int(level[3]))]
+            self.index_disk[disk] = nearest_index
+            index_disk_inv.append([nearest_index, disk])
+
+            # Finding minimum and maximum label, based on list_labels, which is ordered from top to bottom.
+            index_label = self.list_labels.index(int(level[3]))
+            if first_label is None or index_label < first_label:
+                first_label = index_label
+            if last_label is None or index_label > last_label:
+                last_label = index_label
 
         if first_label is not None:
             self.first_label = self.list_labels[first_label]
@@ -500,9 +546,9 @@ class Centerline:
         index_disk_inv.append([0, 'bottom'])
         index_disk_inv = sorted(index_disk_inv, key=itemgetter(0))
 
+        # arc length from the first point, with the same one-point offset as progressive_length
         progress_length = zeros(self.number_of_points)
-        for i in range(self.number_of_points - 1):
-            progress_length[i + 1] = progress_length[i] + self.progressive_length[i]
+        progress_length[1:] = self.incremental_length[:-1]
 
         self.label_reference = label_reference
         if self.label_reference not in self.index_disk:
@@ -518,48 +564,63 @@ class Centerline:
         for disk in self.index_disk:
             self.distance_from_C1label[disk] = progress_length[self.index_disk[self.label_reference]] - progress_length[self.index_disk[disk]]
 
-        for i in range(1, len(index_disk_inv)):
-            for j in range(index_disk_inv[i - 1][0], index_disk_inv[i][0]):
-                self.l_points[j] = index_disk_inv[i][1]
-
-        for i in range(self.number_of_points):
-            self.dist_points[i] = progress_length[self.index_disk[self.label_reference]] - progress_length[i]
-
-        for i in range(self.number_of_points):
-            current_label = self.l_points[i]
-
+        # each disk labels the points between the previous disk and itself; points after the last disk are labeled 0
+        self.level_segments = {}
+        segments = [(index_disk_inv[i - 1][0], index_disk_inv[i][0], index_disk_inv[i][1])
+                    for i in range(1, len(index_disk_inv))]
+        segments.append((index_disk_inv[-1][0], self.number_of_points, 0))
+        for start, stop, label in segments:
+            if start < stop:
+                self.l_points[start:stop] = [label] * (stop - start)
+                self.level_segments.setdefault(label, []).append((start, stop))
+
+        self.dist_points = progress_length[self.index_disk[self.label_reference]] - progress_length
+        self.dist_points_rel = zeros(self.number_of_points)
+        dist_disk = {disk: self.dist_points[index] for disk, index in self.index_disk.items()}
+
+        for label, label_segments in self.level_segments.items():
+            current_label = label
             if current_label == 0:
                 if 'PMG' in self.index_disk:
-                    self.dist_points_rel[i] = self.dist_points[i] - self.dist_points[self.index_disk['PMG']]
+                    for start, stop in label_segments:
+                        self.dist_points_rel[start:stop] = self.dist_points[start:stop] - dist_disk['PMG']
                     continue
                 else:
                     current_label = 'PMG'
 
-            if self.list_labels.index(self.labels_regions[current_label]) < self.list_labels.index(self.first_label):
-                reference_level_position = self.dist_points[self.index_disk[self.regions_labels[str(self.first_label)]]]
-                self.dist_points_rel[i] = self.dist_points[i] - reference_level_position
-
-            elif self.list_labels.index(self.labels_regions[current_label]) >= self.list_labels.index(self.last_label):
-                reference_level_position = self.dist_points[self.index_disk[self.regions_labels[str(self.last_label)]]]
-                self.dist_points_rel[i] = self.dist_points[i] - reference_level_position
-
+            index_current_label = self.list_labels.index(self.labels_regions[current_label])
+            if index_current_label < self.list_labels.index(self.first_label):
+                reference_level_position = dist_disk[self.regions_labels[str(self.first_label)]]
+                offset, scale, sign = reference_level_position, None, 1
+            elif index_current_label >= self.list_labels.index(self.last_label):
+                reference_level_position = dist_disk[self.regions_labels[str(self.last_label)]]
+                offset, scale, sign = reference_level_position, None, 1
             else:
-                index_current_label = self.list_labels.index(self.labels_regions[self.l_points[i]])
-
-                if self.list_labels.index(self.first_label) <= index_current_label < self.list_labels.index(self.last_label):
-                    next_label = self.regions_labels[str(self.list_labels[index_current_label + 1])]
-
-                    if current_label in ['PMJ', 'PMG']:
-                        if next_label in self.index_disk:
-                            self.dist_points_rel[i] = - (self.dist_points[i] - self.dist_points[self.index_disk[next_label]]) / abs(self.dist_points[self.index_disk[next_label]] - self.dist_points[self.index_disk[current_label]])
-                        else:
-                            self.dist_points_rel[i] = (self.average_vert_length[current_label] - self.dist_points[i] + self.dist_points[self.index_disk[current_label]]) / self.average_vert_length[current_label]
+                next_label = self.regions_labels[str(self.list_labels[self.list_labels.index(self.labels_regions[label]) + 1])]
+                if current_label in ['PMJ', 'PMG']:
+                    if next_label in self.index_disk:
+                        offset, sign = dist_disk[next_label], -1
+                        scale = abs(dist_disk[next_label] - dist_disk[current_label])
+                    else:
+                        offset, sign = None, 0
+                        scale = self.average_vert_length[current_label]
+                else:
+                    offset, sign = dist_disk[current_label], 1
+                    if next_label in self.index_disk:
+                        scale = abs(dist_disk[next_label] - dist_disk[current_label])
                     else:
-                        next_label = self.regions_labels[str(self.list_labels[self.list_labels.index(self.labels_regions[self.l_points[i]]) + 1])]
-                        if next_label in self.index_disk:
-                            self.dist_points_rel[i] = (self.dist_points[i] - self.dist_points[self.index_disk[current_label]]) / abs(self.dist_points[self.index_disk[next_label]] - self.dist_points[self.index_disk[current_label]])
-                        else:
-                            self.dist_points_rel[i] = (self.dist_points[i] - self.dist_points[self.index_disk[current_label]]) / self.average_vert_length[current_label]
+                        scale = self.average_vert_length[current_label]
+
+            for start, stop in label_segments:
+                dist = self.dist_points[start:stop]
+                if sign == 0:
+                    self.dist_points_rel[start:stop] = (scale - dist + dist_disk[current_label]) / scale
+                elif scale is None:
+                    self.dist_points_rel[start:stop] = dist - offset
+                elif sign < 0:
+                    self.dist_points_rel[start:stop] = - (dist - offset) / scale
+                else:
+                    self.dist_points_rel[start:stop] = (dist - offset) / scale
 
     def get_closest_to_relative_position(self, vertebral_level, relative_position, mode='levels'):
         """
@@ -572,88 +633,135 @@ class Centerline:
 
         Returns:
         """
-        if mode == 'levels':
-            indexes_vert = np.argwhere(np.array(self.l_points) == vertebral_level)
-            if len(indexes_vert) == 0:
-                return None
-            # find closest
-            arr_dist_rel = np.array(self.dist_points_rel)
-            idx = np.argmin(np.abs(arr_dist_rel[indexes_vert] - relative_position))
-            result = indexes_vert[idx]
+        return self.get_closest_to_relative_positions([vertebral_level], [relative_position], mode=mode)[0]
 
+    def get_closest_to_relative_positions(self, vertebral_levels, relative_positions, mode='levels'):
+        """
+        Batched version of get_closest_to_relative_position().
+        :param vertebral_levels: list of vertebral levels (as found in l_points)
+        :param relative_positions: list of relative positions, one per vertebral level
+        :param mode: {'levels', 'length'}
+        :return: list of indexes of the closest centerline points, None where the level is not on the centerline
+        """
+        relative_positions = np.asarray(relative_positions, dtype=np.float64)
+        if mode == 'levels':
+            result = [None] * len(relative_positions)
+            for vertebral_level, queries in _group_by_level(vertebral_levels).items():
+                # points past the last disk (level 0) do not belong to any vertebral level
+                segments = self.level_segments.get(vertebral_level, []) if vertebral_level != 0 else []
+                if not segments:
+                    continue
+                # the closest point of each segment, then the closest of all segments (first one in case of tie)
+                best_index, best_distance = None, None
+                for start, stop in segments:
+                    index = start + _argmin_abs_monotonic(self.dist_points_rel[start:stop], relative_positions[queries])
+                    distance = np.abs(self.dist_points_rel[index] - relative_positions[queries])
+                    if best_index is None:
+                        best_index, best_distance = index, distance
+                    else:
+                        closer = distance < best_distance
+                        best_index = np.where(closer, index, best_index)
+                        best_distance = np.where(closer, distance, best_distance)
+                for query, index in zip(queries, best_index):
+                    result[query] = index
         elif mode == 'length':
-            result = np.argmin(np.abs(np.array(self.dist_points) - relative_position))
+            result = list(_argmin_abs_monotonic(self.dist_points, relative_positions))
         else:
             raise ValueError("Mode must be either 'levels' or 'length'.")
-
-        if isinstance(result, list) or isinstance(result, np.ndarray):
-            result = result[0]
         return result
 
     def get_closest_to_absolute_position(self, vertebral_level, relative_position, backup_index=None, backup_centerline=None, mode='levels'):
-        if mode == 'levels':
-            if vertebral_level == 0:  # above the C1 vertebral level, the method used is length
-                if backup_centerline is not None:
-                    position_reference_backup = backup_centerline.dist_points[backup_centerline.index_disk[backup_centerline.regions_labels[str(self.first_label)]]]
-                    position_reference_self = self.dist_points[self.index_disk[self.regions_labels[str(self.first_label)]]]
-                    relative_position_from_reference_backup = backup_centerline.dist_points[backup_index] - position_reference_backup
-                    result = np.argmin(np.abs(np.array(self.dist_points) - position_reference_self - relative_position_from_reference_backup))
-                else:
-                    result = np.argmin(np.abs(np.array(self.dist_points) - relative_position))
-            else:
+        return self.get_closest_to_absolute_positions([vertebral_level], [relative_position],
+                                                      backup_indexes=None if backup_index is None else [backup_index],
+                                                      backup_centerline=backup_centerline, mode=mode)[0]
+
+    def get_closest_to_absolute_positions(self, vertebral_levels, relative_positions, backup_indexes=None,
+                                          backup_centerline=None, mode='levels'):
+        """
+        Batched version of get_closest_to_absolute_position(): the queries are grouped by vertebral level and resolved
+        with binary searches on the (monotonic) distances along the centerline.
+        :param vertebral_levels: list of vertebral levels (as found in l_points)
+        :param relative_positions: list of relative positions, one per vertebral level
+        :param backup_indexes: list of indexes on backup_centerline, used outside of the labeled levels
+        :param backup_centerline: Centerline
+        :param mode: {'levels', 'length'}
+        :return: list of indexes of the closest centerline points, None where the level is not on the centerline
+        """
+        if mode not in ['levels', 'length']:
+            raise ValueError("Mode must be either 'levels' or 'length'.")
+        relative_positions = np.asarray(relative_positions, dtype=np.float64)
+        if backup_indexes is not None:
+            backup_indexes = np.asarray(backup_indexes)
+        result = [None] * len(relative_positions)
+        relative_queries = []
+        for vertebral_level, queries in _group_by_level(vertebral_levels).items():
+            if mode == 'levels' and vertebral_level == 0:  # above the C1 vertebral level, the method used is length
+                reference_label = self.first_label
+            elif mode == 'levels':
                 vertebral_number = self.labels_regions[vertebral_level]
                 if self.potential_list_labels.index(vertebral_number) < self.list_labels.index(self.first_label):
-                    if backup_centerline is not None:
-                        position_reference_backup = backup_centerline.dist_points[backup_centerline.index_disk[backup_centerline.regions_labels[str(self.first_label)]]]
-                        position_reference_self = self.dist_points[self.index_disk[self.regions_labels[str(self.first_label)]]]
-                        relative_position_from_reference_backup = backup_centerline.dist_points[backup_index] - position_reference_backup
-                        result = np.argmin(np.abs(np.array(self.dist_points) - position_reference_self - relative_position_from_reference_backup))
-                    else:
-                        reference_level_position = self.dist_points[self.index_disk[self.regions_labels[str(self.first_label)]]]
-                        result = np.argmin(np.abs(np.array(self.dist_points) - reference_level_position - relative_position))
+                    reference_label = self.first_label
                 elif self.potential_list_labels.index(vertebral_number) >= self.list_labels.index(self.last_label):
-                    if backup_centerline is not None:
-                        position_reference_backup = backup_centerline.dist_points[backup_centerline.index_disk[backup_centerline.regions_labels[str(self.last_label)]]]
-                        position_reference_self = self.dist_points[self.index_disk[self.regions_labels[str(self.last_label)]]]
-                        relative_position_from_reference_backup = backup_centerline.dist_points[backup_index] - position_reference_backup
-                        result = np.argmin(np.abs(np.array(self.dist_points) - position_reference_self - relative_position_from_reference_backup))
-                    else:
-                        reference_level_position = self.dist_points[self.index_disk[self.regions_labels[str(self.last_label)]]]
-                        result = np.argmin(np.abs(np.array(self.dist_points) - reference_level_position - relative_position))
+                    reference_label = self.last_label
                 else:
-                    result = self.get_closest_to_relative_position(vertebral_level=vertebral_level, relative_position=relative_position)
-
-        elif mode == 'length':
-            result = self.get_closest_to_relative_position(vertebral_level=vertebral_level, relative_position=relative_position)
-        else:
-            raise ValueError("Mode must be either 'levels' or 'length'.")
+                    reference_label = None
+            else:
+                reference_label = None
 
-        if isinstance(result, list) or isinstance(result, np.ndarray):
-            result = result[0]
+            if reference_label is None:
+                relative_queries.extend(queries)
+                continue
+            if vertebral_level == 0 and backup_centerline is None:
+                indexes = _argmin_abs_monotonic(self.dist_points, relative_positions[queries])
+            else:
+                reference_level_position = self.dist_points[self.index_disk[self.regions_labels[str(reference_label)]]]
+                if backup_centerline is not None:
+                    position_reference_backup = backup_centerline.dist_points[backup_centerline.index_disk[backup_centerline.regions_labels[str(reference_label)]]]
+                    positions = backup_centerline.dist_points[backup_indexes[queries]] - position_reference_backup
+                else:
+                    positions = relative_positions[queries]
+                indexes = _argmin_abs_monotonic(self.dist_points - reference_level_position, positions)
+            for query, index in zip(queries, indexes):
+                result[query] = index
+
+        if relative_queries:
+            indexes = self.get_closest_to_relative_positions([vertebral_levels[i] for i in relative_queries],
+                                                             relative_positions[relative_queries])
+            for query, index in zip(relative_queries, indexes):
+                result[query] = index
         return result
 
     def get_coordinate_interpolated(self, vertebral_level, relative_position, backup_index=None, backup_centerline=None, mode='levels'):
-        index_closest = self.get_closest_to_absolute_position(vertebral_level, relative_position, backup_index=backup_index, backup_centerline=backup_centerline, mode=mode)
-        if index_closest is None:
-            return [np.nan, np.nan, np.nan]
+        return self.get_coordinates_interpolated([vertebral_level], [relative_position],
+                                                 backup_indexes=None if backup_index is None else [backup_index],
+                                                 backup_centerline=backup_centerline, mode=mode)[0].tolist()
 
+    def get_coordinates_interpolated(self, vertebral_levels, relative_positions, backup_indexes=None,
+                                     backup_centerline=None, mode='levels'):
+        """
+        Batched version of get_coordinate_interpolated().
+        :return: numpy array (n, 3) of coordinates, NaN where the level is not on the centerline
+        """
+        relative_positions = np.asarray(relative_positions, dtype=np.float64)
+        indexes_closest = self.get_closest_to_absolute_positions(vertebral_levels, relative_positions,
+                                                                 backup_indexes=backup_indexes,
+                                                                 backup_centerline=backup_centerline, mode=mode)
+        coordinates = np.full((len(relative_positions), 3), np.nan)
+        found = np.array([index is not None for index in indexes_closest], dtype=bool)
+        if not found.any():
+            return coordinates
+
+        index_closest = np.array([index for index in indexes_closest if index is not None], dtype=int)
+        relative_position = relative_positions[found]
         relative_position_closest = self.dist_points_rel[index_closest]
-        coordinate_closest = self.get_point_from_index(index_closest)
-
-        if relative_position < relative_position_closest:
-            index_next = index_closest + 1
-        else:
-            index_next = index_closest - 1
+        index_next = np.where(relative_position < relative_position_closest, index_closest + 1, index_closest - 1)
         relative_position_next = self.dist_points_rel[index_next]
-        coordinate_next = self.get_point_from_index(index_next)
-
-        weight_closest = abs(relative_position - relative_position_closest) / abs(relative_position_next - relative_position_closest)
-        weight_next = abs(relative_position - relative_position_next) / abs(relative_position_next - relative_position_closest)
-        coordinate_result = [weight_closest * coordinate_closest[0] + weight_next * coordinate_next[0],
-                             weight_closest * coordinate_closest[1] + weight_next * coordinate_next[1],
-                             weight_closest * coordinate_closest[2] + weight_next * coordinate_next[2]]
 
-        return coordinate_result
+        weight_closest = np.abs(relative_position - relative_position_closest) / np.abs(relative_position_next - relative_position_closest)
+        weight_next = np.abs(relative_position - relative_position_next) / np.abs(relative_position_next - relative_position_closest)
+        coordinates[found] = (weight_closest[:, np.newaxis] * self.points[index_closest] +
+                              weight_next[:, np.newaxis] * self.points[index_next])
+        return coordinates
 
     def extract_perpendicular_square(self, image, index, size=20, resolution=0.5, interpolation_mode=0, border='constant', cval=0.0):
         # TODO: use native resolution instead of forcing to 0.5. In case native is much higher res, we loose precision!!!
@@ -6,6 +6,10 @@
 import io
 import os
 import re
+import sys
+import types
+import textwrap
+import importlib
 import tempfile
 import datetime
 import logging
@@ -85,7 +89,7 @@ class SmartFormatter(argparse.HelpFormatter):
         # print("splot",text)
         if text.startswith('R|'):
             paragraphs = text[2:].splitlines()
-            rebroken = [argparse._textwrap.wrap(tpar, width) for tpar in paragraphs]
+            rebroken = [textwrap.wrap(tpar, width) for tpar in paragraphs]
             rebrokenstr = []
             for tlinearr in rebroken:
                 if (len(tlinearr) == 0):
@@ -93,7 +97,7 @@ class SmartFormatter(argparse.HelpFormatter):
                 else:
                     for tlinepiece in tlinearr:
                         rebrokenstr.append(tlinepiece)
-            return '\n'.join(rebrokenstr)  # (argparse._textwrap.wrap(text[2:], width))
+            return '\n'.join(rebrokenstr)  # (textwrap.wrap(text[2:], width))
         return argparse.RawDescriptionHelpFormatter._fill_text(self, text, width, indent)
 
     # this is the RawTextHelpFormatter._split_lines
@@ -106,10 +110,10 @@ class SmartFormatter(argparse.HelpFormatter):
                 li = lines[i]
                 o = offsets[i]
                 ol = len(o)
-                init_wrap = argparse._textwrap.fill(li, width).splitlines()
+                init_wrap = textwrap.fill(li, width).splitlines()
                 first = init_wrap[0]
                 rest = "\n".join(init_wrap[1:])
-                rest_wrap = argparse._textwrap.fill(rest, width - ol).splitlines()
+                rest_wrap = textwrap.fill(rest, width - ol).splitlines()
                 offset_lines = [o + wl for wl in rest_wrap]
                 wrapped = wrapped + [first] + offset_lines
             return wrapped
@@ -156,6 +160,33 @@ def check_exe(name):
     return None
 
 
+class LazyModule(types.ModuleType):
+    """
+    Placeholder for a module, which is imported on the first access to one of its attributes. Then, the attributes of
+    the module are copied into the placeholder, so that the following accesses are as fast as with the module.
+    See lazy_import().
+    """
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    """
+    Import a module on first use, e.g. a heavy dependency (matplotlib, skimage, scipy subpackages...) which is not
+    needed to parse the arguments or to display the help of a command. Usage, at the top of a module:
+        morphology = lazy_import('skimage.morphology')
+    and then morphology.dilation(...) as usual. Names cannot be imported from a lazy module ("from ... import ..."
+    imports the module).
+    :param name: str: absolute name of the module
+    :return: the module if it is already imported, otherwise a LazyModule
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+
 def parse_num_list(str_num):
     """
     Parse numbers in string based on delimiter: , or :
@@ -7,8 +7,6 @@
 
 import os
 import numpy as np
-import scipy.ndimage.measurements
-from scipy.ndimage.filters import gaussian_filter
 
 import sct_utils as sct
 from sct_maths import mutual_information
@@ -16,6 +14,9 @@ from sct_maths import mutual_information
 from spinalcordtoolbox.image import Image
 from spinalcordtoolbox.metadata import get_file_label
 from spinalcordtoolbox.math import dilate
+from spinalcordtoolbox.utils import lazy_import
+
+ndimage = lazy_import('scipy.ndimage')
 
 
 def label_vert(fname_seg, fname_label, verbose=1):
@@ -78,7 +79,7 @@ def vertebral_detection(fname, fname_seg, contrast, param, init_disc, verbose=1,
     data = im_input.data
 
     # smooth data
-    data = gaussian_filter(data, param.smooth_factor, output=None, mode="reflect")
+    data = ndimage.gaussian_filter(data, param.smooth_factor, output=None, mode="reflect")
 
     # get dimension of src
     nx, ny, nz = data.shape
@@ -252,7 +253,7 @@ def center_of_mass(x):
     """
     if (x == 0).all():
         raise ValueError("Array has no mass")
-    return scipy.ndimage.measurements.center_of_mass(x)
+    return ndimage.center_of_mass(x)
 
 
 def create_label_z(fname_seg, z, value, fname_labelz='labelz.nii.gz'):
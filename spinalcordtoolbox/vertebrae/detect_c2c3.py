@@ -22,18 +22,31 @@ import os
 import sys
 import logging
 import sct_utils as sct
-from sct_flatten_sagittal import flatten_sagittal
 import numpy as np
 import nibabel as nib
-from scipy.ndimage.measurements import center_of_mass
-from skimage.measure import label as label_regions
 
 import spinalcordtoolbox.image as msct_image
+from spinalcordtoolbox.flattening import flatten_sagittal
 from spinalcordtoolbox.image import Image, zeros_like
+from spinalcordtoolbox.utils import lazy_import
+
+ndimage = lazy_import('scipy.ndimage')
 
 logger = logging.getLogger(__name__)
 
 
+def _scale_intensity(nii):
+    """
+    Return a float32 copy of the image, with intensities scaled as: 2 * data / (max - min) - 1
+    :param nii: Image
+    :return: Image
+    """
+    nii_scaled = msct_image.change_type(nii, np.float32)
+    min_data, max_data = np.min(nii_scaled.data), np.max(nii_scaled.data)
+    nii_scaled.data = 2 * nii_scaled.data / (max_data - min_data) - 1
+    return nii_scaled
+
+
 def detect_c2c3(nii_im, nii_seg, contrast, nb_sag_avg=7.0, verbose=1):
     """
     Detect the posterior edge of C2-C3 disc.
@@ -53,9 +66,9 @@ def detect_c2c3(nii_im, nii_seg, contrast, nb_sag_avg=7.0, verbose=1):
     orientation_init = nii_im.orientation
     z_seg_max = np.max(np.where(nii_seg.change_orientation('PIR').data)[1])
 
-    # Flatten sagittal
-    nii_im = flatten_sagittal(nii_im, nii_seg,verbose=verbose)
-    nii_seg_flat = flatten_sagittal(nii_seg, nii_seg, verbose=verbose)
+    # Flatten sagittal. Data are scaled between -1 and 1 beforehand, as expected by the detector. See #1790, #2069
+    nii_im = flatten_sagittal(_scale_intensity(nii_im), nii_seg, verbose=verbose)
+    nii_seg_flat = flatten_sagittal(_scale_intensity(nii_seg), nii_seg, verbose=verbose)
 
     # create temporary folder with intermediate results
     logger.info("Creating temporary folder...")
@@ -122,7 +135,7 @@ def detect_c2c3(nii_im, nii_seg, contrast, nb_sag_avg=7.0, verbose=1):
         coord_max = np.where(pred == np.max(pred))
         pa_c2c3, is_c2c3 = coord_max[0][0], coord_max[1][0]
         nii_seg.change_orientation('PIR')
-        rl_c2c3 = int(np.rint(center_of_mass(np.array(nii_seg.data[:, is_c2c3, :]))[1]))
+        rl_c2c3 = int(np.rint(ndimage.center_of_mass(np.array(nii_seg.data[:, is_c2c3, :]))[1]))
         nii_c2c3.data[pa_c2c3, is_c2c3, rl_c2c3] = 3
     else:
         logger.warning('C2-C3 not detected...')
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# Apply chains of ANTs transformations (affine matrices and displacement fields) in-process. The chain is composed once
+# into the source voxel coordinates of each destination voxel, which can then be used to resample any number of volumes.
+
+
+from __future__ import division, absolute_import
+
+import os
+import logging
+import concurrent.futures
+
+import numpy as np
+
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.resampling import ResamplingPlan
+from spinalcordtoolbox.utils import lazy_import
+
+
+logger = logging.getLogger(__name__)
+
+ndimage = lazy_import('scipy.ndimage')
+scipy_io = lazy_import('scipy.io')
+
+# ITK uses LPS physical coordinates, NIfTI affines use RAS
+RAS2LPS = np.diag([-1., -1., 1., 1.])
+
+# interpolation order of map_coordinates, for each sct_apply_transfo method
+INTERPOLATION_ORDER = {'nn': 0, 'linear': 1, 'spline': 3}
+
+# number of destination voxels interpolated at a time by the linear kernel
+KERNEL_CHUNK_SIZE = 2 ** 18
+
+
+def is_affine_file(fname):
+    """:return: True if the file is an ANTs affine transformation (text or matlab format)"""
+    return fname.endswith(('.txt', '.mat'))
+
+
+def read_affine(fname):
+    """
+    Read an affine transformation written by ITK/ANTs, as a text file ("#Insight Transform File") or a matlab file.
+    ITK transformations map points of the fixed (destination) space onto the moving (source) space:
+    p_src = A (p_dest - c) + t + c, with c the center of rotation.
+    :param fname: str: path of the .txt or .mat file
+    :return: 4x4 numpy array, acting on LPS physical coordinates
+    """
+    if fname.endswith('.mat'):
+        mat = scipy_io.loadmat(fname)
+        key = [k for k in mat if not k.startswith('__') and k != 'fixed'][0]
+        parameters = np.ravel(mat[key]).astype(np.float64)
+        fixed = np.ravel(mat['fixed']).astype(np.float64)
+    else:
+        fields = {}
+        with open(fname) as f:
+            for line in f:
+                if ':' in line and not line.startswith('#'):
+                    key, value = line.split(':', 1)
+                    fields[key.strip()] = value
+        parameters = np.array(fields['Parameters'].split(), dtype=np.float64)
+        fixed = np.array(fields.get('FixedParameters', '').split(), dtype=np.float64)
+    ndim = int(round((np.sqrt(4 * len(parameters) + 1) - 1) / 2))
+    if ndim * (ndim + 1) != len(parameters):
+        raise ValueError("Unsupported transformation in {}: {} parameters".format(fname, len(parameters)))
+    matrix = parameters[:ndim ** 2].reshape(ndim, ndim)
+    translation = parameters[ndim ** 2:]
+    center = fixed if len(fixed) == ndim else np.zeros(ndim)
+    # 2D transformations act on the first two axes
+    affine = np.eye(4)
+    affine[:ndim, :ndim] = matrix
+    affine[:ndim, 3] = translation + center - matrix.dot(center)
+    return affine
+
+
+def read_displacement_field(fname):
+    """
+    Read a displacement field written by ANTs: 5D NIfTI with vector intent, whose vectors are physical displacements
+    in LPS coordinates.
+    :param fname: str: path of the NIfTI file
+    :return: 4D numpy array (x, y, z, 3) of float64, 4x4 affine (voxel to LPS) of the field
+    """
+    im_warp = Image(fname)
+    if im_warp.header.get_intent()[0] != 'vector':
+        raise ValueError("Displacement field in {} is invalid: should be encoded in a 5D file with vector intent code"
+                         " (see https://nifti.nimh.nih.gov/pub/dist/src/niftilib/nifti1.h".format(fname))
+    data = np.asarray(im_warp.data, dtype=np.float64)
+    data = data.reshape(data.shape[:3] + (data.shape[-1],))
+    # 2D fields only displace along x and y
+    if data.shape[-1] == 2:
+        data = np.concatenate([data, np.zeros(data.shape[:3] + (1,))], axis=-1)
+    return data, RAS2LPS.dot(im_warp.hdr.get_best_affine())
+
+
+def apply_displacement_field(points, field, affine):
+    """
+    Displace points with a displacement field, interpolated linearly. As in ITK, points outside of the field (by more
+    than half a voxel) are not displaced.
+    :param points: numpy array (3, n) of LPS coordinates
+    :param field: 4D numpy array (x, y, z, 3), see read_displacement_field()
+    :param affine: 4x4 affine (voxel to LPS) of the field
+    :return: numpy array (3, n) of displaced LPS coordinates
+    """
+    inv_affine = np.linalg.inv(affine)
+    index = inv_affine[:3, :3].dot(points) + inv_affine[:3, 3:]
+    shape = np.array(field.shape[:3])[:, np.newaxis]
+    is_inside = np.all((index >= -0.5) & (index <= shape - 0.5), axis=0)
+    displacement = np.zeros_like(points)
+    for axis in range(3):
+        displacement[axis, is_inside] = ndimage.map_coordinates(field[..., axis], index[:, is_inside], order=1,
+                                                                mode='nearest')
+    return points + displacement
+
+
+class WarpPlan(ResamplingPlan):
+    """
+    Mapping from a destination grid to a source grid through a chain of transformations. The chain is composed once
+    into the source voxel coordinates of each destination voxel; apply() then only costs the interpolation, for each
+    volume.
+
+    Example:
+      plan = WarpPlan.from_files(['warp_src2dest.nii.gz'], Image('src.nii'), Image('dest.nii'))
+      data_reg = plan.apply(Image('src.nii').data, order=1, mode='constant', n_jobs=4)
+    """
+    def __init__(self, transforms, affine, shape, affine_r, shape_r):
+        """
+        :param transforms: list of transformations, in the order they are applied to the points of the destination
+            grid. Each one is either a 4x4 affine, or a tuple (field, affine of the field), see
+            read_displacement_field(). All act on LPS coordinates.
+        :param affine: 4x4 affine of the source grid
+        :param shape: tuple: 3d shape of the source grid
+        :param affine_r: 4x4 affine of the destination grid
+        :param shape_r: tuple: 3d shape of the destination grid
+        """
+        self.shape = tuple(shape)
+        self.shape_r = tuple(shape_r)
+        self.affine_r = np.array(affine_r, dtype=np.float64)
+        # go through LPS coordinates; consecutive affines are merged so that points are only transformed once
+        affine_lps = RAS2LPS.dot(affine_r)
+        points = None
+        for transform in transforms:
+            if isinstance(transform, tuple):
+                field, affine_field = transform
+                if points is None:
+                    ijk = np.indices(self.shape_r, dtype=np.float64).reshape(3, -1)
+                    points = affine_lps[:3, :3].dot(ijk) + affine_lps[:3, 3:]
+                    # fields are usually defined on the destination grid: no need to interpolate them
+                    if field.shape[:3] == self.shape_r and np.allclose(affine_field, affine_lps, rtol=0, atol=1e-6):
+                        points += field.reshape(-1, 3).T
+                        affine_lps = np.eye(4)
+                        continue
+                else:
+                    points = affine_lps[:3, :3].dot(points) + affine_lps[:3, 3:]
+                points = apply_displacement_field(points, field, affine_field)
+                affine_lps = np.eye(4)
+            else:
+                affine_lps = transform.dot(affine_lps)
+        vox2vox = np.linalg.inv(RAS2LPS.dot(affine)).dot(affine_lps)
+        if points is None:
+            points = np.indices(self.shape_r, dtype=np.float64).reshape(3, -1)
+        self.coords = (vox2vox[:3, :3].dot(points) + vox2vox[:3, 3:]).reshape((3,) + self.shape_r)
+        self.coords.flags.writeable = False
+        # as in ITK, destination voxels that fall more than half a voxel outside of the source grid are background
+        shape = np.array(self.shape).reshape((3,) + (1,) * len(self.shape_r))
+        self.is_outside = np.any((self.coords < -0.5) | (self.coords > shape - 0.5), axis=0)
+        self._kernels = {}
+
+    def _get_kernel(self, order):
+        """
+        Flat (Fortran order) source index of each destination voxel and, for linear interpolation, the fractional part
+        of its coordinates. Coordinates are clipped to the source grid, which amounts to extending the source with its
+        nearest values.
+        :param order: int: 0 (nearest neighbour) or 1 (linear)
+        :return: index, list of weights (one per axis, for order=1)
+        """
+        if order not in self._kernels:
+            coords = self.coords.reshape(3, -1, order='F')
+            index = np.zeros(coords.shape[1], dtype=np.intp)
+            weights = []
+            for axis, n in enumerate(self.shape):
+                coord = np.clip(coords[axis], 0, n - 1)
+                if order == 0:
+                    index_axis = np.floor(coord + 0.5)
+                else:
+                    index_axis = np.minimum(np.floor(coord), max(n - 2, 0))
+                    weights.append((coord - index_axis).astype(np.float32))
+                index += index_axis.astype(np.intp) * int(np.prod(self.shape[:axis]))
+            self._kernels[order] = index, weights
+        return self._kernels[order]
+
+    def _interpolate_volume(self, volume, order, out):
+        """
+        Interpolate a 3d volume on the destination grid, by chunks of destination voxels.
+        :param volume: 3d numpy array defined on the source grid
+        :param order: int: 0 (nearest neighbour) or 1 (linear)
+        :param out: 1d numpy array: destination voxels, in Fortran order
+        """
+        values = np.ravel(volume, order='F')
+        index, weights = self._get_kernel(order)
+        if order == 0:
+            np.take(values, index, out=out)
+            return
+        values = values.astype(np.promote_types(values.dtype, np.float32), copy=False)
+        # offset of the next voxel along each axis (no neighbour along axes of size 1, whose weights are 0)
+        ox, oy, oz = [int(np.prod(self.shape[:axis])) if n > 1 else 0 for axis, n in enumerate(self.shape)]
+
+        def lerp(a, b, weight):
+            return a + weight * (b - a)
+
+        for start in range(0, len(index), KERNEL_CHUNK_SIZE):
+            chunk = slice(start, start + KERNEL_CHUNK_SIZE)
+            i = index[chunk]
+            wx, wy, wz = [weight[chunk] for weight in weights]
+            c00 = lerp(values[i], values[i + ox], wx)
+            c10 = lerp(values[i + oy], values[i + oy + ox], wx)
+            c01 = lerp(values[i + oz], values[i + oz + ox], wx)
+            c11 = lerp(values[i + oz + oy], values[i + oz + oy + ox], wx)
+            out[chunk] = lerp(lerp(c00, c10, wy), lerp(c01, c11, wy), wz)
+
+    def apply(self, data, order=1, mode='constant', n_jobs=1):
+        """
+        Resample data onto the destination grid. Nearest neighbour and linear interpolation use precomputed indexes
+        and weights, so that each volume only costs a few gathers; spline interpolation uses map_coordinates.
+
+        :param data: 3d or 4d numpy array defined on the source grid
+        :param order: int: order of the spline interpolation (0: nn, 1: linear, 3: cubic spline)
+        :param mode: 'constant': as ANTs, voxels outside of the source grid are 0, and voxels on its edges are
+            interpolated from the nearest values. 'nearest': outside values are filled with the nearest value.
+        :param n_jobs: int: Number of threads across which the volumes of a 4d array are distributed.
+        :return: numpy array. The dtype is kept if it is a float or if order=0, otherwise the data are converted to
+            float32.
+        """
+        if data.shape[:3] != self.shape:
+            raise ValueError("Data shape {} does not match the source grid {}".format(data.shape, self.shape))
+        if order > 1:
+            data_r = super(WarpPlan, self).apply(data, order=order, mode='nearest', n_jobs=n_jobs)
+        else:
+            dtype = data.dtype if (order == 0 or np.issubdtype(data.dtype, np.floating)) else np.float32
+            data_r = np.empty(self.shape_r + data.shape[3:], dtype=dtype, order='F')
+            volumes = data.reshape(self.shape + (-1,), order='A')
+            data_r_volumes = data_r.reshape((-1, volumes.shape[3]), order='F')
+            # build the kernel once, before the threads need it
+            self._get_kernel(order)
+
+            def resample_volume(it):
+                self._interpolate_volume(volumes[..., it], order, data_r_volumes[:, it])
+
+            if n_jobs > 1:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                    list(executor.map(resample_volume, range(volumes.shape[3])))
+            else:
+                for it in range(volumes.shape[3]):
+                    resample_volume(it)
+        if mode == 'constant':
+            data_r[self.is_outside] = 0
+        return data_r
+
+    def _resample_volume(self, volume, output, order, mode):
+        # the mapping is not affine: interpolate at the composed coordinates
+        return ndimage.map_coordinates(volume, self.coords, output=output, order=order, mode=mode, cval=0.0)
+
+    @classmethod
+    def from_files(cls, list_warp, im_src, im_dest, list_warpinv=()):
+        """
+        Create a plan from the transformations given to sct_apply_transfo.
+        :param list_warp: list of str: warping fields and affine matrices, from source to destination (i.e. the first
+            one was estimated from the source image)
+        :param im_src: Image: source image
+        :param im_dest: Image: destination image
+        :param list_warpinv: list of str: affine matrices of list_warp which should be inverted
+        :return: WarpPlan
+        """
+        transforms = []
+        # the points of the destination grid go through the chain backwards
+        for fname in reversed(list_warp):
+            if is_affine_file(fname):
+                affine = read_affine(fname)
+                transforms.append(np.linalg.inv(affine) if fname in list_warpinv else affine)
+            else:
+                transforms.append(read_displacement_field(fname))
+            logger.debug("Loaded transformation: %s", os.path.basename(fname))
+        return cls(transforms, im_src.hdr.get_best_affine(), im_src.data.shape[:3],
+                   im_dest.hdr.get_best_affine(), im_dest.data.shape[:3])
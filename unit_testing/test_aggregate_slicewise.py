@@ -300,3 +300,71 @@ def test_save_as_csv_extract_metric(dummy_data_and_labels):
         spamreader = csv.reader(csvfile, delimiter=',')
         next(spamreader)  # skip header
         assert next(spamreader)[1:-1] == [__version__, '', '0:4', '', 'label_0', '2.5', '38.0']
+
+
+@pytest.fixture(scope="session")
+def dummy_atlas():
+    """
+    Create a dummy atlas with the structure of the PAM50 atlas: 36 individual labels (30 WM tracts, 6 GM regions) with
+    partial volume between neighbouring labels, clustered as WM and GM for MAP estimation, and combined labels.
+    """
+    nx, ny, nz, n_labels = 20, 20, 6, 36
+    np.random.seed(0)
+    # each label is a smooth blob around a random center; at each voxel, labels sum to the probability to be in the cord
+    centers = np.random.uniform(2, 17, (n_labels, 2))
+    x, y = np.mgrid[:nx, :ny]
+    blobs = np.exp(-((x[..., np.newaxis] - centers[:, 0]) ** 2 + (y[..., np.newaxis] - centers[:, 1]) ** 2) / 4.)
+    cord = np.clip(1.2 - np.sqrt((x - 9.5) ** 2 + (y - 9.5) ** 2) / 8., 0, 1)
+    labels = blobs / blobs.sum(axis=-1, keepdims=True) * cord[..., np.newaxis]
+    labels = np.repeat(labels[:, :, np.newaxis, :], nz, axis=2)
+    # the last slice is outside the cord
+    labels[:, :, -1] = 0
+    # metric: a value per label, with noise, and a few nonfinite voxels
+    values = np.where(np.arange(n_labels) < 30, 40., 20.) + np.random.normal(0, 3, n_labels)
+    data = np.sum(labels * values, axis=-1) + np.random.normal(0, 1, (nx, ny, nz))
+    data[10, 10, 1] = np.nan
+    data[9, 10, 2] = np.inf
+    label_struc = {i: aggregate_slicewise.LabelStruc(id=i, name='label_{}'.format(i), map_cluster=int(i >= 30))
+                   for i in range(n_labels)}
+    label_struc[50] = aggregate_slicewise.LabelStruc(id=list(range(36)), name='spinal cord', map_cluster=0)
+    label_struc[51] = aggregate_slicewise.LabelStruc(id=list(range(30)), name='white matter', map_cluster=0)
+    label_struc[52] = aggregate_slicewise.LabelStruc(id=list(range(30, 36)), name='gray matter', map_cluster=1)
+    label_struc[53] = aggregate_slicewise.LabelStruc(id=[0, 1, 2, 3], name='dorsal columns', map_cluster=0)
+    return Metric(data=data), labels, label_struc
+
+
+# noinspection 801,PyShadowingNames
+@pytest.mark.parametrize('method', ['wa', 'bin', 'max', 'ml', 'map'])
+@pytest.mark.parametrize('perslice', [True, False])
+def test_extract_metric_multilabel(dummy_atlas, method, perslice):
+    """All labels at once give the same results as one label at a time"""
+    data, labels, label_struc = dummy_atlas
+    id_labels = list(range(36)) + [50, 51, 52, 53]
+    agg_metrics = aggregate_slicewise.extract_metric_multilabel(data, labels, label_struc, id_labels,
+                                                                perslice=perslice, method=method,
+                                                                indiv_labels_ids=list(range(36)))
+    assert len(agg_metrics) == len(id_labels)
+    for id_label, agg_metric in zip(id_labels, agg_metrics):
+        expected = aggregate_slicewise.extract_metric(data, labels=labels, label_struc=label_struc, id_label=id_label,
+                                                      perslice=perslice, method=method,
+                                                      indiv_labels_ids=list(range(36)))
+        assert list(agg_metric) == list(expected)
+        for slicegroup in expected:
+            assert agg_metric[slicegroup].keys() == expected[slicegroup].keys()
+            for key, value in expected[slicegroup].items():
+                if isinstance(value, float):
+                    assert agg_metric[slicegroup][key] == pytest.approx(value, rel=1e-6), (id_label, slicegroup, key)
+                else:
+                    assert agg_metric[slicegroup][key] == value, (id_label, slicegroup, key)
+
+
+# noinspection 801,PyShadowingNames
+def test_save_as_csv_multilabel(dummy_data_and_labels):
+    """Results of several labels are written in the same file"""
+    data, labels, label_struc = dummy_data_and_labels
+    agg_metrics = aggregate_slicewise.extract_metric_multilabel(data, labels, label_struc, [0, 99], perslice=False,
+                                                                method='wa')
+    aggregate_slicewise.save_as_csv(agg_metrics, 'tmp_file_out.csv')
+    with open('tmp_file_out.csv', 'r') as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=',')
+        assert [(row['Label'], float(row['WA()'])) for row in reader] == [('label_0', 38.0), ('label_1,2', 22.0)]
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.atlas
+
+from __future__ import absolute_import
+
+import pytest
+
+import numpy as np
+import nibabel as nib
+
+from spinalcordtoolbox.metadata import InfoLabel
+from spinalcordtoolbox.atlas import SparseAtlas
+from spinalcordtoolbox.warping import WarpPlan, RAS2LPS
+from spinalcordtoolbox.aggregate_slicewise import extract_metric_multilabel, Metric, LabelStruc
+
+
+@pytest.fixture(scope="module")
+def dummy_labels():
+    """Stack of 6 labels on a 12x15x9 grid, each non-zero in a few voxels"""
+    np.random.seed(0)
+    data = np.random.rand(12, 15, 9, 6)
+    data[data < 0.85] = 0
+    affine = np.diag([0.5, 0.5, 1., 1.])
+    affine[:3, 3] = [-3, 2, 10]
+    return data, affine
+
+
+@pytest.fixture()
+def dummy_atlas_folder(tmp_path, dummy_labels):
+    """Folder of labels, with info_label.txt, oriented LPI"""
+    data, affine = dummy_labels
+    indiv_labels = []
+    for i_label in range(data.shape[3]):
+        fname = 'atlas_{:02d}.nii.gz'.format(i_label)
+        nib.save(nib.Nifti1Image(data[..., i_label].astype(np.float32), affine), str(tmp_path / fname))
+        indiv_labels.append((i_label, 'label {}'.format(i_label), fname))
+    InfoLabel(indiv_labels=indiv_labels, combined_labels=[(50, 'all', list(range(6)))],
+              clusters_apriori=[('first', [0, 1, 2]), ('second', [3, 4, 5])]).save(str(tmp_path / 'info_label.txt'))
+    return str(tmp_path)
+
+
+def test_dense_roundtrip(dummy_labels):
+    data, affine = dummy_labels
+    atlas = SparseAtlas.from_dense(data, affine)
+    assert atlas.matrix.nnz == np.count_nonzero(data)
+    assert atlas.nbytes < data.nbytes / 2
+    assert np.array_equal(atlas.to_dense(), data)
+    assert np.array_equal(atlas.get_label(3), data[..., 3])
+
+
+def test_from_folder(tmp_path, dummy_labels, dummy_atlas_folder):
+    data, affine = dummy_labels
+    atlas = SparseAtlas.load(dummy_atlas_folder)
+    assert atlas.ids == list(range(6))
+    assert atlas.names[2] == 'label 2'
+    assert atlas.filenames[2] == 'atlas_02.nii.gz'
+    assert np.allclose(atlas.affine, affine)
+    assert np.allclose(atlas.to_dense(), data)
+    # reoriented labels
+    atlas_rpi = SparseAtlas.load(dummy_atlas_folder, orientation='RPI')
+    assert np.allclose(atlas_rpi.to_dense(), data[::-1])
+    # cache
+    fname_npz = str(tmp_path / 'atlas.npz')
+    atlas.save(fname_npz)
+    atlas_npz = SparseAtlas.load(fname_npz)
+    assert (atlas_npz.ids, atlas_npz.names, atlas_npz.filenames) == (atlas.ids, atlas.names, atlas.filenames)
+    assert np.array_equal(atlas_npz.affine, atlas.affine)
+    assert (atlas_npz.matrix != atlas.matrix).nnz == 0
+
+
+def test_weighted_sum(dummy_labels):
+    data, affine = dummy_labels
+    atlas = SparseAtlas.from_dense(data, affine)
+    metric = np.random.rand(*data.shape[:3])
+    weighted = data * metric[..., np.newaxis]
+    assert np.allclose(atlas.weighted_sum(metric), weighted.sum(axis=(0, 1, 2)))
+    assert np.allclose(atlas.weighted_sum(metric, per_slice=True), weighted.sum(axis=(0, 1)))
+    with pytest.raises(ValueError):
+        atlas.weighted_sum(metric[:-1])
+
+
+def test_get_support(dummy_labels):
+    data, affine = dummy_labels
+    atlas = SparseAtlas.from_dense(data, affine)
+    index, weights = atlas.get_support([2, 5])
+    rows = np.concatenate([data[:, :, iz].reshape(-1, data.shape[3]) for iz in [2, 5]])
+    assert np.array_equal(rows[index], weights)
+    assert not np.delete(rows, index, axis=0).any()
+    assert np.array_equal(atlas.get_slices([2, 5]).toarray(), rows)
+
+
+@pytest.mark.parametrize('order', [0, 1])
+def test_warp(dummy_labels, order):
+    """Warping the support only gives the same labels as warping the dense stack"""
+    data, affine = dummy_labels
+    atlas = SparseAtlas.from_dense(data, affine)
+    shape_r, affine_r = (14, 11, 10), np.eye(4)
+    field = np.random.uniform(-2, 2, shape_r + (3,))
+    translation = np.eye(4)
+    translation[:3, 3] = [1, -1, 0.5]
+    plan = WarpPlan([translation, (field, RAS2LPS.dot(affine_r))], affine, data.shape[:3], affine_r, shape_r)
+    atlas_r = atlas.warp(plan, order=order)
+    assert atlas_r.shape == shape_r
+    assert np.array_equal(atlas_r.affine, affine_r)
+    assert np.allclose(atlas_r.to_dense(), plan.apply(data, order=order), atol=1e-6)
+    with pytest.raises(ValueError):
+        atlas.warp(plan, order=3)
+
+
+@pytest.mark.parametrize('method', ['wa', 'bin', 'ml', 'map'])
+def test_extract_metric_sparse(dummy_labels, method):
+    """Metrics extracted with a sparse atlas are those extracted with the dense stack of labels"""
+    data, affine = dummy_labels
+    labels = data / np.maximum(data.sum(axis=-1, keepdims=True), 1)
+    metric = Metric(data=np.sum(labels * np.arange(10, 70, 10), axis=-1) + np.random.rand(*data.shape[:3]))
+    label_struc = {i: LabelStruc(id=i, name=str(i), map_cluster=int(i >= 3)) for i in range(6)}
+    label_struc[50] = LabelStruc(id=list(range(6)), name='all', map_cluster=0)
+    kwargs = dict(perslice=True, method=method, indiv_labels_ids=list(range(6)))
+    expected = extract_metric_multilabel(metric, labels, label_struc, [0, 3, 50], **kwargs)
+    agg_metrics = extract_metric_multilabel(metric, SparseAtlas.from_dense(labels, affine), label_struc, [0, 3, 50],
+                                            **kwargs)
+    for agg_metric, agg_metric_expected in zip(agg_metrics, expected):
+        for slicegroup in agg_metric_expected:
+            for key, value in agg_metric_expected[slicegroup].items():
+                if isinstance(value, float):
+                    assert agg_metric[slicegroup][key] == pytest.approx(value)
+                else:
+                    assert agg_metric[slicegroup][key] == value
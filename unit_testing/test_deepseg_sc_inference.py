@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.deepseg_sc.inference, with models that do not need keras
+
+from __future__ import absolute_import
+
+import numpy as np
+import pytest
+
+from spinalcordtoolbox.deepseg_sc import inference
+
+
+class DummyModel(object):
+    """Keras-like model: the prediction is a pointwise function of the input. Records the batch sizes."""
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, batch, batch_size=None):
+        self.batch_sizes.append(len(batch))
+        return 1 / (1 + np.exp(-batch))
+
+
+@pytest.mark.parametrize('memory_budget', [1, 10 ** 6, inference.MEMORY_BUDGET])
+def test_predict_slices(memory_budget):
+    data = np.random.RandomState(0).rand(16, 16, 30).astype(np.float32)
+    data[..., [3, 4, 20]] = 0
+    model = DummyModel()
+    data_pred = inference.predict_slices(model, data, memory_budget=memory_budget)
+    expected = 1 / (1 + np.exp(-data))
+    expected[..., [3, 4, 20]] = 0
+    assert data_pred.dtype == np.float32
+    np.testing.assert_allclose(data_pred, expected, rtol=1e-6)
+    # empty slices are not predicted
+    assert sum(model.batch_sizes) == 27
+    assert max(model.batch_sizes) == min(27, inference.get_batch_size((16, 16), memory_budget))
+
+
+@pytest.mark.parametrize('nz,overlap', [(100, 0), (100, 12), (48, 12), (30, 12), (49, 47)])
+def test_predict_patches_3d(nz, overlap):
+    data = np.random.RandomState(0).rand(8, 8, nz).astype(np.float32) + 1
+    model = DummyModel()
+    data_pred = inference.predict_patches_3d(model, data, patch_shape=(8, 8, 48), mean=1., std=2., overlap=overlap)
+    # blending a pointwise model is exact
+    np.testing.assert_allclose(data_pred, 1 / (1 + np.exp(-(data - 1.) / 2.)), rtol=1e-5)
+
+
+def test_predict_patches_3d_empty():
+    data = np.zeros((8, 8, 150), dtype=np.float32)
+    data[..., 100:110] = 1
+    model = DummyModel()
+    data_pred = inference.predict_patches_3d(model, data, patch_shape=(8, 8, 48), mean=0., std=1., overlap=0)
+    # only the tiles that contain signal are predicted: [96, 144) and [102, 150)
+    assert sum(model.batch_sizes) == 2
+    assert not data_pred[..., :96].any()
+    np.testing.assert_allclose(data_pred[..., 100:110], 1 / (1 + np.exp(-1.)), rtol=1e-6)
+
+
+def test_get_z_tiles():
+    assert inference.get_z_tiles(100, 48, 0) == [0, 48, 52]
+    assert inference.get_z_tiles(100, 48, 12) == [0, 36, 52]
+    assert inference.get_z_tiles(20, 48, 12) == [0]
+    weights = inference.get_blending_weights(48, 12)
+    assert weights.min() > 0 and weights[12:36].min() == 1
+
+
+def test_place_slices():
+    rs = np.random.RandomState(0)
+    shape, crop_size = (30, 25, 12), 8
+    data_crop = rs.rand(crop_size, crop_size, shape[2])
+    x_starts = [str(x) for x in rs.randint(0, shape[0] - 3, 10)]
+    y_starts = list(rs.randint(0, shape[1] - 3, 10))
+    z_indexes = list(range(1, 11))
+    data_out = inference.place_slices(shape, data_crop, x_starts, y_starts, z_indexes)
+    expected = np.zeros(shape, dtype=np.float32)
+    for x, y, z in zip(x_starts, y_starts, z_indexes):
+        x, y = int(x), int(y)
+        x_end, y_end = min(x + crop_size, shape[0]), min(y + crop_size, shape[1])
+        expected[x:x_end, y:y_end, z] = data_crop[:x_end - x, :y_end - y, z]
+    np.testing.assert_array_equal(data_out, expected)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for sct_dmri_separate_b0_and_dwi
+
+from __future__ import absolute_import
+
+import sys, os
+import pytest
+
+import numpy as np
+
+from spinalcordtoolbox.utils import __sct_dir__
+sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+import sct_dmri_separate_b0_and_dwi
+
+
+@pytest.mark.parametrize('index', [[0], [1, 3, 4], [4, 0]])
+def test_mean_volumes(index):
+    data = np.random.RandomState(0).rand(4, 5, 3, 6).astype(np.float32)
+    np.testing.assert_allclose(sct_dmri_separate_b0_and_dwi.mean_volumes(data, index), data[..., index].mean(-1),
+                               rtol=1e-6)
+    np.testing.assert_array_equal(sct_dmri_separate_b0_and_dwi.select_volumes(data, index), data[..., index])
+
+
+def test_mean_volumes_3d():
+    data = np.arange(24.).reshape(2, 3, 4)
+    np.testing.assert_array_equal(sct_dmri_separate_b0_and_dwi.mean_volumes(data, [0]), data)
+
+
+def test_mean_volumes_empty():
+    """No volume to average, e.g. no DWI: the program exits instead of writing a NaN volume"""
+    with pytest.raises(SystemExit):
+        sct_dmri_separate_b0_and_dwi.mean_volumes(np.ones((2, 3, 4, 5)), [])
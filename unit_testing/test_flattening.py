@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.flattening
+
+from __future__ import absolute_import
+
+import numpy as np
+import nibabel as nib
+import pytest
+from skimage import transform
+
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.flattening import shift_slices, flatten_sagittal
+
+
+def dummy_curved_cord(nt=None):
+    """Sagittal-like volume in RPI orientation, with a cord that oscillates along x, and its segmentation"""
+    nx, ny, nz = 40, 30, 60
+    xx = np.arange(nx)[:, np.newaxis, np.newaxis]
+    zz = np.arange(nz)[np.newaxis, np.newaxis, :]
+    x_cord = 20 + 6 * np.sin(zz / 10.)
+    data = np.exp(-(xx - x_cord) ** 2 / 50.) * np.ones((1, ny, 1)) * 100
+    seg = ((np.abs(xx - np.round(x_cord)) <= 2) * np.ones((1, ny, 1)))
+    seg[:, :10] = seg[:, 20:] = 0
+    if nt is not None:
+        data = np.stack([data * (t + 1) for t in range(nt)], axis=-1)
+    affine = np.diag([-1., -1., 1., 1.])  # RPI
+    im = Image(data, hdr=nib.Nifti1Image(data, affine).header)
+    im_seg = Image(seg.astype(np.uint8), hdr=nib.Nifti1Image(seg.astype(np.uint8), affine).header)
+    return im, im_seg
+
+
+@pytest.mark.parametrize('offset', [0, 2, -3.25, 0.5])
+def test_shift_slices_matches_skimage(offset):
+    img = np.random.RandomState(0).rand(20, 15)
+    data_shifted = shift_slices(img[:, :, np.newaxis], [offset])
+    img_reg = transform.warp(img, transform.SimilarityTransform(translation=(0, offset)), preserve_range=True)
+    np.testing.assert_allclose(data_shifted[:, :, 0], img_reg, atol=1e-12)
+
+
+def test_shift_slices_dtype():
+    data = np.arange(24, dtype=np.int16).reshape(4, 2, 3)
+    assert shift_slices(data, [0, 1, 0.5]).dtype == np.float32
+    assert shift_slices(data.astype(np.float64), [0, 1, 0.5]).dtype == np.float64
+
+
+def test_flatten_sagittal_centers_cord():
+    im, im_seg = dummy_curved_cord()
+    data_flat = flatten_sagittal(im, im_seg, verbose=0).data
+    # the cord is now in the medial plane of every slice within the segmentation
+    x_max = np.argmax(data_flat[:, 15, :], axis=0)
+    assert np.all(np.abs(x_max - im.dim[0] // 2) <= 1)
+
+
+def test_flatten_unflatten():
+    im, im_seg = dummy_curved_cord()
+    data = im.data.copy()
+    im_flat = flatten_sagittal(im, im_seg, verbose=0)
+    im_unflat = flatten_sagittal(im_flat, im_seg, verbose=0, unflatten=True)
+    # linear interpolation is applied twice, so the cord is only slightly smoothed
+    np.testing.assert_allclose(im_unflat.data[5:-5], data[5:-5], atol=5)
+
+
+def test_flatten_sagittal_4d():
+    im, im_seg = dummy_curved_cord(nt=3)
+    im_3d, _ = dummy_curved_cord()
+    data_flat = flatten_sagittal(im, im_seg, verbose=0).data
+    data_flat_3d = flatten_sagittal(im_3d, im_seg, verbose=0).data
+    assert data_flat.shape == im.data.shape
+    for t in range(3):
+        np.testing.assert_allclose(data_flat[..., t], data_flat_3d * (t + 1))
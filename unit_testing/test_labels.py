@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.labels
+
+from __future__ import absolute_import
+
+import os
+import sys
+
+import numpy as np
+import nibabel as nib
+import pytest
+
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.labels import LabelSet
+from spinalcordtoolbox.types import Coordinate
+from spinalcordtoolbox.utils import __sct_dir__
+
+sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+
+from sct_label_utils import ProcessLabels
+
+
+@pytest.fixture()
+def image_labels():
+    data = np.zeros((10, 11, 12), dtype=np.int16)
+    data[5, 5, 10], data[4, 6, 8], data[5, 5, 4], data[6, 6, 4], data[2, 2, 2] = 1, 2, 3, 3, 4
+    affine = np.diag([0.5, 0.5, 2, 1])
+    affine[:3, 3] = [-10, -20, 5]
+    return Image(data, hdr=nib.Nifti1Image(data, affine).header), affine
+
+
+def test_from_image(image_labels):
+    image, _ = image_labels
+    labels = LabelSet.from_image(image)
+    assert len(labels) == 5
+    assert labels.value.dtype == np.int16
+    assert [(c.x, c.y, c.z, c.value) for c in labels.to_coordinates()] == \
+        [(c.x, c.y, c.z, c.value) for c in image.getNonZeroCoordinates()]
+
+
+def test_from_array_2d():
+    data = np.zeros((4, 5))
+    data[1, 3] = 7
+    labels = LabelSet.from_array(data)
+    assert list(labels) == [(1, 3, 0, 7)]
+    out = np.zeros_like(data)
+    labels.write(out)
+    assert np.array_equal(out, data)
+
+
+def test_sort(image_labels):
+    labels = LabelSet.from_image(image_labels[0])
+    coordinates = labels.to_coordinates()
+    for by in ['x', 'z', 'value']:
+        for reverse in [False, True]:
+            expected = sorted(coordinates, key=lambda c: getattr(c, by), reverse=reverse)
+            assert [str(c) for c in labels.sort(by=by, reverse=reverse).to_coordinates()] == [str(c) for c in expected]
+
+
+def test_set_operations(image_labels):
+    labels = LabelSet.from_image(image_labels[0])
+    other = LabelSet.from_coordinates([Coordinate([0, 0, 0, 3]), Coordinate([0, 0, 0, 4]), Coordinate([1, 1, 1, 9])])
+    # labels are in the order of np.nonzero()
+    assert labels.value.tolist() == [4, 2, 3, 1, 3]
+    assert labels.intersection(other).value.tolist() == [4, 3, 3]
+    assert labels.difference(other).value.tolist() == [2, 1]
+    assert labels.remove_values([1, 3]).value.tolist() == [4, 2]
+    distances, indexes = other.nearest(labels)
+    assert indexes.tolist() == [0, 0, 0]
+    np.testing.assert_allclose(distances, [np.sqrt(12), np.sqrt(12), np.sqrt(3)])
+
+
+def test_centroids(image_labels):
+    values, centroids = LabelSet.from_image(image_labels[0]).centroids()
+    assert values.tolist() == [1, 2, 3, 4]
+    assert centroids.tolist() == [[5, 5, 10], [4, 6, 8], [5.5, 5.5, 4], [2, 2, 2]]
+
+
+def test_physical_coordinates(image_labels):
+    image, affine = image_labels
+    labels = LabelSet.from_image(image)
+    np.testing.assert_allclose(labels.physical_coordinates(image), image.transfo_pix2phys(labels.coordinates))
+
+
+def process_labels(tmp_path, image, data_ref=None, **kwargs):
+    """ProcessLabels on an image of labels (and a reference image defined on the same grid)"""
+    fname_label = str(tmp_path / 'labels.nii.gz')
+    image.save(fname_label)
+    fname_ref = None
+    if data_ref is not None:
+        fname_ref = str(tmp_path / 'ref.nii.gz')
+        Image(data_ref, hdr=image.hdr).save(fname_ref)
+    return ProcessLabels(fname_label, fname_ref=fname_ref, verbose=0, **kwargs)
+
+
+def get_labels(image):
+    """:return: dict {(x, y, z): value} of the non-zero voxels"""
+    return {tuple(int(i) for i in index): image.data[index] for index in zip(*np.nonzero(image.data))}
+
+
+def test_cubic_to_point(tmp_path, image_labels):
+    image = process_labels(tmp_path, image_labels[0]).cubic_to_point()
+    # the two voxels of label 3 are merged at their (rounded) center of mass
+    assert get_labels(image) == {(5, 5, 10): 1, (4, 6, 8): 2, (6, 6, 4): 3, (2, 2, 2): 4}
+
+
+def test_label_vertebrae(tmp_path, image_labels):
+    image = process_labels(tmp_path, image_labels[0]).label_vertebrae([1, 3])
+    assert get_labels(image) == {(5, 5, 10): 1, (6, 6, 4): 3}
+
+
+def test_increment_z_inverse(tmp_path, image_labels):
+    image = process_labels(tmp_path, image_labels[0]).increment_z_inverse()
+    assert get_labels(image) == {(5, 5, 10): 1, (4, 6, 8): 2, (5, 5, 4): 3, (6, 6, 4): 4, (2, 2, 2): 5}
+
+
+def test_labelize_from_disks(tmp_path, image_labels):
+    data = np.zeros((10, 11, 12), dtype=np.int16)
+    data[5, 5, :] = 1
+    disks = np.zeros_like(data)
+    disks[5, 5, 10], disks[5, 5, 6], disks[5, 5, 1] = 1, 2, 3
+    image = Image(data, hdr=image_labels[0].hdr)
+    image = process_labels(tmp_path, image, data_ref=disks).labelize_from_disks()
+    assert get_labels(image) == dict([((5, 5, z), 1) for z in range(7, 11)] + [((5, 5, z), 2) for z in range(2, 7)])
+
+
+def test_remove_label(tmp_path, image_labels):
+    reference = np.zeros((10, 11, 12), dtype=np.int16)
+    reference[0, 0, 0], reference[1, 1, 1], reference[2, 2, 2] = 3, 4, 9
+    image = process_labels(tmp_path, image_labels[0], data_ref=reference).remove_label()
+    assert get_labels(image) == {(5, 5, 4): 3, (6, 6, 4): 3, (2, 2, 2): 4}
+    # with symmetry, the labels of the reference that are not in the input are removed too
+    fname_ref_out = str(tmp_path / 'ref_out.nii.gz')
+    process = process_labels(tmp_path, image_labels[0], data_ref=reference,
+                             fname_output=[str(tmp_path / 'out.nii.gz'), fname_ref_out])
+    process.remove_label(symmetry=True)
+    assert get_labels(Image(fname_ref_out)) == {(0, 0, 0): 3, (1, 1, 1): 4}
+
+
+def test_remove_or_keep_labels(tmp_path, image_labels):
+    process = process_labels(tmp_path, image_labels[0])
+    # only the last voxel of each value is processed
+    assert get_labels(process.remove_or_keep_labels([3, 4, 7], action='keep')) == {(6, 6, 4): 3, (2, 2, 2): 4}
+    assert get_labels(process.remove_or_keep_labels([1, 3], action='remove')) == \
+        {(4, 6, 8): 2, (5, 5, 4): 3, (2, 2, 2): 4}
+
+
+def test_plan_ref(tmp_path, image_labels):
+    data = np.zeros((10, 11, 12), dtype=np.int16)
+    data[1, 1, 3], data[2, 2, 3], data[4, 4, 8], data[3, 3, 5] = 2, 5, 7, -1
+    image = Image(data, hdr=image_labels[0].hdr)
+    image = process_labels(tmp_path, image, data_ref=np.zeros_like(data)).plan_ref()
+    expected = np.zeros(data.shape)
+    # each slice that has labels is filled with its last label
+    expected[:, :, 3], expected[:, :, 8], expected[:, :, 5] = 5, 7, -1
+    assert np.array_equal(image.data, expected)
+
+
+def test_display_voxel(tmp_path, image_labels):
+    process = process_labels(tmp_path, image_labels[0])
+    coordinates = process.display_voxel()
+    assert [(c.x, c.y, c.z, c.value) for c in coordinates] == \
+        [(5, 5, 10, 1), (4, 6, 8, 2), (5, 5, 4, 3), (6, 6, 4, 3), (2, 2, 2, 4)]
+    assert process.useful_notation == '5,5,10,1:4,6,8,2:5,5,4,3:6,6,4,3:2,2,2,4'
+    # physical coordinates, sorted by value
+    coordinates_phys = process.get_physical_coordinates()
+    np.testing.assert_allclose([[c.x, c.y, c.z] for c in coordinates_phys],
+                               image_labels[0].transfo_pix2phys([[c.x, c.y, c.z] for c in coordinates]))
+    assert [c.value for c in coordinates_phys] == [1, 2, 3, 3, 4]
@@ -5,6 +5,7 @@
 
 from __future__ import absolute_import
 import os
+import pytest
 import numpy as np
 import datetime
 
@@ -66,3 +67,97 @@ def test_erode():
     # Test with data as input
     data_dil_erode = sct.math.erode(im_dil.data, size=1, shape='ball')
     assert np.array_equal(np.where(data_dil_erode), (np.array([4]), np.array([4]), np.array([4])))
+
+
+# noinspection 801,PyShadowingNames
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_denoise_nlmeans(n_jobs):
+    from dipy.denoise.nlmeans import nlmeans
+    from dipy.denoise.noise_estimate import estimate_sigma
+    data = np.random.RandomState(0).rand(30, 25, 20) * 100
+    sigma = estimate_sigma(data)
+    # chunked denoising must match whole-volume denoising (no seam at the chunk boundaries)
+    data_ref = nlmeans(data, sigma, patch_radius=1, block_radius=2)
+    data_den = sct.math.denoise_nlmeans(data, patch_radius=1, block_radius=2, chunk_size=8, n_jobs=n_jobs)
+    assert data_den.shape == data.shape
+    assert np.allclose(data_den, data_ref)
+    # masked denoising: chunks outside of the mask are skipped and set to 0
+    mask = np.zeros(data.shape, dtype=bool)
+    mask[10:15, 10:15, 5:10] = True
+    data_ref = nlmeans(data, sigma, mask=mask, patch_radius=1, block_radius=2)
+    data_den = sct.math.denoise_nlmeans(data, patch_radius=1, block_radius=2, mask=mask, chunk_size=8, n_jobs=n_jobs)
+    assert np.allclose(data_den, data_ref)
+    assert not data_den[~mask].any()
+
+
+# noinspection 801,PyShadowingNames
+def test_denoise_nlmeans_4d():
+    from dipy.denoise.nlmeans import nlmeans
+    data = np.random.RandomState(0).rand(20, 20, 15, 3) * 100
+    data_ref = nlmeans(data, 10., patch_radius=1, block_radius=2)
+    data_den = sct.math.denoise_nlmeans(data, patch_radius=1, block_radius=2, sigma=10., chunk_size=8, n_jobs=1)
+    assert np.allclose(data_den, data_ref)
+
+
+# noinspection 801,PyShadowingNames
+@pytest.mark.parametrize('chunk_size', [None, 4, 7])
+def test_expression(chunk_size):
+    from scipy.ndimage import gaussian_filter, gaussian_laplace
+    rs = np.random.RandomState(0)
+    data = np.asfortranarray(rs.normal(1, 1, (20, 18, 30)))
+    mask = np.asfortranarray(rs.uniform(0, 2, data.shape))
+    # elementwise operations are fused, chunks are padded for the neighbourhood operations
+    expression = sct.math.Expression().thr(0.5).mul(mask).smooth([1, 1, 2]).add(2.).laplacian([1, 1, 0.5]).bin(0)
+    data_thr = data.copy()
+    data_thr[data_thr < 0.5] = 0
+    data_ref = gaussian_laplace(gaussian_filter(data_thr * mask, [1, 1, 2]) + 2., [1, 1, 0.5]) > 0
+    assert expression.halo == 8 + 2
+    assert np.array_equal(expression.evaluate(data, chunk_size=chunk_size), data_ref)
+    # the input is not modified
+    assert data.min() < 0.5
+    # reduction
+    expression = sct.math.Expression().sub(mask).smooth([1, 1, 1]).mean(2)
+    data_ref = np.mean(gaussian_filter(data - mask, 1), 2)
+    np.testing.assert_allclose(expression.evaluate(data, chunk_size=chunk_size), data_ref)
+
+
+def test_expression_errors():
+    with pytest.raises(ValueError):
+        sct.math.Expression().mean(3).add(1.)
+    with pytest.raises(ValueError):
+        sct.math.Expression().add(1., 2.)
+    with pytest.raises(ValueError):
+        sct.math.Expression().add(np.zeros((2, 2, 2))).evaluate(np.zeros((2, 2, 3)))
+
+
+# noinspection 801,PyShadowingNames
+@pytest.mark.parametrize('chain', [
+    ['-thr', '0.5', '-mul', 'op0.nii.gz', '-smooth', '1', '-add', '2', '-laplacian', '1,1,2', '-bin', '0'],
+    ['-add', 'op0.nii.gz', 'op1.nii.gz', '-div', '3', '-smooth', '2,1,1', '-sub', 'op1.nii.gz', '-rms', 'y'],
+])
+def test_sct_maths_chain(tmp_path, chain):
+    """Chained operations give the same result as one call of sct_maths per operation"""
+    import sys
+    import nibabel as nib
+    from spinalcordtoolbox.image import Image
+    from spinalcordtoolbox.utils import __sct_dir__
+    sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+    import sct_maths
+    rs = np.random.RandomState(0)
+    affine = np.diag([0.8, 0.8, 2.5, 1])
+    data = rs.normal(1, 1, (20, 18, 30))
+    nib.save(nib.Nifti1Image(data, affine), str(tmp_path / 'data.nii.gz'))
+    for i in range(2):
+        nib.save(nib.Nifti1Image(rs.uniform(0, 2, data.shape), affine), str(tmp_path / 'op{}.nii.gz'.format(i)))
+    chain = [str(tmp_path / arg) if arg.endswith('.nii.gz') else arg for arg in chain]
+    # one call per operation
+    fname = str(tmp_path / 'data.nii.gz')
+    operations = [i for i, arg in enumerate(chain) if arg.startswith('-') and not arg[1:2].isdigit()] + [len(chain)]
+    for start, stop in zip(operations[:-1], operations[1:]):
+        fname_out = str(tmp_path / 'step{}.nii.gz'.format(start))
+        sct_maths.main(['-i', fname, '-o', fname_out, '-v', '0'] + chain[start:stop])
+        fname = fname_out
+    for chunk in ['0', '7']:
+        sct_maths.main(['-i', str(tmp_path / 'data.nii.gz'), '-o', str(tmp_path / 'chain.nii.gz'), '-v', '0',
+                        '-chunk', chunk] + chain)
+        assert np.array_equal(Image(str(tmp_path / 'chain.nii.gz')).data, Image(fname).data)
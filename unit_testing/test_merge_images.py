@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for sct_merge_images
+
+from __future__ import absolute_import
+
+import sys, os
+import pytest
+
+import numpy as np
+import nibabel as nib
+
+from spinalcordtoolbox.utils import __sct_dir__
+sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+from spinalcordtoolbox.image import Image
+import sct_merge_images
+
+
+def save_image(data, z_offset, fname):
+    affine = np.eye(4)
+    affine[2, 3] = z_offset
+    nib.save(nib.Nifti1Image(data, affine), fname)
+    return fname
+
+
+def save_field(data, fname):
+    """Displacement field (x, y, z, 3) on the destination grid"""
+    im_warp = nib.Nifti1Image(data[:, :, :, np.newaxis, :], np.eye(4))
+    im_warp.header.set_intent('vector', (), '')
+    nib.save(im_warp, fname)
+    return fname
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_merge_images_overlap(tmp_path, n_jobs):
+    """Two slabs overlapping over 4 slices: the overlap is the average of both"""
+    fname_dest = save_image(np.zeros((10, 10, 20), dtype=np.float32), 0, str(tmp_path / 'dest.nii.gz'))
+    fname_src1 = save_image(np.full((10, 10, 12), 1, dtype=np.int16), 0, str(tmp_path / 'src1.nii.gz'))
+    fname_src2 = save_image(np.full((10, 10, 12), 3, dtype=np.int16), 8, str(tmp_path / 'src2.nii.gz'))
+    fname_warp = save_field(np.zeros((10, 10, 20, 3)), str(tmp_path / 'warp.nii.gz'))
+    param = sct_merge_images.Param()
+    param.fname_out = str(tmp_path / 'merged.nii.gz')
+    param.n_jobs = n_jobs
+    param.verbose = 0
+    sct_merge_images.merge_images([fname_src1, fname_src2], fname_dest, [fname_warp, fname_warp], param)
+    data = Image(param.fname_out).data
+    assert np.allclose(data[..., :8], 1)
+    assert np.allclose(data[..., 8:12], 2)
+    assert np.allclose(data[..., 12:], 3)
+
+
+def test_merge_images_partial_volume(tmp_path):
+    """Weighted average with the partial volume of each source, after a translation of half a voxel along z"""
+    fname_dest = save_image(np.zeros((6, 6, 20), dtype=np.float32), 0, str(tmp_path / 'dest.nii.gz'))
+    # source 1: slices 0 to 11, whose last two slices are zero; source 2: slices 8 to 19
+    data_src1 = np.full((6, 6, 12), 2, dtype=np.float32)
+    data_src1[..., 10:] = 0
+    fname_src1 = save_image(data_src1, 0, str(tmp_path / 'src1.nii.gz'))
+    fname_src2 = save_image(np.full((6, 6, 12), 5, dtype=np.float32), 8, str(tmp_path / 'src2.nii.gz'))
+    # each destination slice k is sampled at z = k + 0.5 in the sources
+    field = np.zeros((6, 6, 20, 3))
+    field[..., 2] = 0.5
+    fname_warp = save_field(field, str(tmp_path / 'warp.nii.gz'))
+    param = sct_merge_images.Param()
+    param.fname_out = str(tmp_path / 'merged.nii.gz')
+    param.verbose = 0
+    sct_merge_images.merge_images([fname_src1, fname_src2], fname_dest, [fname_warp, fname_warp], param)
+    # source 1: value 2 (partial volume 1) up to slice 8, value 1 (partial volume 0.5) at slice 9, then nothing
+    # source 2: from slice 7 (at -0.5 voxel from its first slice), value 5 (partial volume 1)
+    expected = [2] * 7 + [(2 + 5) / 2.] * 2 + [(1 * 0.5 + 5) / 1.5] + [5] * 10
+    data = Image(param.fname_out).data
+    assert np.allclose(data, np.broadcast_to(expected, data.shape), atol=1e-6)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.postprocessing and the volume-wise post-processing of deepseg_sc
+
+from __future__ import absolute_import
+
+import numpy as np
+import nibabel as nib
+import pytest
+from scipy.ndimage import label
+
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox import postprocessing
+from spinalcordtoolbox.deepseg_sc.postprocessing import post_processing_volume_wise
+
+
+def dummy_segmentation():
+    """Straight cord along z (slices 2 to 36), with holes at slices 10-11 and 20-27, and two blobs above the cord"""
+    data = np.zeros((20, 20, 50), dtype=np.float32)
+    data[8:12, 8:12, 2:37] = 1
+    data[..., 10:12] = 0
+    data[..., 20:28] = 0
+    data[1:3, 1:3, 40:42] = 1  # small blob
+    data[14:19, 14:19, 44:50] = 1  # large blob
+    return data
+
+
+@pytest.mark.parametrize('axis', [0, 1, 2])
+def test_keep_largest_object_per_slice(axis):
+    data = (np.random.RandomState(axis).rand(15, 12, 10) > 0.6).astype(np.float32)
+    data_expected = data.copy()
+    for i in range(data.shape[axis]):
+        index = tuple(i if iaxis == axis else slice(None) for iaxis in range(3))
+        labeled_obj, num_obj = label(data[index])
+        if num_obj > 1:
+            data_expected[index] *= labeled_obj == np.bincount(labeled_obj.flat)[1:].argmax() + 1
+    data_out = postprocessing.keep_largest_object_per_slice(data, axis=axis)
+    assert data_out.dtype == data.dtype
+    np.testing.assert_array_equal(data_out, data_expected)
+
+
+def test_keep_largest_object():
+    data = dummy_segmentation()
+    data_out = postprocessing.keep_largest_object(data)
+    # the large blob (150 voxels) is larger than each piece of cord
+    np.testing.assert_array_equal(data_out[..., 44:], data[..., 44:])
+    assert np.count_nonzero(data_out) == 5 * 5 * 6
+
+
+def test_slice_counts_and_holes():
+    data = dummy_segmentation()
+    counts = postprocessing.get_slice_counts(data)
+    assert counts[2] == 16 and counts[10] == 0
+    np.testing.assert_array_equal(postprocessing.get_hole_ranges(counts),
+                                  [[10, 12], [20, 28], [37, 40], [42, 44]])
+    np.testing.assert_array_equal(postprocessing.get_hole_ranges(np.zeros(5)), np.zeros((0, 2)))
+    np.testing.assert_allclose(postprocessing.get_slice_areas(data * 0.5, pixel_area=0.25)[2], 2)
+
+
+def test_interpolate_holes():
+    data = np.zeros((1, 1, 6))
+    data[0, 0, [0, 5]] = [1, 6]
+    data_interp = postprocessing.interpolate_holes(data, [[1, 5]])
+    np.testing.assert_allclose(data_interp[0, 0], [1, 2, 3, 4, 5, 6])
+
+
+def test_post_processing_volume_wise():
+    data = dummy_segmentation()
+    data[9, 9, 36] = 0.5  # partial volume
+    data[2:12, 8:12, 30] = 1  # edge slice with more voxels
+    im_seg = Image(data.copy(), hdr=nib.Nifti1Image(data, np.eye(4)).header)
+    data_pp = post_processing_volume_wise(im_seg).data
+    # the small blob above the cord is removed, not the large one
+    assert not data_pp[..., 40:42].any()
+    np.testing.assert_array_equal(data_pp[..., 44:50], data[..., 44:50])
+    # the cord and its soft values are kept
+    np.testing.assert_array_equal(data_pp[..., :40], data[..., :40])
+
+
+def test_post_processing_volume_wise_isolated_voxels():
+    data = dummy_segmentation()
+    data[..., 37:] = 0
+    data[9, 9, 1] = 1  # isolated voxel below the cord
+    im_seg = Image(data.copy(), hdr=nib.Nifti1Image(data, np.eye(4)).header)
+    data_pp = post_processing_volume_wise(im_seg).data
+    assert not data_pp[..., 1].any()
+    np.testing.assert_array_equal(data_pp[..., 2:], data[..., 2:])
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.reports.qc
+
+import sys, os
+
+import numpy as np
+import nibabel as nib
+import matplotlib.image
+import matplotlib.figure
+import pytest
+
+from spinalcordtoolbox.utils import __sct_dir__
+sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+import spinalcordtoolbox.reports.qc as qc
+import spinalcordtoolbox.reports.slice as qcslice
+from spinalcordtoolbox.image import Image
+
+
+def test_write_png(tmp_path):
+    """The PNG encoder writes images that decode back to the same pixels"""
+    rgba = np.random.RandomState(0).randint(0, 256, size=(13, 7, 4)).astype(np.uint8)
+    fname = str(tmp_path / 'img.png')
+    qc._write_png(fname, rgba)
+    im = matplotlib.image.imread(fname)
+    assert im.shape == rgba.shape
+    assert np.array_equal(np.round(im * 255).astype(np.uint8), rgba)
+
+
+@pytest.mark.parametrize('a', [np.arange(12.).reshape(3, 4), np.ones((3, 4))])
+def test_gray_to_rgba(a):
+    rgba = qc._gray_to_rgba(a)
+    assert rgba.shape == a.shape + (4,)
+    assert (rgba[..., 3] == 255).all()
+    assert rgba[..., 0].min() == 0
+    if np.ptp(a):
+        assert rgba[..., 0].max() == 255
+
+
+def test_batch_index_update(tmp_path, monkeypatch):
+    """The index is only updated when leaving the outermost context"""
+    updated = []
+    monkeypatch.setattr(qc, 'update_index', updated.append)
+    monkeypatch.delenv('SCT_QC_DEFER_INDEX', raising=False)
+    assert not qc._is_index_update_deferred()
+    with qc.batch_index_update():
+        with qc.batch_index_update():
+            assert qc._is_index_update_deferred()
+            qc._deferred_index_folders.add(str(tmp_path))
+        assert updated == []
+    assert updated == [str(tmp_path)]
+    assert not qc._is_index_update_deferred()
+    monkeypatch.setenv('SCT_QC_DEFER_INDEX', '1')
+    assert qc._is_index_update_deferred()
+
+
+def test_update_index_no_entry(tmp_path):
+    qc.update_index(str(tmp_path))
+    assert not os.path.exists(str(tmp_path / 'index.html'))
+
+
+def test_listed_seg_rgba():
+    """The array rendering of listed_seg gives the colors of the matplotlib rendering, including for soft masks"""
+    mask = np.array([[0, 0.3, 0.49, 0.5], [0.6, 0.99, 1, 1.4], [1.6, 2, 0, 1]])
+    qc_image = qc.QcImage(None, 'none', [qc.QcImage.listed_seg])
+    qc_image.aspect_mask = 1.
+    ax = matplotlib.figure.Figure().add_subplot(111)
+    qc_image.listed_seg(mask.copy(), ax)
+    image = ax.get_images()[0]
+    rgba_matplotlib = image.to_rgba(image.get_array(), bytes=True)
+    rgba = qc_image.listed_seg_rgba(mask.copy())
+    assert np.array_equal(rgba, rgba_matplotlib)
+    # only voxels >= 1 are painted
+    assert np.array_equal(rgba[..., 3] > 0, mask >= 1)
+
+
+def test_slice_resample_cache(tmp_path):
+    """The resampled background taken from the cache is the same as the one resampled without cache"""
+    data = np.random.RandomState(0).rand(20, 15, 10).astype(np.float32)
+    seg = (data > 0.5).astype(np.float32)
+    affine = np.diag([0.8, 0.8, 2, 1])
+    fname, fname_seg = str(tmp_path / 'im.nii.gz'), str(tmp_path / 'seg.nii.gz')
+    nib.save(nib.Nifti1Image(data, affine), fname)
+    nib.save(nib.Nifti1Image(seg, affine), fname_seg)
+
+    qcslice._resampled_cache.clear()
+    expected = qcslice.Axial([Image(fname), Image(fname_seg)])._images
+    for _ in range(2):
+        images = qcslice.Axial([Image(fname), Image(fname_seg)], cache=True)._images
+        assert len(qcslice._resampled_cache) == 1
+        for image, image_expected in zip(images, expected):
+            assert np.array_equal(image.data, image_expected.data)
+            assert image.orientation == image_expected.orientation
+    # the cached copy is not modified through the images it was taken from
+    images[0].data[:] = 0
+    images = qcslice.Axial([Image(fname), Image(fname_seg)], cache=True)._images
+    assert np.array_equal(images[0].data, expected[0].data)
@@ -11,6 +11,7 @@ import pytest
 
 import numpy as np
 import nibabel as nib
+from nibabel.processing import resample_from_to
 
 from spinalcordtoolbox.utils import __sct_dir__
 sys.path.append(os.path.join(__sct_dir__, 'scripts'))
@@ -86,3 +87,31 @@ def test_nib_resample_image_4d(fake_4dimage_nib):
     assert img_r.get_data()[8, 8, 4, 0] == 1.0  # make sure there is no displacement in world coordinate system
     assert img_r.get_data()[8, 8, 4, 1] == 0.0
     assert img_r.header.get_zooms() == (0.5, 0.5, 1.0, 1.0)
+
+
+# noinspection 801,PyShadowingNames
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_nib_resample_image_4d_matches_3d(fake_4dimage_nib, fake_3dimage_nib_big, n_jobs):
+    """Test that each volume of a resampled 4D image matches the resampling of the 3D volume"""
+    data = np.random.RandomState(0).rand(9, 9, 9, 3).astype(np.float32)
+    nii = nib.nifti1.Nifti1Image(data, fake_4dimage_nib.affine)
+    img_r = resampling.resample_nib(nii, image_dest=fake_3dimage_nib_big, interpolation='linear', n_jobs=n_jobs)
+    assert img_r.get_data().shape == (29, 39, 19, 3)
+    assert img_r.get_data().dtype == np.float32
+    for it in range(3):
+        img3d_r = resampling.resample_nib(nib.nifti1.Nifti1Image(data[..., it], nii.affine),
+                                          image_dest=fake_3dimage_nib_big, interpolation='linear')
+        assert np.allclose(img_r.get_data()[..., it], img3d_r.get_data())
+
+
+# noinspection 801,PyShadowingNames
+def test_resampling_plan(fake_3dimage_nib, fake_3dimage_nib_big):
+    """A ResamplingPlan gives the same result as nibabel's resample_from_to"""
+    plan = resampling.ResamplingPlan(fake_3dimage_nib.affine, fake_3dimage_nib.shape, fake_3dimage_nib_big.affine,
+                                     fake_3dimage_nib_big.shape)
+    for order in [0, 1, 2]:
+        img_r = resample_from_to(fake_3dimage_nib, fake_3dimage_nib_big, order=order, mode='nearest')
+        assert np.array_equal(plan.apply(fake_3dimage_nib.get_data(), order=order), img_r.get_data())
+    # data must be defined on the source grid
+    with pytest.raises(ValueError):
+        plan.apply(fake_3dimage_nib_big.get_data())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.scheduler and sct_run_batch
+
+from __future__ import absolute_import
+
+import sys, os
+import stat
+import pytest
+
+from spinalcordtoolbox.utils import __sct_dir__
+sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+from spinalcordtoolbox.scheduler import Journal, Job, Scheduler, PENDING, RUNNING, DONE, FAILED
+import sct_run_batch
+
+GB = 1024 ** 3
+
+# Dummy task: records its subject and ITK thread count, and fails if the subject folder contains a file "fail" (the
+# file is removed, so that the next attempt succeeds)
+DUMMY_TASK = """#!/bin/bash
+echo "$1 $ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS" >> "$PATH_RESULTS/calls.txt"
+if [ -f "$PATH_DATA/$1/fail" ]; then
+  rm "$PATH_DATA/$1/fail"
+  exit 3
+fi
+touch "$PATH_RESULTS/$1_done"
+"""
+
+
+@pytest.fixture()
+def dummy_batch(tmp_path):
+    """Folders of 4 subjects, and the dummy task"""
+    path_data = tmp_path / 'data'
+    for subject in ['sub-01', 'sub-02', 'sub-03', 'sub-04']:
+        (path_data / subject).mkdir(parents=True)
+    fname_task = str(tmp_path / 'task.sh')
+    with open(fname_task, 'w') as f:
+        f.write(DUMMY_TASK)
+    os.chmod(fname_task, os.stat(fname_task).st_mode | stat.S_IEXEC)
+    return path_data, tmp_path / 'output', fname_task
+
+
+def read_calls(path_output):
+    with open(str(path_output / 'results' / 'calls.txt')) as f:
+        return [line.split() for line in f]
+
+
+def test_journal(tmp_path):
+    journal = Journal(str(tmp_path / 'journal.jsonl'))
+    journal.record('a', RUNNING)
+    journal.record('a', DONE, duration=10., peak_rss=100)
+    journal.record('b', FAILED, duration=3., peak_rss=300)
+    journal.record('a', DONE, duration=12., peak_rss=50)
+    # interrupted write
+    with open(journal.fname, 'a') as f:
+        f.write('{"name": "b", "sta')
+    assert {name: record['state'] for name, record in journal.last_states().items()} == {'a': DONE, 'b': FAILED}
+    assert journal.history() == {'a': {'duration': 12., 'peak_rss': 100}, 'b': {'peak_rss': 300}}
+
+
+def test_scheduler_order(tmp_path):
+    journal = Journal(str(tmp_path / 'journal.jsonl'))
+    journal.record('a', DONE, duration=10., peak_rss=2 * GB)
+    journal.record('b', DONE, duration=30., peak_rss=1 * GB)
+    jobs = [Job(name, [], '') for name in ['a', 'b', 'c']]
+    ordered = Scheduler(journal, n_cores=4).order(jobs)
+    # c is new: average duration, largest memory
+    assert [job.name for job in ordered] == ['b', 'c', 'a']
+    assert [job.memory for job in ordered] == [1 * GB, 2 * GB, 2 * GB]
+
+
+def test_scheduler_resources(tmp_path):
+    scheduler = Scheduler(Journal(str(tmp_path / 'journal.jsonl')), n_jobs=4, n_cores=8, memory_budget=5 * GB)
+    running = [Job('a', [], ''), Job('b', [], '')]
+    for job in running:
+        job.itk_threads, job.memory = 2, 2 * GB
+    # 4 free cores, for 2 jobs that can start
+    assert scheduler.get_itk_threads(running, 2) == 2
+    assert scheduler.get_itk_threads(running, 1) == 4
+    assert scheduler.get_itk_threads(running * 4, 1) == 1
+    job = Job('c', [], '')
+    job.memory = 1 * GB
+    assert scheduler.fits(job, running)
+    job.memory = 2 * GB
+    assert not scheduler.fits(job, running)
+    assert scheduler.fits(job, [])
+
+
+def test_run_batch(dummy_batch):
+    path_data, path_output, fname_task = dummy_batch
+    (path_data / 'sub-03' / 'fail').touch()
+    args = ['-path-data', str(path_data), '-path-output', str(path_output), '-jobs', '2']
+
+    # sub-03 fails
+    assert sct_run_batch.main(args + [fname_task]) == 1
+    assert sorted(subject for subject, _ in read_calls(path_output)) == ['sub-01', 'sub-02', 'sub-03', 'sub-04']
+    assert os.path.isfile(str(path_output / 'log' / 'err.task_sub-03.log'))
+    journal = Journal(str(path_output / 'log' / 'batch_journal.jsonl'))
+    states = journal.last_states()
+    assert states['sub-03']['state'] == FAILED and states['sub-03']['returncode'] == 3
+    assert all(states[subject]['state'] == DONE for subject in ['sub-01', 'sub-02', 'sub-04'])
+    assert all(states[subject]['peak_rss'] > 0 for subject in states)
+
+    # resume: only sub-03 runs again, alone, with all the cores
+    os.remove(str(path_output / 'results' / 'calls.txt'))
+    assert sct_run_batch.main(args + ['-itk-threads', '0', fname_task]) == 0
+    calls = read_calls(path_output)
+    assert [subject for subject, _ in calls] == ['sub-03']
+    assert int(calls[0][1]) >= 1
+    assert journal.last_states()['sub-03']['state'] == DONE
+    assert not os.path.isfile(str(path_output / 'log' / 'err.task_sub-03.log'))
+
+    # other task arguments: all subjects run again
+    os.remove(str(path_output / 'results' / 'calls.txt'))
+    assert sct_run_batch.main(args + ['-task-args', 'foo', fname_task]) == 0
+    assert sorted(subject for subject, _ in read_calls(path_output)) == ['sub-01', 'sub-02', 'sub-03', 'sub-04']
+
+
+def test_run_batch_retry(dummy_batch):
+    path_data, path_output, fname_task = dummy_batch
+    (path_data / 'sub-02' / 'fail').touch()
+    assert sct_run_batch.main(['-path-data', str(path_data), '-path-output', str(path_output), '-jobs', '3',
+                               '-itk-threads', '2', '-retry', '1', fname_task]) == 0
+    calls = read_calls(path_output)
+    assert sorted(subject for subject, _ in calls) == ['sub-01', 'sub-02', 'sub-02', 'sub-03', 'sub-04']
+    assert all(threads == '2' for _, threads in calls)
+    states = [record['state'] for record in Journal(str(path_output / 'log' / 'batch_journal.jsonl')).read()
+              if record['name'] == 'sub-02']
+    assert states == [PENDING, RUNNING, FAILED, PENDING, RUNNING, DONE]
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.smoothing and sct_smooth_spinalcord
+
+from __future__ import absolute_import
+
+import sys, os
+import pytest
+
+import numpy as np
+import nibabel as nib
+from scipy.ndimage import gaussian_filter
+
+from spinalcordtoolbox.utils import __sct_dir__
+sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.smoothing import CurvedSpace
+import sct_smooth_spinalcord
+
+
+def dummy_curved_cord(shape=(48, 48, 60)):
+    """Tube of radius ~4 voxels following a curved centerline, whose intensity oscillates along the cord"""
+    z = np.arange(shape[2], dtype=np.float64)
+    centerline = np.array([shape[0] / 2. + 6 * np.sin(z / 20.), shape[1] / 2. + 3 * np.cos(z / 15.), z])
+    x, y, z = np.indices(shape)
+    r2 = (x - centerline[0][z]) ** 2 + (y - centerline[1][z]) ** 2
+    data = np.exp(-r2 / 16.) * (1 + 0.5 * np.sin(z / 3.))
+    return data, centerline
+
+
+@pytest.mark.parametrize('mode', ['smooth', 'smooth_direct'])
+def test_smooth_straight_centerline(mode):
+    """Straight centerline at the center of the field of view: same as a Gaussian filter"""
+    data = np.random.RandomState(0).rand(21, 25, 30)
+    pixdim = (0.8, 0.8, 1.5)
+    centerline = np.array([np.full(30, 10.), np.full(30, 12.), np.arange(30.)])
+    space = CurvedSpace(centerline, pixdim, data.shape)
+    np.testing.assert_allclose(space.coords_straight, np.indices(data.shape), atol=1e-5)
+    assert not space.is_outside.any()
+    data_smooth = getattr(space, mode)(data, [1, 0, 3])
+    sigmas = np.array([1, 0, 3]) / np.array(pixdim)
+    data_ref = gaussian_filter(data, sigmas, truncate=4.0, mode='reflect' if mode == 'smooth' else 'nearest')
+    np.testing.assert_allclose(data_smooth, data_ref, atol=1e-10)
+
+
+def test_curved_space():
+    data, centerline = dummy_curved_cord()
+    space = CurvedSpace(centerline, (1, 1, 1), data.shape)
+    # in the straightened space, the cord is at the center of the slices
+    data_straight = space.straighten(data)
+    assert data_straight.shape == space.shape_straight
+    profile = data_straight[:, :, 10:-10].mean(axis=2)
+    assert np.unravel_index(np.argmax(profile), profile.shape) in [(23, 23), (23, 24), (24, 23), (24, 24)]
+    # round trip
+    data_curved = space.curve(data_straight)
+    in_cord = (data > 0.1) & ~space.is_outside
+    assert np.abs(data_curved - data)[in_cord].max() < 0.1
+    # smoothing along the cord averages the oscillations, without blurring the cord as smoothing along z does
+    x, y, z = np.indices(data.shape)
+    tube = np.exp(-((x - centerline[0][z]) ** 2 + (y - centerline[1][z]) ** 2) / 16.)
+    center = (tube > 0.8) & (z >= 15) & (z < 45)
+    cord = (tube > 0.1) & (z >= 15) & (z < 45)
+    error_z = np.abs(gaussian_filter(data, [0, 0, 6]) - tube)[cord].mean()
+    # the direct mode samples along the tangent of each slice, which deviates from the centerline where it bends
+    for mode, max_error_ratio in [('smooth', 0.6), ('smooth_direct', 0.9)]:
+        data_smooth = getattr(space, mode)(data, [0, 0, 6])
+        assert np.std(data_smooth[center] / tube[center]) < 0.3 * np.std(data[center] / tube[center])
+        assert np.abs(data_smooth - tube)[cord].mean() < max_error_ratio * error_z
+
+
+def test_sct_smooth_spinalcord(tmp_path, monkeypatch):
+    data, centerline = dummy_curved_cord()
+    seg = np.zeros(data.shape, dtype=np.uint8)
+    seg[np.round(centerline[0]).astype(int), np.round(centerline[1]).astype(int), centerline[2].astype(int)] = 1
+    # image in LPI orientation, to check that the output is in the native orientation
+    affine = np.diag([-1., 1., 1., 1.])
+    nib.save(nib.Nifti1Image(data.astype(np.float32), affine), str(tmp_path / 'data.nii.gz'))
+    nib.save(nib.Nifti1Image(seg, affine), str(tmp_path / 'seg.nii.gz'))
+    monkeypatch.chdir(str(tmp_path))
+    for mode in ['straighten', 'direct']:
+        sct_smooth_spinalcord.main(['-i', 'data.nii.gz', '-s', 'seg.nii.gz', '-smooth', '0,0,6',
+                                    '-param', 'mode=' + mode, '-v', '0'])
+        im_smooth = Image('data_smooth.nii.gz')
+        assert im_smooth.orientation == Image('data.nii.gz').orientation
+        assert im_smooth.data.shape == data.shape
+        # the oscillations along the cord are smoothed out
+        in_cord = seg.astype(bool)
+        assert np.std(im_smooth.data[in_cord]) < 0.5 * np.std(data[in_cord])
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for the startup of the SCT commands (lazy imports, see spinalcordtoolbox.utils.lazy_import)
+
+from __future__ import absolute_import
+
+import os
+import sys
+import re
+import time
+import subprocess
+
+import pytest
+
+from spinalcordtoolbox.utils import __sct_dir__
+from benchmarks.bench_startup import get_commands, run_command
+
+
+# Wall time of "<command> -h", in s (min of STARTUP_RUNS runs). The commands take 0.1 to 0.5 s once their heavy
+# dependencies are lazy-loaded, and took up to 1.4 s when they imported them at module level.
+STARTUP_BUDGET = 1.
+STARTUP_RUNS = 3
+# Scripts whose help cannot be displayed in this environment, for reasons unrelated to the startup time
+HELP_UNAVAILABLE = {
+    'sct_analyze_texture': "needs skimage.feature.greycomatrix (skimage < 0.19)",
+    'sct_check_dependencies': "needs the 'requirements' package",
+    'sct_deepseg': "needs ivadomed",
+    'sct_extract_metric': "needs the PAM50 atlas",
+    'sct_pipeline': "Python 2 only",
+    'sct_utils': "module, not a command",
+}
+# Modules that the commands only need to process data, and that should not be imported to display the help
+HEAVY_MODULES = ['matplotlib', 'skimage', 'scipy.stats', 'scipy.signal', 'pandas', 'dipy', 'sklearn', 'keras',
+                 'tensorflow']
+
+
+def run_python(args):
+    env = dict(os.environ)
+    env['MPLBACKEND'] = 'Agg'
+    env['PYTHONPATH'] = os.pathsep.join([__sct_dir__, os.path.join(__sct_dir__, 'scripts')])
+    return subprocess.run([sys.executable] + args, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+
+
+def test_lazy_import():
+    proc = run_python(['-c', """
+import sys
+from spinalcordtoolbox.utils import lazy_import
+ndimage = lazy_import('scipy.ndimage')
+assert 'scipy.ndimage' not in sys.modules
+assert ndimage.map_coordinates.__module__.startswith('scipy.ndimage')
+assert 'scipy.ndimage' in sys.modules
+assert lazy_import('scipy.ndimage') is sys.modules['scipy.ndimage']
+"""])
+    assert proc.returncode == 0, proc.stderr
+
+
+@pytest.mark.parametrize('command', ['sct_maths', 'sct_image', 'sct_apply_transfo', 'sct_process_segmentation',
+                                     'sct_register_to_template', 'sct_register_multimodal', 'sct_label_vertebrae',
+                                     'sct_propseg', 'sct_straighten_spinalcord', 'sct_analyze_lesion'])
+def test_help_does_not_import_heavy_modules(command):
+    proc = run_python(['-X', 'importtime', os.path.join(__sct_dir__, 'scripts', command + '.py'), '-h'])
+    assert proc.returncode == 0, proc.stderr
+    imported = set(re.findall(r'^import time:.*\|\s+(\S+)$', proc.stderr, re.MULTILINE))
+    assert imported
+    assert not imported.intersection(HEAVY_MODULES)
+
+
+@pytest.mark.parametrize('command', [
+    pytest.param(command, marks=pytest.mark.skip(reason=HELP_UNAVAILABLE[command]))
+    if command in HELP_UNAVAILABLE else command for command in get_commands()])
+def test_help_startup_time(command):
+    durations = []
+    for _ in range(STARTUP_RUNS):
+        start = time.time()
+        proc = run_command(command)
+        durations.append(time.time() - start)
+        assert proc.returncode == 0, proc.stderr
+    assert min(durations) < STARTUP_BUDGET
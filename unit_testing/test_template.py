@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.template
+
+from __future__ import absolute_import
+
+import numpy as np
+import nibabel as nib
+
+from spinalcordtoolbox import template
+from spinalcordtoolbox.template import get_continuous_levels_along_centerline, get_continuous_vertebral_levels, \
+    VertLevelIndex, get_vert_level_index
+from spinalcordtoolbox.image import Image
+
+
+def test_get_continuous_levels_along_centerline():
+    # straight centerline along z (1 mm spacing), from inferior to superior: level 3 on 5 points, then level 2 on 4
+    # points, then level 1 on a single point
+    levels = np.array([3, 3, 3, 3, 3, 2, 2, 2, 2, 1])
+    coords = np.column_stack([np.zeros(10), np.zeros(10), np.arange(10.)])
+    continuous_levels = get_continuous_levels_along_centerline(levels, coords)
+    np.testing.assert_allclose(continuous_levels, [4, 3.75, 3.5, 3.25, 3, 3, 2 + 2 / 3., 2 + 1 / 3., 2, 1])
+    # the relative position only depends on the length along the centerline
+    coords[:, 2] *= 2
+    np.testing.assert_allclose(get_continuous_levels_along_centerline(levels, coords), continuous_levels)
+
+
+def test_get_continuous_vertebral_levels():
+    # straight segmentation (RPI, 3x3 voxels per slice) labeled with levels 3, 2 and 1 on 4 slices each
+    data = np.zeros((9, 9, 12), dtype=np.uint8)
+    for iz, level in enumerate([3] * 4 + [2] * 4 + [1] * 4):
+        data[3:6, 3:6, iz] = level
+    im_vertlevel = Image(data, hdr=nib.Nifti1Image(data, np.diag([-1., 1, 1, 1])).header)
+    assert im_vertlevel.orientation == 'RPI'
+    im_continuous = get_continuous_vertebral_levels(im_vertlevel)
+    assert im_continuous.data.dtype == np.float32
+    assert np.array_equal(im_continuous.data > 0, data > 0)
+    # all the voxels of a slice get the same value, which goes from level + 1 at the bottom of the level to level at
+    # its top: the values are continuous from one vertebra to the next
+    values = im_continuous.data[3:6, 3:6, :]
+    assert np.all(values == values[1, 1])
+    np.testing.assert_allclose(values[1, 1], [4, 3 + 2 / 3., 3 + 1 / 3., 3, 3, 2 + 2 / 3., 2 + 1 / 3., 2,
+                                              2, 1 + 2 / 3., 1 + 1 / 3., 1], rtol=1e-6)
+
+
+def dummy_vertlevel():
+    """Vertebral labeling (9x9x9): one slice without label, partial volume, and nonfinite values"""
+    data = np.zeros((9, 9, 9))
+    data[4, 4, :] = [2, 2, 3, 3, 0, 4, 4, 5, 6]
+    data[3, 4, 3] = 4  # average: 3.5 -> rounded to 4
+    data[5, 4, 5] = np.nan
+    data[5, 4, 6] = np.inf
+    return data
+
+
+def test_vert_level_index():
+    index = VertLevelIndex(dummy_vertlevel())
+    assert [index.get_level(iz) for iz in range(9)] == [2, 2, 3, 4, None, 4, 4, 5, 6]
+    assert index.get_slices(4) == [3, 5, 6]
+    assert index.get_slices(7) == []
+    assert index.levels == [2, 3, 4, 5, 6]
+    np.testing.assert_allclose(index.fractional_levels, [2, 2, 3, 3.5, np.nan, 4, 4, 5, 6])
+    # same results as a loop across slices
+    data = dummy_vertlevel()
+    for iz in range(9):
+        values = data[..., iz][(data[..., iz] != 0) & np.isfinite(data[..., iz])]
+        assert index.get_level(iz) == (int(np.round(np.mean(values))) if len(values) else None)
+
+
+def test_get_vert_level_index():
+    template._vert_level_index_cache.clear()
+    im_vertlevel = Image(dummy_vertlevel())
+    index = get_vert_level_index(im_vertlevel)
+    # same data in another image: cached
+    assert get_vert_level_index(Image(dummy_vertlevel())) is index
+    assert template.get_slices_from_vertebral_levels(im_vertlevel, 4) == [3, 5, 6]
+    assert template.get_vertebral_level_from_slice(im_vertlevel, 4) is None
+    # different data
+    im_vertlevel.data[4, 4, 0] = 3
+    assert get_vert_level_index(im_vertlevel) is not index
+    assert len(template._vert_level_index_cache) == 2
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.template_cache
+
+from __future__ import absolute_import
+
+import os
+
+import pytest
+import numpy as np
+import nibabel
+
+from spinalcordtoolbox import template_cache
+from spinalcordtoolbox.image import Image
+
+
+@pytest.fixture
+def path_template(tmp_path, monkeypatch):
+    """Template folder going through a cache in a temporary folder"""
+    path_template = tmp_path / 'PAM50'
+    path_template.mkdir()
+    monkeypatch.setattr(template_cache, 'CACHED_FOLDERS', [str(path_template)])
+    monkeypatch.setenv(template_cache.ENV_CACHE, str(tmp_path / 'cache'))
+    return path_template
+
+
+def save_template(fname, value):
+    data = np.full((5, 6, 7), value, dtype=np.float32)
+    nibabel.save(nibabel.Nifti1Image(data, np.eye(4)), str(fname))
+    return str(fname)
+
+
+def get_entries():
+    """:return: list of str: decompressed files in the cache"""
+    path_cache = template_cache.get_cache_dir()
+    if not os.path.isdir(path_cache):
+        return []
+    return sorted(fname for fname in os.listdir(path_cache) if fname.endswith('.nii'))
+
+
+def test_load_from_cache(path_template):
+    fname = save_template(path_template / 'PAM50_t2.nii.gz', 3)
+    im = Image(fname)
+    assert isinstance(im.data, np.memmap)
+    assert np.all(im.data == 3)
+    assert im.absolutepath == fname
+    assert len(get_entries()) == 1
+    # modifying the data does not modify the cache entry (copy-on-write)
+    im.data[:] = 0
+    assert np.all(Image(fname).data == 3)
+    assert len(get_entries()) == 1
+
+
+def test_invalidation(path_template):
+    fname = save_template(path_template / 'PAM50_t2.nii.gz', 3)
+    Image(fname)
+    stat = os.stat(fname)
+    save_template(fname, 4)
+    os.utime(fname, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert np.all(Image(fname).data == 4)
+    assert len(get_entries()) == 2
+    template_cache.clear_cache()
+    assert get_entries() == []
+
+
+def test_not_cached(path_template, tmp_path, monkeypatch):
+    # file outside of the template folders
+    fname = save_template(tmp_path / 'subject.nii.gz', 1)
+    assert template_cache.get_cached_path(fname) == fname
+    assert not isinstance(Image(fname).data, np.memmap)
+    # cache disabled
+    fname = save_template(path_template / 'PAM50_t2.nii.gz', 2)
+    monkeypatch.setenv(template_cache.ENV_CACHE, '0')
+    assert template_cache.get_cached_path(fname) == fname
+    assert np.all(Image(fname).data == 2)
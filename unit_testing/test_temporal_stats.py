@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.temporal_stats
+
+from __future__ import absolute_import
+
+import numpy as np
+import pytest
+
+from spinalcordtoolbox.temporal_stats import TemporalStats, compute_temporal_stats, snr_in_roi
+
+
+@pytest.fixture(scope='module')
+def series():
+    """4D int16 series with a linear drift along time"""
+    rs = np.random.RandomState(0)
+    drift = np.linspace(0, 200, 50)
+    return (rs.normal(1000, 20, size=(6, 5, 7, 50)) + drift).astype(np.int16)
+
+
+@pytest.mark.parametrize('chunk_size,slab_size,n_jobs', [(50, None, 1), (7, None, 1), (1, 2, 1), (16, 3, 4)])
+def test_compute_temporal_stats(series, chunk_size, slab_size, n_jobs):
+    stats = compute_temporal_stats(series, chunk_size=chunk_size, slab_size=slab_size, n_jobs=n_jobs)
+    assert stats.n == 50
+    np.testing.assert_allclose(stats.mean, np.mean(series, 3), rtol=1e-12)
+    np.testing.assert_allclose(stats.std(), np.std(series, 3, ddof=1), rtol=1e-10)
+    np.testing.assert_allclose(stats.tsnr(), np.mean(series, 3) / np.std(series, 3, ddof=1), rtol=1e-10)
+
+
+def test_compute_temporal_stats_volumes(series):
+    volumes = [0, 1, 2, 10, 11, 30, 49]
+    stats = compute_temporal_stats(series, volumes=volumes, chunk_size=3)
+    np.testing.assert_allclose(stats.mean, np.mean(series[..., volumes], 3), rtol=1e-12)
+    np.testing.assert_allclose(stats.std(), np.std(series[..., volumes], 3, ddof=1), rtol=1e-10)
+
+
+def test_tsnr_detrended(series):
+    stats = compute_temporal_stats(series, chunk_size=9)
+    time = np.arange(50)
+    values = series.reshape(-1, 50).T.astype(np.float64)
+    coefs = np.polyfit(time, values, 1)
+    residuals = values - (np.outer(time, coefs[0]) + coefs[1])
+    std_residuals = np.sqrt((residuals ** 2).sum(0) / 48).reshape(series.shape[:3])
+    np.testing.assert_allclose(stats.tsnr_detrended(), np.mean(series, 3) / std_residuals, rtol=1e-8)
+    # removing the drift increases the tSNR
+    assert np.all(stats.tsnr_detrended() > stats.tsnr())
+
+
+def test_merge(series):
+    stats_a, stats_b = TemporalStats(series.shape[:3]), TemporalStats(series.shape[:3])
+    stats_a.update(series[..., :20])
+    stats_b.update(series[..., 20:], time=np.arange(20, 50))
+    stats = compute_temporal_stats(series)
+    stats_a.merge(stats_b)
+    for attr in ['mean', 'm2', 'c_xt', 'mean_t', 'm2_t']:
+        np.testing.assert_allclose(getattr(stats_a, attr), getattr(stats, attr), rtol=1e-10)
+
+
+def test_snr_in_roi(series):
+    stats = compute_temporal_stats(series)
+    mask = np.zeros(series.shape[:3])
+    mask[2:4, 1:3, 3:6] = 1
+    mask[3, 2, 4] = 0.5
+    data_mean, data_std = np.mean(series, 3), np.std(series, 3, ddof=1)
+    expected = np.average(data_mean, weights=mask) / np.average(data_std, weights=mask)
+    assert snr_in_roi(stats, mask) == pytest.approx(expected, rel=1e-10)
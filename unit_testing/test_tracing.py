@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.tracing
+
+from __future__ import absolute_import
+
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+from spinalcordtoolbox.utils import __sct_dir__
+from spinalcordtoolbox import tracing
+
+
+SCRIPT_PARENT = """
+import sys
+import sct_utils as sct
+from spinalcordtoolbox import tracing
+
+@tracing.traced
+def stage():
+    return sum(range(100000))
+
+stage()
+sct.run([sys.executable, sys.argv[1]], verbose=0)
+"""
+
+SCRIPT_CHILD = """
+from spinalcordtoolbox import tracing
+
+with tracing.span('child_stage', args={'n': 3}):
+    pass
+"""
+
+
+@pytest.mark.skipif(tracing.is_enabled(), reason="tracing is enabled in this session (SCT_TRACE)")
+def test_disabled():
+    def func():
+        pass
+    assert tracing.traced(func) is func
+    assert tracing.traced(name='stage')(func) is func
+    with tracing.span('stage') as span:
+        assert span.id is None
+    env = {'A': '1'}
+    assert tracing.get_child_env(env) is env
+
+
+def test_tracer(tmpdir):
+    tracer = tracing.Tracer(str(tmpdir.join('trace.json')), trace_id='abc', parent_id='1.0')
+    with tracer.span('outer') as outer:
+        with tracer.span('inner', args={'n': 1}) as inner:
+            env = tracer.get_child_env({})
+        with pytest.raises(ValueError):
+            with tracer.span('failing'):
+                raise ValueError('oops')
+    assert env == {'SCT_TRACE': str(tmpdir.join('trace.json')), 'SCT_TRACE_ID': 'abc', 'SCT_TRACE_PARENT': inner.id}
+    events = dict((event['name'], event) for event in tracer.events)
+    assert events['outer']['args']['parent'] == '1.0'
+    assert events['inner']['args']['parent'] == outer.id
+    assert events['inner']['args']['n'] == 1
+    assert events['failing']['args']['error'] == "ValueError('oops')"
+    assert events['outer']['dur'] >= events['inner']['dur']
+    stages = tracing.summarize(tracer.events + [dict(events['inner'])])
+    assert [(stage['name'], stage['calls']) for stage in stages][0] == ('outer', 1)
+    assert dict((stage['name'], stage['calls']) for stage in stages)['inner'] == 2
+    assert 'inner' in tracing.format_summary(stages)
+
+
+def test_trace_nested_processes(tmpdir):
+    fname_parent, fname_child = str(tmpdir.join('parent.py')), str(tmpdir.join('child.py'))
+    with open(fname_parent, 'w') as f:
+        f.write(SCRIPT_PARENT)
+    with open(fname_child, 'w') as f:
+        f.write(SCRIPT_CHILD)
+    env = dict((key, value) for key, value in os.environ.items() if not key.startswith('SCT_TRACE'))
+    env['SCT_TRACE'] = 'trace.json'
+    env['PYTHONPATH'] = os.pathsep.join([__sct_dir__, os.path.join(__sct_dir__, 'scripts')] +
+                                        ([env['PYTHONPATH']] if 'PYTHONPATH' in env else []))
+    proc = subprocess.run([sys.executable, fname_parent, fname_child], cwd=str(tmpdir), env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    assert proc.returncode == 0, proc.stderr
+    assert 'Trace written to' in proc.stderr
+    assert 'child_stage' in proc.stderr
+    # the part files of the child processes are merged, and removed
+    assert sorted(os.listdir(str(tmpdir))) == ['child.py', 'parent.py', 'trace.json']
+    with open(str(tmpdir.join('trace.json'))) as f:
+        trace = json.load(f)
+    spans = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+    by_name = dict((event['name'], event) for event in spans)
+    assert set(by_name) == {'parent.py', 'child.py', '__main__.stage', os.path.basename(sys.executable),
+                            'child_stage'}
+    assert len(set(event['pid'] for event in spans)) == 2
+    # the process of the child is attached to the sct.run() span, which is attached to the process of the parent
+    span_run = [event for event in spans if event['cat'] == 'run'][0]
+    assert by_name['child.py']['args']['parent'] == span_run['args']['id']
+    assert span_run['args']['parent'] == by_name['parent.py']['args']['id']
+    assert by_name['child_stage']['args']['parent'] == by_name['child.py']['args']['id']
+    assert by_name['__main__.stage']['args']['parent'] == by_name['parent.py']['args']['id']
+    assert span_run['args']['max_rss_bytes'] > 0
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.types
+
+from __future__ import absolute_import
+
+import numpy as np
+import pytest
+
+from spinalcordtoolbox.types import Centerline
+
+
+def dummy_centerline(n_points):
+    z = np.linspace(0, 100, n_points)
+    x, y = 5 * np.sin(z / 10.), 3 * np.cos(z / 7.)
+    return x, y, z, np.gradient(x), np.gradient(y), np.ones(n_points)
+
+
+@pytest.mark.parametrize('n_points', [2, 50])
+def test_centerline_geometry(n_points):
+    """The batched geometry matches the per-point computation"""
+    centerline = Centerline(*dummy_centerline(n_points))
+    assert centerline.matrices.shape == centerline.inverse_matrices.shape == (n_points, 3, 3)
+    assert centerline.offset_plans.shape == (n_points,)
+
+    reference = Centerline(*dummy_centerline(n_points))
+    reference.derivatives = np.array(list(zip(*dummy_centerline(n_points)[3:])))
+    for index in range(n_points):
+        origin, x_prime, y_prime, z_prime, matrix, inverse_matrix = reference.compute_coordinate_system(index)
+        np.testing.assert_allclose(centerline.matrices[index], matrix, rtol=0, atol=1e-15)
+        np.testing.assert_allclose(centerline.inverse_matrices[index], inverse_matrix, rtol=0, atol=1e-15)
+        np.testing.assert_allclose(centerline.plans_parameters[index], reference.get_plan_parameters(index),
+                                   rtol=1e-14)
+    # orthonormal frames
+    np.testing.assert_allclose(np.einsum('nij,nik->njk', centerline.matrices, centerline.matrices),
+                               np.tile(np.eye(3), (n_points, 1, 1)), atol=1e-14)
+
+
+def test_centerline_length():
+    x, y, z = [0, 3, 3, 3], [0, 4, 4, 4], [0, 0, 1, 3]
+    centerline = Centerline(x, y, z, [0] * 4, [0] * 4, [1] * 4)
+    assert centerline.length == 8
+    assert centerline.progressive_length == [0, 5, 1, 2]
+    assert centerline.incremental_length == [0, 5, 6, 8]
+    assert centerline.progressive_length_inverse == [0, 2, 1, 5]
+    assert centerline.incremental_length_inverse == [0, 2, 3, 8]
+
+
+def dummy_centerline_with_disks(n_points=500):
+    """Straight centerline along z with disks C1 (top) to C5"""
+    z = np.linspace(0, 100, n_points)
+    centerline = Centerline(np.zeros(n_points), np.zeros(n_points), z,
+                            np.zeros(n_points), np.zeros(n_points), np.ones(n_points))
+    centerline.compute_vertebral_distribution([[0, 0, 90, 1], [0, 0, 70, 2], [0, 0, 50, 3], [0, 0, 30, 4],
+                                               [0, 0, 10, 5]])
+    return centerline
+
+
+def test_vertebral_distribution():
+    centerline = dummy_centerline_with_disks()
+    assert (centerline.first_label, centerline.last_label) == (1, 5)
+    assert centerline.l_points[0] == 'C5'
+    assert centerline.l_points[300] == 'C2'
+    assert centerline.l_points[-1] == 0
+    # the points between two disks are labeled with the upper one, and their relative position goes from 1 (lower
+    # disk) to 0 (upper disk)
+    index_c2, index_c3 = centerline.index_disk['C2'], centerline.index_disk['C3']
+    assert set(centerline.l_points[index_c3:index_c2]) == {'C2'}
+    assert centerline.dist_points_rel[index_c3] == 1
+    assert np.all(np.diff(centerline.dist_points_rel[index_c3:index_c2]) < 0)
+    np.testing.assert_allclose(centerline.dist_points_rel[index_c2 - 1], 0, atol=0.02)
+
+
+def closest_brute_force(centerline, level, position):
+    """Index of the closest point to a position, by an argmin over all the points"""
+    if level == 0:
+        # above the labeled levels: position along the centerline
+        return int(np.argmin(np.abs(centerline.dist_points - position)))
+    if centerline.labels_regions[level] >= centerline.last_label:
+        # below the last disk: position along the centerline, from the last disk
+        distances = centerline.dist_points - centerline.dist_points[centerline.index_disk['C5']]
+        return int(np.argmin(np.abs(distances - position)))
+    # relative position within the level
+    distances = np.where(np.array(centerline.l_points) == level, centerline.dist_points_rel, np.inf)
+    return int(np.argmin(np.abs(distances - position)))
+
+
+def test_get_closest_to_absolute_positions():
+    """Batched queries give the indexes of an argmin over all the points"""
+    centerline = dummy_centerline_with_disks()
+    levels = centerline.l_points + ['C3', 'C3', 'C2', 'C5', 'L2', 0]
+    positions = list(centerline.dist_points_rel) + [0.5, -2, 0.2, 3.3, 5.1, 12.4]
+    indexes = centerline.get_closest_to_absolute_positions(levels, positions)
+    assert indexes == [closest_brute_force(centerline, level, position)
+                       for level, position in zip(levels, positions)]
+    assert indexes[-6:] == [200, 248, 329, 34, 25, 387]
+    # single queries
+    assert centerline.get_closest_to_absolute_position('C3', 0.5) == 200
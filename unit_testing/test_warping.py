@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8
+# pytest unit tests for spinalcordtoolbox.warping
+
+from __future__ import absolute_import
+
+import sys, os
+import distutils.spawn
+import pytest
+
+import numpy as np
+import nibabel as nib
+from scipy.io import savemat
+from scipy.ndimage import map_coordinates
+
+from spinalcordtoolbox.utils import __sct_dir__
+sys.path.append(os.path.join(__sct_dir__, 'scripts'))
+from spinalcordtoolbox.image import Image
+from spinalcordtoolbox.warping import WarpPlan, read_affine, RAS2LPS
+import sct_apply_transfo
+
+
+def fake_image(data, affine):
+    return Image(data, hdr=nib.Nifti1Image(data, affine).header)
+
+
+def fake_3dimage(affine=None):
+    """
+    :return: an Image with recognizable values, resolution 0.5x0.8x1.2 mm
+    """
+    shape = (10, 20, 30)
+    data = np.fromfunction(lambda x, y, z: (1 + x) + (1 + y) * 100 + (1 + z) * 10000, shape).astype(np.float32)
+    if affine is None:
+        affine = np.diag([0.5, 0.8, 1.2, 1.])
+        affine[:3, 3] = [3, -4, 10]
+    return fake_image(data, affine)
+
+
+def save_field(displacement, im_ref, fname):
+    """Save a constant displacement (in LPS) as an ANTs warping field defined on the grid of im_ref"""
+    data = np.zeros(im_ref.data.shape[:3] + (1, 3))
+    data[...] = displacement
+    im_warp = fake_image(data, im_ref.hdr.get_best_affine())
+    im_warp.header.set_intent('vector', (), '')
+    im_warp.save(fname)
+    return fname
+
+
+def write_affine_txt(fname, matrix, translation, center):
+    with open(fname, 'w') as f:
+        f.write("#Insight Transform File V1.0\n#Transform 0\nTransform: AffineTransform_double_3_3\n")
+        f.write("Parameters: {}\n".format(" ".join(str(v) for v in list(np.ravel(matrix)) + list(translation))))
+        f.write("FixedParameters: {}\n".format(" ".join(str(v) for v in center)))
+    return fname
+
+
+def test_read_affine(tmp_path):
+    matrix = np.array([[0., -1, 0], [1, 0, 0], [0, 0, 1]])
+    translation, center = [1., 2, 3], [10., 0, -5]
+    point = np.array([4., 5, 6])
+    expected = matrix.dot(point - center) + translation + center
+    affine = read_affine(write_affine_txt(str(tmp_path / 'affine.txt'), matrix, translation, center))
+    assert np.allclose(affine[:3, :3].dot(point) + affine[:3, 3], expected)
+    fname_mat = str(tmp_path / 'affine.mat')
+    savemat(fname_mat, {'AffineTransform_double_3_3': np.concatenate([matrix.ravel(), translation])[:, np.newaxis],
+                        'fixed': np.array(center)[:, np.newaxis]})
+    assert np.allclose(read_affine(fname_mat), affine)
+
+
+@pytest.mark.parametrize('orientation', ['LPI', 'RPI', 'ASR', 'PIL'])
+def test_warp_plan_field(tmp_path, orientation):
+    """Shift by one voxel (+x, +y, +z in LPI) with a displacement field, whatever the orientation of the data"""
+    im_src = fake_3dimage()
+    data_src = im_src.data.copy()
+    im_src.change_orientation(orientation)
+    # sampling at p - (1 voxel) in RAS, i.e. displacement of (+0.5, +0.8, -1.2) in LPS
+    fname_warp = save_field([0.5, 0.8, -1.2], im_src, str(tmp_path / 'warp.nii'))
+    plan = WarpPlan.from_files([fname_warp], im_src, im_src)
+    data_dst = fake_image(plan.apply(im_src.data, order=1), im_src.hdr.get_best_affine()).change_orientation('LPI').data
+    assert np.allclose(data_dst[1:, 1:, 1:], data_src[:-1, :-1, :-1])
+    assert np.all(data_dst[0] == 0) and np.all(data_dst[:, 0] == 0) and np.all(data_dst[:, :, 0] == 0)
+
+
+def test_warp_plan_chain(tmp_path):
+    """Field and affine are composed in the order of sct_apply_transfo, and affines can be inverted"""
+    im_src = fake_3dimage()
+    # translation of 1 mm along L (i.e. -x in RAS), applied to the points of the destination grid
+    fname_affine = write_affine_txt(str(tmp_path / 'affine.txt'), np.eye(3), [1., 0, 0], [0., 0, 0])
+    fname_warp = save_field([-1., 0, 0], im_src, str(tmp_path / 'warp.nii'))
+    plan = WarpPlan.from_files([fname_affine], im_src, im_src)
+    assert np.allclose(plan.coords[0], np.indices(im_src.data.shape)[0] - 2)
+    plan = WarpPlan.from_files([fname_affine], im_src, im_src, list_warpinv=[fname_affine])
+    assert np.allclose(plan.coords[0], np.indices(im_src.data.shape)[0] + 2)
+    # the field cancels the affine
+    plan = WarpPlan.from_files([fname_affine, fname_warp], im_src, im_src)
+    assert np.allclose(plan.coords, np.indices(im_src.data.shape))
+
+
+def test_warp_plan_kernels():
+    """Precomputed nearest neighbour and linear kernels match map_coordinates, with the ITK border handling"""
+    np.random.seed(0)
+    shape, shape_r = (12, 15, 9), (14, 11, 10)
+    field = np.random.uniform(-2, 2, shape_r + (3,))
+    affine = np.eye(4)
+    affine[:3, 3] = [1, -1, 0.5]
+    plan = WarpPlan([affine, (field, RAS2LPS)], np.eye(4), shape, np.eye(4), shape_r)
+    assert plan.is_outside.any() and not plan.is_outside.all()
+    data = np.random.rand(*shape + (3,))
+    for order in [0, 1, 3]:
+        data_r = plan.apply(data, order=order, n_jobs=2)
+        for it in range(data.shape[3]):
+            expected = map_coordinates(data[..., it], plan.coords, order=order, mode='nearest')
+            expected[plan.is_outside] = 0
+            assert np.allclose(data_r[..., it], expected, atol=1e-6)
+    # integers are converted to float for linear interpolation, and kept for nearest neighbour
+    data_int = (data[..., 0] * 10).astype(np.int16)
+    assert plan.apply(data_int, order=0).dtype == np.int16
+    assert plan.apply(data_int, order=1).dtype == np.float32
+
+
+def test_apply_transfo_4d(tmp_path):
+    """4D images are warped in-process, volume by volume, into the destination space"""
+    im_3d = fake_3dimage()
+    data = np.stack([im_3d.data * (it + 1) for it in range(4)], axis=-1)
+    im_src = fake_image(data, im_3d.hdr.get_best_affine())
+    im_src.hdr['pixdim'][4] = 2.5
+    fname_src, fname_dest = str(tmp_path / 'src.nii'), str(tmp_path / 'dest.nii')
+    im_src.save(fname_src)
+    fake_3dimage().save(fname_dest)
+    fname_warp = save_field([0.5, 0.8, -1.2], im_3d, str(tmp_path / 'warp.nii'))
+    fname_out = str(tmp_path / 'src_reg.nii')
+    sct_apply_transfo.Transform(input_filename=fname_src, fname_dest=fname_dest, list_warp=[fname_warp],
+                                output_filename=fname_out, interp='linear', n_jobs=2).apply()
+    im_out = Image(fname_out)
+    assert im_out.data.shape == data.shape
+    assert im_out.hdr['pixdim'][4] == 2.5
+    assert np.allclose(im_out.hdr.get_best_affine(), Image(fname_dest).hdr.get_best_affine())
+    assert np.allclose(im_out.data[1:, 1:, 1:], data[:-1, :-1, :-1])
+
+
+def test_apply_transfo_4d_int_destination(tmp_path):
+    """Float data warped onto an integer destination is saved as float32, without quantization"""
+    im_3d = fake_3dimage()
+    data = np.stack([im_3d.data / 1000. * (it + 1) for it in range(2)], axis=-1)
+    im_src = fake_image(data, im_3d.hdr.get_best_affine())
+    fname_src, fname_dest = str(tmp_path / 'src.nii'), str(tmp_path / 'dest.nii')
+    im_src.save(fname_src)
+    im_dest = fake_3dimage()
+    im_dest.hdr.set_data_dtype(np.int16)
+    im_dest.hdr.set_slope_inter(0.013, 0)
+    im_dest.save(fname_dest, dtype=np.int16)
+    fname_warp = save_field([0, 0, 0], im_3d, str(tmp_path / 'warp.nii'))
+    fname_out = str(tmp_path / 'src_reg.nii')
+    sct_apply_transfo.Transform(input_filename=fname_src, fname_dest=fname_dest, list_warp=[fname_warp],
+                                output_filename=fname_out, interp='linear').apply()
+    im_out = Image(fname_out)
+    assert im_out.hdr.get_data_dtype() == np.float32
+    assert np.allclose(im_out.data, data, atol=1e-4)
+
+
+@pytest.mark.skipif(distutils.spawn.find_executable('isct_antsApplyTransforms') is None,
+                    reason="ANTs binaries are not available")
+def test_warp_plan_vs_ants(tmp_path):
+    """Same result as antsApplyTransforms, within interpolation tolerance"""
+    im_src = fake_3dimage()
+    fname_src = str(tmp_path / 'src.nii')
+    im_src.save(fname_src)
+    np.random.seed(0)
+    data_warp = np.random.uniform(-1, 1, im_src.data.shape + (1, 3))
+    im_warp = fake_image(data_warp, im_src.hdr.get_best_affine())
+    im_warp.header.set_intent('vector', (), '')
+    fname_warp = str(tmp_path / 'warp.nii')
+    im_warp.save(fname_warp)
+    fname_affine = write_affine_txt(str(tmp_path / 'affine.txt'), np.eye(3) * 1.05, [0.3, -0.2, 0.5], [4., 2, 15])
+    fname_out = str(tmp_path / 'src_reg.nii')
+    sct_apply_transfo.Transform(input_filename=fname_src, fname_dest=fname_src, list_warp=[fname_affine, fname_warp],
+                                output_filename=fname_out, interp='linear').apply()
+    plan = WarpPlan.from_files([fname_affine, fname_warp], im_src, im_src)
+    data_ants = Image(fname_out).data
+    data_sct = plan.apply(im_src.data, order=1)
+    # voxels on the border of the source grid are ambiguous
+    is_inside = ~plan.is_outside & np.all((plan.coords > 0.01) & (plan.coords < np.array(
+        im_src.data.shape).reshape(3, 1, 1, 1) - 1.01), axis=0)
+    assert np.allclose(data_sct[is_inside], data_ants[is_inside], rtol=1e-4)